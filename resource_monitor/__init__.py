@@ -0,0 +1,8 @@
+"""Resource monitor: a headless sampling core plus PyQt5 front-ends
+
+Only the GUI-free modules are imported here, so ``import resource_monitor``
+works on hosts without PyQt5, matplotlib, GPUtil or the win32 extensions.
+"""
+from resource_monitor.sampler import SYSTEM_KEY, ResourceSampler, current_username, get_gpus
+
+__all__ = ["SYSTEM_KEY", "ResourceSampler", "current_username", "get_gpus"]
@@ -0,0 +1,219 @@
+"""Command-line entry point: python -m resource_monitor"""
+import argparse
+import csv
+import datetime
+import sys
+import time
+
+from resource_monitor.aggregate import parse_group_by
+from resource_monitor.columnar import ColumnarWriter
+from resource_monitor.exporter import DEFAULT_PORT, MetricsExporter
+from resource_monitor.recorder import CSV_COLUMNS, Recorder, csv_rows, jsonl_line
+from resource_monitor.remote import Agent, Collector, parse_address
+from resource_monitor.store import HistoryDatabase
+from resource_monitor.sampler import DEFAULT_CALL_TIMEOUT, DEFAULT_WORKERS, ResourceSampler
+from resource_monitor.scheduler import AsyncSampler, parse_cadence
+
+
+def parse_args(argv=None):
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(
+        prog="python -m resource_monitor",
+        description="Sample resource usage of processes without the GUI")
+    parser.add_argument("software", nargs="*", help="process names to monitor")
+    parser.add_argument("-i", "--interval", type=float, default=1.0,
+                        help="update interval in seconds (default: 1)")
+    parser.add_argument("-n", "--count", type=int, default=0,
+                        help="number of samples to take, 0 runs until interrupted")
+    parser.add_argument("-r", "--rescan-interval", type=float, default=10.0,
+                        help="seconds between full process table scans (default: 10)")
+    parser.add_argument("-g", "--group-by", default="pattern",
+                        help="comma-separated keys to roll up matching processes by: "
+                             "pattern, username, tree, cmdline (default: pattern)")
+    parser.add_argument("-s", "--system", action="store_true",
+                        help="also monitor system-wide resources")
+    parser.add_argument("-f", "--format", choices=["text", "jsonl", "csv", "columnar", "sqlite"],
+                        default="text",
+                        help="output format; columnar (binary .rmc) and sqlite (database with "
+                             "1m/1h rollups) need --output (default: text)")
+    parser.add_argument("-o", "--output", help="file to record samples to (default: stdout)")
+    parser.add_argument("--flush-interval", type=float, default=5.0,
+                        help="seconds between writes of buffered samples to --output (default: 5)")
+    parser.add_argument("--rotate-size", type=float, default=0,
+                        help="start a new jsonl/csv --output file after this many MB, 0 never (default: 0)")
+    parser.add_argument("--rotate-time", type=float, default=0,
+                        help="start a new jsonl/csv --output file after this many seconds, 0 never (default: 0)")
+    parser.add_argument("--keep", type=int, default=0,
+                        help="number of rotated files to keep, 0 keeps all (default: 0)")
+    parser.add_argument("-w", "--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"threads reading processes in parallel, 0 reads them one after another "
+                             f"(default: {DEFAULT_WORKERS})")
+    parser.add_argument("--call-timeout", type=float, default=DEFAULT_CALL_TIMEOUT,
+                        help=f"seconds a process may take to read before it is skipped for the tick "
+                             f"(default: {DEFAULT_CALL_TIMEOUT:g})")
+    parser.add_argument("--backend", choices=["psutil", "procfs"], default="psutil",
+                        help="how processes are read; procfs parses /proc directly and is several times "
+                             "faster on hosts with many processes, Linux only (default: psutil)")
+    parser.add_argument("--cadence", nargs="?", const="", metavar="COLLECTOR=SECONDS,...",
+                        help="sample with the asyncio scheduler, each collector (cpu, memory, io, connections, "
+                             "gpu, system) on its own interval, e.g. cpu=0.25,connections=10; --interval "
+                             "sets how often merged samples are written")
+    parser.add_argument("--metrics-port", type=int, nargs="?", const=DEFAULT_PORT,
+                        help=f"serve the latest sample for Prometheus at http://HOST:PORT/metrics "
+                             f"(default port when given without a value: {DEFAULT_PORT})")
+    parser.add_argument("--metrics-host", default="",
+                        help="address the metrics endpoint listens on (default: all interfaces)")
+    parser.add_argument("--agent", metavar="HOST[:PORT]",
+                        help="stream samples to a collector; nothing is written to stdout unless --output is given")
+    parser.add_argument("--agent-name", help="host name the agent reports (default: this machine's name)")
+    parser.add_argument("--collect", metavar="[HOST:]PORT",
+                        help="receive samples from agents instead of sampling, series are named \"host: name\"")
+    args = parser.parse_args(argv)
+    if not args.software and not args.system and not args.collect:
+        parser.error("give at least one process name, --system or --collect")
+    if args.collect and args.agent:
+        parser.error("--collect and --agent can't be combined")
+    if args.backend == "procfs" and not sys.platform.startswith("linux"):
+        parser.error("--backend procfs needs Linux")
+    if args.backend == "procfs" and args.cadence is not None:
+        parser.error("--backend procfs can't be combined with --cadence")
+    if args.format in ("columnar", "sqlite") and not args.output:
+        parser.error(f"--format {args.format} needs --output")
+    try:
+        args.group_by = parse_group_by(args.group_by)
+        args.cadence = None if args.cadence is None else parse_cadence(args.cadence)
+    except ValueError as e:
+        parser.error(str(e))
+    return args
+
+
+class SampleWriter:
+    """Write samples to a stream as text, JSON lines or CSV"""
+
+    def __init__(self, stream, format_type):
+        self.stream = stream
+        self.format_type = format_type
+        self.csv_writer = csv.writer(stream) if format_type == "csv" else None
+        self.header_written = False
+
+    def write(self, timestamp, data):
+        """Write one sample"""
+        if self.format_type == "jsonl":
+            self.stream.write(jsonl_line(timestamp, data))
+        elif self.format_type == "csv":
+            if not self.header_written:
+                self.csv_writer.writerow(CSV_COLUMNS)
+                self.header_written = True
+            self.csv_writer.writerows(csv_rows(timestamp, data))
+        else:
+            time_str = datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S")
+            for software, metrics in data.items():
+                self.stream.write(
+                    f"{time_str} {software}: CPU {metrics['cpu']:.1f}% | Memory {metrics['memory']:.1f}MB | "
+                    f"Network {metrics['network']:.2f}Mbps | Disk {metrics['disk']:.2f}MB/s | "
+                    f"GPU {metrics['gpu']:.1f}% | PID {metrics['pid']} | Instances {metrics.get('count', 1)}\n")
+        self.stream.flush()
+
+
+def sample(args, emit):
+    """Pass samples to emit until the requested count is reached"""
+    if args.cadence is not None:
+        sampler = AsyncSampler(args.software, args.interval, args.system, rescan_interval=args.rescan_interval,
+                               group_by=args.group_by, intervals=args.cadence, workers=args.workers)
+        taken = 0
+
+        def emit_counted(timestamp, data):
+            nonlocal taken
+            emit(timestamp, data)
+            taken += 1
+            if taken == args.count:
+                sampler.stop()
+
+        sampler.serve(emit_counted)
+        return
+
+    sampler_class = ResourceSampler
+    if args.backend == "procfs":
+        # Imported on demand, the module needs the Unix-only pwd module
+        from resource_monitor.procfs import ProcfsSampler
+        sampler_class = ProcfsSampler
+    sampler = sampler_class(args.software, args.interval, args.system,
+                            rescan_interval=args.rescan_interval, group_by=args.group_by,
+                            workers=args.workers, call_timeout=args.call_timeout)
+    taken = 0
+    try:
+        while not args.count or taken < args.count:
+            emit(time.time(), sampler.get_resource_data())
+            taken += 1
+            if not args.count or taken < args.count:
+                time.sleep(args.interval)
+    finally:
+        sampler.close()
+
+
+def main(argv=None):
+    """Sample until the requested count is reached or Ctrl+C is pressed"""
+    args = parse_args(argv)
+
+    stream = None
+    if args.format == "columnar":
+        writer = ColumnarWriter(args.output, flush_interval=args.flush_interval)
+    elif args.format == "sqlite":
+        writer = HistoryDatabase(args.output, flush_interval=args.flush_interval)
+        writer.start_rollups()
+    elif args.output and args.format != "text":
+        # Buffered, rotating files for long runs
+        writer = Recorder(args.output, args.format, flush_interval=args.flush_interval,
+                          max_bytes=int(args.rotate_size * 1024 * 1024), max_age=args.rotate_time,
+                          max_files=args.keep)
+    elif args.agent and not args.output:
+        writer = None
+    else:
+        stream = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        writer = SampleWriter(stream, args.format)
+    exporter = None
+    if args.metrics_port is not None:
+        exporter = MetricsExporter(args.metrics_host, args.metrics_port)
+    agent = None
+    if args.agent:
+        agent = Agent(*parse_address(args.agent), name=args.agent_name)
+
+    def emit(timestamp, data):
+        if writer is not None:
+            writer.write(timestamp, data)
+        if exporter is not None:
+            exporter.update(timestamp, data)
+        if agent is not None:
+            agent.write(timestamp, data)
+
+    def backfill(timestamp, data):
+        # Late series of agents that were behind; the exporter only shows the newest values
+        # and columnar files must stay in time order
+        if writer is not None and not getattr(writer, 'ordered', False):
+            writer.write(timestamp, data)
+        if agent is not None:
+            agent.write(timestamp, data)
+
+    try:
+        if args.collect:
+            # Merged samples of all agents take the place of local sampling
+            collector = Collector(emit, *parse_address(args.collect), interval=args.interval, backfill=backfill)
+            collector.serve()
+        else:
+            sample(args, emit)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if agent is not None:
+            agent.close()
+        if exporter is not None:
+            exporter.close()
+        if isinstance(writer, (Recorder, ColumnarWriter, HistoryDatabase)):
+            writer.close()
+        elif stream is not None and stream is not sys.stdout:
+            stream.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
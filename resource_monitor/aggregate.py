@@ -0,0 +1,130 @@
+"""Roll up every instance of a monitored service into one series
+
+A watch-list entry usually matches several processes (browser renderers,
+worker pools). aggregate() groups the per-process records of one tick by
+configurable keys and reports the sum and maximum of every metric together
+with the number of instances, in a single pass over the records.
+
+Group keys:
+    pattern     the watch-list entry the process matched
+    username    the process owner
+    tree        the topmost matched ancestor, so a parent and all its matched
+                descendants form one group
+    cmdline     the full command line
+
+Grouped by tree, every group also lists its processes as 'nodes', parents
+before children, so front-ends can show the hierarchy with the usage of
+each process and of its subtree.
+"""
+from resource_monitor.proctree import ProcessTree
+
+GROUP_KEYS = ('pattern', 'username', 'tree', 'cmdline')
+
+# Metrics that are summed over instances
+SUMMED_METRICS = ('cpu', 'memory', 'network', 'disk', 'gpu')
+
+# Fields of the per-process nodes of tree groups
+NODE_FIELDS = ('pid', 'ppid', 'name', 'username', 'cpu', 'memory')
+
+
+def parse_group_by(group_by):
+    """Normalize a group-by spec ('pattern,username' or a sequence) to a tuple"""
+    if isinstance(group_by, str):
+        group_by = [key.strip() for key in group_by.split(',') if key.strip()]
+    group_by = tuple(group_by) or ('pattern',)
+    for key in group_by:
+        if key not in GROUP_KEYS:
+            raise ValueError(f"Unknown group key {key!r}, expected one of {', '.join(GROUP_KEYS)}")
+    return group_by
+
+
+def tree_roots(records):
+    """Map each pid to the pid of its topmost ancestor among the records"""
+    pids = [record['pid'] for record in records]
+    tree = ProcessTree(pids, [record.get('ppid') for record in records])
+    return {pids[row]: pids[root] for row, root in enumerate(tree.root_rows())}
+
+
+def group_label(pattern, parts):
+    """Build the series name of a group"""
+    if pattern is None:
+        return ", ".join(parts)
+    if not parts:
+        return pattern
+    return f"{pattern} [{', '.join(parts)}]"
+
+
+def aggregate(records, group_by=('pattern',), unknown_user="Unknown"):
+    """Group per-process records and return {label: metrics}
+
+    Each record is a metrics dict ('cpu', 'memory', 'network', 'disk', 'gpu',
+    'pid', 'username') plus 'matches' (the watch-list entries it matched) and,
+    when needed by group_by, 'ppid' and 'cmdline'. The returned metrics hold
+    the sums, 'max' with the per-metric maxima, 'count' and 'pids', plus
+    'nodes' when grouped by tree.
+    """
+    group_by = parse_group_by(group_by)
+    by_pattern = 'pattern' in group_by
+
+    roots = {}
+    by_tree = 'tree' in group_by
+    if by_tree:
+        if by_pattern:
+            # Trees are formed among the processes matching the same entry
+            members = {}
+            for record in records:
+                for pattern in record['matches']:
+                    members.setdefault(pattern, []).append(record)
+            for pattern, pattern_records in members.items():
+                for pid, root in tree_roots(pattern_records).items():
+                    roots[(pattern, pid)] = root
+        else:
+            for pid, root in tree_roots(records).items():
+                roots[(None, pid)] = root
+
+    groups = {}
+    for record in records:
+        for pattern in (record['matches'] if by_pattern else (None,)):
+            parts = []
+            for key in group_by:
+                if key == 'username':
+                    parts.append(record.get('username') or unknown_user)
+                elif key == 'tree':
+                    parts.append(f"tree {roots.get((pattern, record['pid']), record['pid'])}")
+                elif key == 'cmdline':
+                    cmdline = record.get('cmdline') or ''
+                    parts.append(cmdline if isinstance(cmdline, str) else ' '.join(cmdline))
+            label = group_label(pattern, parts)
+
+            group = groups.get(label)
+            if group is None:
+                group = groups[label] = {metric: 0 for metric in SUMMED_METRICS}
+                group['max'] = {metric: 0 for metric in SUMMED_METRICS}
+                group['count'] = 0
+                group['pids'] = []
+                group['usernames'] = []
+                if by_tree:
+                    group['nodes'] = []
+            for metric in SUMMED_METRICS:
+                value = record.get(metric) or 0
+                group[metric] += value
+                if value > group['max'][metric]:
+                    group['max'][metric] = value
+            group['count'] += 1
+            group['pids'].append(record['pid'])
+            username = record.get('username') or unknown_user
+            if username not in group['usernames']:
+                group['usernames'].append(username)
+            if by_tree:
+                group['nodes'].append({field: record.get(field) for field in NODE_FIELDS})
+
+    for group in groups.values():
+        group['pids'].sort()
+        group['pid'] = group['pids'][0]
+        group['username'] = ", ".join(group.pop('usernames'))
+        if by_tree:
+            # Parents before children, in the order the tree is walked
+            nodes = group['nodes']
+            tree = ProcessTree([node['pid'] for node in nodes], [node['ppid'] for node in nodes])
+            group['nodes'] = [nodes[row] for row in tree.order]
+    return groups
@@ -0,0 +1,96 @@
+"""Compare writing and loading recordings as JSON lines and as columnar .rmc
+
+Run from anywhere: python resource_monitor/benchmarks/bench_columnar.py
+The default is one day of 1 s samples of five series; -n 604800 is a week.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from resource_monitor.columnar import ColumnarRecording, ColumnarWriter
+from resource_monitor.recorder import Recorder
+
+
+def samples(series_count, count):
+    """Yield (timestamp, data) like ResourceSampler.get_resource_data()"""
+    rng = np.random.default_rng(0)
+    values = rng.random((count, series_count, 5)) * 100
+    base = time.time()
+    for i in range(count):
+        data = {}
+        for s in range(series_count):
+            cpu, memory, network, disk, gpu = values[i, s].tolist()
+            data[f"series {s}"] = {'cpu': cpu, 'memory': memory, 'network': network, 'disk': disk,
+                                   'gpu': gpu, 'pid': 1000 + s, 'username': 'user', 'count': 1}
+        yield base + i, data
+
+
+def timed(function):
+    """Return (result, seconds) of calling function"""
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def write_all(writer, series_count, count):
+    """Record all samples and close the writer"""
+    with writer:
+        for timestamp, data in samples(series_count, count):
+            writer.write(timestamp, data)
+
+
+def load_jsonl(path):
+    """Read the CPU column of the first series the way an analysis script would"""
+    times, cpu = [], []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            times.append(record['timestamp'])
+            cpu.append(record['software']['series 0']['cpu'])
+    return np.array(times), np.array(cpu)
+
+
+def load_columnar(path):
+    """Map the recording, the columns are views without parsing"""
+    recording = ColumnarRecording(path)
+    return recording.times, recording.column('series 0', 'cpu')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--samples", type=int, default=86400, help="samples to record (default: 86400)")
+    parser.add_argument("-s", "--series", type=int, default=5, help="series per sample (default: 5)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        jsonl_path = os.path.join(directory, "bench.jsonl")
+        rmc_path = os.path.join(directory, "bench.rmc")
+        _, jsonl_write = timed(lambda: write_all(Recorder(jsonl_path), args.series, args.samples))
+        _, rmc_write = timed(lambda: write_all(ColumnarWriter(rmc_path), args.series, args.samples))
+        (_, jsonl_cpu), jsonl_load = timed(lambda: load_jsonl(jsonl_path))
+        (times, rmc_cpu), rmc_open = timed(lambda: load_columnar(rmc_path))
+
+        # Slicing an hour in the middle, through the time index
+        recording = ColumnarRecording(rmc_path)
+        middle = times[len(times) // 2]
+        hour, rmc_slice = timed(lambda: recording.column('series 0', 'cpu')[recording.window(middle, middle + 3600)])
+        assert np.allclose(jsonl_cpu, rmc_cpu, rtol=1e-6)
+
+        print(f"{args.samples} samples x {args.series} series")
+        print(f"{'format':>8} {'write us/sample':>16} {'size MB':>8} {'load ms':>9}")
+        for name, write, path, load in (("jsonl", jsonl_write, jsonl_path, jsonl_load),
+                                        ("rmc", rmc_write, rmc_path, rmc_open)):
+            print(f"{name:>8} {write / args.samples * 1e6:>16.1f} {os.path.getsize(path) / 1e6:>8.1f} "
+                  f"{load * 1000:>9.2f}")
+        print(f"rmc one-hour window: {len(hour)} points in {rmc_slice * 1000:.3f} ms")
+        recording.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Measure compression ratio and speed of CompressedHistory
+
+Run from anywhere: python resource_monitor/benchmarks/bench_compressed.py
+Samples look like real monitor output: CPU and memory as slow random walks
+rounded like psutil reports them, mostly idle network and disk, no GPU.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from resource_monitor.compressed import CompressedHistory
+
+
+def samples(series_count, count):
+    """Yield (timestamp, data) at 1 s with a few milliseconds of jitter"""
+    rng = np.random.default_rng(0)
+    cpu = np.round(np.clip(20 + np.cumsum(rng.normal(0, 0.5, (count, series_count)), axis=0), 0, 100), 1)
+    memory = 200 + np.cumsum(rng.normal(0, 0.05, (count, series_count)), axis=0)
+    memory = np.round(memory * 256) / 256  # RSS is a whole number of 4 KiB pages
+    busy = rng.random((count, series_count)) < 0.05
+    network = np.where(busy, np.round(rng.exponential(0.5, (count, series_count)), 3), 0.0)
+    base = time.time()
+    for i in range(count):
+        data = {}
+        for s in range(series_count):
+            data[f"series {s}"] = {'cpu': float(cpu[i, s]), 'memory': float(memory[i, s]),
+                                   'network': float(network[i, s]), 'disk': 0.0, 'gpu': 0,
+                                   'pid': 1000 + s, 'username': 'user'}
+        yield base + i + rng.normal(0, 0.003), data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--samples", type=int, default=3600, help="samples to append (default: 3600)")
+    parser.add_argument("-s", "--series", type=int, default=20, help="series per sample (default: 20)")
+    args = parser.parse_args()
+
+    history = CompressedHistory()
+    start = time.perf_counter()
+    for timestamp, data in samples(args.series, args.samples):
+        history.append(timestamp, data)
+    append = time.perf_counter() - start
+
+    times = history.times()
+    middle = times[len(times) // 2]
+    start = time.perf_counter()
+    window = history.series("series 0", "cpu", middle, middle + 300)
+    decode = time.perf_counter() - start
+
+    print(f"{args.samples} samples x {args.series} series")
+    print(f"append: {append / args.samples * 1e6:.0f} us/sample")
+    print(f"memory: {history.nbytes / 1e6:.2f} MB compressed, {history.raw_nbytes / 1e6:.2f} MB as float64 "
+          f"({history.raw_nbytes / history.nbytes:.1f}x)")
+    print(f"5 minute window of one metric: {len(window)} points in {decode * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
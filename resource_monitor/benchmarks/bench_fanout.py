@@ -0,0 +1,69 @@
+"""Compare tick latency of serial and pooled per-process sampling
+
+Run from anywhere: python resource_monitor/benchmarks/bench_fanout.py
+Starts child processes that each hold open sockets, so connections() has
+real work to do, then times get_resource_data() with 0 (serial) and the
+given numbers of worker threads. --per-process disables counting all
+connections in one net_connections() call.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from resource_monitor import sampler as sampler_module
+from resource_monitor.sampler import ResourceSampler
+
+CHILD = """
+import socket, sys, time
+server = socket.socket()
+server.bind(('127.0.0.1', 0))
+server.listen()
+sockets = [socket.create_connection(server.getsockname()) for _ in range(int(sys.argv[1]))]
+sockets += [server.accept()[0] for _ in sockets]
+print('ready', flush=True)
+time.sleep(3600)
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-p", "--processes", type=int, default=100, help="child processes (default: 100)")
+    parser.add_argument("-c", "--connections", type=int, default=50,
+                        help="connections per child (default: 50)")
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[0, 4, 16],
+                        help="pool sizes to compare (default: 0 4 16)")
+    parser.add_argument("-t", "--ticks", type=int, default=5, help="ticks per pool size (default: 5)")
+    parser.add_argument("--per-process", action="store_true", help="call connections() for every process")
+    args = parser.parse_args()
+    if args.per_process:
+        sampler_module.BATCH_CONNECTIONS_THRESHOLD = float('inf')
+
+    tag = f"bench_fanout_{os.getpid()}"
+    children = [subprocess.Popen([sys.executable, "-c", CHILD, str(args.connections), tag],
+                                 stdout=subprocess.PIPE, text=True) for _ in range(args.processes)]
+    try:
+        for child in children:
+            child.stdout.readline()
+        print(f"{args.processes} processes x {2 * args.connections + 1} sockets")
+        print(f"{'workers':>8} {'ms/tick':>9}")
+        for workers in args.workers:
+            sampler = ResourceSampler([f"cmdline:{tag}"], workers=workers)
+            sampler.get_resource_data()  # Discovery and CPU baselines
+            start = time.perf_counter()
+            for _ in range(args.ticks):
+                data = sampler.get_resource_data()
+            elapsed = (time.perf_counter() - start) / args.ticks
+            sampler.close()
+            assert next(iter(data.values()))['count'] == args.processes
+            print(f"{workers:>8} {elapsed * 1000:>9.1f}")
+    finally:
+        for child in children:
+            child.kill()
+            child.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Compare the start-up import cost of the headless core and the GUI
+
+Run from anywhere: python resource_monitor/benchmarks/bench_import.py
+Each import is timed in a fresh interpreter so module caches don't interfere.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Directory that contains the resource_monitor package
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TARGETS = [
+    ("baseline (python -c pass)", "pass"),
+    ("headless core (resource_monitor)", "import resource_monitor"),
+    ("GUI stack (PyQt5 + matplotlib Qt5Agg)",
+     "import PyQt5.QtWidgets, matplotlib; matplotlib.use('Qt5Agg'); "
+     "import matplotlib.backends.backend_qt5agg, matplotlib.pyplot"),
+]
+
+
+def time_import(statement, repeat):
+    """Return wall times of running statement in fresh interpreters, None if it fails"""
+    times = []
+    env = dict(os.environ, QT_QPA_PLATFORM="offscreen")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", statement], cwd=ROOT, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None
+        times.append(elapsed)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-r", "--repeat", type=int, default=10, help="runs per target (default: 10)")
+    args = parser.parse_args()
+
+    medians = {}
+    for label, statement in TARGETS:
+        times = time_import(statement, args.repeat)
+        if times is None:
+            print(f"{label:50s} unavailable (import failed)")
+            continue
+        medians[label] = statistics.median(times)
+        print(f"{label:50s} median {medians[label] * 1000:8.1f} ms  min {min(times) * 1000:8.1f} ms")
+
+    baseline, core, gui = (medians.get(label) for label, _ in TARGETS)
+    if baseline is not None and core is not None and gui is not None:
+        print(f"\nheadless core costs {(core - baseline) / (gui - baseline):.1%} of the GUI import time")
+
+
+if __name__ == "__main__":
+    main()
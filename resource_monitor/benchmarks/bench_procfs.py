@@ -0,0 +1,116 @@
+"""Compare tick latency of the psutil and /proc sampling backends
+
+Run from anywhere on Linux: python resource_monitor/benchmarks/bench_procfs.py
+Builds a synthetic procfs tree with the given numbers of processes (the
+stat, statm, io and status files of each, plus copies of the system-wide
+files psutil reads) and points both backends at it, so tables far larger
+than this machine's can be measured. With --live the real /proc is used
+instead and the processes are started as sleeping children.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+import psutil
+
+from resource_monitor.procfs import ProcfsSampler, available
+from resource_monitor.sampler import ResourceSampler
+
+# System-wide files read by psutil or the samplers
+SYSTEM_FILES = ('stat', 'net/dev', 'net/tcp', 'net/tcp6', 'net/udp', 'net/udp6', 'diskstats')
+
+
+def build_tree(root, count, first_pid):
+    """Write a procfs-like tree with count processes named bench-worker"""
+    for path in SYSTEM_FILES:
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        try:
+            shutil.copyfile(os.path.join("/proc", path), os.path.join(root, path))
+        except OSError:
+            open(os.path.join(root, path), "w").close()
+    status = open("/proc/self/status").read()
+    io = open("/proc/self/io").read()
+    for i in range(count):
+        pid = first_pid + i
+        directory = os.path.join(root, str(pid))
+        os.makedirs(os.path.join(directory, "fd"))
+        with open(os.path.join(directory, "stat"), "w") as f:
+            f.write(f"{pid} (bench-worker) S 1 {pid} {pid} 0 -1 4194304 100 0 0 0 {i % 500} {i % 70} 0 0 "
+                    f"20 0 1 0 {1000 + i} 20000000 1000 18446744073709551615 0 0 0 0 0 0 0 0 0 0 0 0 17 0 0 0 "
+                    f"0 0 0\n")
+        with open(os.path.join(directory, "statm"), "w") as f:
+            f.write(f"4882 {1000 + i % 900} 500 1 0 200 0\n")
+        with open(os.path.join(directory, "status"), "w") as f:
+            f.write(status)
+        with open(os.path.join(directory, "io"), "w") as f:
+            f.write(io)
+        with open(os.path.join(directory, "cmdline"), "w") as f:
+            f.write(f"bench-worker\0--id\0{i}\0")
+
+
+def time_ticks(sampler, ticks):
+    """Return (ms of the first tick with discovery, ms per following tick, series count)"""
+    start = time.perf_counter()
+    sampler.get_resource_data()
+    first = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(ticks):
+        data = sampler.get_resource_data()
+    steady = (time.perf_counter() - start) / ticks
+    sampler.close()
+    return first * 1000, steady * 1000, next(iter(data.values()))['count']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-p", "--processes", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="process table sizes to compare (default: 1000 10000 50000)")
+    parser.add_argument("-t", "--ticks", type=int, default=5, help="ticks per backend and size (default: 5)")
+    parser.add_argument("--live", action="store_true", help="start real sleeping processes instead")
+    args = parser.parse_args()
+    if not available():
+        parser.error("needs Linux with /proc")
+
+    # psutil caches Process objects by PID, so every tree gets PIDs of its own
+    first_pid = 100000
+    print(f"{'processes':>10} {'backend':>8} {'first ms':>10} {'ms/tick':>9}")
+    for count in args.processes:
+        children = []
+        root = None
+        try:
+            if args.live:
+                children = [subprocess.Popen(["sleep", "3600"]) for _ in range(count)]
+                proc_root, pattern = "/proc", "exact:sleep"
+            else:
+                root = tempfile.mkdtemp(prefix="bench_procfs_")
+                build_tree(root, count, first_pid)
+                first_pid += count
+                proc_root, pattern = root, "exact:bench-worker"
+
+            for backend in ("psutil", "procfs"):
+                # Process scans and reads of psutil follow PROCFS_PATH
+                psutil.PROCFS_PATH = proc_root
+                if backend == "psutil":
+                    sampler = ResourceSampler([pattern], workers=0)
+                else:
+                    sampler = ProcfsSampler([pattern], workers=0, proc_root=proc_root)
+                first, steady, found = time_ticks(sampler, args.ticks)
+                psutil.PROCFS_PATH = "/proc"
+                assert found >= count, f"{backend} found {found} of {count} processes"
+                print(f"{count:>10} {backend:>8} {first:>10.1f} {steady:>9.1f}")
+        finally:
+            psutil.PROCFS_PATH = "/proc"
+            for child in children:
+                child.kill()
+                child.wait()
+            if root is not None:
+                shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
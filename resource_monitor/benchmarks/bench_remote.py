@@ -0,0 +1,95 @@
+"""Run a collector and several agents on localhost and measure the stream
+
+Run from anywhere: python resource_monitor/benchmarks/bench_remote.py
+Every agent sends synthetic samples as fast as its batches are accepted;
+the collector merges them into 1 s buckets. One more agent buffers the
+same samples while its collector address is unreachable and resends the
+backlog after reconnecting; the run fails unless every one of its buckets
+reaches the collector's callbacks and nothing is counted late. Prints the
+wire size per sample and how many samples arrived, were backfilled, late
+or dropped.
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from resource_monitor.remote import Agent, Collector, encode_batch
+
+
+def sample(series_count, i):
+    """One sample dict like ResourceSampler.get_resource_data()"""
+    return {f"series {s}": {'cpu': (i * 7 + s) % 100 / 1.0, 'memory': 100.0 + s, 'network': 0.0, 'disk': 0.0,
+                            'gpu': 0.0, 'pid': 1000 + s, 'username': 'user', 'count': 1}
+            for s in range(series_count)}
+
+
+def unused_port():
+    """Return a localhost port nothing listens on"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-a", "--agents", type=int, default=10, help="agents to start (default: 10)")
+    parser.add_argument("-s", "--series", type=int, default=5, help="series per sample (default: 5)")
+    parser.add_argument("-t", "--seconds", type=float, default=5.0, help="seconds of samples (default: 5)")
+    args = parser.parse_args()
+
+    merged = []
+    backlog_buckets = set()  # Buckets in which the reconnecting agent's series arrived
+
+    def receive(timestamp, data):
+        merged.append(len(data))
+        if "backlog: series 0" in data:
+            backlog_buckets.add(timestamp)
+
+    def backfill(timestamp, data):
+        backlog_buckets.add(timestamp)
+
+    collector = Collector(receive, '127.0.0.1', 0, interval=1.0, delay=1.0, backfill=backfill).start()
+    agents = [Agent('127.0.0.1', collector.port, name=f"agent{i}", batch_interval=0.1)
+              for i in range(args.agents)]
+    backlog = Agent('127.0.0.1', unused_port(), name="backlog", batch_interval=0.1,
+                    reconnect_delay=0.2, max_reconnect_delay=0.2)
+
+    # Ten samples per second and agent, timestamps spread over the run
+    start = time.time()
+    count = int(args.seconds * 10)
+    for i in range(count):
+        for agent in agents + [backlog]:
+            agent.write(start + i / 10, sample(args.series, i))
+        time.sleep(max(0.0, start + (i + 1) / 10 - time.time()))
+    # A sample that can't be encoded must only cost itself
+    backlog.write(start + count / 10, {"bad": {'cpu': "not a number"}})
+    for agent in agents:
+        agent.close()
+    backlog.address = ('127.0.0.1', collector.port)
+    while backlog.sent + backlog.invalid < count + 1:
+        time.sleep(0.1)
+    backlog.close()
+    time.sleep(0.5)
+    collector.stop()
+    collector.thread.join()
+
+    payload = encode_batch("agent0", [(start + i, sample(args.series, i)) for i in range(60)])
+    received = sum(state['samples'] for state in collector.hosts.values())
+    print(f"{args.agents} agents x {args.series} series, {count} samples each")
+    print(f"wire size: {len(payload) / 60:.0f} bytes/sample in one-minute batches")
+    print(f"received {received} of {count * (args.agents + 1)} samples, "
+          f"dropped {sum(agent.dropped for agent in agents)}, late {collector.merger.late}")
+    print(f"merged buckets: {len(merged)}, series per bucket: {max(merged) if merged else 0}")
+    expected = {int((start + i / 10) // 1.0) * 1.0 for i in range(count)}
+    print(f"reconnected agent: {backlog.sent} samples sent, {collector.merger.backfilled} backfilled, "
+          f"{len(backlog_buckets & expected)} of {len(expected)} buckets delivered")
+    assert collector.merger.late == 0, "samples dropped as late"
+    assert backlog.invalid == 1, "the bad sample wasn't dropped on its own"
+    assert backlog_buckets >= expected, "buckets of the backlog were lost"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare per-frame cost of clear-and-replot with LiveChart's blitting
+
+Run from anywhere: python resource_monitor/benchmarks/bench_render.py
+Long histories show the effect of decimation: -p 100000
+Uses the Agg canvas, so no display or Qt is needed.
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from resource_monitor.charts import LiveChart
+
+
+def make_canvas():
+    """Return an Agg canvas with an axes attribute, like MplCanvas"""
+    figure = Figure(figsize=(5, 4), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    canvas.axes = figure.add_subplot(111)
+    return canvas
+
+
+def frames(series_count, points, frame_count):
+    """Yield (times, [values...]) for a window scrolling one point per frame"""
+    # Random walks, resource metrics vary slowly from one sample to the next
+    rng = np.random.default_rng(0)
+    data = 50 + np.cumsum(rng.normal(0, 1, (series_count, points + frame_count)), axis=1)
+    base = time.time() / 86400.0
+    for i in range(frame_count):
+        times = base + np.arange(i, i + points) / 86400.0
+        yield i + points, times, [data[s, i:i + points] for s in range(series_count)]
+
+
+def bench_replot(series_count, points, frame_count):
+    """Old path: clear the axes and plot every series again"""
+    canvas = make_canvas()
+    elapsed = []
+    for _, times, values in frames(series_count, points, frame_count):
+        start = time.perf_counter()
+        canvas.axes.clear()
+        canvas.axes.grid(True)
+        for s, column in enumerate(values):
+            canvas.axes.plot(times, column, label=f"series {s}")
+        canvas.axes.legend(loc='upper left')
+        canvas.figure.tight_layout()
+        canvas.draw()
+        elapsed.append(time.perf_counter() - start)
+    return elapsed
+
+
+def bench_live(series_count, points, frame_count, decimate=False):
+    """New path: persistent artists, blitting within the current limits"""
+    canvas = make_canvas()
+    chart = LiveChart(canvas, "bench", "Time")
+    elapsed = []
+    for end_index, times, values in frames(series_count, points, frame_count):
+        start = time.perf_counter()
+        chart.update(times, [(f"series {s}", column, f"series {s}", {}) for s, column in enumerate(values)],
+                     end_index if decimate else None)
+        elapsed.append(time.perf_counter() - start)
+    return elapsed, chart.full_draws
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-p", "--points", type=int, default=600, help="points per series (default: 600)")
+    parser.add_argument("-f", "--frames", type=int, default=100, help="frames per run (default: 100)")
+    args = parser.parse_args()
+    # Large legends don't fit the small figure, which is irrelevant for timing
+    warnings.filterwarnings("ignore", "Tight layout not applied")
+
+    print(f"{'series':>6} {'replot ms/frame':>16} {'live ms/frame':>14} {'decimated ms/frame':>19} {'full draws':>11}")
+    for series_count in (1, 5, 20, 50):
+        replot = bench_replot(series_count, args.points, args.frames)
+        live, _ = bench_live(series_count, args.points, args.frames)
+        decimated, full_draws = bench_live(series_count, args.points, args.frames, decimate=True)
+        print(f"{series_count:>6} {np.median(replot) * 1000:>16.2f} {np.median(live) * 1000:>14.2f} "
+              f"{np.median(decimated) * 1000:>19.2f} {full_draws:>8}/{args.frames}")
+
+
+if __name__ == "__main__":
+    main()
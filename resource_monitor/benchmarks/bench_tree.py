@@ -0,0 +1,84 @@
+"""Compare subtree rollups in one linear pass with walking up from every process
+
+Run from anywhere: python resource_monitor/benchmarks/bench_tree.py
+Builds synthetic process tables where each process's parent is a random
+earlier process (the bushy trees of real hosts) or the previous one (a
+chain, the worst case for walking up), then times building a ProcessTree
+and summing CPU over every subtree against adding each process's CPU to all
+of its ancestors. Walks that would take too long are skipped.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from resource_monitor.proctree import ProcessTree
+
+# Ancestor steps above which the walking approach is not run
+MAX_STEPS = 50_000_000
+
+
+def build_table(count, shape, seed=0):
+    """Return (pids, ppids, cpu) of count processes shaped as a random tree or a chain"""
+    rng = random.Random(seed)
+    pids = list(range(1, count + 1))
+    if shape == "chain":
+        ppids = [pid - 1 for pid in pids]
+    else:
+        ppids = [rng.randrange(0, pid) for pid in pids]
+    cpu = [rng.random() * 10 for _ in pids]
+    return pids, ppids, cpu
+
+
+def walk_up(pids, ppids, cpu):
+    """Add every process's CPU to itself and all of its ancestors"""
+    rows = {pid: row for row, pid in enumerate(pids)}
+    totals = list(cpu)
+    for row in range(len(pids)):
+        parent = rows.get(ppids[row])
+        while parent is not None:
+            totals[parent] += cpu[row]
+            parent = rows.get(ppids[parent])
+    return totals
+
+
+def depth_sum(tree):
+    """Return the number of ancestor steps walk_up() takes"""
+    depths = [0] * len(tree)
+    for row in tree.order:
+        parent = tree.parents[row]
+        if parent >= 0:
+            depths[row] = depths[parent] + 1
+    return sum(depths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-p", "--processes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="process table sizes (default: 1000 10000 100000)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="runs per measurement (default: 5)")
+    args = parser.parse_args()
+
+    print(f"{'processes':>10} {'shape':>7} {'linear ms':>10} {'walk ms':>10}")
+    for count in args.processes:
+        for shape in ("random", "chain"):
+            pids, ppids, cpu = build_table(count, shape)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                tree = ProcessTree(pids, ppids)
+                totals = tree.rollup(cpu)
+            linear = (time.perf_counter() - start) / args.repeat * 1000
+
+            walk = "-"
+            if depth_sum(tree) <= MAX_STEPS:
+                start = time.perf_counter()
+                expected = walk_up(pids, ppids, cpu)
+                walk = f"{(time.perf_counter() - start) * 1000:.1f}"
+                assert all(abs(a - b) < 1e-6 * max(1.0, abs(b)) for a, b in zip(totals, expected))
+            print(f"{count:>10} {shape:>7} {linear:>10.1f} {walk:>10}")
+
+
+if __name__ == "__main__":
+    main()
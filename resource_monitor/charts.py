@@ -0,0 +1,174 @@
+"""Incremental matplotlib rendering for the live charts
+
+Clearing the axes and re-plotting every series each tick also rebuilds the
+legend, the tick labels and the layout. LiveChart keeps one Line2D per
+series and only moves its data with set_data(). The static parts (axes,
+grid, ticks, legend) are rendered once into a cached background; as long as
+the new data fits the current limits a frame is just "restore background,
+draw the lines, blit the axes". A full redraw only happens when the limits
+have to grow, the set of series or their labels change, or the canvas was
+resized.
+
+With the absolute sample index passed to update(), every series is first
+reduced to about two points per pixel column by a MinMaxDecimator, so the
+cost of a frame no longer depends on the length of the history.
+
+This module needs matplotlib and is only imported by the GUI front-ends.
+"""
+import numpy as np
+import matplotlib.dates as mdates
+
+from resource_monitor.downsample import MinMaxDecimator
+
+# Default line colors, cycled per series
+COLORS = ['b', 'g', 'r', 'c', 'm', 'y', 'k', 'tab:orange', 'tab:purple', 'tab:brown']
+
+# Fraction of the visible span added as headroom when limits have to grow
+HEADROOM = 0.1
+
+
+class LiveChart:
+    """Persistent line artists of one axes, updated by blitting"""
+
+    def __init__(self, canvas, title, xlabel, tz=None, legend_kwargs=None, blit=True, decimate=True):
+        self.canvas = canvas
+        self.axes = canvas.axes
+        self.legend_kwargs = legend_kwargs or {'loc': 'upper left'}
+        self.blit = blit and getattr(canvas, 'supports_blit', False)
+        self.lines = {}  # name -> Line2D
+        self.labels = {}  # name -> legend text
+        self.decimate = decimate
+        self.decimators = {}  # name -> MinMaxDecimator
+        self.background = None
+        self.needs_full_draw = True
+        self.layout_dirty = True  # Legend changed, the layout must be recomputed
+        self.full_draws = 0
+
+        self.axes.set_title(title)
+        self.axes.set_xlabel(xlabel)
+        self.axes.grid(True)
+        self.axes.xaxis.set_major_formatter(mdates.DateFormatter("%H:%M:%S", tz=tz))
+        self.axes.tick_params(axis='x', rotation=45)
+        self.axes.set_ylim(0, 1)
+        canvas.mpl_connect('draw_event', self._on_draw)
+
+    def update(self, times, series, end_index=None):
+        """Show new data; series is a list of (name, values, label, style) tuples
+
+        end_index is the absolute index after the newest point (HistoryStore.count);
+        when given, series are decimated to the pixel width of the axes.
+        """
+        self._sync_lines(series)
+        if self.decimate and end_index is not None:
+            # About one min/max pair per pixel column
+            buckets = max(int(self.axes.bbox.width), 1)
+            reduced = []
+            for name, values, label, style in series:
+                decimator = self.decimators.setdefault(name, MinMaxDecimator(buckets))
+                line_times, line_values = decimator.decimate(times, values, end_index, buckets)
+                self.lines[name].set_data(line_times, line_values)
+                reduced.append((name, line_values, label, style))
+            series = reduced
+        else:
+            for name, values, _, _ in series:
+                self.lines[name].set_data(times, values)
+
+        if self._update_limits(times, series) or self.needs_full_draw or not self.blit:
+            self._full_draw()
+        else:
+            self._blit_lines()
+
+    def clear(self):
+        """Remove all lines, e.g. when monitoring restarts"""
+        for line in self.lines.values():
+            line.remove()
+        self.lines = {}
+        self.labels = {}
+        self.decimators = {}
+        legend = self.axes.get_legend()
+        if legend is not None:
+            legend.remove()
+        self.axes.set_ylim(0, 1)
+        self.needs_full_draw = True
+
+    def _sync_lines(self, series):
+        """Create, remove and relabel lines to match the series list"""
+        names = [name for name, _, _, _ in series]
+        for name in list(self.lines):
+            if name not in names:
+                self.lines.pop(name).remove()
+                self.labels.pop(name)
+                self.decimators.pop(name, None)
+                self.needs_full_draw = True
+
+        for i, (name, _, label, style) in enumerate(series):
+            line = self.lines.get(name)
+            if line is None:
+                style = dict(style or {})
+                style.setdefault('color', COLORS[i % len(COLORS)])
+                line, = self.axes.plot([], [], label=label, animated=self.blit, **style)
+                self.lines[name] = line
+                self.labels[name] = label
+                self.needs_full_draw = True
+            elif self.labels[name] != label:
+                line.set_label(label)
+                self.labels[name] = label
+                self.needs_full_draw = True
+
+        if self.needs_full_draw:
+            self.layout_dirty = True
+            if self.lines:
+                self.axes.legend(**self.legend_kwargs)
+            elif self.axes.get_legend() is not None:
+                self.axes.get_legend().remove()
+
+    def _update_limits(self, times, series):
+        """Grow or shift the axis limits when the data leaves them, return True if changed"""
+        if not len(times):
+            return False
+        changed = False
+
+        first, last = times[0], times[-1]
+        x0, x1 = self.axes.get_xlim()
+        if self.needs_full_draw or last > x1 or first < x0:
+            span = max(last - first, 1e-6)
+            self.axes.set_xlim(first, last + span * HEADROOM)
+            changed = True
+
+        peak = 0.0
+        for _, values, _, _ in series:
+            if len(values) and not np.isnan(values).all():
+                peak = max(peak, float(np.nanmax(values)))
+        y0, y1 = self.axes.get_ylim()
+        # Grow when the data exceeds the limit, shrink once it uses less than half
+        if peak > y1 or (peak > 0 and peak < y1 * 0.5 * (1 - HEADROOM)):
+            self.axes.set_ylim(0, max(peak * (1 + 2 * HEADROOM), 1e-6))
+            changed = True
+        return changed
+
+    def _full_draw(self):
+        """Redraw everything; _on_draw then caches the background"""
+        self.needs_full_draw = False
+        self.full_draws += 1
+        if self.layout_dirty:
+            self.canvas.figure.tight_layout()
+            self.layout_dirty = False
+        self.canvas.draw()
+
+    def _on_draw(self, event):
+        """Cache the background after every full draw, then put the lines on top"""
+        if not self.blit:
+            return
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        for line in self.lines.values():
+            self.axes.draw_artist(line)
+
+    def _blit_lines(self):
+        """Restore the cached background and draw only the lines"""
+        if self.background is None:
+            self._full_draw()
+            return
+        self.canvas.restore_region(self.background)
+        for line in self.lines.values():
+            self.axes.draw_artist(line)
+        self.canvas.blit(self.axes.bbox)
@@ -0,0 +1,384 @@
+"""Rule-based process classification for the process picker
+
+Every process is put in the Applications category or not, and is either a
+user or a system process. Rules decide, one per line in the form
+``<category> <kind>:<pattern>``:
+
+    application name:*.exe          process name, substring or wildcard
+    application exe:/opt/*          executable path, substring or wildcard
+    application cmdline:--app=      command line, substring or wildcard
+    application desktop:            launched by an installed .desktop entry
+    application window:             owns a visible top-level window (Windows)
+    system uid:0-999                real UID in a range, "1000-" is open-ended
+    system cgroup:system.slice      /proc/[pid]/cgroup contains the text (Linux)
+    user user:@current              owner name, @current is the logged-in user
+
+Any matching application rule marks an application. For the owner the first
+matching system or user rule wins, and processes no rule claims are system
+processes. DEFAULT_RULES is used unless a rules file exists at RULES_PATH.
+
+Classifying needs the executable, command line, owner and cgroup of a
+process, which cost several system calls each. ProcessClassifier memoizes
+the result per (pid, create_time), so a process is classified once in its
+lifetime and a refresh only looks at processes that started since the last
+one. Fields no rule uses are never read. window: rules are the exception,
+a process can map its first window long after it started: for them only
+the static rules' matches are memoized, and the window rules are checked
+on every classify() against the window list, which is re-read every
+WINDOW_CACHE_SECONDS.
+"""
+import fnmatch
+import os
+import re
+import shlex
+import sys
+import time
+
+import psutil
+
+from resource_monitor.sampler import current_username
+
+# Category bits of a process
+CATEGORY_APPLICATION = 1
+CATEGORY_SYSTEM = 2
+CATEGORY_USER = 4
+
+CATEGORIES = {
+    'application': CATEGORY_APPLICATION,
+    'system': CATEGORY_SYSTEM,
+    'user': CATEGORY_USER,
+}
+
+# Rule kinds and the process field each one looks at
+RULE_KINDS = {
+    'name': 'name',
+    'exe': 'exe',
+    'cmdline': 'cmdline',
+    'desktop': 'exe',
+    'window': 'pid',
+    'uid': 'uid',
+    'user': 'username',
+    'cgroup': 'cgroup',
+}
+
+DEFAULT_RULES = [
+    # Common application extensions
+    'application name:*.exe',
+    'application name:*.app',
+    'application name:*.jar',
+    'application name:*.pyw',
+    # Common application names
+    'application name:chrome',
+    'application name:firefox',
+    'application name:explorer',
+    'application name:word',
+    'application name:excel',
+    'application name:powerpoint',
+    'application name:notepad',
+    'application name:photoshop',
+    'application name:premiere',
+    'application name:aftereffects',
+    'application name:vscode',
+    'application name:sublime',
+    # Installed desktop applications and anything showing a window
+    'application desktop:',
+    'application window:',
+    # Services started by systemd run as system processes, whoever owns them
+    'system cgroup:/system.slice/',
+    'user user:@current',
+]
+
+# Per-user rules file, replaces DEFAULT_RULES when present
+RULES_PATH = os.path.join(os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config'),
+                          'resource_monitor', 'classify.rules')
+
+# Rule kinds whose result changes during a process's lifetime, never memoized
+DYNAMIC_KINDS = ('window',)
+
+# Seconds the list of windows is reused while classifying
+WINDOW_CACHE_SECONDS = 5.0
+
+_WILDCARD_CHARS = set('*?[')
+
+# Cached win32gui and win32process modules, False once the import has failed
+_win32 = None
+
+
+def _load_win32():
+    """Import the win32 extensions on first use, return None when they are not installed"""
+    global _win32
+    if _win32 is None:
+        try:
+            import win32gui
+            import win32process
+            _win32 = (win32gui, win32process)
+        except Exception:
+            _win32 = False
+    return _win32 or None
+
+
+def window_pids():
+    """Return the PIDs owning a visible top-level window, empty where this can't be read"""
+    win32 = _load_win32()
+    if win32 is None:
+        return set()
+    win32gui, win32process = win32
+    pids = set()
+
+    def add_window(hwnd, _):
+        if win32gui.IsWindowVisible(hwnd) and win32gui.GetWindowText(hwnd):
+            pids.add(win32process.GetWindowThreadProcessId(hwnd)[1])
+        return True
+
+    try:
+        win32gui.EnumWindows(add_window, None)
+    except Exception:
+        return set()
+    return pids
+
+
+def desktop_dirs():
+    """Return the XDG directories holding .desktop entries"""
+    data_home = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'share')
+    data_dirs = (os.environ.get('XDG_DATA_DIRS') or '/usr/local/share:/usr/share').split(':')
+    return [os.path.join(directory, 'applications') for directory in [data_home] + data_dirs if directory]
+
+
+def desktop_executables(directories=None):
+    """Return the lowercase executable names and paths launched by .desktop entries"""
+    executables = set()
+    for directory in desktop_dirs() if directories is None else directories:
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                if not file_name.endswith('.desktop'):
+                    continue
+                try:
+                    with open(os.path.join(root, file_name), encoding='utf-8', errors='replace') as f:
+                        lines = [line for line in f if line.startswith(('Exec=', 'TryExec='))]
+                except OSError:
+                    continue
+                for line in lines:
+                    try:
+                        args = shlex.split(line.partition('=')[2])
+                    except ValueError:
+                        continue
+                    # Skip "env VAR=value" wrappers
+                    while args and (args[0] == 'env' or '=' in args[0]):
+                        args.pop(0)
+                    if args:
+                        executables.add(args[0].lower())
+                        executables.add(os.path.basename(args[0]).lower())
+    return executables
+
+
+def read_cgroup(pid):
+    """Return the contents of /proc/[pid]/cgroup, or None where there is none"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        with open(f'/proc/{pid}/cgroup', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class Rule:
+    """One classification rule"""
+
+    def __init__(self, category, kind, pattern=''):
+        if category not in CATEGORIES:
+            raise ValueError(f"Unknown category {category!r}, expected one of {', '.join(CATEGORIES)}")
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Unknown rule kind {kind!r}, expected one of {', '.join(RULE_KINDS)}")
+        self.category = category
+        self.kind = kind
+        self.pattern = pattern
+        self.field = RULE_KINDS[kind]
+        self.regex = None
+        self.uid_range = None
+        if kind == 'uid':
+            self.uid_range = self._parse_range(pattern)
+        elif kind in ('name', 'exe', 'cmdline') and _WILDCARD_CHARS & set(pattern):
+            # fnmatch.translate anchors the pattern to the whole field
+            self.regex = re.compile(fnmatch.translate(pattern.lower()), re.IGNORECASE)
+        elif kind in ('name', 'exe', 'cmdline', 'cgroup', 'user') and not pattern:
+            raise ValueError(f"Empty pattern in rule {self}")
+
+    def __str__(self):
+        return f"{self.category} {self.kind}:{self.pattern}"
+
+    def _parse_range(self, pattern):
+        """Parse "0-999", "1000-", "-99" or "0" into an inclusive (low, high) range"""
+        low, sep, high = pattern.partition('-')
+        try:
+            low = int(low) if low.strip() else 0
+            high = (int(high) if high.strip() else None) if sep else low
+        except ValueError:
+            raise ValueError(f"Invalid UID range in rule {self}")
+        return low, high
+
+    def matches(self, values, context):
+        """Return True when the rule applies to a process's field values"""
+        value = values.get(self.field)
+        if self.kind == 'window':
+            return value in context.window_pids()
+        if self.kind == 'desktop':
+            # The name stands in for executables that can't be read
+            executables = context.desktop_executables()
+            if value is None:
+                return (values.get('name') or '').lower() in executables
+            exe = value.lower()
+            return exe in executables or os.path.basename(exe) in executables
+        if value is None:
+            return False
+        if self.kind == 'uid':
+            low, high = self.uid_range
+            return value >= low and (high is None or value <= high)
+        if self.kind == 'user':
+            pattern = context.current_user if self.pattern == '@current' else self.pattern
+            return value == pattern
+        if self.regex is not None:
+            return self.regex.match(value) is not None
+        return self.pattern.lower() in value.lower()
+
+
+def parse_rule(text):
+    """Parse "<category> <kind>:<pattern>" into a Rule, raise ValueError if it is invalid"""
+    category, _, selector = text.strip().partition(' ')
+    kind, sep, pattern = selector.strip().partition(':')
+    if not sep:
+        raise ValueError(f"Invalid rule {text!r}, expected \"<category> <kind>:<pattern>\"")
+    return Rule(category, kind, pattern.strip())
+
+
+def load_rules(path):
+    """Read rules from a file, one per line, blank lines and # comments are skipped"""
+    rules = []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                rules.append(parse_rule(line))
+            except ValueError as e:
+                raise ValueError(f"{path}, line {number}: {e}")
+    return rules
+
+
+def configured_rules():
+    """Return the rules from RULES_PATH if it exists, otherwise the default rules"""
+    if os.path.exists(RULES_PATH):
+        try:
+            return load_rules(RULES_PATH)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring classification rules: {e}")
+    return [parse_rule(rule) for rule in DEFAULT_RULES]
+
+
+class ProcessClassifier:
+    """Category bits of processes, computed once per (pid, create_time)"""
+
+    def __init__(self, rules=None, current_user=None):
+        rules = configured_rules() if rules is None else rules
+        self.rules = [parse_rule(rule) if isinstance(rule, str) else rule for rule in rules]
+        self.current_user = current_user if current_user is not None else current_username()
+        self.cache = {}  # (pid, create_time) -> category bits, or indexes of matching static rules
+        self.dynamic = {index for index, rule in enumerate(self.rules) if rule.kind in DYNAMIC_KINDS}
+        self.classified = 0
+        # Only read the fields some rule looks at
+        self.fields = {'name'} | {rule.field for rule in self.rules}
+        self._desktop_executables = None
+        self._window_pids = None
+        self._window_time = 0.0
+
+    def desktop_executables(self):
+        """Executables of the installed .desktop entries, read once"""
+        if self._desktop_executables is None:
+            self._desktop_executables = desktop_executables()
+        return self._desktop_executables
+
+    def window_pids(self):
+        """PIDs owning a visible window, re-read every WINDOW_CACHE_SECONDS"""
+        now = time.monotonic()
+        if self._window_pids is None or now - self._window_time >= WINDOW_CACHE_SECONDS:
+            self._window_pids = window_pids()
+            self._window_time = now
+        return self._window_pids
+
+    def classify(self, proc, info=None):
+        """Return the category bits of a psutil.Process, from the cache when known
+
+        info may hold fields already read, e.g. proc.info from process_iter().
+        """
+        info = info or {}
+        pid = info.get('pid', proc.pid)
+        create_time = info.get('create_time')
+        if create_time is None:
+            create_time = proc.create_time()
+        key = (pid, create_time)
+        cached = self.cache.get(key)
+        if cached is None:
+            values = self._read_values(proc, info)
+            if not self.dynamic:
+                cached = self.cache[key] = self.classify_values(values)
+            else:
+                self.classified += 1
+                cached = self.cache[key] = frozenset(
+                    index for index, rule in enumerate(self.rules)
+                    if index not in self.dynamic and rule.matches(values, self))
+        if not self.dynamic:
+            return cached
+        # Window rules only look at the pid
+        dynamic_values = {'pid': pid}
+        return self._categories(lambda index, rule: index in cached or
+                                (index in self.dynamic and rule.matches(dynamic_values, self)))
+
+    def classify_values(self, values):
+        """Return the category bits of a process from a dict of its field values"""
+        self.classified += 1
+        return self._categories(lambda index, rule: rule.matches(values, self))
+
+    def _categories(self, matches):
+        """Combine the rules for which matches(index, rule) is True into category bits"""
+        categories = 0
+        owner = None
+        for index, rule in enumerate(self.rules):
+            bit = CATEGORIES[rule.category]
+            if bit == CATEGORY_APPLICATION:
+                if not categories & CATEGORY_APPLICATION and matches(index, rule):
+                    categories |= CATEGORY_APPLICATION
+            elif owner is None and matches(index, rule):
+                owner = bit
+        return categories | (owner or CATEGORY_SYSTEM)
+
+    def _read_values(self, proc, info):
+        """Read the fields the rules need, reusing those already in info"""
+        values = {'pid': proc.pid}
+        with proc.oneshot():
+            for field in self.fields:
+                if field in values:
+                    continue
+                if field in info:
+                    value = info[field]
+                elif field == 'cgroup':
+                    value = read_cgroup(proc.pid)
+                else:
+                    try:
+                        if field == 'uid':
+                            value = proc.uids().real
+                        else:
+                            value = getattr(proc, field)()
+                    except (psutil.Error, AttributeError, OSError):
+                        # uids() is POSIX only, exe() and cmdline() may be denied
+                        value = None
+                if field == 'cmdline' and isinstance(value, list):
+                    value = ' '.join(value)
+                values[field] = value
+        return values
+
+    def prune(self, keys):
+        """Forget processes whose key is not in keys, i.e. that have exited"""
+        keys = set(keys)
+        for key in [key for key in self.cache if key not in keys]:
+            del self.cache[key]
@@ -0,0 +1,349 @@
+"""Memory-mapped columnar recording format (.rmc)
+
+JSON and CSV recordings have to be parsed line by line, which takes minutes
+for a multi-day capture. An .rmc file stores every (series, metric) pair as
+one fixed-width little-endian column, so ColumnarRecording can mmap the file
+and hand out NumPy views without reading or converting anything: opening a
+recording costs the same for an hour as for a week, and slicing a column
+touches only the pages that are used.
+
+Layout:
+    prefix      magic, header size, capacity, count (PREFIX, 32 bytes)
+    header      UTF-8 JSON padded with NUL bytes to header size: version,
+                metrics, series, usernames and the columns as
+                [series, metric, dtype, offset]
+    columns     one region of capacity * itemsize bytes per column; the
+                first count values are valid
+
+The timestamp column has series None. Metrics are float32 with NaN for
+missing values, pid and count are int32 with -1.
+
+ColumnarWriter grows capacity by doubling while recording (the unused tail
+is a sparse hole on most file systems) and trims the file to the recorded
+count when closed. A new series gets a column that is missing for all
+earlier samples.
+
+Columns of a series never move once laid out: the file reserves room for
+a number of series slots after the used columns, and a new series takes
+the next free slot, so only the header is rewritten. When the slots run
+out and most series haven't had a value for RETIRE_SAMPLES samples (short
+lived processes that have exited), the writer closes the file and goes on
+in a numbered segment (samples.rmc, samples.0001.rmc, ...) that holds only
+the live series; otherwise the slots double, which only extends the file.
+Rows therefore don't widen forever with every process ever seen.
+"""
+import json
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"RMCOLS\x00\x01"
+VERSION = 1
+
+# Magic, header size, capacity, count
+PREFIX = struct.Struct("<8sQQQ")
+
+PAGE_SIZE = 4096
+
+# Series slots reserved in a new file, doubled when they run out
+SERIES_SLOTS = 16
+
+# Samples without a value after which a series is left out of the next segment
+RETIRE_SAMPLES = 600
+
+TIME_COLUMN = 'timestamp'
+TIME_DTYPE = '<f8'
+
+# Stored metrics and their column types
+COLUMN_DTYPES = {
+    'cpu': '<f4',
+    'memory': '<f4',
+    'network': '<f4',
+    'disk': '<f4',
+    'gpu': '<f4',
+    'pid': '<i4',
+    'count': '<i4',
+}
+
+
+def missing_value(dtype):
+    """Value stored for a missing sample in a column of this type"""
+    return np.nan if np.dtype(dtype).kind == 'f' else -1
+
+
+def segment_path(path, index):
+    """Path of a numbered segment, samples.jsonl -> samples.0001.jsonl"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}.{index:04d}{ext}"
+
+
+class ColumnarWriter:
+    """Append samples to an .rmc file through a writable memory map"""
+
+    # Samples must be written in time order, ColumnarRecording.window() bisects the timestamps
+    ordered = True
+
+    def __init__(self, path, capacity=4096, metrics=tuple(COLUMN_DTYPES), flush_interval=5.0):
+        for metric in metrics:
+            if metric not in COLUMN_DTYPES:
+                raise ValueError(f"Unknown metric {metric!r}, expected one of {', '.join(COLUMN_DTYPES)}")
+        self.path = path
+        self.base_path = path
+        self.segment = 0
+        self.paths = [path]
+        self.metrics = tuple(metrics)
+        self.flush_interval = flush_interval
+        # Multiples of 16 keep every column 64-byte aligned
+        self.initial_capacity = max(16, -(-capacity // 16) * 16)
+        self.map = None
+        self.last_flush = time.monotonic()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._open(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def current_path(self):
+        """File samples are written to"""
+        return self.path
+
+    def write(self, timestamp, data):
+        """Append one sample {name: metrics}; series missing from it get missing values"""
+        if self.file is None:
+            raise ValueError("write to a closed recording")
+        new = [name for name in data if name not in self.usernames]
+        if new:
+            self._add_series(new)
+        if self.count == self.capacity:
+            self._relayout(self.header_size, self.capacity * 2)
+
+        row = self.count
+        self.views[(None, TIME_COLUMN)][row] = timestamp
+        for name in self.series:
+            metrics = data.get(name)
+            if metrics is not None:
+                self.last_seen[name] = row
+                if metrics.get('username'):
+                    self.usernames[name] = metrics['username']
+            for metric in self.metrics:
+                value = None if metrics is None else metrics.get(metric)
+                self.views[(name, metric)][row] = missing_value(COLUMN_DTYPES[metric]) if value is None else value
+        self.count += 1
+        self._write_prefix()
+
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write dirty pages of the map to disk"""
+        self.last_flush = time.monotonic()
+        if self.map is not None:
+            self.map.flush()
+
+    def close(self):
+        """Trim unused capacity, write the final header and close the file"""
+        if self.file is None:
+            return
+        self.slots = len(self.series)
+        self._relayout(self.header_size, max(16, -(-self.count // 16) * 16))
+        self._unmap()
+        self.file.close()
+        self.file = None
+
+    def _open(self, path):
+        """Start an empty file with no series"""
+        self.file = open(path, 'w+b')
+        self.capacity = self.initial_capacity
+        self.header_size = PAGE_SIZE
+        self.slots = SERIES_SLOTS
+        self.count = 0
+        self.series = []
+        self.usernames = {}  # series -> last seen username
+        self.last_seen = {}  # series -> last row with a value
+        self.columns = [(None, TIME_COLUMN, TIME_DTYPE)]
+        self.offsets = []
+        self.views = {}
+        self._relayout(self.header_size, self.capacity)
+
+    def _next_segment(self, live):
+        """Close the file and continue in the next numbered segment with the live series"""
+        usernames = self.usernames
+        self.close()
+        self.segment += 1
+        self.path = segment_path(self.base_path, self.segment)
+        self.paths.append(self.path)
+        self._open(self.path)
+        self._add_series(live)
+        self.usernames.update((name, usernames[name]) for name in live)
+
+    def _add_series(self, names):
+        """Give new series the next free slots, missing for all earlier samples"""
+        slots = self.slots
+        if len(self.series) + len(names) > slots:
+            live = [name for name in self.series if self.count - self.last_seen[name] <= RETIRE_SAMPLES]
+            if self.count and len(live) + len(names) <= slots // 2:
+                self._next_segment(live)
+                slots = self.slots
+            while len(self.series) + len(names) > slots:
+                slots *= 2
+        for name in names:
+            self.series.append(name)
+            self.usernames[name] = None
+            self.last_seen[name] = self.count
+            self.columns.extend((name, metric, COLUMN_DTYPES[metric]) for metric in self.metrics)
+        header_size = self.header_size
+        while len(self._header_bytes(self._offsets(header_size, self.capacity, slots))) > header_size:
+            header_size *= 2
+        if header_size == self.header_size and slots == self.slots:
+            # The slots are already laid out, existing columns stay where they are
+            self.offsets = self._offsets(header_size, self.capacity)
+            self._add_views(self.columns[-len(names) * len(self.metrics):], self.offsets[len(self.views):])
+            self._write_header()
+        else:
+            self.slots = slots
+            self._relayout(header_size, self.capacity)
+        for name in names:
+            for metric in self.metrics:
+                self.views[(name, metric)][:self.count] = missing_value(COLUMN_DTYPES[metric])
+
+    def _offsets(self, header_size, capacity, slots=None):
+        """Start of every column and the end of the free slots for a given header size and capacity"""
+        if slots is None:
+            slots = self.slots
+        offsets = []
+        offset = header_size
+        for _, _, dtype in self.columns:
+            offsets.append(offset)
+            offset += capacity * np.dtype(dtype).itemsize
+        row_size = sum(np.dtype(COLUMN_DTYPES[metric]).itemsize for metric in self.metrics)
+        offset += (slots - len(self.series)) * capacity * row_size
+        offsets.append(offset)  # End of the file
+        return offsets
+
+    def _relayout(self, header_size, capacity):
+        """Move the columns to a new header size and capacity and remap the file"""
+        offsets = self._offsets(header_size, capacity)
+        old_offsets = self.offsets[:-1]
+        growing = header_size >= self.header_size and capacity >= self.capacity
+        size = max(offsets[-1], self.offsets[-1] if self.offsets else 0)
+
+        # Unmap before resizing, Windows refuses to truncate a mapped file
+        self._unmap()
+        self.file.truncate(size)
+        self.map = np.memmap(self.file, dtype=np.uint8, mode='r+', shape=(size,))
+
+        # Columns move up when growing and down when shrinking; go in the
+        # order that never overwrites a column that hasn't been moved yet
+        moved = list(zip(self.columns, old_offsets, offsets))
+        if growing:
+            moved.reverse()
+        for (_, _, dtype), old, new in moved:
+            if old != new:
+                length = self.count * np.dtype(dtype).itemsize
+                self.map[new:new + length] = self.map[old:old + length]
+
+        if offsets[-1] < size:
+            self._unmap()
+            self.file.truncate(offsets[-1])
+            self.map = np.memmap(self.file, dtype=np.uint8, mode='r+', shape=(offsets[-1],))
+
+        self.header_size = header_size
+        self.capacity = capacity
+        self.offsets = offsets
+        self._add_views(self.columns, offsets)
+        self._write_header()
+
+    def _add_views(self, columns, offsets):
+        """Map columns starting at offsets as NumPy views"""
+        for (series, metric, dtype), offset in zip(columns, offsets):
+            dtype = np.dtype(dtype)
+            self.views[(series, metric)] = self.map[offset:offset + self.capacity * dtype.itemsize].view(dtype)
+
+    def _unmap(self):
+        """Flush and drop the memory map and all views of it"""
+        if self.map is not None:
+            self.map.flush()
+        self.views = {}
+        self.map = None
+
+    def _header_bytes(self, offsets):
+        """Prefix and JSON header"""
+        header = {
+            'version': VERSION,
+            'metrics': list(self.metrics),
+            'series': self.series,
+            'usernames': self.usernames,
+            'columns': [[series, metric, dtype, offset]
+                        for (series, metric, dtype), offset in zip(self.columns, offsets)],
+        }
+        return PREFIX.pack(MAGIC, 0, 0, 0) + json.dumps(header, ensure_ascii=False).encode('utf-8')
+
+    def _write_header(self):
+        """Rewrite the prefix and the JSON header in place"""
+        header = self._header_bytes(self.offsets)
+        self.map[:self.header_size] = 0
+        self.map[:len(header)] = np.frombuffer(header, dtype=np.uint8)
+        self._write_prefix()
+
+    def _write_prefix(self):
+        """Update the sample count, readers only trust the first count values"""
+        prefix = PREFIX.pack(MAGIC, self.header_size, self.capacity, self.count)
+        self.map[:PREFIX.size] = np.frombuffer(prefix, dtype=np.uint8)
+
+
+class ColumnarRecording:
+    """Read-only view of an .rmc file; columns are NumPy views of the memory map"""
+
+    def __init__(self, path):
+        self.path = path
+        self.map = np.memmap(path, dtype=np.uint8, mode='r')
+        if len(self.map) < PREFIX.size:
+            raise ValueError(f"{path} is not a columnar recording")
+        magic, header_size, self.capacity, self.count = PREFIX.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a columnar recording")
+        header = json.loads(bytes(self.map[PREFIX.size:header_size]).rstrip(b"\x00").decode('utf-8'))
+        if header['version'] != VERSION:
+            raise ValueError(f"Unsupported columnar recording version {header['version']}")
+
+        self.metrics = header['metrics']
+        self.series = header['series']
+        self.usernames = header['usernames']
+        self.columns = {}
+        for series, metric, dtype, offset in header['columns']:
+            dtype = np.dtype(dtype)
+            self.columns[(series, metric)] = self.map[offset:offset + self.count * dtype.itemsize].view(dtype)
+        self.times = self.columns[(None, TIME_COLUMN)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def column(self, series, metric, start=None, stop=None):
+        """Values of one metric of a series as a view, optionally sliced by index"""
+        return self.columns[(series, metric)][start:stop]
+
+    def window(self, start_time=None, end_time=None):
+        """Index slice of the samples with start_time <= timestamp < end_time"""
+        start = 0 if start_time is None else int(np.searchsorted(self.times, start_time, 'left'))
+        stop = self.count if end_time is None else int(np.searchsorted(self.times, end_time, 'left'))
+        return slice(start, stop)
+
+    def close(self):
+        """Release the memory map; views handed out before keep it alive"""
+        self.columns = {}
+        self.times = None
+        self.map = None
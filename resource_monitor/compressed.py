@@ -0,0 +1,423 @@
+"""Compressed long-term history (Gorilla encoding)
+
+HistoryStore keeps 8 bytes per value so that plotting gets zero-copy views,
+which limits it to the recent past. CompressedHistory keeps days of samples
+in a fraction of the memory with the encoding of Facebook's Gorilla TSDB:
+
+    timestamps  rounded to milliseconds and stored as delta-of-deltas; a
+                steady sampling interval costs 1 bit, normal jitter 9 bits
+    values      XOR of each float64 with the previous one of its column;
+                an unchanged value costs 1 bit, a small change only its
+                meaningful bits
+
+Samples are grouped into chunks of chunk_size. The chunk being filled is
+encoded incrementally; full chunks are sealed into immutable byte strings.
+A time-window query only decodes the chunks that overlap the window, and
+retention drops whole sealed chunks. Slowly varying metrics (memory, idle
+network and disk, GPU) typically shrink 10x or more; busy CPU percentages
+less.
+
+The read API matches HistoryStore (names, times(), series(), label_series(),
+latest()), with optional time windows instead of a point count, so export
+code works with either store. pid and username labels are run-length
+encoded since they rarely change.
+"""
+import numpy as np
+
+from resource_monitor.history import LABELS, METRICS
+
+# Samples per chunk
+CHUNK_SIZE = 1024
+
+MASK64 = (1 << 64) - 1
+
+NAN_BITS = int(np.array(np.nan).view(np.uint64))
+
+
+class BitWriter:
+    """Append bit fields to a growing byte string"""
+
+    __slots__ = ('data', 'acc', 'bits')
+
+    def __init__(self):
+        self.data = bytearray()
+        self.acc = 0  # Bits not yet forming a full byte
+        self.bits = 0
+
+    def write(self, value, nbits):
+        """Append the nbits low bits of a non-negative value"""
+        self.acc = (self.acc << nbits) | value
+        self.bits += nbits
+        while self.bits >= 8:
+            self.bits -= 8
+            self.data.append((self.acc >> self.bits) & 0xFF)
+        self.acc &= (1 << self.bits) - 1
+
+    def getvalue(self):
+        """Written bits as bytes, the last byte padded with zeros"""
+        if self.bits:
+            return bytes(self.data) + bytes([(self.acc << (8 - self.bits)) & 0xFF])
+        return bytes(self.data)
+
+    @property
+    def nbytes(self):
+        return len(self.data) + 1
+
+
+class BitReader:
+    """Read bit fields written by BitWriter"""
+
+    __slots__ = ('data', 'pos', 'acc', 'bits')
+
+    def __init__(self, data):
+        self.data = data + bytes(9)  # Padding, reads never run past the end
+        self.pos = 0
+        self.acc = 0
+        self.bits = 0
+
+    def read(self, nbits):
+        """Return the next nbits as a non-negative int"""
+        while self.bits < nbits:
+            self.acc = (self.acc << 8) | self.data[self.pos]
+            self.pos += 1
+            self.bits += 8
+        self.bits -= nbits
+        value = self.acc >> self.bits
+        self.acc &= (1 << self.bits) - 1
+        return value
+
+
+class TimestampEncoder:
+    """Delta-of-delta encoding of millisecond timestamps"""
+
+    __slots__ = ('writer', 'previous', 'delta', 'count')
+
+    def __init__(self):
+        self.writer = BitWriter()
+        self.previous = 0
+        self.delta = 0
+        self.count = 0
+
+    def append(self, ms):
+        writer = self.writer
+        if self.count == 0:
+            writer.write(ms & MASK64, 64)
+        else:
+            delta = ms - self.previous
+            dod = delta - self.delta
+            if dod == 0:
+                writer.write(0, 1)
+            elif -63 <= dod <= 64:
+                writer.write(0b10, 2)
+                writer.write(dod + 63, 7)
+            elif -255 <= dod <= 256:
+                writer.write(0b110, 3)
+                writer.write(dod + 255, 9)
+            elif -2047 <= dod <= 2048:
+                writer.write(0b1110, 4)
+                writer.write(dod + 2047, 12)
+            else:
+                writer.write(0b1111, 4)
+                writer.write(dod & MASK64, 64)
+            self.delta = delta
+        self.previous = ms
+        self.count += 1
+
+
+def decode_timestamps(data, count):
+    """Decode count timestamps in seconds"""
+    reader = BitReader(data)
+    read = reader.read
+    out = np.empty(count, dtype=np.int64)
+    if not count:
+        return out.astype(np.float64)
+    previous = read(64)
+    if previous >= 1 << 63:
+        previous -= 1 << 64
+    out[0] = previous
+    delta = 0
+    for i in range(1, count):
+        if not read(1):
+            dod = 0
+        elif not read(1):
+            dod = read(7) - 63
+        elif not read(1):
+            dod = read(9) - 255
+        elif not read(1):
+            dod = read(12) - 2047
+        else:
+            dod = read(64)
+            if dod >= 1 << 63:
+                dod -= 1 << 64
+        delta += dod
+        previous += delta
+        out[i] = previous
+    return out / 1000.0
+
+
+class XorEncoder:
+    """XOR encoding of float64 bit patterns"""
+
+    __slots__ = ('writer', 'previous', 'leading', 'trailing', 'count')
+
+    def __init__(self):
+        self.writer = BitWriter()
+        self.previous = 0
+        self.leading = -1  # No bit window yet
+        self.trailing = 0
+        self.count = 0
+
+    def append(self, bits):
+        writer = self.writer
+        if self.count == 0:
+            writer.write(bits, 64)
+        else:
+            xor = bits ^ self.previous
+            if xor == 0:
+                writer.write(0, 1)
+            else:
+                leading = min(64 - xor.bit_length(), 31)
+                trailing = (xor & -xor).bit_length() - 1
+                if self.leading >= 0 and leading >= self.leading and trailing >= self.trailing:
+                    # Fits the previous window of meaningful bits
+                    writer.write(0b10, 2)
+                    writer.write(xor >> self.trailing, 64 - self.leading - self.trailing)
+                else:
+                    meaningful = 64 - leading - trailing
+                    writer.write(0b11, 2)
+                    writer.write(leading, 5)
+                    writer.write(meaningful & 63, 6)  # 64 is stored as 0
+                    writer.write(xor >> trailing, meaningful)
+                    self.leading = leading
+                    self.trailing = trailing
+        self.previous = bits
+        self.count += 1
+
+
+def decode_values(data, count):
+    """Decode count float64 values"""
+    reader = BitReader(data)
+    read = reader.read
+    out = np.empty(count, dtype=np.uint64)
+    if not count:
+        return out.view(np.float64)
+    previous = read(64)
+    out[0] = previous
+    leading = trailing = 0
+    for i in range(1, count):
+        if read(1):
+            if read(1):
+                leading = read(5)
+                meaningful = read(6) or 64
+                trailing = 64 - leading - meaningful
+            previous ^= read(64 - leading - trailing) << trailing
+        out[i] = previous
+    return out.view(np.float64)
+
+
+class Chunk:
+    """Up to chunk_size samples; encoders while open, bytes once sealed"""
+
+    __slots__ = ('first', 'start', 'end', 'count', 'times', 'columns', 'sealed')
+
+    def __init__(self, first):
+        self.first = first  # Absolute index of the first sample
+        self.start = None  # First and last timestamp in seconds
+        self.end = None
+        self.count = 0
+        self.times = TimestampEncoder()
+        self.columns = {}  # name -> list of XorEncoder (open) or bytes (sealed), one per metric
+        self.sealed = False
+
+    def seal(self):
+        """Freeze the encoders into byte strings"""
+        self.times = self.times.writer.getvalue()
+        self.columns = {name: [encoder.writer.getvalue() for encoder in encoders]
+                        for name, encoders in self.columns.items()}
+        self.sealed = True
+
+    def time_data(self):
+        return self.times if self.sealed else self.times.writer.getvalue()
+
+    def column_data(self, name, index):
+        """Encoded values of one metric, None if the series has no values in this chunk"""
+        column = self.columns.get(name)
+        if column is None:
+            return None
+        return column[index] if self.sealed else column[index].writer.getvalue()
+
+    @property
+    def nbytes(self):
+        if self.sealed:
+            return len(self.times) + sum(len(data) for column in self.columns.values() for data in column)
+        return self.times.writer.nbytes + sum(encoder.writer.nbytes for column in self.columns.values()
+                                              for encoder in column)
+
+
+class CompressedHistory:
+    """Long-retention history of many series, Gorilla-compressed in chunks"""
+
+    def __init__(self, retention=None, chunk_size=CHUNK_SIZE, metrics=METRICS):
+        self.retention = retention  # Seconds of history to keep, None keeps everything
+        self.chunk_size = chunk_size
+        self.metrics = tuple(metrics)
+        self.metric_index = {metric: i for i, metric in enumerate(self.metrics)}
+        self.clear()
+
+    def __len__(self):
+        return self.count - self.chunks[0].first if self.chunks else 0
+
+    def __contains__(self, name):
+        return name in self.labels
+
+    @property
+    def names(self):
+        """Series names in insertion order"""
+        return list(self.labels)
+
+    @property
+    def nbytes(self):
+        """Memory held by the encoded chunks"""
+        return sum(chunk.nbytes for chunk in self.chunks)
+
+    @property
+    def raw_nbytes(self):
+        """Memory the same points would take as float64 columns"""
+        return len(self) * 8 * (1 + len(self.labels) * len(self.metrics))
+
+    def clear(self):
+        """Drop all data"""
+        self.chunks = []
+        self.count = 0  # Samples appended since the last clear
+        self.labels = {}  # name -> list of [first index, pid, username] runs
+
+    def add_series(self, name):
+        """Create an empty series"""
+        if name not in self.labels:
+            self.labels[name] = []
+
+    def remove_series(self, name):
+        """Forget a series"""
+        self.labels.pop(name, None)
+        for chunk in self.chunks:
+            chunk.columns.pop(name, None)
+
+    def append(self, timestamp, data):
+        """Append one sample {name: metrics dict}; series missing from it get NaN"""
+        for name in data:
+            self.add_series(name)
+        chunk = self.chunks[-1] if self.chunks else None
+        if chunk is None or chunk.count == self.chunk_size:
+            if chunk is not None:
+                chunk.seal()
+            chunk = Chunk(self.count)
+            self.chunks.append(chunk)
+            self._expire(timestamp)
+
+        chunk.times.append(int(round(timestamp * 1000)))
+        if chunk.start is None:
+            chunk.start = timestamp
+        chunk.end = timestamp
+
+        # Bit patterns of all values in one conversion
+        names = list(self.labels)
+        values = np.full((len(names), len(self.metrics)), np.nan)
+        for i, name in enumerate(names):
+            metrics = data.get(name)
+            if metrics is not None:
+                values[i] = [np.nan if metrics.get(metric) is None else metrics[metric] for metric in self.metrics]
+        bits = values.view(np.uint64).tolist()
+
+        for name, row in zip(names, bits):
+            encoders = chunk.columns.get(name)
+            if encoders is None:
+                # The series is new in this chunk, earlier samples are NaN
+                encoders = chunk.columns[name] = [XorEncoder() for _ in self.metrics]
+                for encoder in encoders:
+                    for _ in range(chunk.count):
+                        encoder.append(NAN_BITS)
+            for encoder, value in zip(encoders, row):
+                encoder.append(value)
+
+            metrics = data.get(name)
+            label = [None if metrics is None else metrics.get(key) for key in LABELS]
+            runs = self.labels[name]
+            if not runs or runs[-1][1:] != label:
+                runs.append([self.count] + label)
+        chunk.count += 1
+        self.count += 1
+
+    def _expire(self, now):
+        """Drop sealed chunks that ended before the retention window"""
+        if self.retention is None:
+            return
+        while len(self.chunks) > 1 and self.chunks[0].sealed and self.chunks[0].end < now - self.retention:
+            self.chunks.pop(0)
+        first = self.chunks[0].first
+        for runs in self.labels.values():
+            # Keep the run that is current at the first retained sample
+            while len(runs) > 1 and runs[1][0] <= first:
+                runs.pop(0)
+
+    def _chunks(self, start_time, end_time):
+        """Chunks overlapping [start_time, end_time]"""
+        return [chunk for chunk in self.chunks if chunk.count and
+                (start_time is None or chunk.end >= start_time) and
+                (end_time is None or chunk.start <= end_time)]
+
+    def _mask(self, times, start_time, end_time):
+        """Positions of the times inside the window"""
+        mask = np.ones(len(times), dtype=bool)
+        if start_time is not None:
+            mask &= times >= start_time
+        if end_time is not None:
+            mask &= times <= end_time
+        return mask
+
+    def times(self, start_time=None, end_time=None):
+        """Timestamps in the window, all retained ones by default"""
+        parts = []
+        for chunk in self._chunks(start_time, end_time):
+            times = decode_timestamps(chunk.time_data(), chunk.count)
+            parts.append(times[self._mask(times, start_time, end_time)])
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def series(self, name, metric, start_time=None, end_time=None):
+        """Values of one metric of a series in the window"""
+        if name not in self.labels:
+            raise KeyError(name)
+        index = self.metric_index[metric]
+        parts = []
+        for chunk in self._chunks(start_time, end_time):
+            data = chunk.column_data(name, index)
+            values = np.full(chunk.count, np.nan) if data is None else decode_values(data, chunk.count)
+            if start_time is not None or end_time is not None:
+                times = decode_timestamps(chunk.time_data(), chunk.count)
+                values = values[self._mask(times, start_time, end_time)]
+            parts.append(values)
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def label_series(self, name, label, start_time=None, end_time=None):
+        """pid or username of a series per point in the window, as an object array"""
+        position = LABELS.index(label) + 1
+        runs = self.labels[name]
+        parts = []
+        for chunk in self._chunks(start_time, end_time):
+            column = np.full(chunk.count, None, dtype=object)
+            indexes = chunk.first + np.arange(chunk.count)
+            for i, run in enumerate(runs):
+                end = runs[i + 1][0] if i + 1 < len(runs) else self.count
+                column[(indexes >= run[0]) & (indexes < end)] = run[position]
+            if start_time is not None or end_time is not None:
+                times = decode_timestamps(chunk.time_data(), chunk.count)
+                column = column[self._mask(times, start_time, end_time)]
+            parts.append(column)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=object)
+
+    def latest(self, name, label):
+        """Most recent non-empty pid or username of a series"""
+        position = LABELS.index(label) + 1
+        for run in reversed(self.labels.get(name, [])):
+            if run[position] is not None:
+                return run[position]
+        return None
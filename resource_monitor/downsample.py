@@ -0,0 +1,156 @@
+"""Level-of-detail reduction of long series for plotting
+
+A chart can't show more points than it has pixel columns, so pushing a day
+of 10 Hz samples into matplotlib only costs time. Two reductions are
+provided:
+
+    min/max bucketing   keeps the lowest and highest point of every bucket,
+                        so spikes always survive. MinMaxDecimator does it
+                        incrementally: buckets are aligned to absolute sample
+                        indices, and complete buckets are cached until they
+                        scroll out of the window, so each frame only reduces
+                        the points that arrived since the last one.
+    LTTB                Largest-Triangle-Three-Buckets picks the one point per
+                        bucket that best preserves the visual shape.
+"""
+import numpy as np
+
+
+def minmax(times, values, buckets):
+    """Reduce to the min and max point of each of `buckets` equal buckets"""
+    n = len(values)
+    if n <= 2 * buckets:
+        return times, values
+    size = int(np.ceil(n / buckets))
+    return _minmax_blocks(times, values, size)
+
+
+def _minmax_blocks(times, values, size):
+    """Min and max point, in time order, of consecutive blocks of `size` points"""
+    n = len(values)
+    if n == 0:
+        return times[:0], values[:0]
+    full = n // size * size
+    t_parts, v_parts = [], []
+    if full:
+        t, v = _reduce_rows(times[:full].reshape(-1, size), values[:full].reshape(-1, size))
+        t_parts.append(t)
+        v_parts.append(v)
+    if full < n:
+        t, v = _reduce_rows(times[full:].reshape(1, -1), values[full:].reshape(1, -1))
+        t_parts.append(t)
+        v_parts.append(v)
+    return np.concatenate(t_parts), np.concatenate(v_parts)
+
+
+def _reduce_rows(times, values):
+    """Min/max point of every row of 2-D arrays, interleaved in time order"""
+    nan = np.isnan(values)
+    low = np.where(nan, np.inf, values).argmin(axis=1)
+    high = np.where(nan, -np.inf, values).argmax(axis=1)
+    first = np.minimum(low, high)
+    second = np.maximum(low, high)
+    rows = np.arange(len(values))
+
+    t = np.empty((len(values), 2))
+    v = np.empty((len(values), 2))
+    t[:, 0], t[:, 1] = times[rows, first], times[rows, second]
+    v[:, 0], v[:, 1] = values[rows, first], values[rows, second]
+    # Rows without any value stay gaps in the line
+    v[nan.all(axis=1)] = np.nan
+    return t.ravel(), v.ravel()
+
+
+def lttb(times, values, threshold):
+    """Largest-Triangle-Three-Buckets downsampling to about `threshold` points"""
+    n = len(values)
+    if threshold >= n or threshold < 3:
+        return times, values
+    valid = ~np.isnan(values)
+    if not valid.all():
+        # LTTB needs real numbers; NaN gaps are dropped
+        times, values = times[valid], values[valid]
+        n = len(values)
+        if threshold >= n:
+            return times, values
+
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = end, max(edges[i + 2] if i + 2 < len(edges) else n, end + 1)
+        # Average of the next bucket is the third triangle corner
+        avg_t = times[next_start:next_end].mean()
+        avg_v = values[next_start:next_end].mean()
+        t_a, v_a = times[previous], values[previous]
+        areas = np.abs((t_a - avg_t) * (values[start:end] - v_a) - (t_a - times[start:end]) * (avg_v - v_a))
+        previous = start + int(areas.argmax())
+        selected[i + 1] = previous
+    return times[selected], values[selected]
+
+
+class MinMaxDecimator:
+    """Incremental min/max bucketing of a sliding window"""
+
+    def __init__(self, buckets=1000):
+        self.buckets = buckets
+        self.reset()
+
+    def reset(self):
+        """Drop cached buckets"""
+        self.size = None  # Points per bucket
+        self.first = 0  # Number of the first cached bucket, bucket k starts at index k * size
+        self.times = np.empty(0)
+        self.values = np.empty(0)
+
+    def decimate(self, times, values, end_index, buckets=None):
+        """Reduce a window whose newest point has absolute index end_index - 1
+
+        times and values are the window, e.g. views from HistoryStore; the
+        absolute index only has to increase by one per appended point.
+        """
+        if buckets is not None and buckets != self.buckets:
+            self.buckets = buckets
+            self.reset()
+        n = len(values)
+        if n <= 2 * self.buckets:
+            self.reset()
+            return times, values
+
+        # Powers of two keep the bucket size stable while the window grows
+        size = 1 << int(np.ceil(np.log2(n / self.buckets)))
+        start_index = end_index - n
+        first = -(-start_index // size)  # First bucket that lies completely in the window
+        cached_end = self.first + len(self.values) // 2
+        if size != self.size or first < self.first or end_index // size < cached_end:
+            # Bucket size changed, or the window moved back (history was cleared)
+            self.reset()
+            self.size = size
+            self.first = first
+
+        # Drop buckets that scrolled out, two points are cached per bucket
+        if first > self.first:
+            drop = min(first - self.first, len(self.values) // 2)
+            self.times = self.times[2 * drop:]
+            self.values = self.values[2 * drop:]
+            self.first = first
+
+        # Reduce buckets completed since the last frame
+        complete_end = end_index // size
+        cached_end = self.first + len(self.values) // 2
+        if complete_end > cached_end:
+            lo = cached_end * size - start_index
+            hi = complete_end * size - start_index
+            t, v = _minmax_blocks(times[lo:hi], values[lo:hi], size)
+            self.times = np.concatenate([self.times, t])
+            self.values = np.concatenate([self.values, v])
+
+        # Partial buckets at both ends are reduced fresh every frame
+        head_end = self.first * size - start_index
+        tail_start = complete_end * size - start_index
+        head_t, head_v = _minmax_blocks(times[:head_end], values[:head_end], size)
+        tail_t, tail_v = _minmax_blocks(times[tail_start:], values[tail_start:], size)
+        return (np.concatenate([head_t, self.times, tail_t]),
+                np.concatenate([head_v, self.values, tail_v]))
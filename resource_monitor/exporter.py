@@ -0,0 +1,131 @@
+"""Prometheus/OpenMetrics endpoint for monitor samples
+
+MetricsExporter serves the latest sample at /metrics. Every value is one
+gauge sample of the resource_monitor_usage family:
+
+    resource_monitor_usage{pattern="nginx",user="www-data",metric="cpu"} 12.5
+
+The PID is not a label: a series rolls up several processes and reports the
+PID of whichever comes first, and a label that changes with it would start
+a new Prometheus series every time. resource_monitor_pid carries it as the
+value of a gauge with the same labels instead.
+
+The sampler loop calls update() after each sample, which renders the
+response body once in both exposition formats. Scrapes only send the cached
+bytes, so they never walk the process table and any number of scrapers cost
+the same as one. The server runs in a daemon thread; update() replaces the
+cached snapshot with a single assignment, which needs no lock.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from resource_monitor.history import METRICS
+
+DEFAULT_PORT = 9105
+
+PROMETHEUS_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+OPENMETRICS_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Units of the metric label values, for the HELP text
+METRIC_UNITS = {'cpu': 'percent', 'memory': 'MB', 'network': 'Mbps', 'disk': 'MB/s', 'gpu': 'percent'}
+
+
+def escape_label(value):
+    """Escape a label value for the text exposition format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(timestamp, data, metrics=METRICS, openmetrics=False):
+    """Render one sample {name: metrics} in the Prometheus or OpenMetrics text format"""
+    units = ", ".join(f"{metric} in {METRIC_UNITS.get(metric, 'units')}" for metric in metrics)
+    lines = [
+        f"# HELP resource_monitor_usage Resource usage of monitored processes ({units})",
+        "# TYPE resource_monitor_usage gauge",
+    ]
+    instances = []
+    pids = []
+    for name, values in data.items():
+        labels = f'pattern="{escape_label(name)}",user="{escape_label(values.get("username") or "")}"'
+        for metric in metrics:
+            value = values.get(metric)
+            if value is not None:
+                lines.append(f'resource_monitor_usage{{{labels},metric="{metric}"}} {float(value)!r}')
+        instances.append(f'resource_monitor_instances{{{labels}}} {values.get("count", 1)}')
+        if values.get('pid') is not None:
+            pids.append(f'resource_monitor_pid{{{labels}}} {values["pid"]}')
+
+    lines.append("# HELP resource_monitor_instances Processes rolled up into each series")
+    lines.append("# TYPE resource_monitor_instances gauge")
+    lines.extend(instances)
+    lines.append("# HELP resource_monitor_pid PID of the first process of each series")
+    lines.append("# TYPE resource_monitor_pid gauge")
+    lines.extend(pids)
+    lines.append("# HELP resource_monitor_last_sample_timestamp_seconds Time the sample was taken")
+    lines.append("# TYPE resource_monitor_last_sample_timestamp_seconds gauge")
+    lines.append(f"resource_monitor_last_sample_timestamp_seconds {float(timestamp)!r}")
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serve the exporter's cached snapshot"""
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        openmetrics = 'application/openmetrics-text' in self.headers.get('Accept', '')
+        content_type, body = self.server.exporter.snapshot[openmetrics]
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood stderr
+        pass
+
+
+class MetricsExporter:
+    """HTTP /metrics endpoint serving the latest sample"""
+
+    def __init__(self, host='', port=DEFAULT_PORT, metrics=METRICS):
+        self.metrics = tuple(metrics)
+        empty = render_metrics(0, {}, self.metrics).encode('utf-8')
+        empty_openmetrics = render_metrics(0, {}, self.metrics, openmetrics=True).encode('utf-8')
+        # (Prometheus, OpenMetrics) content type and body, indexed by openmetrics
+        self.snapshot = ((PROMETHEUS_TYPE, empty), (OPENMETRICS_TYPE, empty_openmetrics))
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.exporter = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def address(self):
+        """(host, port) the server is bound to, the port is useful when 0 was given"""
+        return self.server.server_address[:2]
+
+    def update(self, timestamp, data):
+        """Render a new sample for the following scrapes"""
+        self.snapshot = (
+            (PROMETHEUS_TYPE, render_metrics(timestamp, data, self.metrics).encode('utf-8')),
+            (OPENMETRICS_TYPE, render_metrics(timestamp, data, self.metrics, openmetrics=True).encode('utf-8')),
+        )
+
+    def close(self):
+        """Stop serving"""
+        if self.thread is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.thread = None
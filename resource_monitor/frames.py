@@ -0,0 +1,59 @@
+"""Frame scheduling for the live charts
+
+Samples arrive at the sampling rate, which can be much faster than the
+screen needs to change. FrameScheduler separates the two: every sample
+only calls request(), and a single-shot QTimer runs the render callback at
+most ``fps`` times a second. Requests that arrive while a frame is pending
+are coalesced into it, so the renderer always draws the newest data and
+never works through a backlog.
+
+This module needs PyQt5 and is only imported by the GUI front-ends.
+"""
+import time
+
+from PyQt5.QtCore import QObject, QTimer
+
+# Default frame rate cap
+DEFAULT_FPS = 10
+
+
+class FrameScheduler(QObject):
+    """Run a render callback at most fps times a second, on demand"""
+
+    def __init__(self, render, fps=DEFAULT_FPS, parent=None):
+        super().__init__(parent)
+        self.render = render
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self._frame)
+        self.last_frame = None  # time.monotonic() of the last rendered frame
+        self.requests = 0
+        self.frames = 0
+        self.set_fps(fps)
+
+    def set_fps(self, fps):
+        """Change the frame rate cap"""
+        if fps <= 0:
+            raise ValueError("fps must be positive")
+        self.fps = fps
+        self.interval = 1.0 / fps
+
+    def request(self):
+        """Ask for a frame; coalesced with a pending one"""
+        self.requests += 1
+        if self.timer.isActive():
+            return
+        # Draw immediately unless the last frame was less than one interval ago
+        delay = 0.0
+        if self.last_frame is not None:
+            delay = max(0.0, self.last_frame + self.interval - time.monotonic())
+        self.timer.start(int(delay * 1000))
+
+    def cancel(self):
+        """Drop a pending frame"""
+        self.timer.stop()
+
+    def _frame(self):
+        self.last_frame = time.monotonic()
+        self.frames += 1
+        self.render()
@@ -0,0 +1,248 @@
+"""Compiled multi-pattern process matcher
+
+A watch-list entry is a selector string. Plain entries keep the original
+behaviour (case-insensitive substring of the process name); a prefix picks
+another kind of match:
+
+    chrome              substring of the process name
+    exact:nginx         whole process name
+    glob:python3.*      shell-style wildcard over the process name
+    re:^gunicorn\\b     regular expression searched in the process name
+    exe:/opt/app/       executable path, substring or wildcard
+    cmdline:--worker    command line, substring or wildcard
+    tree:1234           process 1234 and all of its descendants
+
+All matching is case-insensitive. The watch list is compiled once into an
+Aho-Corasick automaton per field plus combined wildcard/regex prefilters, so
+matching a process costs one scan of its name instead of one per pattern.
+
+A tree: selector depends on the parents of other processes, so it can't be
+decided one process at a time. match_trees() takes the whole process table,
+links it by parent PID and returns the subtree members of every tree:
+selector, which are then passed to match().
+"""
+import fnmatch
+import re
+from collections import deque
+
+from resource_monitor.proctree import ProcessTree
+
+# Selector kinds and the process field each one looks at
+SELECTOR_KINDS = {
+    'substring': 'name',
+    'exact': 'name',
+    'glob': 'name',
+    're': 'name',
+    'exe': 'exe',
+    'cmdline': 'cmdline',
+    'tree': 'ppid',
+}
+
+_WILDCARD_CHARS = set('*?[')
+
+
+def parse_selector(selector):
+    """Split a selector into (kind, field, pattern), raise ValueError if it is invalid"""
+    kind, sep, pattern = selector.partition(':')
+    if not sep or kind not in SELECTOR_KINDS or kind == 'substring':
+        # Plain names may contain ':' themselves, treat them as substrings
+        kind, pattern = 'substring', selector
+    if not pattern:
+        raise ValueError(f"Empty pattern in selector {selector!r}")
+    if kind == 'tree' and not pattern.isdigit():
+        raise ValueError(f"Invalid PID in selector {selector!r}")
+    if kind == 're':
+        try:
+            re.compile(pattern, re.IGNORECASE)
+        except re.error as e:
+            raise ValueError(f"Invalid regular expression in selector {selector!r}: {e}")
+    return kind, SELECTOR_KINDS[kind], pattern
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton reporting which of many substrings occur in a text"""
+
+    def __init__(self, words):
+        # words: iterable of (word, payload); payloads of all found words are returned
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for word, payload in words:
+            self._add(word, payload)
+        self._build()
+
+    def __bool__(self):
+        return len(self.goto) > 1
+
+    def _add(self, word, payload):
+        """Insert a word into the trie"""
+        state = 0
+        for char in word:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(set())
+            state = next_state
+        self.output[state].add(payload)
+
+    def _build(self):
+        """Compute failure links breadth-first and merge outputs along them"""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                fail_state = self.goto[fallback].get(char, 0)
+                # Depth-one states fail back to the root, not to themselves
+                self.fail[next_state] = fail_state if fail_state != next_state else 0
+                self.output[next_state] |= self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """Return the set of payloads whose word occurs in text"""
+        found = set()
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return found
+
+
+# Backreferences change meaning once patterns are joined into one regex
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+class _PatternSet:
+    """Wildcard or regex patterns over one field behind a single combined prefilter"""
+
+    def __init__(self, entries):
+        # entries: list of (compiled regex, payload)
+        self.entries = []
+        self.standalone = []
+        for regex, payload in entries:
+            if _BACKREFERENCE.search(regex.pattern):
+                self.standalone.append((regex, payload))
+            else:
+                self.entries.append((regex, payload))
+        self.prefilter = None
+        if self.entries:
+            try:
+                self.prefilter = re.compile('|'.join(f'(?:{regex.pattern})' for regex, _ in self.entries),
+                                            re.IGNORECASE)
+            except re.error:
+                # e.g. repeated group names or inline flags, test the patterns one by one
+                self.standalone.extend(self.entries)
+                self.entries = []
+
+    def __bool__(self):
+        return bool(self.entries or self.standalone)
+
+    def find(self, text):
+        """Return the set of payloads whose pattern matches text"""
+        found = {payload for regex, payload in self.standalone if regex.search(text)}
+        if self.prefilter is None or not self.prefilter.search(text):
+            return found
+        if len(self.entries) == 1:
+            found.add(self.entries[0][1])
+        else:
+            found.update(payload for regex, payload in self.entries if regex.search(text))
+        return found
+
+
+class ProcessMatcher:
+    """Watch list compiled for matching many processes against many selectors"""
+
+    def __init__(self, selectors):
+        self.selectors = list(selectors)
+        substrings = {'name': [], 'exe': [], 'cmdline': []}
+        patterns = {'name': [], 'exe': [], 'cmdline': []}
+        self.exact = {}
+        self.trees = {}  # Root PID -> indexes of its tree: selectors
+
+        for index, selector in enumerate(self.selectors):
+            kind, field, pattern = parse_selector(selector)
+            pattern_lower = pattern.lower()
+            if kind == 'exact':
+                self.exact.setdefault(pattern_lower, set()).add(index)
+            elif kind == 'tree':
+                self.trees.setdefault(int(pattern), set()).add(index)
+            elif kind == 're':
+                patterns[field].append((re.compile(pattern, re.IGNORECASE), index))
+            elif kind == 'glob' or (kind in ('exe', 'cmdline') and _WILDCARD_CHARS & set(pattern)):
+                # fnmatch.translate anchors the pattern to the whole field
+                patterns[field].append((re.compile(fnmatch.translate(pattern_lower), re.IGNORECASE), index))
+            else:
+                substrings[field].append((pattern_lower, index))
+
+        self.automata = {field: AhoCorasick(words) for field, words in substrings.items()}
+        self.pattern_sets = {field: _PatternSet(entries) for field, entries in patterns.items()}
+
+        # Only ask psutil for the expensive fields when a selector needs them
+        self.needs_exe = bool(self.automata['exe'] or self.pattern_sets['exe'])
+        self.needs_cmdline = bool(self.automata['cmdline'] or self.pattern_sets['cmdline'])
+        self.needs_tree = bool(self.trees)
+
+    @property
+    def attrs(self):
+        """psutil.process_iter attribute names needed for matching"""
+        attrs = ['name']
+        if self.needs_exe:
+            attrs.append('exe')
+        if self.needs_cmdline:
+            attrs.append('cmdline')
+        if self.needs_tree:
+            attrs.append('ppid')
+        return attrs
+
+    def match_trees(self, infos):
+        """Return {pid: tree: selector indexes} for process info dicts holding 'pid' and 'ppid'"""
+        if not self.trees:
+            return {}
+        pids = [info['pid'] for info in infos]
+        tree = ProcessTree(pids, [info.get('ppid') for info in infos])
+        rows = {pid: row for row, pid in enumerate(pids)}
+        members = {}
+        for root, indexes in self.trees.items():
+            row = rows.get(root)
+            if row is None:
+                continue
+            for member in tree.subtree(row):
+                members.setdefault(pids[member], set()).update(indexes)
+        return members
+
+    def match(self, name, exe=None, cmdline=None, trees=None):
+        """Return every selector that matches the process, in watch-list order
+
+        trees holds the indexes of the tree: selectors the process belongs to,
+        as found by match_trees().
+        """
+        name = (name or '').lower()
+        found = self.automata['name'].find(name) if self.automata['name'] else set()
+        found |= self.exact.get(name, set())
+        found |= self.pattern_sets['name'].find(name)
+        if trees:
+            found |= trees
+        if self.needs_exe and exe:
+            exe = exe.lower()
+            found |= self.automata['exe'].find(exe)
+            found |= self.pattern_sets['exe'].find(exe)
+        if self.needs_cmdline and cmdline:
+            if not isinstance(cmdline, str):
+                cmdline = ' '.join(cmdline)
+            cmdline = cmdline.lower()
+            found |= self.automata['cmdline'].find(cmdline)
+            found |= self.pattern_sets['cmdline'].find(cmdline)
+        return [self.selectors[index] for index in sorted(found)]
+
+    def match_info(self, info, trees=None):
+        """Match a psutil process info dict"""
+        return self.match(info.get('name'), info.get('exe'), info.get('cmdline'), trees)
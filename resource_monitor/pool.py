@@ -0,0 +1,90 @@
+"""Pool of psutil.Process handles kept alive across ticks
+
+psutil computes a process's CPU percentage from the times stored in the
+Process object by the previous cpu_percent() call, so a freshly created
+object always reports 0.0. The pool hands out the same object tick after
+tick, primes new objects as soon as they are created and evicts them once
+the process has exited or its PID has been reused.
+
+A handle is primed during the discovery scan, often milliseconds before
+the same tick reads it. CPU times have a granularity of about 10 ms, so a
+percentage over such a short interval is 0 or wildly inflated; until
+MIN_CPU_INTERVAL has passed since priming, cpu_settled() is False and the
+readers report 0 without touching the baseline.
+"""
+import time
+
+import psutil
+
+# Seconds a CPU baseline has to cover before its first percentage is reported
+MIN_CPU_INTERVAL = 0.1
+
+
+class ProcessPool:
+    """psutil.Process objects keyed by (pid, create_time)"""
+
+    def __init__(self):
+        self.handles = {}
+        self.primed = {}  # key -> monotonic time of priming, until the first interval is long enough
+
+    def __len__(self):
+        return len(self.handles)
+
+    def __contains__(self, key):
+        return key in self.handles
+
+    def get(self, pid, create_time=None):
+        """Return the pooled handle of a process, creating and priming it if needed
+
+        Raises psutil.NoSuchProcess when the process is gone or, if create_time
+        is given, when the PID now belongs to a different process.
+        """
+        if create_time is not None:
+            handle = self.handles.get((pid, create_time))
+            if handle is not None:
+                return handle
+
+        handle = psutil.Process(pid)
+        key = (pid, handle.create_time())
+        if create_time is not None and key[1] != create_time:
+            raise psutil.NoSuchProcess(pid)
+        if key in self.handles:
+            return self.handles[key]
+
+        self._prime(handle)
+        self.primed[key] = time.monotonic()
+        self.handles[key] = handle
+        return handle
+
+    def _prime(self, handle):
+        """Start the CPU time baseline so the next cpu_percent() is a real delta"""
+        try:
+            handle.cpu_percent(interval=None)
+        except (psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+
+    def cpu_settled(self, key):
+        """Return True when cpu_percent() of a handle covers at least MIN_CPU_INTERVAL"""
+        primed = self.primed.get(key)
+        if primed is None:
+            return True
+        if time.monotonic() - primed < MIN_CPU_INTERVAL:
+            return False
+        self.primed.pop(key, None)
+        return True
+
+    def is_alive(self, key):
+        """Return True when the pooled process still runs under the same PID"""
+        handle = self.handles.get(key)
+        return handle is not None and handle.is_running()
+
+    def evict(self, key):
+        """Drop the handle of an exited process"""
+        self.handles.pop(key, None)
+        self.primed.pop(key, None)
+
+    def prune(self, keys):
+        """Drop every handle whose key is not in keys"""
+        for key in set(self.handles) - set(keys):
+            del self.handles[key]
+            self.primed.pop(key, None)
@@ -0,0 +1,576 @@
+"""Item model behind the process selection dialog
+
+Building a QTreeWidgetItem per process, cloned into up to three category
+branches, makes a host with 20k processes cost tens of thousands of items
+before the dialog even shows. ProcessTableModel instead wraps a single
+ProcessSnapshot, one scan of the process table stored column by column in
+plain lists, and only formats the rows a view actually paints.
+
+ProcessFilterProxy picks the rows of one category that match a search query.
+The query is answered by a SearchIndex over the snapshot, built on the first
+search and kept up to date afterwards, so filtering a row is a set lookup.
+Sorting is forwarded to the source model, which reorders the snapshot
+with one key-based sort instead of a lessThan() callback per comparison.
+
+For live refresh, update_snapshot() diffs a new scan against the rows shown,
+matched by (pid, create_time), and reports only the row removals, inserts
+and value changes to the views. Kept rows stay in place, so the scroll
+position and selection survive; new processes are inserted at their sorted
+position.
+
+ProcessTreeModel shows the same snapshot as a parent/child hierarchy, with
+the CPU and memory of each process's whole subtree next to its own. The
+tree and the subtree sums are rebuilt in linear time from the parent PIDs
+whenever the processes change; ticks that only change values keep the
+structure and only refresh the numbers.
+
+This module needs PyQt5 and is only imported by the GUI front-ends.
+"""
+from bisect import bisect_right
+
+from PyQt5.QtCore import (QAbstractItemModel, QAbstractTableModel, QItemSelectionModel, QModelIndex,
+                          QSortFilterProxyModel, Qt)
+from PyQt5.QtGui import QColor
+
+from resource_monitor.proctree import ProcessTree
+from resource_monitor.search import SearchIndex, parse_query
+
+# Rows of processes above this CPU percentage are highlighted
+HIGH_CPU_PERCENT = 50
+HIGH_CPU_COLOR = QColor(255, 200, 200)
+
+# Column lists of a ProcessSnapshot
+SNAPSHOT_COLUMNS = ('keys', 'names', 'pids', 'usernames', 'cpu', 'memory', 'categories', 'ppids')
+
+
+def _runs(rows):
+    """Group ascending row numbers into (first, last) ranges of consecutive rows"""
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return runs
+
+
+class ProcessSnapshot:
+    """One scan of the process table, stored as parallel column lists"""
+
+    def __init__(self):
+        self.keys = []  # (pid, create_time) identifying each process across scans
+        self.names = []
+        self.pids = []
+        self.usernames = []
+        self.cpu = []
+        self.memory = []
+        self.categories = []
+        self.ppids = []
+
+    def __len__(self):
+        return len(self.pids)
+
+    def append(self, name, pid, username, cpu_percent, memory_mb, categories, create_time=None, ppid=None):
+        """Add one process"""
+        self.keys.append((pid, create_time))
+        self.names.append(name)
+        self.pids.append(pid)
+        self.usernames.append(username)
+        self.cpu.append(cpu_percent)
+        self.memory.append(memory_mb)
+        self.categories.append(categories)
+        self.ppids.append(ppid)
+
+    def sort_keys(self, column):
+        """Return the values rows are sorted by for a column"""
+        if column == 0:
+            return [name.lower() for name in self.names]
+        return (self.names, self.pids, [username.lower() for username in self.usernames],
+                self.cpu, self.memory)[column]
+
+    def sort_key(self, column, row):
+        """Return the value one row is sorted by for a column"""
+        if column == 0:
+            return self.names[row].lower()
+        if column == 2:
+            return self.usernames[row].lower()
+        return (self.names, self.pids, None, self.cpu, self.memory)[column][row]
+
+    def reorder(self, order):
+        """Rearrange all columns so that row i becomes the old row order[i]"""
+        for attr in SNAPSHOT_COLUMNS:
+            column = getattr(self, attr)
+            setattr(self, attr, [column[i] for i in order])
+
+    def delete(self, start, stop):
+        """Remove rows start to stop - 1"""
+        for attr in SNAPSHOT_COLUMNS:
+            del getattr(self, attr)[start:stop]
+
+    def insert(self, row, other, other_row):
+        """Insert the row of another snapshot before row"""
+        for attr in SNAPSHOT_COLUMNS:
+            getattr(self, attr).insert(row, getattr(other, attr)[other_row])
+
+    def copy_row(self, row, other, other_row):
+        """Overwrite a row with the values of a row of another snapshot"""
+        for attr in SNAPSHOT_COLUMNS:
+            getattr(self, attr)[row] = getattr(other, attr)[other_row]
+
+
+class _SnapshotSearch:
+    """Search over the snapshot of a model, shared by the table and tree models"""
+
+    def search(self, terms):
+        """Return (keys of the processes matching terms, serial of the next process indexed)"""
+        if self.search_index is None:
+            self.search_index = SearchIndex()
+            self._index_rows(range(len(self.snapshot)))
+        return self.search_index.search(terms), self.search_index.next_serial
+
+    def _index_rows(self, rows):
+        """Add rows of the snapshot to the search index, if there is one"""
+        if self.search_index is None:
+            return
+        snapshot = self.snapshot
+        for row in rows:
+            self.search_index.add(snapshot.keys[row], snapshot.names[row], snapshot.pids[row], snapshot.usernames[row])
+
+
+class ProcessTableModel(_SnapshotSearch, QAbstractTableModel):
+    """Flat table model over a ProcessSnapshot"""
+
+    def __init__(self, headers, parent=None):
+        super().__init__(parent)
+        self.headers = list(headers)
+        self.snapshot = ProcessSnapshot()
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+        self.search_index = None  # Built on the first search
+
+    def snapshot_row(self, row, parent=QModelIndex()):
+        """Return the snapshot row shown at a row of the model"""
+        return row
+
+    def set_snapshot(self, snapshot):
+        """Replace all rows with a new scan, sorted like the previous one"""
+        if 0 <= self.sort_column < len(self.headers):
+            snapshot.reorder(self._sorted_rows(snapshot, self.sort_column, self.sort_order))
+        self.beginResetModel()
+        self.snapshot = snapshot
+        if self.search_index is not None:
+            self.search_index.clear()
+            self._index_rows(range(len(snapshot)))
+        self.endResetModel()
+
+    def update_snapshot(self, snapshot):
+        """Apply a new scan as row removals, inserts and value changes"""
+        current = self.snapshot
+        if not len(current):
+            self.set_snapshot(snapshot)
+            return
+        new_rows = {key: row for row, key in enumerate(snapshot.keys)}
+
+        # Processes that have exited, last rows first so the others keep their numbers
+        removed = [row for row, key in enumerate(current.keys) if key not in new_rows]
+        for first, last in reversed(_runs(removed)):
+            if self.search_index is not None:
+                for row in range(first, last + 1):
+                    self.search_index.remove(current.keys[row])
+            self.beginRemoveRows(QModelIndex(), first, last)
+            current.delete(first, last + 1)
+            self.endRemoveRows()
+
+        # Values of running processes change in place
+        changed = []
+        for row, key in enumerate(current.keys):
+            new_row = new_rows.pop(key)
+            renamed = (current.names[row] != snapshot.names[new_row]
+                       or current.usernames[row] != snapshot.usernames[new_row])
+            if renamed or current.cpu[row] != snapshot.cpu[new_row] or current.memory[row] != snapshot.memory[new_row]:
+                current.copy_row(row, snapshot, new_row)
+                changed.append(row)
+                if renamed:
+                    self._index_rows((row,))
+        if changed:
+            # One range for all of them, views only repaint the rows they show
+            self.dataChanged.emit(self.index(changed[0], 0), self.index(changed[-1], len(self.headers) - 1),
+                                  [Qt.DisplayRole, Qt.ToolTipRole, Qt.BackgroundRole])
+
+        # New processes, at their sorted position
+        if new_rows:
+            sorting = 0 <= self.sort_column < len(self.headers)
+            # A copy, sort_keys() may return the column list itself
+            keys = list(current.sort_keys(self.sort_column)) if sorting else None
+            descending = self.sort_order == Qt.DescendingOrder
+            for new_row in new_rows.values():
+                row = len(current)
+                if sorting:
+                    key = snapshot.sort_key(self.sort_column, new_row)
+                    row = self._insert_position(keys, key, descending)
+                    keys.insert(row, key)
+                self.beginInsertRows(QModelIndex(), row, row)
+                current.insert(row, snapshot, new_row)
+                # Indexed before the proxy filters the new row
+                self._index_rows((row,))
+                self.endInsertRows()
+
+    @staticmethod
+    def _insert_position(keys, key, descending):
+        """Return where key goes in ascending or descending keys"""
+        if not descending:
+            return bisect_right(keys, key)
+        low, high = 0, len(keys)
+        while low < high:
+            middle = (low + high) // 2
+            if keys[middle] < key:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.snapshot)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and 0 <= section < len(self.headers):
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.row(), index.column()
+        snapshot = self.snapshot
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return snapshot.names[row]
+            if column == 1:
+                return str(snapshot.pids[row])
+            if column == 2:
+                return snapshot.usernames[row]
+            if column == 3:
+                return f"{snapshot.cpu[row]:.1f}"
+            if column == 4:
+                return f"{snapshot.memory[row]:.1f}"
+        elif role == Qt.ToolTipRole and column == 0:
+            # Full name of processes cut off by the column width
+            return snapshot.names[row]
+        elif role == Qt.BackgroundRole and snapshot.cpu[row] > HIGH_CPU_PERCENT:
+            return HIGH_CPU_COLOR
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Reorder the snapshot by one column, keeping selections on their processes"""
+        if not 0 <= column < len(self.headers):
+            return
+        self.sort_column = column
+        self.sort_order = order
+        if not len(self.snapshot):
+            return
+        order_rows = self._sorted_rows(self.snapshot, column, order)
+
+        self.layoutAboutToBeChanged.emit()
+        self.snapshot.reorder(order_rows)
+        new_rows = [0] * len(order_rows)
+        for new_row, old_row in enumerate(order_rows):
+            new_rows[old_row] = new_row
+        old_indexes = self.persistentIndexList()
+        self.changePersistentIndexList(
+            old_indexes, [self.index(new_rows[index.row()], index.column()) for index in old_indexes])
+        self.layoutChanged.emit()
+
+    @staticmethod
+    def _sorted_rows(snapshot, column, order):
+        """Return the rows of a snapshot in sorted order"""
+        keys = snapshot.sort_keys(column)
+        return sorted(range(len(keys)), key=keys.__getitem__, reverse=order == Qt.DescendingOrder)
+
+
+class ProcessTreeModel(_SnapshotSearch, QAbstractItemModel):
+    """Parent/child tree over a ProcessSnapshot, with the CPU and memory of every subtree
+
+    Columns are those of ProcessTableModel followed by the subtree CPU and
+    memory. The internal id of an index is its snapshot row.
+    """
+
+    def __init__(self, headers, parent=None):
+        super().__init__(parent)
+        self.headers = list(headers)
+        self.snapshot = ProcessSnapshot()
+        self.tree = ProcessTree([], [])
+        self.positions = []  # Row of each snapshot row among its siblings
+        self.rows = {}  # (pid, create_time) -> snapshot row
+        self.subtree_cpu = []
+        self.subtree_memory = []
+        self.sort_column = -1
+        self.sort_order = Qt.AscendingOrder
+        self.search_index = None  # Built on the first search
+
+    def snapshot_row(self, row, parent=QModelIndex()):
+        """Return the snapshot row shown at a row under parent"""
+        if parent.isValid():
+            return self.tree.children[parent.internalId()][row]
+        return self.tree.roots[row]
+
+    def index_of(self, snapshot_row, column=0):
+        """Return the index showing a snapshot row"""
+        return self.createIndex(self.positions[snapshot_row], column, snapshot_row)
+
+    def set_snapshot(self, snapshot):
+        """Replace all processes with a new scan and rebuild the tree"""
+        self.beginResetModel()
+        self.snapshot = snapshot
+        self.tree = ProcessTree(snapshot.pids, snapshot.ppids)
+        self.rows = {key: row for row, key in enumerate(snapshot.keys)}
+        self._rollup()
+        self._sort_siblings()
+        if self.search_index is not None:
+            self.search_index.clear()
+            self._index_rows(range(len(snapshot)))
+        self.endResetModel()
+
+    def update_snapshot(self, snapshot):
+        """Apply a new scan, in place when every process is still there under the same parent"""
+        current = self.snapshot
+        if len(snapshot) != len(current):
+            self.set_snapshot(snapshot)
+            return
+        current_rows = []
+        for new_row, key in enumerate(snapshot.keys):
+            row = self.rows.get(key)
+            if row is None or current.ppids[row] != snapshot.ppids[new_row]:
+                # Processes started, exited or were reparented
+                self.set_snapshot(snapshot)
+                return
+            current_rows.append(row)
+
+        for new_row, row in enumerate(current_rows):
+            renamed = (current.names[row] != snapshot.names[new_row]
+                       or current.usernames[row] != snapshot.usernames[new_row])
+            current.copy_row(row, snapshot, new_row)
+            if renamed:
+                self._index_rows((row,))
+        self._rollup()
+        # A range may only span siblings, so one per parent
+        last_column = len(self.headers) - 1
+        roles = [Qt.DisplayRole, Qt.ToolTipRole, Qt.BackgroundRole]
+        for siblings in [self.tree.roots] + self.tree.children:
+            if siblings:
+                self.dataChanged.emit(self.index_of(siblings[0]), self.index_of(siblings[-1], last_column), roles)
+
+    def _rollup(self):
+        """Sum CPU and memory over every subtree, one linear pass each"""
+        self.subtree_cpu = self.tree.rollup(self.snapshot.cpu)
+        self.subtree_memory = self.tree.rollup(self.snapshot.memory)
+
+    def _sort_keys(self, column):
+        """Return the values rows are sorted by for a column"""
+        if column == 5:
+            return self.subtree_cpu
+        if column == 6:
+            return self.subtree_memory
+        return self.snapshot.sort_keys(column)
+
+    def _sort_siblings(self):
+        """Sort the children of every process and record the row of each among its siblings"""
+        groups = [self.tree.roots] + self.tree.children
+        if 0 <= self.sort_column < len(self.headers):
+            keys = self._sort_keys(self.sort_column)
+            descending = self.sort_order == Qt.DescendingOrder
+            for siblings in groups:
+                if len(siblings) > 1:
+                    siblings.sort(key=keys.__getitem__, reverse=descending)
+        positions = [0] * len(self.snapshot)
+        for siblings in groups:
+            for position, row in enumerate(siblings):
+                positions[row] = position
+        self.positions = positions
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        return self.createIndex(row, column, self.snapshot_row(row, parent))
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = self.tree.parents[index.internalId()]
+        if parent < 0:
+            return QModelIndex()
+        return self.index_of(parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.tree.roots)
+        if parent.column() != 0:
+            return 0
+        return len(self.tree.children[parent.internalId()])
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and 0 <= section < len(self.headers):
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, column = index.internalId(), index.column()
+        snapshot = self.snapshot
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return snapshot.names[row]
+            if column == 1:
+                return str(snapshot.pids[row])
+            if column == 2:
+                return snapshot.usernames[row]
+            if column == 3:
+                return f"{snapshot.cpu[row]:.1f}"
+            if column == 4:
+                return f"{snapshot.memory[row]:.1f}"
+            if column == 5:
+                return f"{self.subtree_cpu[row]:.1f}"
+            if column == 6:
+                return f"{self.subtree_memory[row]:.1f}"
+        elif role == Qt.ToolTipRole and column == 0:
+            return snapshot.names[row]
+        elif role == Qt.BackgroundRole and snapshot.cpu[row] > HIGH_CPU_PERCENT:
+            return HIGH_CPU_COLOR
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sort the children of every process by one column, keeping selections on their processes"""
+        if not 0 <= column < len(self.headers):
+            return
+        self.sort_column = column
+        self.sort_order = order
+        if not len(self.snapshot):
+            return
+
+        self.layoutAboutToBeChanged.emit()
+        self._sort_siblings()
+        old_indexes = self.persistentIndexList()
+        self.changePersistentIndexList(
+            old_indexes, [self.index_of(index.internalId(), index.column()) for index in old_indexes])
+        self.layoutChanged.emit()
+
+
+def tree_state(view, model, proxy=None):
+    """Return the expanded and selected processes and the scroll position of a view over a ProcessTreeModel"""
+    snapshot = model.snapshot
+    expanded = set()
+    for row, children in enumerate(model.tree.children):
+        if not children:
+            continue
+        index = model.index_of(row)
+        if view.isExpanded(proxy.mapFromSource(index) if proxy is not None else index):
+            expanded.add(snapshot.keys[row])
+    selected = []
+    for index in view.selectionModel().selectedRows():
+        if proxy is not None:
+            index = proxy.mapToSource(index)
+        selected.append(snapshot.keys[index.internalId()])
+    return expanded, selected, view.verticalScrollBar().value()
+
+
+def restore_tree_state(view, model, state, proxy=None):
+    """Expand, select and scroll like tree_state() found, for the processes still there"""
+    expanded, selected, scroll = state
+
+    def view_index(key):
+        row = model.rows.get(key)
+        if row is None:
+            return QModelIndex()
+        index = model.index_of(row)
+        return proxy.mapFromSource(index) if proxy is not None else index
+
+    for key in expanded:
+        index = view_index(key)
+        if index.isValid():
+            view.setExpanded(index, True)
+    selection = view.selectionModel()
+    for key in selected:
+        index = view_index(key)
+        if index.isValid():
+            selection.select(index, QItemSelectionModel.Select | QItemSelectionModel.Rows)
+    view.verticalScrollBar().setValue(scroll)
+
+
+class ProcessFilterProxy(QSortFilterProxyModel):
+    """Rows of one category that match a search query"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.category = 0
+        self.terms = []
+        self.matching = None  # Keys found by the last search, None shows every row
+        self.search_serial = 0
+        self.accepted = None  # Answers for every snapshot row while the whole filter is re-run
+        # Rows are filtered by name, PID and user, which don't change while a process runs,
+        # so value updates need no filtering pass
+        self.setDynamicSortFilter(False)
+
+    def setSourceModel(self, model):
+        # Searches of the previous model don't apply to the new one
+        self.category = 0
+        self.terms = []
+        self.matching = None
+        self.search_serial = 0
+        # In a tree the ancestors of matching processes stay visible; a flat list has no
+        # children to look into, so it skips the extra call per rejected row
+        self.setRecursiveFilteringEnabled(isinstance(model, ProcessTreeModel))
+        super().setSourceModel(model)
+
+    def set_filter(self, category, query):
+        """Show the rows matching a category bit (0 for all) and a search query"""
+        terms = parse_query(query)
+        if category == self.category and terms == self.terms:
+            return
+        self.category = category
+        self.terms = terms
+        if terms:
+            self.matching, self.search_serial = self.sourceModel().search(terms)
+        else:
+            self.matching = None
+
+        # Decide all rows in one pass, the per-row callbacks then only look the answer up
+        snapshot = self.sourceModel().snapshot
+        if category:
+            accepted = [bool(categories & category) for categories in snapshot.categories]
+        else:
+            accepted = [True] * len(snapshot)
+        if self.matching is not None:
+            matching = self.matching
+            accepted = [ok and key in matching for ok, key in zip(accepted, snapshot.keys)]
+        self.accepted = accepted
+        try:
+            self.invalidateFilter()
+        finally:
+            self.accepted = None
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        row = model.snapshot_row(source_row, source_parent)
+        if self.accepted is not None:
+            return self.accepted[row]
+        snapshot = model.snapshot
+        if self.category and not snapshot.categories[row] & self.category:
+            return False
+        if self.matching is None:
+            return True
+        key = snapshot.keys[row]
+        if key in self.matching:
+            return True
+        # Processes indexed after the search are tested on their own
+        index = model.search_index
+        return index.serials.get(key, -1) >= self.search_serial and index.matches(key, self.terms)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        # The source model sorts its columns directly, rows keep its order here
+        self.sourceModel().sort(column, order)
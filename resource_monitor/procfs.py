@@ -0,0 +1,409 @@
+"""Linux process reader that parses /proc directly
+
+psutil builds a Process object per process and opens, reads and parses a
+file for nearly every attribute it is asked for. For the few numbers a tick
+needs that overhead dominates once thousands of processes are tracked, so
+this backend reads them straight from procfs:
+
+    /proc/[pid]/stat     name, state, ppid, CPU times and start time
+    /proc/[pid]/statm    resident set size
+    /proc/[pid]/io       bytes read from and written to storage
+    /proc/[pid]/status   real UID, read once when a process starts being tracked
+
+The stat, statm and io files of tracked processes stay open and are re-read
+with pread(), which regenerates their contents without another open() and
+path lookup. A descriptor stays bound to the process it was opened for:
+once that process has exited reads fail with ESRCH, so a reused PID is never
+sampled as the old process. Only as many descriptors are kept as the
+open-file limit comfortably allows; past that, files are opened per read and
+the start time in stat tells a reused PID apart.
+
+ProcfsSampler plugs this into ResourceSampler and returns the same sample
+dicts. Failed reads raise the matching psutil exceptions, so the sampling
+loop handles both backends alike. System-wide data still comes from psutil,
+which needs only a few calls per tick.
+"""
+import errno
+import os
+import pwd
+import sys
+import time
+from collections import namedtuple
+
+import psutil
+
+from resource_monitor.pool import MIN_CPU_INTERVAL
+from resource_monitor.sampler import ResourceSampler
+from resource_monitor.tracker import ProcessTracker
+
+PROC_ROOT = "/proc"
+
+# Units of the CPU times in stat and of the page counts in statm
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+# Large enough for any stat, statm or io file
+READ_SIZE = 4096
+
+# Files kept open for every tracked process
+KEPT_FILES = ('stat', 'statm', 'io')
+
+# Share of the soft open-file limit that kept descriptors may use
+DESCRIPTOR_SHARE = 0.5
+
+# Socket tables covered by psutil's 'inet' connection kind
+INET_TABLES = ('tcp', 'tcp6', 'udp', 'udp6')
+
+# The kernel truncates process names in stat to this many characters
+COMM_LENGTH = 15
+
+MemoryInfo = namedtuple('MemoryInfo', ['rss', 'vms'])
+
+# uid -> user name, looked up once per uid
+_usernames = {}
+
+
+def available(proc_root=PROC_ROOT):
+    """Return True when procfs can be read on this platform"""
+    return sys.platform.startswith('linux') and os.path.isdir(proc_root)
+
+
+def _error(e, pid):
+    """Translate an OSError from a /proc read into the psutil exception"""
+    if e.errno in (errno.ENOENT, errno.ESRCH):
+        return psutil.NoSuchProcess(pid)
+    if e.errno in (errno.EACCES, errno.EPERM):
+        return psutil.AccessDenied(pid)
+    return e
+
+
+def read_file(path, size=READ_SIZE):
+    """Return up to size bytes of a file, opened only for this read"""
+    fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        return os.read(fd, size)
+    finally:
+        os.close(fd)
+
+
+def parse_stat(data):
+    """Return (name, state, ppid, CPU ticks, start ticks) from the contents of a stat file"""
+    # The name is in parentheses and may contain spaces and parentheses itself
+    start = data.index(b'(')
+    end = data.rindex(b')')
+    fields = data[end + 2:].split()
+    # fields[0] is field 3 of proc(5): state, ppid, ... utime (14), stime (15), starttime (22)
+    return (data[start + 1:end].decode('utf-8', 'replace'), fields[0], int(fields[1]),
+            int(fields[11]) + int(fields[12]), int(fields[19]))
+
+
+def parse_io(data):
+    """Return (read_bytes, write_bytes) from the contents of an io file"""
+    values = {}
+    for line in data.split(b'\n'):
+        key, _, value = line.partition(b': ')
+        if key in (b'read_bytes', b'write_bytes'):
+            values[key] = int(value)
+    return values.get(b'read_bytes', 0), values.get(b'write_bytes', 0)
+
+
+def boot_time(proc_root=PROC_ROOT):
+    """Return the boot time from /proc/stat in seconds since the epoch"""
+    with open(f"{proc_root}/stat", 'rb') as f:
+        for line in f:
+            if line.startswith(b'btime'):
+                return float(line.split()[1])
+    return 0.0
+
+
+def username(uid):
+    """Return the name of a user, or the uid as a string like psutil does"""
+    name = _usernames.get(uid)
+    if name is None:
+        try:
+            name = pwd.getpwuid(uid).pw_name
+        except KeyError:
+            name = str(uid)
+        _usernames[uid] = name
+    return name
+
+
+def socket_inodes(proc_root=PROC_ROOT):
+    """Return the inodes of all TCP and UDP sockets, as the strings used in fd links"""
+    inodes = set()
+    for table in INET_TABLES:
+        try:
+            with open(f"{proc_root}/net/{table}", 'rb') as f:
+                next(f, None)  # Header
+                for line in f:
+                    fields = line.split()
+                    # Sockets in TIME_WAIT have no inode and no owner
+                    if len(fields) > 9 and fields[9] != b'0':
+                        inodes.add(fields[9].decode())
+        except OSError:
+            continue
+    return inodes
+
+
+def descriptor_budget():
+    """Return how many descriptors may be kept open for tracked processes"""
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft == resource.RLIM_INFINITY:
+            soft = 65536
+    except (ImportError, ValueError, OSError):
+        soft = 1024
+    return int(soft * DESCRIPTOR_SHARE)
+
+
+class ProcHandle:
+    """Kept descriptors and CPU baseline of one tracked process"""
+
+    def __init__(self, pid, start_ticks, proc_root=PROC_ROOT, keep_open=True):
+        self.pid = pid
+        self.start_ticks = start_ticks
+        self.directory = f"{proc_root}/{pid}"
+        self.keep_open = keep_open
+        self.fds = {}  # file name -> open descriptor
+        self.last_cpu = None  # (CPU ticks, monotonic time) of the previous sample
+        self.username = None
+        self.name = None
+
+    def read(self, name):
+        """Return the current contents of one file of the process"""
+        try:
+            fd = self.fds.get(name)
+            if fd is not None:
+                return os.pread(fd, READ_SIZE, 0)
+            if not self.keep_open:
+                return read_file(f"{self.directory}/{name}")
+            fd = os.open(f"{self.directory}/{name}", os.O_RDONLY | os.O_CLOEXEC)
+            self.fds[name] = fd
+            return os.read(fd, READ_SIZE)
+        except OSError as e:
+            raise _error(e, self.pid) from None
+
+    def prime(self, cpu_ticks, timestamp):
+        """Start the CPU time baseline so the first sample is a real delta
+
+        timestamp is the monotonic time the ticks were read at, not when the
+        scan that read them finished, or the first delta comes out too high.
+        """
+        self.last_cpu = (cpu_ticks, timestamp)
+
+    def sample(self, read_io=True):
+        """Return (ppid, CPU percent, MemoryInfo, (read_bytes, write_bytes) or None)"""
+        _, state, ppid, cpu_ticks, start_ticks = parse_stat(self.read('stat'))
+        if start_ticks != self.start_ticks:
+            # The PID now belongs to a different process
+            raise psutil.NoSuchProcess(self.pid)
+        if state == b'Z':
+            raise psutil.ZombieProcess(self.pid)
+
+        # Percent of one CPU like psutil.Process.cpu_percent()
+        now = time.monotonic()
+        cpu_percent = 0.0
+        # Over a shorter interval, e.g. right after the scan primed the handle, ticks only
+        # quantize to 0 or hundreds of percent; the baseline is kept for the next sample
+        if self.last_cpu is None:
+            self.last_cpu = (cpu_ticks, now)
+        elif now - self.last_cpu[1] >= MIN_CPU_INTERVAL:
+            cpu_percent = round((cpu_ticks - self.last_cpu[0]) / CLOCK_TICKS / (now - self.last_cpu[1]) * 100, 1)
+            self.last_cpu = (cpu_ticks, now)
+
+        statm = self.read('statm').split()
+        memory_info = MemoryInfo(int(statm[1]) * PAGE_SIZE, int(statm[0]) * PAGE_SIZE)
+
+        counters = None
+        if read_io:
+            try:
+                counters = parse_io(self.read('io'))
+            except psutil.AccessDenied:
+                # Other users' io files need ptrace access
+                pass
+        return ppid, cpu_percent, memory_info, counters
+
+    def cmdline(self):
+        """Return the command line as a list of arguments"""
+        try:
+            with open(f"{self.directory}/cmdline", 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            raise _error(e, self.pid) from None
+        return [arg.decode('utf-8', 'replace') for arg in data.rstrip(b'\0').split(b'\0')] if data else []
+
+    def count_sockets(self, inodes):
+        """Return how many of the given socket inodes the process has open"""
+        count = 0
+        try:
+            with os.scandir(f"{self.directory}/fd") as entries:
+                for entry in entries:
+                    try:
+                        target = os.readlink(entry.path)
+                    except OSError:
+                        continue
+                    if target.startswith('socket:[') and target[8:-1] in inodes:
+                        count += 1
+        except OSError:
+            # Other users' fd tables are not readable
+            return 0
+        return count
+
+    def close(self):
+        """Close the kept descriptors"""
+        for fd in self.fds.values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = {}
+
+
+class ProcfsTracker(ProcessTracker):
+    """ProcessTracker that discovers processes by scanning /proc"""
+
+    def __init__(self, rescan_interval=10.0, proc_root=PROC_ROOT):
+        super().__init__(rescan_interval)
+        self.proc_root = proc_root
+        self.boot_time = boot_time(proc_root)
+        self.max_kept = descriptor_budget() // len(KEPT_FILES)
+
+    def refresh(self, matcher, force=False):
+        """Rediscover matching processes if due, return True when a scan ran"""
+        now = time.monotonic()
+        if not force and not self.needs_rescan(matcher, now):
+            return False
+
+        previous = {key: handle for key, (handle, _) in self.tracked.items()}
+        kept = sum(handle.keep_open for handle in previous.values())
+        scanned = []
+        with os.scandir(self.proc_root) as entries:
+            for entry in entries:
+                if not entry.name.isdigit():
+                    continue
+                try:
+                    scanned.append(self._read_info(int(entry.name), matcher))
+                except (psutil.AccessDenied, psutil.NoSuchProcess):
+                    continue
+
+        # tree: selectors need the parents of all processes before any of them is matched
+        trees = matcher.match_trees([info for info, *_ in scanned]) if matcher.needs_tree else {}
+        tracked = {}
+        for info, cpu_ticks, cpu_time, start_ticks in scanned:
+            pid = info['pid']
+            matches = matcher.match_info(info, trees.get(pid))
+            if not matches:
+                continue
+            key = (pid, info['create_time'])
+            handle = previous.pop(key, None)
+            if handle is None:
+                handle = ProcHandle(pid, start_ticks, self.proc_root, keep_open=kept < self.max_kept)
+                kept += handle.keep_open
+                handle.username = self._read_username(pid)
+                handle.prime(cpu_ticks, cpu_time)
+            handle.name = info['name']
+            tracked[key] = (handle, matches)
+
+        # Close the descriptors of processes that are no longer tracked
+        for handle in previous.values():
+            handle.close()
+        self.tracked = tracked
+        self.matcher = matcher
+        self.last_scan = now
+        self.stale = False
+        self.scan_count += 1
+        return True
+
+    def _read_info(self, pid, matcher):
+        """Return the fields matcher needs, the CPU ticks with the time they were read and the start ticks"""
+        directory = f"{self.proc_root}/{pid}"
+        try:
+            name, state, ppid, cpu_ticks, start_ticks = parse_stat(read_file(f"{directory}/stat"))
+        except OSError as e:
+            raise _error(e, pid) from None
+        cpu_time = time.monotonic()
+        if state == b'Z':
+            # Exited processes waiting to be reaped would be dropped right away
+            raise psutil.NoSuchProcess(pid)
+        info = {'pid': pid, 'ppid': ppid, 'name': name, 'create_time': start_ticks / CLOCK_TICKS + self.boot_time}
+
+        cmdline = None
+        if matcher.needs_cmdline or len(name) >= COMM_LENGTH:
+            try:
+                cmdline = ProcHandle(pid, start_ticks, self.proc_root).cmdline()
+            except psutil.Error:
+                cmdline = None
+            # Like psutil, complete truncated names from the first argument
+            if len(name) >= COMM_LENGTH and cmdline:
+                full_name = os.path.basename(cmdline[0])
+                if full_name.startswith(name):
+                    info['name'] = full_name
+        if matcher.needs_cmdline:
+            info['cmdline'] = cmdline
+        if matcher.needs_exe:
+            try:
+                info['exe'] = os.readlink(f"{directory}/exe")
+            except OSError:
+                info['exe'] = None
+        return info, cpu_ticks, cpu_time, start_ticks
+
+    def _read_username(self, pid):
+        """Return the owner of a process from the real UID in its status file"""
+        try:
+            with open(f"{self.proc_root}/{pid}/status", 'rb') as f:
+                for line in f:
+                    if line.startswith(b'Uid:'):
+                        return username(int(line.split()[1]))
+        except OSError:
+            pass
+        return None
+
+    def discard(self, key):
+        """Forget a process that has exited and rescan on the next refresh"""
+        entry = self.tracked.pop(key, None)
+        if entry is not None:
+            entry[0].close()
+            self.stale = True
+
+    def close(self):
+        """Close the descriptors of all tracked processes"""
+        for handle, _ in self.tracked.values():
+            handle.close()
+        self.tracked = {}
+        self.stale = True
+
+
+class ProcfsSampler(ResourceSampler):
+    """ResourceSampler that reads the tracked processes from /proc instead of through psutil"""
+
+    def __init__(self, *args, proc_root=PROC_ROOT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.proc_root = proc_root
+        self.tracker = ProcfsTracker(self.tracker.rescan_interval, proc_root)
+
+    def _count_connections(self):
+        """Count inet sockets of the tracked processes from /proc/net and their fd tables"""
+        inodes = socket_inodes(self.proc_root)
+        counts = {}
+        if inodes:
+            for (pid, _), (handle, _) in self.tracker.items():
+                counts[pid] = handle.count_sockets(inodes)
+        return counts
+
+    def _read_process(self, key, proc, attrs, current_process_network):
+        """Read one tracked process from its kept /proc files"""
+        ppid, cpu_percent, memory_info, counters = proc.sample()
+        info = {'pid': key[0], 'ppid': ppid, 'cpu_percent': cpu_percent, 'memory_info': memory_info,
+                'username': proc.username}
+        if 'cmdline' in attrs:
+            info['cmdline'] = proc.cmdline()
+        if 'name' in attrs:
+            info['name'] = proc.name
+        metrics = self._sample_process(proc, info, current_process_network)
+        return info, metrics, counters
+
+    def close(self):
+        """Stop the worker pool and close all kept descriptors"""
+        super().close()
+        self.tracker.close()
@@ -0,0 +1,89 @@
+"""Parent/child hierarchy of processes with subtree rollups
+
+Services such as browsers and worker pools are trees: one parent process
+starting renderers, workers or helpers. ProcessTree links a list of
+processes to their parents through a pid -> row index, so building the tree
+is a single pass over the rows, however deep it is. Rows are also put in
+breadth-first order, parents before their children, which lets rollup()
+sum any per-process value over every subtree in one more linear pass: walk
+the order backwards and add each row's total to its parent's.
+
+A process whose parent is not among the rows is a root. PID reuse can make a
+process appear as the parent of its own ancestor; such cycles are broken at
+the first row found on them, which becomes a root.
+"""
+from collections import deque
+
+
+class ProcessTree:
+    """Parent and children of each row of parallel pid and ppid lists"""
+
+    def __init__(self, pids, ppids):
+        index = {pid: row for row, pid in enumerate(pids)}
+        self.parents = []
+        for row, ppid in enumerate(ppids):
+            parent = index.get(ppid, -1)
+            # PID 0 and a few kernel threads are their own parents
+            self.parents.append(parent if parent != row else -1)
+        self.children = [[] for _ in self.parents]
+        self.roots = []
+        for row, parent in enumerate(self.parents):
+            if parent < 0:
+                self.roots.append(row)
+            else:
+                self.children[parent].append(row)
+
+        # Breadth-first order from the roots, rows on a cycle are not reached
+        visited = [False] * len(self.parents)
+        self.order = []
+        self._visit(self.roots, visited)
+        if len(self.order) < len(self.parents):
+            for row, seen in enumerate(visited):
+                if seen:
+                    continue
+                self.children[self.parents[row]].remove(row)
+                self.parents[row] = -1
+                self.roots.append(row)
+                self._visit([row], visited)
+
+    def __len__(self):
+        return len(self.parents)
+
+    def _visit(self, rows, visited):
+        """Append rows and everything below them to the order"""
+        queue = deque(rows)
+        for row in rows:
+            visited[row] = True
+        while queue:
+            row = queue.popleft()
+            self.order.append(row)
+            for child in self.children[row]:
+                if not visited[child]:
+                    visited[child] = True
+                    queue.append(child)
+
+    def rollup(self, values):
+        """Return the sum of values over the subtree of every row"""
+        totals = list(values)
+        parents = self.parents
+        for row in reversed(self.order):
+            parent = parents[row]
+            if parent >= 0:
+                totals[parent] += totals[row]
+        return totals
+
+    def root_rows(self):
+        """Return the row of the topmost ancestor of every row"""
+        roots = list(range(len(self.parents)))
+        for row in self.order:
+            parent = self.parents[row]
+            if parent >= 0:
+                roots[row] = roots[parent]
+        return roots
+
+    def subtree(self, row):
+        """Return a row and all rows below it, parents before children"""
+        rows = [row]
+        for current in rows:
+            rows.extend(self.children[current])
+        return rows
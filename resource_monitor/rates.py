@@ -0,0 +1,114 @@
+"""Rates from cumulative counters
+
+psutil reports I/O as counters that only ever grow. RateEngine keeps the
+previous snapshot and its monotonic timestamp for every key (a process,
+NIC or disk) and turns the next snapshot into per-second rates. All keys
+seen in one update are computed together with NumPy array operations.
+
+A counter that goes backwards has either wrapped around or been reset (a
+NIC was re-created, a driver reloaded). With ``wrap`` set to the counter's
+modulus, e.g. 2 ** 32, a decrease is treated as a wraparound when that gives
+a plausible delta; otherwise the counter is assumed to restart from zero and
+its current value is the delta.
+"""
+import time
+
+import numpy as np
+
+
+class RateEngine:
+    """Per-second rates of groups of counters, batched over many keys"""
+
+    def __init__(self, columns=1, wrap=None):
+        self.columns = columns
+        self.wrap = wrap
+        self.index = {}  # key -> row in values/timestamps
+        self.keys = []
+        self.values = np.zeros((0, columns), dtype=np.float64)
+        self.timestamps = np.zeros(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, samples, timestamp=None, drop_missing=True):
+        """Store a snapshot and return {key: array of rates per second}
+
+        samples maps each key to a sequence of ``columns`` counter values.
+        Keys seen for the first time get zero rates. With drop_missing, keys
+        absent from samples are forgotten, e.g. processes that have exited.
+        """
+        now = time.monotonic() if timestamp is None else timestamp
+        if not samples:
+            if drop_missing:
+                self.clear()
+            return {}
+
+        keys = list(samples)
+        current = np.array([samples[key] for key in keys], dtype=np.float64).reshape(len(keys), self.columns)
+
+        # Rows of keys we have a previous snapshot for
+        rows = np.array([self.index.get(key, -1) for key in keys], dtype=np.int64)
+        known = rows >= 0
+        rates = np.zeros_like(current)
+
+        if known.any():
+            known_rows = rows[known]
+            delta = current[known] - self.values[known_rows]
+            elapsed = now - self.timestamps[known_rows]
+
+            backwards = delta < 0
+            if backwards.any():
+                if self.wrap is not None:
+                    wrapped = delta + self.wrap
+                    # A wrap can't produce more than one modulus worth of progress
+                    plausible = backwards & (wrapped >= 0) & (wrapped < self.wrap)
+                    delta = np.where(plausible, wrapped, delta)
+                    backwards = delta < 0
+                # Reset counters started over from zero
+                delta = np.where(backwards, current[known], delta)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                known_rates = delta / elapsed[:, None]
+            known_rates[~(elapsed > 0)] = 0.0
+            rates[known] = known_rates
+
+        self._store(keys, rows, current, now, drop_missing)
+        return {key: rates[i] for i, key in enumerate(keys)}
+
+    def _store(self, keys, rows, current, now, drop_missing):
+        """Remember the snapshot for the next update"""
+        if drop_missing:
+            # Rebuild compactly from this snapshot only
+            self.keys = keys
+            self.index = {key: i for i, key in enumerate(keys)}
+            self.values = current
+            self.timestamps = np.full(len(keys), now, dtype=np.float64)
+            return
+
+        known = rows >= 0
+        self.values[rows[known]] = current[known]
+        self.timestamps[rows[known]] = now
+        new = np.flatnonzero(~known)
+        if len(new):
+            for i in new:
+                self.index[keys[i]] = len(self.keys)
+                self.keys.append(keys[i])
+            self.values = np.vstack([self.values, current[new]])
+            self.timestamps = np.concatenate([self.timestamps, np.full(len(new), now)])
+
+    def forget(self, key):
+        """Drop the snapshot of one key"""
+        row = self.index.pop(key, None)
+        if row is None:
+            return
+        self.keys.pop(row)
+        self.values = np.delete(self.values, row, axis=0)
+        self.timestamps = np.delete(self.timestamps, row)
+        self.index = {k: i for i, k in enumerate(self.keys)}
+
+    def clear(self):
+        """Drop all snapshots"""
+        self.index = {}
+        self.keys = []
+        self.values = np.zeros((0, self.columns), dtype=np.float64)
+        self.timestamps = np.zeros(0, dtype=np.float64)
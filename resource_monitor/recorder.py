@@ -0,0 +1,179 @@
+"""Continuous recording of samples to disk
+
+export_data() can only save what the in-memory history still holds.
+Recorder appends every sample to a file as it arrives, so a run of any
+length is kept completely while memory use stays flat: samples are
+formatted into a small text buffer that is written out when it reaches
+buffer_size bytes or flush_interval seconds have passed, whichever comes
+first.
+
+Files can be rotated by size (max_bytes) and by age (max_age seconds).
+With rotation enabled the segments are numbered, samples.0001.jsonl,
+samples.0002.jsonl, ..., and max_files keeps only the newest ones. Every
+CSV segment starts with its own header, so each file can be read on its
+own.
+
+Formats:
+    jsonl   one {"timestamp": ..., "software": {name: metrics}} object per line
+    csv     one row per series and sample with the columns in CSV_COLUMNS
+
+open_recorder() also handles the binary columnar format (.rmc) of
+resource_monitor.columnar and the SQLite history database (.db) of
+resource_monitor.store.
+"""
+import csv
+import io
+import json
+import os
+import time
+
+from resource_monitor.columnar import ColumnarWriter, segment_path
+from resource_monitor.store import HistoryDatabase
+
+RECORD_FORMATS = ('jsonl', 'csv')
+
+# Metrics written per series and sample
+RECORD_METRICS = ['cpu', 'memory', 'network', 'disk', 'gpu', 'pid', 'username', 'count']
+
+CSV_COLUMNS = ['timestamp', 'software'] + RECORD_METRICS
+
+
+def jsonl_line(timestamp, data):
+    """Format one sample as a JSON line"""
+    return json.dumps({"timestamp": timestamp, "software": data}, ensure_ascii=False) + "\n"
+
+
+def csv_rows(timestamp, data):
+    """Rows of one sample, one per series"""
+    return [[timestamp, software] + [metrics.get(metric) for metric in RECORD_METRICS]
+            for software, metrics in data.items()]
+
+
+def open_recorder(path, flush_interval=5.0, max_bytes=0, max_age=0, max_files=0):
+    """Open a recorder for path; .rmc is columnar, .db SQLite, .csv CSV, anything else JSON lines
+
+    Columnar recordings and databases are a single file, the rotation
+    options only apply to the text formats. Databases roll up in the
+    background until closed.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.rmc':
+        return ColumnarWriter(path, flush_interval=flush_interval)
+    if ext in ('.db', '.sqlite', '.sqlite3'):
+        database = HistoryDatabase(path, flush_interval=flush_interval)
+        database.start_rollups()
+        return database
+    format_type = 'csv' if ext == '.csv' else 'jsonl'
+    return Recorder(path, format_type, flush_interval=flush_interval, max_bytes=max_bytes,
+                    max_age=max_age, max_files=max_files)
+
+
+class Recorder:
+    """Append samples to JSON lines or CSV files with buffering and rotation"""
+
+    def __init__(self, path, format_type='jsonl', buffer_size=64 * 1024, flush_interval=5.0,
+                 max_bytes=0, max_age=0, max_files=0):
+        if format_type not in RECORD_FORMATS:
+            raise ValueError(f"Unknown record format {format_type!r}, expected one of {', '.join(RECORD_FORMATS)}")
+        self.path = path
+        self.format_type = format_type
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_files = max_files
+        self.rotating = bool(max_bytes or max_age)
+
+        self.buffer = io.StringIO()
+        self.csv_writer = csv.writer(self.buffer, lineterminator="\n")
+        self.file = None
+        self.index = 0  # Number of the current segment
+        self.paths = []  # Segments written so far, oldest first
+        self.size = 0  # Bytes in the current segment
+        self.header_size = 0  # Bytes of the CSV header at the start of each segment
+        self.opened = 0.0  # time.monotonic() the current segment was opened
+        self.last_flush = time.monotonic()
+        self.samples = 0
+        self._open_segment()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def current_path(self):
+        """File samples are currently written to"""
+        return self.paths[-1] if self.paths else None
+
+    def write(self, timestamp, data):
+        """Buffer one sample {name: metrics}, flushing and rotating as configured"""
+        if self.file is None:
+            raise ValueError("write to a closed recorder")
+        now = time.monotonic()
+        if self.max_age and now - self.opened >= self.max_age:
+            self._rotate()
+
+        if self.format_type == 'jsonl':
+            self.buffer.write(jsonl_line(timestamp, data))
+        else:
+            self.csv_writer.writerows(csv_rows(timestamp, data))
+        self.samples += 1
+
+        if self.buffer.tell() >= self.buffer_size or now - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered samples to the file"""
+        self.last_flush = time.monotonic()
+        if self.file is None or not self.buffer.tell():
+            return
+        chunk = self.buffer.getvalue().encode('utf-8')
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        if self.max_bytes and self.size > self.header_size and self.size + len(chunk) > self.max_bytes:
+            self._rotate()
+        self.file.write(chunk)
+        self.file.flush()
+        self.size += len(chunk)
+
+    def close(self):
+        """Flush and close the current file"""
+        if self.file is None:
+            return
+        self.flush()
+        self.file.close()
+        self.file = None
+
+    def _rotate(self):
+        """Close the current segment and start the next one"""
+        self.flush()
+        self.file.close()
+        self._open_segment()
+
+    def _open_segment(self):
+        """Open a new file and write the CSV header"""
+        self.index += 1
+        path = segment_path(self.path, self.index) if self.rotating else self.path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(path, 'wb')
+        self.paths.append(path)
+        self.size = 0
+        self.opened = time.monotonic()
+
+        # Remove the oldest segments beyond max_files
+        while self.max_files and len(self.paths) > self.max_files:
+            old = self.paths.pop(0)
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+        if self.format_type == 'csv':
+            header = io.StringIO()
+            csv.writer(header, lineterminator="\n").writerow(CSV_COLUMNS)
+            chunk = header.getvalue().encode('utf-8')
+            self.file.write(chunk)
+            self.size = self.header_size = len(chunk)
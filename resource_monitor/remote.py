@@ -0,0 +1,472 @@
+"""Remote agents and a central collector over TCP
+
+An Agent runs next to the sampler on every monitored machine and streams
+samples to one Collector, which merges them into a single sample stream
+for the charts, recorders and exporters. Series are renamed to
+"host: name", so the host is one more dimension of the series name.
+
+Wire format: every message is a frame of a 4-byte little-endian length
+followed by a batch payload. A payload starts with a flags byte (1 when the
+rest is zlib-compressed) and contains
+
+    string table    u16 count, then u16 length + UTF-8 bytes per string
+    host            u16 string index
+    samples         u32 count, then per sample f8 timestamp, u16 series
+                    count and per series a SERIES record
+
+Names and usernames are indexes into the string table, so a batch of a
+minute of samples of a few series is mostly fixed-size binary records.
+
+Backpressure: the collector reads a frame only after the previous one was
+accepted by its bounded queue. A slow consumer stops the reads, TCP flow
+control then stops the agent's drain(), and samples accumulate in the
+agent's bounded buffer, where the oldest are dropped. Agents reconnect with
+exponential backoff and send what was buffered meanwhile.
+
+Agents sample on their own clocks. HostMerger puts samples into buckets of
+the collector interval and emits a bucket once it is `delay` seconds old,
+so all hosts share one time axis in the history. Emitted buckets are
+tracked per host: the backlog an agent resends after a reconnect, or the
+samples of an agent whose clock is behind, belong to buckets already
+emitted for the other hosts. They are not dropped but collected as
+backfill, up to `max_backfill` seconds back, and passed to a separate
+callback once the agent has moved past them, since charts and exporters
+expect the main stream in time order. Only samples at or before the last
+bucket emitted with the same host's data are late.
+"""
+import asyncio
+import collections
+import math
+import socket
+import struct
+import threading
+import time
+import zlib
+
+from resource_monitor.history import METRICS
+
+DEFAULT_PORT = 9106
+
+# Frame header: payload length
+FRAME = struct.Struct("<I")
+
+# Largest accepted payload, a corrupt length must not allocate gigabytes
+MAX_FRAME = 64 * 1024 * 1024
+
+# Samples per batch, a long backlog after a reconnect is sent in pieces
+MAX_BATCH = 3600
+
+# Name, username, pid, instance count and the metrics of one series
+SERIES = struct.Struct(f"<HHii{len(METRICS)}f")
+
+SAMPLE = struct.Struct("<dH")
+
+NO_STRING = 0xFFFF
+
+FLAG_ZLIB = 1
+
+# Payloads shorter than this are sent uncompressed
+COMPRESS_THRESHOLD = 512
+
+HOST_SEPARATOR = ": "
+
+
+def parse_address(text, default_port=DEFAULT_PORT, default_host=''):
+    """Split "host:port", "host" or "port" into (host, port)"""
+    host, _, port = text.rpartition(':')
+    if not _:
+        if text.isdigit():
+            return default_host, int(text)
+        return text, default_port
+    return host.strip('[]') or default_host, int(port)
+
+
+def encode_batch(host, samples):
+    """Encode [(timestamp, {name: metrics})] of one host as a payload"""
+    strings = {}
+
+    def index(text):
+        if text is None:
+            return NO_STRING
+        return strings.setdefault(str(text), len(strings))
+
+    host_index = index(host)
+    body = [struct.pack("<I", len(samples))]
+    for timestamp, data in samples:
+        body.append(SAMPLE.pack(timestamp, len(data)))
+        for name, metrics in data.items():
+            pid = metrics.get('pid')
+            values = [math.nan if metrics.get(metric) is None else metrics[metric] for metric in METRICS]
+            body.append(SERIES.pack(index(name), index(metrics.get('username')), -1 if pid is None else pid,
+                                    metrics.get('count', 1), *values))
+    if len(strings) >= NO_STRING:
+        raise ValueError("too many distinct names in one batch")
+
+    table = [struct.pack("<H", len(strings))]
+    for text in strings:
+        encoded = text.encode('utf-8')
+        table.append(struct.pack("<H", len(encoded)) + encoded)
+    payload = b"".join(table) + struct.pack("<H", host_index) + b"".join(body)
+    if len(payload) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(payload, 1)
+        if len(compressed) < len(payload):
+            return bytes([FLAG_ZLIB]) + compressed
+    return b"\x00" + payload
+
+
+def decode_batch(payload):
+    """Return (host, [(timestamp, {name: metrics})]) of a payload"""
+    view = zlib.decompress(payload[1:]) if payload[0] & FLAG_ZLIB else payload[1:]
+    (count,) = struct.unpack_from("<H", view)
+    offset = 2
+    strings = []
+    for _ in range(count):
+        (length,) = struct.unpack_from("<H", view, offset)
+        strings.append(bytes(view[offset + 2:offset + 2 + length]).decode('utf-8'))
+        offset += 2 + length
+    host_index, sample_count = struct.unpack_from("<HI", view, offset)
+    offset += 6
+
+    samples = []
+    for _ in range(sample_count):
+        timestamp, series_count = SAMPLE.unpack_from(view, offset)
+        offset += SAMPLE.size
+        data = {}
+        for _ in range(series_count):
+            name, username, pid, instances, *values = SERIES.unpack_from(view, offset)
+            offset += SERIES.size
+            metrics = {metric: None if value != value else value for metric, value in zip(METRICS, values)}
+            metrics['pid'] = None if pid == -1 else pid
+            metrics['username'] = None if username == NO_STRING else strings[username]
+            metrics['count'] = instances
+            data[strings[name]] = metrics
+        samples.append((timestamp, data))
+    return strings[host_index], samples
+
+
+def frame(payload):
+    """Prefix a payload with its length"""
+    return FRAME.pack(len(payload)) + payload
+
+
+class Agent:
+    """Stream samples to a collector from a background thread
+
+    write() only appends to a bounded buffer and can be called from the
+    sampling loop; it has the write/close interface of Recorder.
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT, name=None, batch_interval=1.0, max_pending=3600,
+                 reconnect_delay=1.0, max_reconnect_delay=30.0):
+        self.address = (host, port)
+        self.name = name or socket.gethostname()
+        self.batch_interval = batch_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.pending = collections.deque(maxlen=max_pending)
+        self.lock = threading.Lock()  # Keeps write() out while a failed batch is put back
+        self.dropped = 0  # Samples lost because the buffer was full
+        self.invalid = 0  # Samples dropped because they couldn't be encoded
+        self.sent = 0
+        self.connections = 0
+        self.connected = False
+        self.stopping = False
+        self.loop = asyncio.new_event_loop()
+        self.stop_event = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, timestamp, data):
+        """Queue one sample for the next batch"""
+        with self.lock:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append((timestamp, data))
+
+    def close(self, timeout=5.0):
+        """Send what is buffered, if connected, and stop"""
+        if self.thread is None:
+            return
+        self.stopping = True
+        if self.stop_event is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def _run(self):
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.loop.close()
+
+    async def _sleep(self, seconds):
+        """Sleep, returning early when close() is called"""
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _main(self):
+        self.stop_event = asyncio.Event()
+        if self.stopping:
+            return
+        delay = self.reconnect_delay
+        while not self.stopping:
+            try:
+                reader, writer = await asyncio.open_connection(*self.address)
+            except OSError:
+                await self._sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            delay = self.reconnect_delay
+            self.connected = True
+            self.connections += 1
+            try:
+                while not self.stopping:
+                    await self._send(writer)
+                    if reader.at_eof():
+                        break
+                    await self._sleep(self.batch_interval)
+                await self._send(writer)
+                writer.close()
+                await writer.wait_closed()
+            except OSError:
+                pass
+            finally:
+                self.connected = False
+                writer.close()
+
+    def _requeue(self, samples):
+        """Put an unsent batch back in front of the buffer to send it again after reconnecting"""
+        with self.lock:
+            # write() may have refilled the buffer meanwhile; the batch holds the oldest samples,
+            # drop those explicitly, extendleft() on a full deque would drop the newest
+            overflow = max(0, len(self.pending) + len(samples) - self.pending.maxlen)
+            self.dropped += overflow
+            self.pending.extendleft(reversed(samples[overflow:]))
+
+    def _encode(self, samples):
+        """Return the payloads of a batch, leaving out the samples that can't be encoded"""
+        try:
+            return [encode_batch(self.name, samples)]
+        except (ValueError, TypeError, struct.error) as e:
+            if len(samples) == 1:
+                self.invalid += 1
+                print(f"Agent: dropping a sample that can't be encoded: {e}")
+                return []
+        # Split the batch to find the bad samples, or to fit the string table
+        middle = len(samples) // 2
+        return self._encode(samples[:middle]) + self._encode(samples[middle:])
+
+    async def _send(self, writer):
+        """Send the buffered samples in batches, waiting while the collector isn't reading"""
+        while self.pending:
+            samples = [self.pending.popleft() for _ in range(min(len(self.pending), MAX_BATCH))]
+            invalid = self.invalid
+            payloads = self._encode(samples)
+            try:
+                for payload in payloads:
+                    writer.write(frame(payload))
+                await writer.drain()
+            except OSError:
+                self.invalid = invalid
+                self._requeue(samples)
+                raise
+            self.sent += len(samples) - (self.invalid - invalid)
+
+
+class HostMerger:
+    """Align samples of many hosts on one time axis"""
+
+    def __init__(self, interval=1.0, delay=2.0, separator=HOST_SEPARATOR, max_backfill=3600.0):
+        self.interval = interval
+        self.delay = delay
+        self.separator = separator
+        self.max_backfill = max_backfill
+        self.buckets = {}  # Bucket number -> {host: {name: metrics}}
+        self.backfill = {}  # Bucket number -> {host: {name: metrics}} of buckets already emitted
+        self.emitted = None  # Last emitted bucket number
+        self.host_emitted = {}  # Host -> last bucket number emitted with its samples
+        self.newest = {}  # Host -> newest bucket number received
+        self.late = 0  # Samples that arrived after their bucket was emitted for their host
+        self.backfilled = 0  # Samples merged into buckets already emitted for other hosts
+
+    def add(self, host, timestamp, data):
+        """Put a sample of host into the bucket of its timestamp"""
+        number = int(timestamp // self.interval)
+        if number <= self.host_emitted.get(host, -math.inf):
+            self.late += 1
+            return
+        if self.emitted is not None and number <= self.emitted:
+            if not self.max_backfill or number < self.emitted - self.max_backfill / self.interval:
+                self.late += 1
+                return
+            buckets = self.backfill
+            self.backfilled += 1
+        else:
+            buckets = self.buckets
+        buckets.setdefault(number, {}).setdefault(host, {}).update(data)
+        self.newest[host] = max(number, self.newest.get(host, number))
+
+    def _pop(self, buckets, numbers):
+        """Remove buckets and return them as [(timestamp, {"host: name": metrics})]"""
+        merged = []
+        for number in numbers:
+            data = {}
+            for host, series in buckets.pop(number).items():
+                self.host_emitted[host] = max(number, self.host_emitted.get(host, number))
+                for name, metrics in series.items():
+                    data[f"{host}{self.separator}{name}"] = metrics
+            merged.append((number * self.interval, data))
+        return merged
+
+    def pop_ready(self, now=None):
+        """Return [(timestamp, data)] of the buckets older than delay, in time order"""
+        now = time.time() if now is None else now
+        # Buckets that ended at least delay seconds ago
+        last = int((now - self.delay) // self.interval) - 1
+        numbers = sorted(number for number in self.buckets if number <= last)
+        if numbers:
+            self.emitted = max(numbers[-1], self.emitted if self.emitted is not None else numbers[-1])
+        return self._pop(self.buckets, numbers)
+
+    def pop_backfill(self, flush=False):
+        """Return [(timestamp, data)] of backfilled buckets all of whose hosts have moved past them
+
+        Only the backfilled series are in data, the other hosts' series of
+        the same timestamp were emitted before.
+        """
+        numbers = sorted(number for number, hosts in self.backfill.items()
+                         if flush or all(self.newest[host] > number for host in hosts))
+        return self._pop(self.backfill, numbers)
+
+
+class Collector:
+    """Receive batches from any number of agents and merge them
+
+    callback(timestamp, data) is called with merged samples from the thread
+    that runs serve(), in time order. backfill(timestamp, data) is called
+    from the same thread with the series of hosts that were behind, for
+    timestamps already passed to callback; without it they are dropped.
+    """
+
+    def __init__(self, callback, host='', port=DEFAULT_PORT, interval=1.0, delay=None, max_queue=256,
+                 backfill=None, max_backfill=3600.0):
+        self.callback = callback
+        self.backfill = backfill
+        self.address = (host, port)
+        self.merger = HostMerger(interval, 2 * interval + 1.0 if delay is None else delay,
+                                 max_backfill=max_backfill if backfill is not None else 0.0)
+        self.max_queue = max_queue
+        self.hosts = {}  # Host name -> {'peer', 'connected', 'samples', 'last_seen'}
+        self.loop = None
+        self.server = None
+        self.stop_event = None
+        self.stopping = False
+        self.connections = {}  # Writer -> handler task of every open agent connection
+        self.ready = threading.Event()
+
+    @property
+    def port(self):
+        """Port the server listens on, useful when 0 was given"""
+        self.ready.wait()
+        return self.server.sockets[0].getsockname()[1] if self.server else None
+
+    def serve(self):
+        """Serve until stop() is called"""
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self.ready.set()
+
+    def start(self):
+        """Serve in a daemon thread, return once listening"""
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        return self
+
+    def stop(self):
+        """Stop serving, may be called from any thread"""
+        self.stopping = True
+        if self.loop is not None and self.stop_event is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        queue = asyncio.Queue(self.max_queue)
+        self.server = await asyncio.start_server(lambda reader, writer: self._handle(reader, writer, queue),
+                                                 *self.address)
+        self.ready.set()
+        consumer = asyncio.create_task(self._consume(queue))
+        try:
+            if not self.stopping:
+                await self.stop_event.wait()
+        finally:
+            self.server.close()
+            # Open connections are not closed by the server, end their handlers
+            for writer in list(self.connections):
+                writer.close()
+            await asyncio.gather(*self.connections.values(), return_exceptions=True)
+            await self.server.wait_closed()
+            consumer.cancel()
+            # Emit what was received, also the bucket still being filled
+            self._emit(time.time() + self.merger.delay + self.merger.interval, flush=True)
+
+    async def _handle(self, reader, writer, queue):
+        """Read the frames of one agent connection"""
+        peer = writer.get_extra_info('peername')
+        self.connections[writer] = asyncio.current_task()
+        host = None
+        try:
+            while True:
+                (length,) = FRAME.unpack(await reader.readexactly(FRAME.size))
+                if length > MAX_FRAME:
+                    print(f"Collector: frame of {length} bytes from {peer}, closing the connection")
+                    break
+                host, samples = decode_batch(await reader.readexactly(length))
+                state = self.hosts.setdefault(host, {'samples': 0})
+                state.update(peer=peer, connected=True, last_seen=time.time())
+                state['samples'] += len(samples)
+                # Waits while the queue is full, which stops reading from this agent
+                await queue.put((host, samples))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except (ValueError, struct.error, zlib.error, UnicodeDecodeError, IndexError) as e:
+            print(f"Collector: invalid batch from {peer}: {e}")
+        finally:
+            if host in self.hosts:
+                self.hosts[host]['connected'] = False
+            del self.connections[writer]
+            writer.close()
+
+    async def _consume(self, queue):
+        """Merge received samples and emit complete buckets"""
+        while True:
+            try:
+                host, samples = await asyncio.wait_for(queue.get(), self.merger.interval / 2)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                for timestamp, data in samples:
+                    self.merger.add(host, timestamp, data)
+            self._emit()
+
+    def _emit(self, now=None, flush=False):
+        for timestamp, data in self.merger.pop_ready(now):
+            try:
+                self.callback(timestamp, data)
+            except Exception as e:
+                print(f"Collector callback error: {e}")
+        for timestamp, data in self.merger.pop_backfill(flush):
+            try:
+                self.backfill(timestamp, data)
+            except Exception as e:
+                print(f"Collector backfill error: {e}")
@@ -0,0 +1,434 @@
+"""Replay of recordings and exports
+
+open_recording() returns a Recording for any file the monitor writes:
+
+    .jsonl      Recorder JSON lines, rotated segments are opened together
+    .csv        Recorder CSV (one row per series), or a GUI CSV export
+    .json       GUI JSON export, English or Chinese layout
+    .rmc        columnar recording, with the segments it went on in
+    .db         SQLite history database
+
+Large recordings are indexed, not loaded: the index holds the timestamp
+and file position of every sample, and samples are parsed only when
+read() asks for them. Exports are small (they hold one history) and are
+parsed completely.
+
+ReplaySession feeds a Recording into a HistoryStore the way live sampling
+does, so the chart code doesn't know the difference. seek() reloads the
+window that ends at a sample, tick() advances by wall-clock time times the
+playback speed and only appends the samples that were passed.
+"""
+import csv
+import datetime
+import glob
+import io
+import json
+import os
+import re
+import sqlite3
+
+import numpy as np
+
+from resource_monitor.columnar import COLUMN_DTYPES, ColumnarRecording, segment_path
+from resource_monitor.recorder import CSV_COLUMNS, RECORD_METRICS
+
+# Files open_recording() understands, for file dialogs
+RECORDING_PATTERNS = ('*.jsonl', '*.csv', '*.json', '*.rmc', '*.db')
+
+# Column name suffixes of GUI CSV exports, English and Chinese
+EXPORT_SUFFIXES = {
+    '_CPU(%)': 'cpu',
+    '_Memory(MB)': 'memory', '_内存(MB)': 'memory',
+    '_Network(Mbps)': 'network', '_网络(Mbps)': 'network',
+    '_Disk(MB/s)': 'disk', '_硬盘(MB/s)': 'disk',
+    '_GPU(%)': 'gpu',
+    '_PID': 'pid',
+    '_User': 'username', '_用户名': 'username',
+}
+
+# Metric keys of the Chinese JSON export
+CHINESE_JSON_KEYS = {'CPU(%)': 'cpu', '内存(MB)': 'memory', '网络(Mbps)': 'network', '硬盘(MB/s)': 'disk',
+                     'GPU(%)': 'gpu', 'PID': 'pid', '用户名': 'username'}
+
+SEGMENT_PATTERN = re.compile(r"^(.*)\.(\d{4})(\.[^.]+)$")
+
+TIMESTAMP_PATTERN = re.compile(rb'"timestamp":\s*(-?[0-9.]+(?:[eE][-+]?[0-9]+)?)')
+
+
+def segment_paths(path):
+    """All numbered segments of a rotated recording, or just path"""
+    match = SEGMENT_PATTERN.match(path)
+    if not match:
+        return [path]
+    stem, _, ext = match.groups()
+    paths = [candidate for candidate in glob.glob(f"{glob.escape(stem)}.[0-9][0-9][0-9][0-9]{glob.escape(ext)}")
+             if SEGMENT_PATTERN.match(candidate)]
+    return sorted(paths) or [path]
+
+
+def columnar_segments(path):
+    """A columnar recording followed by the numbered segments ColumnarWriter went on in"""
+    match = SEGMENT_PATTERN.match(path)
+    if match:
+        path = match.group(1) + match.group(3)
+    paths = [path] if os.path.exists(path) else []
+    return paths + [segment for segment in segment_paths(segment_path(path, 1)) if os.path.exists(segment)]
+
+
+def parse_value(metric, text):
+    """Convert a CSV cell of a metric, empty cells are None"""
+    if text == '' or text is None:
+        return None
+    if metric == 'username':
+        return text
+    if metric in ('pid', 'count'):
+        return int(float(text))
+    return float(text)
+
+
+def clock_times(time_strings, end):
+    """Timestamps for "%H:%M:%S" strings whose last one is at or before datetime end
+
+    Exports only store the time of day; walking backwards from end, a time
+    later than its successor means the capture crossed midnight.
+    """
+    result = []
+    date = end.date()
+    following = end
+    for text in reversed(time_strings):
+        clock = datetime.datetime.strptime(text, "%H:%M:%S").time()
+        moment = datetime.datetime.combine(date, clock)
+        if moment > following:
+            moment -= datetime.timedelta(days=1)
+            date = moment.date()
+        result.append(moment.timestamp())
+        following = moment
+    result.reverse()
+    return result
+
+
+class Recording:
+    """Samples of a file in time order; subclasses fill times and implement read()"""
+
+    def __init__(self, path):
+        self.path = path
+        self.times = np.empty(0)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def index_at(self, timestamp):
+        """Index of the last sample at or before timestamp, 0 if there is none"""
+        return max(int(np.searchsorted(self.times, timestamp, 'right')) - 1, 0)
+
+    def read(self, start, stop):
+        """Return [(timestamp, {name: metrics})] of samples start to stop - 1"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryRecording(Recording):
+    """Samples that are already parsed, e.g. from an export"""
+
+    def __init__(self, path, samples):
+        super().__init__(path)
+        samples = sorted(samples, key=lambda sample: sample[0])
+        self.samples = samples
+        self.times = np.array([timestamp for timestamp, _ in samples], dtype=np.float64)
+
+    def read(self, start, stop):
+        return self.samples[max(start, 0):stop]
+
+
+class JsonLinesRecording(Recording):
+    """Recorder JSON lines, indexed by line offsets"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.files = [open(segment, 'rb') for segment in segment_paths(path)]
+        times, files, offsets = [], [], []
+        for number, f in enumerate(self.files):
+            offset = 0
+            for line in f:
+                match = TIMESTAMP_PATTERN.search(line, 0, 64)
+                if match:
+                    times.append(float(match.group(1)))
+                    files.append(number)
+                    offsets.append(offset)
+                offset += len(line)
+        order = np.argsort(times, kind='stable')
+        self.times = np.array(times, dtype=np.float64)[order]
+        self.locations = np.array([files, offsets], dtype=np.int64).reshape(2, -1)[:, order]
+
+    def read(self, start, stop):
+        samples = []
+        for number, offset in self.locations[:, max(start, 0):stop].T.tolist():
+            f = self.files[number]
+            f.seek(offset)
+            record = json.loads(f.readline())
+            samples.append((record['timestamp'], record['software']))
+        return samples
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        self.files = []
+
+
+class CsvRecording(Recording):
+    """Recorder CSV with one row per series, indexed by the first row of every sample"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.files = [open(segment, 'rb') for segment in segment_paths(path)]
+        times, files, offsets = [], [], []
+        for number, f in enumerate(self.files):
+            offset = len(f.readline())  # Header
+            previous = None
+            for line in f:
+                stamp = line.split(b',', 1)[0]
+                if stamp != previous:
+                    times.append(float(stamp))
+                    files.append(number)
+                    offsets.append(offset)
+                    previous = stamp
+                offset += len(line)
+        order = np.argsort(times, kind='stable')
+        self.times = np.array(times, dtype=np.float64)[order]
+        self.locations = np.array([files, offsets], dtype=np.int64).reshape(2, -1)[:, order]
+
+    def read(self, start, stop):
+        samples = []
+        for number, offset in self.locations[:, max(start, 0):stop].T.tolist():
+            f = self.files[number]
+            f.seek(offset)
+            stamp = None
+            data = {}
+            for line in f:
+                row = next(csv.reader([line.decode('utf-8')]))
+                if stamp is not None and row[0] != stamp:
+                    break
+                stamp = row[0]
+                data[row[1]] = {metric: parse_value(metric, text) for metric, text in zip(RECORD_METRICS, row[2:])}
+            samples.append((float(stamp), data))
+        return samples
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        self.files = []
+
+
+class ColumnarFileRecording(Recording):
+    """.rmc recording and its numbered segments; the memory maps already are the index"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.recordings = [ColumnarRecording(segment) for segment in columnar_segments(path)]
+        self.starts = np.cumsum([0] + [len(recording) for recording in self.recordings])
+        self.times = np.concatenate([recording.times for recording in self.recordings])
+
+    def read(self, start, stop):
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        samples = []
+        for recording, first in zip(self.recordings, self.starts.tolist()):
+            if first < stop and start < first + len(recording):
+                samples.extend(self._read(recording, max(start - first, 0), min(stop - first, len(recording))))
+        return samples
+
+    def _read(self, recording, start, stop):
+        """Samples start to stop - 1 of one segment"""
+        columns = {}
+        for name in recording.series:
+            values = {metric: recording.column(name, metric, start, stop).tolist()
+                      for metric in recording.metrics}
+            columns[name] = values
+        samples = []
+        for i in range(stop - start):
+            data = {}
+            for name, values in columns.items():
+                metrics = {}
+                for metric, column in values.items():
+                    value = column[i]
+                    missing = value != value if np.dtype(COLUMN_DTYPES[metric]).kind == 'f' else value == -1
+                    metrics[metric] = None if missing else value
+                if any(metrics[metric] is not None for metric in metrics):
+                    metrics['username'] = recording.usernames.get(name)
+                    data[name] = metrics
+            samples.append((float(recording.times[start + i]), data))
+        return samples
+
+    def close(self):
+        for recording in self.recordings:
+            recording.close()
+        self.recordings = []
+
+
+class DatabaseRecording(Recording):
+    """Raw rows of a SQLite history database"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.connection = sqlite3.connect(path)
+        self.names = dict(self.connection.execute("SELECT id, name FROM series"))
+        self.columns = [row[1] for row in self.connection.execute("PRAGMA table_info(raw)")][2:]
+        self.times = np.array([row[0] for row in self.connection.execute("SELECT DISTINCT ts FROM raw ORDER BY ts")],
+                              dtype=np.float64)
+
+    def read(self, start, stop):
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        rows = self.connection.execute(
+            f"SELECT ts, series_id, {', '.join(self.columns)} FROM raw WHERE ts >= ? AND ts <= ? ORDER BY ts",
+            (self.times[start], self.times[stop - 1]))
+        samples = []
+        for row in rows:
+            if not samples or samples[-1][0] != row[0]:
+                samples.append((row[0], {}))
+            samples[-1][1][self.names.get(row[1], str(row[1]))] = dict(zip(self.columns, row[2:]))
+        return samples
+
+    def close(self):
+        self.connection.close()
+
+
+def load_json_export(path):
+    """Samples of an English or Chinese GUI JSON export"""
+    with open(path, encoding='utf-8-sig') as f:
+        export = json.load(f)
+    samples = []
+    if isinstance(export, list):
+        # Chinese layout: one entry per time point with its timestamp
+        for entry in export:
+            data = {}
+            for name, values in entry['软件资源'].items():
+                data[name] = {CHINESE_JSON_KEYS.get(key, key): value for key, value in values.items()}
+            samples.append((entry['时间戳'], data))
+        return samples
+
+    # English layout: columns per software and time strings
+    end = datetime.datetime.fromisoformat(export['timestamp'])
+    times = clock_times(export['time_points'], end)
+    for i, timestamp in enumerate(times):
+        data = {}
+        for name, columns in export['software'].items():
+            metrics = {metric: column[i] for metric, column in columns.items() if i < len(column)}
+            if any(value is not None for value in metrics.values()):
+                data[name] = metrics
+        samples.append((timestamp, data))
+    return samples
+
+
+def load_csv_export(path, rows):
+    """Samples of an English or Chinese GUI CSV export"""
+    header = rows[0]
+    columns = []
+    for column in header[1:]:
+        for suffix, metric in EXPORT_SUFFIXES.items():
+            if column.endswith(suffix):
+                columns.append((column[:-len(suffix)], metric))
+                break
+        else:
+            columns.append((None, None))
+    end = datetime.datetime.fromtimestamp(os.path.getmtime(path))
+    times = clock_times([row[0] for row in rows[1:]], end)
+    samples = []
+    for timestamp, row in zip(times, rows[1:]):
+        data = {}
+        for (name, metric), text in zip(columns, row[1:]):
+            if name is None:
+                continue
+            value = parse_value(metric, text)
+            if value is not None:
+                data.setdefault(name, {})[metric] = value
+        samples.append((timestamp, data))
+    return samples
+
+
+def open_recording(path):
+    """Open a recording or export for replay, the format is taken from the extension"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.rmc':
+        return ColumnarFileRecording(path)
+    if ext in ('.db', '.sqlite', '.sqlite3'):
+        return DatabaseRecording(path)
+    if ext == '.json':
+        return MemoryRecording(path, load_json_export(path))
+    if ext == '.csv':
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            first = f.readline()
+            if next(csv.reader(io.StringIO(first))) == CSV_COLUMNS:
+                return CsvRecording(path)
+            rows = [next(csv.reader(io.StringIO(first)))] + list(csv.reader(f))
+        return MemoryRecording(path, load_csv_export(path, rows))
+    return JsonLinesRecording(path)
+
+
+class ReplaySession:
+    """Play a Recording into a HistoryStore"""
+
+    def __init__(self, recording, history, speed=1.0):
+        self.recording = recording
+        self.history = history
+        self.speed = speed
+        self.position = -1  # Index of the newest sample in the history
+        self.time = recording.times[0] if len(recording) else 0.0  # Playback clock in recording time
+        self.playing = False
+
+    @property
+    def at_end(self):
+        return self.position >= len(self.recording) - 1
+
+    def seek(self, index):
+        """Show the window of history that ends at sample index"""
+        if not len(self.recording):
+            return
+        index = min(max(index, 0), len(self.recording) - 1)
+        self.history.clear()
+        start = max(index + 1 - self.history.capacity, 0)
+        for timestamp, data in self.recording.read(start, index + 1):
+            self.history.append(timestamp, data)
+        self.position = index
+        self.time = self.recording.times[index]
+
+    def seek_time(self, timestamp):
+        """Seek to the last sample at or before timestamp"""
+        self.seek(self.recording.index_at(timestamp))
+
+    def advance_to(self, index):
+        """Move forward to sample index, appending only the samples in between
+
+        Returns True if the history was reloaded instead, e.g. after a jump
+        back or further than the history capacity.
+        """
+        index = min(index, len(self.recording) - 1)
+        if index == self.position:
+            return False
+        if index < self.position or index - self.position > self.history.capacity or self.position < 0:
+            self.seek(index)
+            return True
+        for timestamp, data in self.recording.read(self.position + 1, index + 1):
+            self.history.append(timestamp, data)
+        self.position = index
+        return False
+
+    def tick(self, elapsed):
+        """Advance the playback clock by elapsed wall-clock seconds; see advance_to()"""
+        if not self.playing or not len(self.recording):
+            return False
+        self.time += elapsed * self.speed
+        reloaded = self.advance_to(self.recording.index_at(self.time))
+        if self.at_end:
+            self.playing = False
+        return reloaded
@@ -1,15 +1,10 @@
 import sys
 import psutil
-import GPUtil
 import time
 import json
 import os
 import datetime
 import queue
-import win32gui
-import win32process
-import win32con
-import win32ui
 import csv
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QLabel, QLineEdit, QPushButton, QListWidget, QTabWidget, 
@@ -17,7 +12,7 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QH
                             QSpinBox, QDoubleSpinBox, QComboBox, QStatusBar, QDialog, 
                             QTreeWidget, QTreeWidgetItem, QHeaderView, QProgressBar, 
                             QToolBar, QAction, QMenu, QCheckBox, QTreeWidgetItemIterator,
-                            QListWidgetItem, QFrame, QGridLayout, QSizePolicy)
+                            QListWidgetItem, QFrame, QGridLayout, QSizePolicy, QSlider, QTreeView)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QDateTime, QTimer, QSortFilterProxyModel, QSize
 from PyQt5.QtGui import QFont, QIcon, QColor, QStandardItemModel, QStandardItem, QPixmap, QImage
 import matplotlib
@@ -26,196 +21,180 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
 
+# 允许直接运行本文件，也可以通过 python -m 运行
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from resource_monitor.charts import LiveChart
+from resource_monitor.classify import CATEGORY_APPLICATION, CATEGORY_SYSTEM, CATEGORY_USER, ProcessClassifier
+from resource_monitor.compressed import CompressedHistory
+from resource_monitor.frames import DEFAULT_FPS, FrameScheduler
+from resource_monitor.history import METRICS, HistoryStore, to_list
+from resource_monitor.matcher import parse_selector
+from resource_monitor.process_model import (ProcessFilterProxy, ProcessSnapshot, ProcessTableModel, ProcessTreeModel,
+                                            restore_tree_state, tree_state)
+from resource_monitor.recorder import open_recorder
+from resource_monitor.remote import DEFAULT_PORT, Collector
+from resource_monitor.replay import RECORDING_PATTERNS, ReplaySession, open_recording
+from resource_monitor.sampler import DEFAULT_WORKERS, ResourceSampler, get_gpus
+from resource_monitor.scheduler import AsyncSampler, parse_cadence
+
+# 图表时间轴使用的本地时区
+LOCAL_TZ = datetime.datetime.now().astimezone().tzinfo
+
 # 设置matplotlib支持中文显示
 plt.rcParams["font.family"] = ["SimHei"]
 plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
 
 class MonitorThread(QThread):
     """监控资源的后台线程"""
-    update_signal = pyqtSignal(dict)
+    update_signal = pyqtSignal(float, dict)  # 采样时间戳, 数据
+    backfill_signal = pyqtSignal(float, dict)  # 较早采样的时间戳, 迟到的数据系列
     
-    def __init__(self, software_list, update_interval=1, monitor_system=False):
+    def __init__(self, software_list, update_interval=1, monitor_system=False, rescan_interval=10.0,
+                 group_by=('pattern',), recorder=None, intervals=None, workers=DEFAULT_WORKERS):
         super().__init__()
         self.software_list = software_list
         self.update_interval = update_interval
         self.running = True
-        self.process_network_counters = {}  # 存储各进程的网络计数器
-        self.system_network_counters = psutil.net_io_counters(pernic=True)
         self.monitor_system = monitor_system
+        # 指定各采集器的间隔时，每个指标由asyncio调度器按各自的节奏读取
+        if intervals is None:
+            self.sampler = ResourceSampler(software_list, update_interval, monitor_system,
+                                           system_key="系统", unknown_user="未知",
+                                           rescan_interval=rescan_interval, group_by=group_by, workers=workers)
+        else:
+            self.sampler = AsyncSampler(software_list, update_interval, monitor_system,
+                                        system_key="系统", unknown_user="未知",
+                                        rescan_interval=rescan_interval, group_by=group_by, intervals=intervals,
+                                        workers=workers)
+        self.recorder = recorder  # 将每个采样追加到磁盘，由本线程负责关闭
     
     def run(self):
+        if isinstance(self.sampler, AsyncSampler):
+            # asyncio调度器自行发出合并后的采样
+            try:
+                self.sampler.serve(self.receive)
+            except Exception as e:
+                print(f"监控线程错误: {e}")
+            self.close_recorder()
+            return
+        
+        # 采样按固定节奏进行，采样本身的耗时不会累加到间隔上
+        next_sample = time.monotonic()
         while self.running:
             try:
                 data = self.get_resource_data()
-                self.update_signal.emit(data)
-                time.sleep(self.update_interval)
+                timestamp = time.time()
+                self.update_signal.emit(timestamp, data)
+                self.record(timestamp, data)
+                next_sample = max(next_sample + self.update_interval, time.monotonic())
+                time.sleep(max(0.0, next_sample - time.monotonic()))
             except Exception as e:
                 print(f"监控线程错误: {e}")
                 self.running = False
+        
+        # 写出仍在缓冲区中的采样
+        self.close_recorder()
+        self.sampler.close()
     
     def stop(self):
         self.running = False
+        if isinstance(self.sampler, AsyncSampler):
+            self.sampler.stop()
+    
+    def receive(self, timestamp, data):
+        """将asyncio调度器的采样传给图表"""
+        self.update_signal.emit(timestamp, data)
+        self.record(timestamp, data)
+    
+    def record(self, timestamp, data):
+        """将采样追加到记录文件（如果正在记录）"""
+        if self.recorder is None:
+            return
+        try:
+            self.recorder.write(timestamp, data)
+        except OSError as e:
+            # 磁盘写满只停止记录，不停止监控
+            print(f"记录错误: {e}")
+            self.close_recorder()
+    
+    def close_recorder(self):
+        """刷新并关闭记录文件"""
+        if self.recorder is None:
+            return
+        try:
+            self.recorder.close()
+        except OSError as e:
+            print(f"记录错误: {e}")
+        self.recorder = None
     
     def get_resource_data(self):
         """获取指定软件的资源使用情况"""
-        data = {}
-        
-        # 监控整机资源
-        if self.monitor_system:
-            # CPU使用率
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            
-            # 内存使用率 (MB)
-            memory = psutil.virtual_memory()
-            memory_mb = memory.used / (1024 ** 2)
-            memory_percent = memory.percent
-            
-            # 网络使用率
-            current_network_counters = psutil.net_io_counters(pernic=True)
-            if self.system_network_counters:
-                network_usage = 0
-                for nic, counters in current_network_counters.items():
-                    if nic in self.system_network_counters:
-                        # 计算接收和发送的字节数差
-                        bytes_sent = counters.bytes_sent - self.system_network_counters[nic].bytes_sent
-                        bytes_recv = counters.bytes_recv - self.system_network_counters[nic].bytes_recv
-                        # 转换为Mbps
-                        network_usage += (bytes_sent + bytes_recv) * 8 / (1024 ** 2) / self.update_interval
-            else:
-                network_usage = 0
-            
-            # 更新上次网络I/O计数器
-            self.system_network_counters = current_network_counters
-            
-            # 硬盘使用率
-            disk_counters = psutil.disk_io_counters()
-            disk_usage = (disk_counters.read_bytes + disk_counters.write_bytes) / (1024 ** 2) / self.update_interval
-            
-            # GPU使用率
-            try:
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    gpu_usage = gpus[0].load * 100  # 转换为百分比
-                else:
-                    gpu_usage = 0
-            except:
-                gpu_usage = 0
-            
-            # 存储整机数据
-            data["系统"] = {
-                'cpu': cpu_percent,
-                'memory': memory_mb,
-                'memory_percent': memory_percent,
-                'network': network_usage,
-                'disk': disk_usage,
-                'gpu': gpu_usage,
-                'pid': None,
-                'username': os.getlogin()
-            }
-        
-        # 获取所有进程信息
-        current_process_network = {}  # 存储当前进程的网络连接数
-        
-        for proc in psutil.process_iter(['name', 'cpu_percent', 'memory_info', 'pid', 'username']):
-            try:
-                process_name = proc.info['name'].lower()
-                
-                # 检查进程名是否在监控列表中
-                for software in self.software_list:
-                    if software.lower() in process_name:
-                        # CPU使用率
-                        cpu_percent = proc.info['cpu_percent']
-                        
-                        # 内存使用率 (MB)
-                        memory_mb = proc.info['memory_info'].rss / (1024 ** 2)
-                        
-                        # 网络使用率
-                        try:
-                            # 获取进程的网络连接
-                            connections = proc.connections(kind='inet')
-                            current_process_network[proc.info['pid']] = len(connections)
-                            
-                            # 基于连接数估算网络使用
-                            if proc.info['pid'] in self.process_network_counters:
-                                last_connections = self.process_network_counters[proc.info['pid']]
-                                network_usage = len(connections) - last_connections
-                                # 如果连接数减少，说明有数据传输
-                                if network_usage < 0:
-                                    network_usage = abs(network_usage) * 0.1  # 估算值
-                                else:
-                                    network_usage = 0
-                            else:
-                                network_usage = 0
-                            
-                            # 限制最大值
-                            if network_usage > 100:
-                                network_usage = 100
-                            
-                        except (psutil.AccessDenied, psutil.NoSuchProcess):
-                            network_usage = 0
-                        
-                        # 硬盘使用率
-                        try:
-                            # 获取进程的I/O计数器
-                            io_counters = proc.io_counters()
-                            if io_counters:
-                                # 转换为MB/s
-                                disk_usage = (io_counters.read_bytes + io_counters.write_bytes) / (1024 ** 2) / self.update_interval
-                            else:
-                                disk_usage = 0
-                        except (psutil.AccessDenied, psutil.NoSuchProcess):
-                            disk_usage = 0
-                        
-                        # GPU使用率
-                        try:
-                            gpu_usage = 0
-                            # 尝试通过进程ID获取GPU使用情况
-                            # 注意：这需要NVIDIA的pynvml库支持
-                            # 这里简化处理，实际应用中可能需要更复杂的实现
-                            gpus = GPUtil.getGPUs()
-                            if gpus:
-                                # 无法直接获取进程的GPU使用，这里仅作示例
-                                pass
-                        except:
-                            gpu_usage = 0
-                        
-                        # 存储数据
-                        data[software] = {
-                            'cpu': cpu_percent,
-                            'memory': memory_mb,
-                            'network': network_usage,
-                            'disk': disk_usage,
-                            'gpu': gpu_usage,
-                            'pid': proc.info['pid'],
-                            'username': proc.info['username'] if 'username' in proc.info else "未知"
-                        }
-                        
-                        # 跳出内层循环，避免重复添加同一进程
-                        break
-            except (psutil.AccessDenied, psutil.NoSuchProcess, psutil.ZombieProcess):
-                continue
+        return self.sampler.get_resource_data()
+
+class CollectorThread(MonitorThread):
+    """接收远程代理采样的后台线程"""
+    
+    def __init__(self, port, update_interval=1, recorder=None):
+        QThread.__init__(self)
+        self.update_interval = update_interval
+        self.running = True
+        self.recorder = recorder
+        # 所有代理的采样合并到同一时间轴上，数据系列命名为 "主机: 名称"
+        # 重新连接的代理补发的积压数据填入已显示的时间点
+        self.collector = Collector(self.receive, port=port, interval=update_interval, backfill=self.receive_backfill)
+    
+    def run(self):
+        try:
+            self.collector.serve()
+        except OSError as e:
+            print(f"收集器错误: {e}")
         
-        # 更新进程网络计数器
-        self.process_network_counters = current_process_network
-        
-        # 为未找到的软件设置默认值
-        for software in self.software_list:
-            if software not in data:
-                data[software] = {
-                    'cpu': 0,
-                    'memory': 0,
-                    'network': 0,
-                    'disk': 0,
-                    'gpu': 0,
-                    'pid': None,
-                    'username': "未知"
-                }
-        
-        return data
+        # 写出仍在缓冲区中的采样
+        self.close_recorder()
+    
+    def stop(self):
+        self.running = False
+        self.collector.stop()
+    
+    def receive(self, timestamp, data):
+        """将所有代理合并后的采样传给图表，由收集器调用"""
+        self.update_signal.emit(timestamp, data)
+        self.record(timestamp, data)
+    
+    def receive_backfill(self, timestamp, data):
+        """将落后代理的数据系列传给图表，由收集器调用"""
+        self.backfill_signal.emit(timestamp, data)
+        # 列式记录必须保持时间顺序
+        if not getattr(self.recorder, 'ordered', False):
+            self.record(timestamp, data)
+
+class ProcessScanThread(QThread):
+    """在后台扫描进程表，用于实时刷新"""
+    snapshot_ready = pyqtSignal(object)
+    
+    def __init__(self, scan, parent=None):
+        super().__init__(parent)
+        self.scan = scan
+    
+    def run(self):
+        try:
+            snapshot = self.scan()
+        except Exception as e:
+            # 保留上次扫描的行，下一次定时器触发时再次扫描
+            print(f"进程扫描错误: {e}")
+            return
+        self.snapshot_ready.emit(snapshot)
 
 class ProcessSelector(QDialog):
     """进程选择对话框"""
-    def __init__(self, parent=None):
+    # 实时刷新模式下两次扫描之间的毫秒数
+    LIVE_REFRESH_INTERVAL = 1000
+    
+    # 停止输入多少毫秒后执行搜索
+    SEARCH_DELAY = 150
+    
+    def __init__(self, parent=None, classifier=None):
         super().__init__(parent)
         self.setWindowTitle("选择进程")
         self.setMinimumSize(900, 600)  # 增大窗口尺寸
@@ -233,8 +212,15 @@ class ProcessSelector(QDialog):
         
         # 搜索框
         self.search_edit = QLineEdit()
-        self.search_edit.setPlaceholderText("搜索进程...")
-        self.search_edit.textChanged.connect(self.filter_processes)
+        self.search_edit.setPlaceholderText("搜索进程，例如 user:root nginx")
+        self.search_edit.setToolTip("所有词都必须匹配；name:、pid: 和 user: 只搜索单个列")
+        
+        # 在输入停顿时搜索，而不是每次按键都搜索
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.filter_processes)
+        self.search_edit.textChanged.connect(self.search_timer.start)
         
         # 刷新按钮
         self.refresh_button = QPushButton("刷新")
@@ -245,19 +231,39 @@ class ProcessSelector(QDialog):
         self.show_icon_checkbox.setChecked(True)
         self.show_icon_checkbox.stateChanged.connect(self.refresh_processes)
         
+        # 实时刷新复选框
+        self.live_checkbox = QCheckBox("实时刷新")
+        self.live_checkbox.stateChanged.connect(self.toggle_live_refresh)
+        
+        # 树状视图复选框
+        self.tree_checkbox = QCheckBox("树状视图")
+        self.tree_checkbox.setToolTip("在父进程下显示进程，并显示每个子树的CPU和内存")
+        self.tree_checkbox.stateChanged.connect(self.toggle_tree_view)
+        
         filter_layout.addWidget(QLabel("筛选类型:"))
         filter_layout.addWidget(self.process_type_combo)
         filter_layout.addWidget(QLabel("搜索:"))
         filter_layout.addWidget(self.search_edit)
         filter_layout.addWidget(self.refresh_button)
         filter_layout.addWidget(self.show_icon_checkbox)
+        filter_layout.addWidget(self.live_checkbox)
+        filter_layout.addWidget(self.tree_checkbox)
         
         layout.addLayout(filter_layout)
         
-        # 创建进程树
-        self.process_tree = QTreeWidget()
-        self.process_tree.setColumnCount(5)
-        self.process_tree.setHeaderLabels(["进程名称", "PID", "用户名", "CPU (%)", "内存 (MB)"])
+        # 基于单个快照创建进程列表，视图只格式化其显示的行
+        self.process_model = ProcessTableModel(["进程名称", "PID", "用户名", "CPU (%)", "内存 (MB)"], self)
+        
+        # 同一扫描结果的父子视图，附带每个子树的合计
+        self.tree_model = ProcessTreeModel(["进程名称", "PID", "用户名", "CPU (%)", "内存 (MB)",
+                                            "子树 CPU (%)", "子树内存 (MB)"], self)
+        
+        self.proxy_model = ProcessFilterProxy(self)
+        self.proxy_model.setSourceModel(self.process_model)
+        self.process_tree = QTreeView()
+        self.process_tree.setModel(self.proxy_model)
+        self.process_tree.setRootIsDecorated(False)
+        self.process_tree.setUniformRowHeights(True)  # 无需逐行测量行高
         
         # 设置列宽策略
         self.process_tree.header().setSectionResizeMode(0, QHeaderView.Stretch)  # 进程名称列自动拉伸
@@ -273,15 +279,15 @@ class ProcessSelector(QDialog):
         
         # 设置样式，使进程名称可以显示完整
         self.process_tree.setStyleSheet("""
-            QTreeWidget {
+            QTreeView {
                 show-decoration-selected: 1;
                 alternate-background-color: #f2f2f2;
             }
-            QTreeWidget::item {
+            QTreeView::item {
                 height: 30px;
                 border-bottom: 1px solid #e0e0e0;
             }
-            QTreeWidget::item:selected {
+            QTreeView::item:selected {
                 background-color: #bde0fe;
                 color: black;
             }
@@ -299,194 +305,177 @@ class ProcessSelector(QDialog):
         self.select_button = QPushButton("选择")
         self.select_button.clicked.connect(self.select_process)
         
+        self.select_subtree_button = QPushButton("选择子树")
+        self.select_subtree_button.setToolTip("将选中的进程及其所有子孙进程作为一个序列监控")
+        self.select_subtree_button.clicked.connect(self.select_subtree)
+        self.select_subtree_button.setVisible(False)
+        
         self.cancel_button = QPushButton("取消")
         self.cancel_button.clicked.connect(self.reject)
         
         button_layout.addStretch(1)
+        button_layout.addWidget(self.select_subtree_button)
         button_layout.addWidget(self.select_button)
         button_layout.addWidget(self.cancel_button)
         
         layout.addLayout(button_layout)
         
+        # 实时刷新在后台扫描，只应用差异
+        self.scan_thread = ProcessScanThread(self.scan_processes, self)
+        self.scan_thread.snapshot_ready.connect(self.apply_snapshot)
+        self.live_timer = QTimer(self)
+        self.live_timer.setInterval(self.LIVE_REFRESH_INTERVAL)
+        self.live_timer.timeout.connect(self.start_live_scan)
+        
+        # 分类来自规则，并在每个进程的生命周期内被记住
+        self.classifier = classifier if classifier is not None else ProcessClassifier()
+        
         # 初始化进程列表
         self.refresh_processes()
         
         # 连接双击事件
-        self.process_tree.itemDoubleClicked.connect(self.item_double_clicked)
-        
-        # 存储原始进程数据
-        self.all_processes = []
+        self.process_tree.doubleClicked.connect(self.item_double_clicked)
+        self.process_tree.setExpandsOnDoubleClick(False)  # 双击用于选择，箭头用于展开
     
     def refresh_processes(self):
         """刷新进程列表"""
-        self.process_tree.clear()
-        self.all_processes = []
-        
-        # 获取当前用户
-        current_user = os.getlogin()
-        
-        # 创建分类根节点
-        self.all_root = QTreeWidgetItem(self.process_tree)
-        self.all_root.setText(0, "所有进程")
-        self.all_root.setExpanded(True)
-        
-        self.apps_root = QTreeWidgetItem(self.process_tree)
-        self.apps_root.setText(0, "应用程序")
-        self.apps_root.setExpanded(True)
+        # 实时扫描已在进行中
+        if self.scan_thread.isRunning():
+            return
         
-        self.system_root = QTreeWidgetItem(self.process_tree)
-        self.system_root.setText(0, "系统进程")
-        self.system_root.setExpanded(True)
+        self.apply_snapshot(self.scan_processes())
         
-        self.user_root = QTreeWidgetItem(self.process_tree)
-        self.user_root.setText(0, "用户进程")
-        self.user_root.setExpanded(True)
+        # 应用筛选
+        self.filter_processes()
+    
+    def scan_processes(self):
+        """返回所有进程的快照"""
+        snapshot = ProcessSnapshot()
         
         # 获取所有进程
-        for proc in psutil.process_iter(['name', 'cpu_percent', 'memory_info', 'username', 'pid']):
+        for proc in psutil.process_iter(['name', 'cpu_percent', 'memory_info', 'username', 'pid', 'ppid',
+                                         'create_time']):
             try:
-                process_name = proc.info['name']
+                # 无法读取的属性在 proc.info 中为 None
+                process_name = proc.info['name'] or ""
                 pid = proc.info['pid']
-                cpu_percent = proc.info['cpu_percent']
-                memory_mb = proc.info['memory_info'].rss / (1024 ** 2)
-                username = proc.info['username'] if 'username' in proc.info else "未知"
-                
-                # 存储原始进程数据
-                process_data = {
-                    'name': process_name,
-                    'pid': pid,
-                    'username': username,
-                    'cpu_percent': cpu_percent,
-                    'memory_mb': memory_mb
-                }
-                self.all_processes.append(process_data)
-                
-                # 创建进程项
-                process_item = QTreeWidgetItem()
-                
-                # 设置进程名称，使用省略号处理过长的名称
-                process_item.setText(0, process_name)
-                process_item.setToolTip(0, process_name)  # 设置完整名称为tooltip
+                cpu_percent = proc.info['cpu_percent'] or 0.0
+                memory_info = proc.info['memory_info']
+                memory_mb = memory_info.rss / (1024 ** 2) if memory_info is not None else 0.0
+                username = proc.info['username'] or "未知"
                 
-                process_item.setText(1, str(pid))
-                process_item.setText(2, username)
-                process_item.setText(3, f"{cpu_percent:.1f}")
-                process_item.setText(4, f"{memory_mb:.1f}")
+                # 按应用程序和用户分类，只对新进程进行分类
+                categories = self.classifier.classify(proc, proc.info)
                 
-                # 设置背景色，CPU使用率高的进程显示为红色
-                if cpu_percent > 50:
-                    for i in range(5):
-                        process_item.setBackground(i, QColor(255, 200, 200))
-                        
-                # 根据用户分类
-                self.all_root.addChild(process_item.clone())
-                
-                # 判断是否为应用程序
-                is_application = self.is_application(process_name)
-                if is_application:
-                    self.apps_root.addChild(process_item.clone())
-                
-                # 根据用户分类
-                if username == current_user:
-                    self.user_root.addChild(process_item.clone())
-                else:
-                    self.system_root.addChild(process_item.clone())
+                # 存储进程数据，行由视图按需创建
+                snapshot.append(process_name, pid, username, cpu_percent, memory_mb, categories,
+                                proc.info['create_time'], proc.info['ppid'])
                     
             except (psutil.AccessDenied, psutil.NoSuchProcess, psutil.ZombieProcess):
                 continue
         
-        # 应用筛选
-        self.filter_processes()
-    
-    def is_application(self, process_name):
-        """判断是否为应用程序"""
-        # 常见的应用程序扩展名
-        app_extensions = ['.exe', '.app', '.jar', '.pyw']
+        # 忘记已退出进程的分类
+        self.classifier.prune(snapshot.keys)
         
-        # 常见的应用程序名称
-        app_names = ['chrome', 'firefox', 'explorer', 'word', 'excel', 'powerpoint', 
-                    'notepad', 'photoshop', 'premiere', 'aftereffects', 'vscode', 'sublime']
-        
-        process_name_lower = process_name.lower()
-        
-        # 检查扩展名
-        for ext in app_extensions:
-            if process_name_lower.endswith(ext):
-                return True
-        
-        # 检查名称
-        for name in app_names:
-            if name in process_name_lower:
-                return True
+        return snapshot
+    
+    def apply_snapshot(self, snapshot):
+        """在列表或树中显示扫描结果，取决于当前显示哪一个"""
+        if not self.tree_checkbox.isChecked():
+            # 只更新变化的行，保留滚动位置和选择
+            self.process_model.update_snapshot(snapshot)
+            return
         
-        return False
+        # 进程启动或退出时树会重建，之后恢复展开的分支和选择
+        state = tree_state(self.process_tree, self.tree_model, self.proxy_model)
+        self.tree_model.update_snapshot(snapshot)
+        restore_tree_state(self.process_tree, self.tree_model, state, self.proxy_model)
+    
+    def toggle_tree_view(self, state):
+        """在平铺列表和进程树之间切换"""
+        tree = state == Qt.Checked
+        header = self.process_tree.header()
+        sort_column, sort_order = header.sortIndicatorSection(), header.sortIndicatorOrder()
+        self.proxy_model.setSourceModel(self.tree_model if tree else self.process_model)
+        self.process_tree.setRootIsDecorated(tree)
+        self.select_subtree_button.setVisible(tree)
+        
+        # 树多出两列
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+        for column in range(1, self.proxy_model.columnCount()):
+            header.setSectionResizeMode(column, QHeaderView.ResizeToContents)
+        
+        # 保留排序方式，除非按仅树中才有的列排序
+        if sort_column >= self.proxy_model.columnCount():
+            sort_column, sort_order = 0, Qt.AscendingOrder
+        self.process_tree.sortByColumn(sort_column, sort_order)
+        
+        # 之前显示的模型保留其行，另一个由新的扫描填充
+        self.refresh_processes()
+        if tree:
+            self.process_tree.expandToDepth(0)
+    
+    def toggle_live_refresh(self, state):
+        """开始或停止每秒刷新列表"""
+        if state == Qt.Checked:
+            self.start_live_scan()
+            self.live_timer.start()
+        else:
+            self.live_timer.stop()
+    
+    def start_live_scan(self):
+        """在后台扫描，除非上一次扫描仍在运行"""
+        if not self.scan_thread.isRunning():
+            self.scan_thread.start()
+    
+    def done(self, result):
+        """在对话框关闭前停止实时刷新"""
+        self.live_timer.stop()
+        self.scan_thread.wait()
+        super().done(result)
     
     def filter_processes(self):
         """根据筛选条件过滤进程"""
-        filter_type = self.process_type_combo.currentText()
-        search_text = self.search_edit.text().lower()
-        
-        # 隐藏所有根节点
-        self.all_root.setHidden(True)
-        self.apps_root.setHidden(True)
-        self.system_root.setHidden(True)
-        self.user_root.setHidden(True)
-        
-        # 根据筛选类型显示相应的根节点
-        if filter_type == "所有进程":
-            self.all_root.setHidden(False)
-        elif filter_type == "应用程序":
-            self.apps_root.setHidden(False)
-        elif filter_type == "系统进程":
-            self.system_root.setHidden(False)
-        elif filter_type == "用户进程":
-            self.user_root.setHidden(False)
-        
-        # 获取当前根节点
-        if filter_type == "所有进程":
-            current_root = self.all_root
-        elif filter_type == "应用程序":
-            current_root = self.apps_root
-        elif filter_type == "系统进程":
-            current_root = self.system_root
-        elif filter_type == "用户进程":
-            current_root = self.user_root
-        else:
-            current_root = self.all_root
-        
-        # 遍历所有子项
-        for i in range(current_root.childCount()):
-            child = current_root.child(i)
-            
-            # 如果有搜索文本，检查是否匹配
-            if search_text and not (search_text in child.text(0).lower() or 
-                                  search_text in child.text(1).lower() or 
-                                  search_text in child.text(2).lower()):
-                child.setHidden(True)
-            else:
-                child.setHidden(False)
+        # 每种筛选类型对应的分类，与下拉框顺序一致
+        categories = [0, CATEGORY_APPLICATION, CATEGORY_SYSTEM, CATEGORY_USER]
+        category = categories[self.process_type_combo.currentIndex()]
+        query = self.search_edit.text()
+        self.proxy_model.set_filter(category, query)
+        
+        # 匹配项可能位于树的深处，展开显示其祖先
+        if self.tree_checkbox.isChecked() and (category or query.strip()):
+            self.process_tree.expandAll()
     
-    def item_double_clicked(self, item, column):
+    def item_double_clicked(self, index):
         """双击项目时选择进程"""
-        # 确保不是顶级项目
-        if item.parent() is not None:
-            self.select_process()
+        self.select_process()
     
-    def select_process(self):
-        """选择进程并返回"""
-        selected_items = self.process_tree.selectedItems()
-        if not selected_items:
+    def selected_row(self):
+        """返回第一个选中进程的快照行，没有选中时提示警告并返回None"""
+        selected_rows = self.process_tree.selectionModel().selectedRows()
+        if not selected_rows:
             QMessageBox.warning(self, "警告", "请先选择一个进程!")
-            return
+            return None
             
         # 获取第一个选中的项目
-        item = selected_items[0]
-        
-        # 确保不是顶级项目
-        if item.parent() is not None:
-            process_name = item.text(0)
-            self.selected_process = process_name
-            self.accept()
+        index = self.proxy_model.mapToSource(selected_rows[0])
+        return self.proxy_model.sourceModel().snapshot_row(index.row(), index.parent())
+    
+    def select_process(self):
+        """选择进程并返回"""
+        row = self.selected_row()
+        if row is None:
+            return
+        self.selected_process = self.proxy_model.sourceModel().snapshot.names[row]
+        self.accept()
+    
+    def select_subtree(self):
+        """选择一个进程及其所有子孙进程，作为一个序列监控"""
+        row = self.selected_row()
+        if row is None:
+            return
+        self.selected_process = f"tree:{self.tree_model.snapshot.pids[row]}"
+        self.accept()
 
 class MplCanvas(FigureCanvas):
     """Matplotlib画布，用于显示图表"""
@@ -503,6 +492,12 @@ class MplCanvas(FigureCanvas):
 
 class ResourceMonitor(QMainWindow):
     """主窗口类"""
+    # group_by_combo 各选项对应的分组键
+    GROUP_BY_OPTIONS = [('pattern',), ('pattern', 'username'), ('pattern', 'tree'), ('pattern', 'cmdline')]
+    
+    # 回放栏中可选的回放速度
+    REPLAY_SPEEDS = [0.5, 1.0, 2.0, 5.0, 10.0, 60.0]
+    
     def __init__(self):
         super().__init__()
         
@@ -515,18 +510,34 @@ class ResourceMonitor(QMainWindow):
         # 存储监控数据
         self.software_list = []
         self.monitor_thread = None
-        self.time_data = []
-        self.cpu_data = {}
-        self.memory_data = {}
-        self.network_data = {}
-        self.disk_data = {}
-        self.gpu_data = {}
-        self.pid_data = {}
-        self.username_data = {}
+        
+        # 进程分类，在多次打开进程选择对话框之间保留
+        self.process_classifier = None
+        
+        # 最新采样中被监控的进程，按进程树分组实例时才有
+        self.monitor_nodes = []
         
         # 最大历史记录点
         self.max_history_points = 60
         
+        # 监控历史，每个数据系列一个预分配的环形缓冲区
+        self.history = HistoryStore(self.max_history_points)
+        
+        # 用于导出的压缩长期历史，禁用时为None
+        self.archive = None
+        
+        # 图表由限制帧率的调度器重绘，而不是每个采样都重绘
+        self.frame_scheduler = FrameScheduler(self._render_frame, DEFAULT_FPS, self)
+        
+        # 正在回放到图表中的记录，显示实时数据时为None
+        self.replay = None
+        self.replay_clock = 0.0
+        
+        # 回放由定时器推进，前进的时间为实际经过的时间乘以速度
+        self.replay_timer = QTimer(self)
+        self.replay_timer.setInterval(50)
+        self.replay_timer.timeout.connect(self._replay_tick)
+        
         # 整机监控选项
         self.monitor_system = False
         
@@ -565,6 +576,7 @@ class ResourceMonitor(QMainWindow):
         software_label = QLabel("软件名称:")
         self.software_entry = QLineEdit()
         self.software_entry.setPlaceholderText("输入软件名称或从进程列表选择")
+        self.software_entry.setToolTip("普通名称匹配进程名的一部分。可用前缀: exact:, glob:, re:, exe:, cmdline:, tree:<PID>")
         
         self.select_process_button = QPushButton("从进程选择")
         self.select_process_button.clicked.connect(self.select_process)
@@ -603,21 +615,127 @@ class ResourceMonitor(QMainWindow):
         self.update_interval_spinbox.setSuffix(" 秒")
         
         self.history_points_spinbox = QSpinBox()
-        self.history_points_spinbox.setRange(10, 1000)
+        self.history_points_spinbox.setRange(10, 1000000)
         self.history_points_spinbox.setValue(60)
         self.history_points_spinbox.setSuffix(" 个点")
         
+        self.archive_hours_spinbox = QSpinBox()
+        self.archive_hours_spinbox.setRange(0, 24 * 30)
+        self.archive_hours_spinbox.setValue(24)
+        self.archive_hours_spinbox.setSuffix(" 小时")
+        self.archive_hours_spinbox.setSpecialValueText("关闭")
+        self.archive_hours_spinbox.setToolTip("超出历史记录点的采样以压缩形式保存在内存中，并包含在导出中")
+        
+        self.max_fps_spinbox = QSpinBox()
+        self.max_fps_spinbox.setRange(1, 60)
+        self.max_fps_spinbox.setValue(DEFAULT_FPS)
+        self.max_fps_spinbox.setSuffix(" 帧/秒")
+        self.max_fps_spinbox.setToolTip("图表最多按此频率重绘，与更新间隔无关")
+        self.max_fps_spinbox.valueChanged.connect(self.frame_scheduler.set_fps)
+        
+        self.cadence_checkbox = QCheckBox("每个指标按各自的节奏采样")
+        self.cadence_checkbox.setToolTip("CPU和内存保持最新，开销大的采集器(连接数、GPU)运行得较少")
+        
+        self.cadence_entry = QLineEdit()
+        self.cadence_entry.setPlaceholderText("cpu=0.25, memory=0.25, io=1, connections=10, gpu=5, system=1")
+        self.cadence_entry.setToolTip("每个采集器两次运行之间的秒数，未列出的采集器使用默认值")
+        
+        self.workers_spinbox = QSpinBox()
+        self.workers_spinbox.setRange(0, 64)
+        self.workers_spinbox.setValue(DEFAULT_WORKERS)
+        self.workers_spinbox.setSuffix(" 个线程")
+        self.workers_spinbox.setSpecialValueText("关闭")
+        self.workers_spinbox.setToolTip("并行读取进程，每次采样的耗时取决于最慢的进程，而不是所有进程之和")
+        
+        self.group_by_combo = QComboBox()
+        self.group_by_combo.addItems(["监控条目", "条目 + 用户", "条目 + 进程树", "条目 + 命令行"])
+        self.group_by_combo.setToolTip("匹配同一条目的多个进程如何合并为数据系列")
+        
+        self.rescan_interval_spinbox = QDoubleSpinBox()
+        self.rescan_interval_spinbox.setRange(1.0, 300.0)
+        self.rescan_interval_spinbox.setValue(10.0)
+        self.rescan_interval_spinbox.setSingleStep(1.0)
+        self.rescan_interval_spinbox.setSuffix(" 秒")
+        self.rescan_interval_spinbox.setToolTip("多久扫描一次完整的进程表以发现新启动的进程")
+        
+        self.record_checkbox = QCheckBox("监控时将采样记录到磁盘")
+        self.record_checkbox.setToolTip("每个采样都追加到JSONL或CSV文件，不受历史记录点限制")
+        
+        self.rotate_size_spinbox = QSpinBox()
+        self.rotate_size_spinbox.setRange(0, 100000)
+        self.rotate_size_spinbox.setValue(0)
+        self.rotate_size_spinbox.setSuffix(" MB")
+        self.rotate_size_spinbox.setSpecialValueText("从不")
+        self.rotate_size_spinbox.setToolTip("当前文件达到此大小时开始一个新的编号文件")
+        
+        self.collector_checkbox = QCheckBox("从以下端口接收远程代理的采样")
+        self.collector_checkbox.setToolTip("显示以此方式启动的代理: python -m resource_monitor ... --agent 本机:端口")
+        
+        self.collector_port_spinbox = QSpinBox()
+        self.collector_port_spinbox.setRange(1, 65535)
+        self.collector_port_spinbox.setValue(DEFAULT_PORT)
+        
         self.start_button = QPushButton("开始监控")
         self.start_button.setCheckable(True)
         self.start_button.toggled.connect(self.toggle_monitoring)
         
         settings_layout.addRow("更新间隔:", self.update_interval_spinbox)
         settings_layout.addRow("历史记录点:", self.history_points_spinbox)
+        settings_layout.addRow("长期历史:", self.archive_hours_spinbox)
+        settings_layout.addRow("最大刷新率:", self.max_fps_spinbox)
+        settings_layout.addRow("进程重新扫描间隔:", self.rescan_interval_spinbox)
+        settings_layout.addRow("进程读取线程:", self.workers_spinbox)
+        settings_layout.addRow("实例分组方式:", self.group_by_combo)
+        settings_layout.addRow("采集节奏:", self.cadence_checkbox)
+        settings_layout.addRow("采集器间隔:", self.cadence_entry)
+        settings_layout.addRow("记录:", self.record_checkbox)
+        settings_layout.addRow("文件轮换大小:", self.rotate_size_spinbox)
+        collector_layout = QHBoxLayout()
+        collector_layout.addWidget(self.collector_checkbox)
+        collector_layout.addWidget(self.collector_port_spinbox)
+        settings_layout.addRow("远程代理:", collector_layout)
         settings_layout.addRow(self.start_button)
         
         settings_group.setLayout(settings_layout)
         control_layout.addWidget(settings_group)
         
+        # 回放控件
+        replay_group = QGroupBox("回放")
+        replay_layout = QHBoxLayout()
+        
+        self.open_recording_button = QPushButton("打开记录...")
+        self.open_recording_button.setToolTip("将记录文件(JSONL、CSV、.rmc、.db)或导出的JSON/CSV文件加载到图表中")
+        self.open_recording_button.clicked.connect(self.open_recording)
+        
+        self.replay_play_button = QPushButton("播放")
+        self.replay_play_button.setCheckable(True)
+        self.replay_play_button.toggled.connect(self.toggle_replay)
+        
+        self.replay_speed_combo = QComboBox()
+        self.replay_speed_combo.addItems([f"{speed:g}x" for speed in self.REPLAY_SPEEDS])
+        self.replay_speed_combo.setCurrentIndex(self.REPLAY_SPEEDS.index(1.0))
+        self.replay_speed_combo.setToolTip("相对于记录时间的回放速度")
+        self.replay_speed_combo.currentIndexChanged.connect(self.set_replay_speed)
+        
+        self.replay_slider = QSlider(Qt.Horizontal)
+        self.replay_slider.setToolTip("拖动以在记录中定位")
+        # 定位会重建历史数据，因此在松开滑块时才执行；拖动时只更新标签
+        self.replay_slider.setTracking(False)
+        self.replay_slider.valueChanged.connect(self.seek_replay)
+        self.replay_slider.sliderMoved.connect(self._show_replay_label)
+        
+        self.replay_position_label = QLabel("未加载记录")
+        
+        replay_layout.addWidget(self.open_recording_button)
+        replay_layout.addWidget(self.replay_play_button)
+        replay_layout.addWidget(self.replay_speed_combo)
+        replay_layout.addWidget(self.replay_slider, 1)
+        replay_layout.addWidget(self.replay_position_label)
+        
+        replay_group.setLayout(replay_layout)
+        control_layout.addWidget(replay_group)
+        self._set_replay_controls_enabled(False)
+        
         # 导出按钮
         export_layout = QHBoxLayout()
         self.export_json_button = QPushButton("导出JSON")
@@ -658,6 +776,32 @@ class ResourceMonitor(QMainWindow):
         self.gpu_canvas = MplCanvas(self, width=5, height=4, dpi=100)
         self.chart_tabs.addTab(self.gpu_canvas, "GPU使用率 (%)")
         
+        # 被监控进程的进程树，显示每个进程及其子树的使用量
+        self.monitor_tree_model = ProcessTreeModel(["进程名称", "PID", "用户名", "CPU (%)", "内存 (MB)",
+                                                    "子树 CPU (%)", "子树内存 (MB)"], self)
+        self.monitor_tree = QTreeView()
+        self.monitor_tree.setModel(self.monitor_tree_model)
+        self.monitor_tree.setUniformRowHeights(True)
+        self.monitor_tree.setSortingEnabled(True)
+        self.monitor_tree.sortByColumn(5, Qt.DescendingOrder)
+        self.monitor_tree.header().setSectionResizeMode(0, QHeaderView.Stretch)
+        # 重建的树默认展开，数值更新保留用户折叠的分支
+        self.monitor_tree_model.modelReset.connect(self.monitor_tree.expandAll)
+        tree_tab = self.chart_tabs.addTab(self.monitor_tree, "进程树")
+        self.chart_tabs.setTabToolTip(tree_tab, "按进程树分组实例时显示")
+        
+        # 按选项卡顺序排列的实时图表，线条对象在更新之间保留
+        self.charts = [
+            ('cpu', LiveChart(self.cpu_canvas, "CPU使用率 (%)", "时间", LOCAL_TZ)),
+            ('memory', LiveChart(self.memory_canvas, "内存使用 (MB)", "时间", LOCAL_TZ)),
+            ('network', LiveChart(self.network_canvas, "网络使用 (Mbps)", "时间", LOCAL_TZ)),
+            ('disk', LiveChart(self.disk_canvas, "硬盘使用 (MB/s)", "时间", LOCAL_TZ)),
+            ('gpu', LiveChart(self.gpu_canvas, "GPU使用率 (%)", "时间", LOCAL_TZ))
+        ]
+        
+        # 隐藏的图表不绘制，切换到其选项卡时再更新
+        self.chart_tabs.currentChanged.connect(self._update_canvas)
+        
         # 添加图表区域到分割器
         splitter.addWidget(self.chart_tabs)
         
@@ -688,14 +832,11 @@ class ResourceMonitor(QMainWindow):
             os_info = platform.platform()
             
             # GPU信息
-            try:
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    gpu_info = gpus[0].name
-                else:
-                    gpu_info = "未检测到GPU"
-            except:
-                gpu_info = "无法获取GPU信息"
+            gpus = get_gpus()
+            if gpus:
+                gpu_info = gpus[0].name
+            else:
+                gpu_info = "未检测到GPU"
             
             # 更新信息标签
             info_text = f"操作系统: {os_info} | CPU: {cpu_count}核 @ {cpu_freq:.2f}GHz | 内存: {total_memory}GB | GPU: {gpu_info}"
@@ -706,7 +847,9 @@ class ResourceMonitor(QMainWindow):
     
     def select_process(self):
         """打开进程选择对话框"""
-        dialog = ProcessSelector(self)
+        if self.process_classifier is None:
+            self.process_classifier = ProcessClassifier()
+        dialog = ProcessSelector(self, self.process_classifier)
         if dialog.exec_():
             # 获取选择的进程
             process_name = dialog.selected_process
@@ -725,18 +868,16 @@ class ResourceMonitor(QMainWindow):
         """添加软件到监控列表"""
         software_name = self.software_entry.text().strip()
         if software_name and software_name not in self.software_list:
+            # 在选择器进入监控线程之前拒绝无效的选择器
+            try:
+                parse_selector(software_name)
+            except ValueError as e:
+                QMessageBox.warning(self, "警告", str(e))
+                return
+            
             self.software_list.append(software_name)
             self.software_listbox.addItem(software_name)
             self.software_entry.clear()
-            
-            # 初始化图表数据
-            self.cpu_data[software_name] = []
-            self.memory_data[software_name] = []
-            self.network_data[software_name] = []
-            self.disk_data[software_name] = []
-            self.gpu_data[software_name] = []
-            self.pid_data[software_name] = []
-            self.username_data[software_name] = []
     
     def remove_software(self):
         """从监控列表中移除软件"""
@@ -751,60 +892,73 @@ class ResourceMonitor(QMainWindow):
             self.software_listbox.takeItem(self.software_listbox.row(item))
             
             # 移除图表数据
-            if software_name in self.cpu_data:
-                del self.cpu_data[software_name]
-            if software_name in self.memory_data:
-                del self.memory_data[software_name]
-            if software_name in self.network_data:
-                del self.network_data[software_name]
-            if software_name in self.disk_data:
-                del self.disk_data[software_name]
-            if software_name in self.gpu_data:
-                del self.gpu_data[software_name]
-            if software_name in self.pid_data:
-                del self.pid_data[software_name]
-            if software_name in self.username_data:
-                del self.username_data[software_name]
+            # 包括其分组的数据系列，例如 "名称 [用户]"
+            for name in self.history.names:
+                if name == software_name or name.startswith(software_name + " ["):
+                    self.history.remove_series(name)
+                    if self.archive is not None:
+                        self.archive.remove_series(name)
     
     def toggle_monitoring(self, checked):
         """开始或停止监控"""
         if checked:
-            if not self.software_list and not self.monitor_system:
-                QMessageBox.warning(self, "警告", "请先添加要监控的软件或选择监控整机资源!")
+            collecting = self.collector_checkbox.isChecked()
+            if not self.software_list and not self.monitor_system and not collecting:
+                QMessageBox.warning(self, "警告", "请先添加要监控的软件、选择监控整机资源或接收远程代理的采样!")
                 self.start_button.setChecked(False)
                 return
                 
-            # 重置数据
-            self.time_data = []
-            for software in self.software_list:
-                self.cpu_data[software] = []
-                self.memory_data[software] = []
-                self.network_data[software] = []
-                self.disk_data[software] = []
-                self.gpu_data[software] = []
-                self.pid_data[software] = []
-                self.username_data[software] = []
+            # asyncio调度器的各采集器间隔，为None时一次采集所有指标
+            intervals = None
+            if self.cadence_checkbox.isChecked():
+                try:
+                    intervals = parse_cadence(self.cadence_entry.text())
+                except ValueError as e:
+                    QMessageBox.warning(self, "警告", f"采集器间隔无效: {e}")
+                    self.start_button.setChecked(False)
+                    return
+            
+            # 在开始之前打开记录文件
+            recorder = None
+            if self.record_checkbox.isChecked():
+                recorder = self.create_recorder()
+                if recorder is None:
+                    self.start_button.setChecked(False)
+                    return
             
-            # 如果监控整机，初始化系统数据
-            if self.monitor_system:
-                self.cpu_data["系统"] = []
-                self.memory_data["系统"] = []
-                self.network_data["系统"] = []
-                self.disk_data["系统"] = []
-                self.gpu_data["系统"] = []
-                self.pid_data["系统"] = []
-                self.username_data["系统"] = []
+            # 停止回放，图表重新显示实时数据
+            self.close_replay()
             
-            # 更新最大历史记录点
+            # 重置数据，数据系列在其分组出现在采样中时创建
             self.max_history_points = self.history_points_spinbox.value()
+            self.history.clear(self.max_history_points)
+            archive_hours = self.archive_hours_spinbox.value()
+            self.archive = CompressedHistory(archive_hours * 3600) if archive_hours else None
+            for _, chart in self.charts:
+                chart.clear()
+            self.monitor_nodes = []
+            self.monitor_tree_model.set_snapshot(ProcessSnapshot())
             
             # 启动监控线程
-            self.monitor_thread = MonitorThread(
-                self.software_list, 
-                self.update_interval_spinbox.value(),
-                self.monitor_system
-            )
+            if collecting:
+                self.monitor_thread = CollectorThread(
+                    self.collector_port_spinbox.value(),
+                    self.update_interval_spinbox.value(),
+                    recorder
+                )
+            else:
+                self.monitor_thread = MonitorThread(
+                    self.software_list, 
+                    self.update_interval_spinbox.value(),
+                    self.monitor_system,
+                    self.rescan_interval_spinbox.value(),
+                    self.GROUP_BY_OPTIONS[self.group_by_combo.currentIndex()],
+                    recorder,
+                    intervals,
+                    self.workers_spinbox.value()
+                )
             self.monitor_thread.update_signal.connect(self.update_charts)
+            self.monitor_thread.backfill_signal.connect(self.backfill_charts)
             self.monitor_thread.finished.connect(self.monitoring_finished)
             self.monitor_thread.start()
             
@@ -817,8 +971,24 @@ class ResourceMonitor(QMainWindow):
             self.export_csv_button.setEnabled(False)
             self.update_interval_spinbox.setEnabled(False)
             self.history_points_spinbox.setEnabled(False)
+            self.archive_hours_spinbox.setEnabled(False)
+            self.rescan_interval_spinbox.setEnabled(False)
+            self.group_by_combo.setEnabled(False)
+            self.workers_spinbox.setEnabled(False)
+            self.cadence_checkbox.setEnabled(False)
+            self.cadence_entry.setEnabled(False)
+            self.record_checkbox.setEnabled(False)
+            self.rotate_size_spinbox.setEnabled(False)
+            self.open_recording_button.setEnabled(False)
+            self.collector_checkbox.setEnabled(False)
+            self.collector_port_spinbox.setEnabled(False)
             
-            self.statusBar.showMessage("正在监控...")
+            if collecting:
+                self.statusBar.showMessage(f"正在端口 {self.collector_port_spinbox.value()} 上接收远程代理的采样...")
+            elif recorder is not None:
+                self.statusBar.showMessage(f"正在监控，记录到 {recorder.current_path}...")
+            else:
+                self.statusBar.showMessage("正在监控...")
         else:
             # 停止监控线程
             if self.monitor_thread and self.monitor_thread.isRunning():
@@ -837,86 +1007,230 @@ class ResourceMonitor(QMainWindow):
         self.export_csv_button.setEnabled(True)
         self.update_interval_spinbox.setEnabled(True)
         self.history_points_spinbox.setEnabled(True)
+        self.archive_hours_spinbox.setEnabled(True)
+        self.rescan_interval_spinbox.setEnabled(True)
+        self.group_by_combo.setEnabled(True)
+        self.workers_spinbox.setEnabled(True)
+        self.cadence_checkbox.setEnabled(True)
+        self.cadence_entry.setEnabled(True)
+        self.record_checkbox.setEnabled(True)
+        self.rotate_size_spinbox.setEnabled(True)
+        self.open_recording_button.setEnabled(True)
+        self.collector_checkbox.setEnabled(True)
+        self.collector_port_spinbox.setEnabled(True)
         
         self.statusBar.showMessage("监控已停止")
     
-    def update_charts(self, data):
+    def create_recorder(self):
+        """选择并打开记录文件，取消时返回None"""
+        current_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "记录采样", f"resource_monitor_record_{current_time}.jsonl",
+            "JSON Lines文件 (*.jsonl);;CSV文件 (*.csv);;列式记录文件 (*.rmc);;SQLite数据库 (*.db)"
+        )
+        if not file_path:
+            return None
+        
+        # 由扩展名决定格式，.rmc 为可内存映射的二进制列式格式，.db 为带汇总的SQLite数据库
+        try:
+            return open_recorder(file_path, max_bytes=self.rotate_size_spinbox.value() * 1024 * 1024)
+        except OSError as e:
+            QMessageBox.critical(self, "错误", f"无法打开记录文件: {str(e)}")
+            return None
+    
+    def open_recording(self):
+        """加载记录或导出文件进行回放"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "打开记录", "",
+            f"记录文件 ({' '.join(RECORDING_PATTERNS)});;所有文件 (*)"
+        )
+        if not file_path:
+            return
+        
+        try:
+            recording = open_recording(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"无法打开记录: {str(e)}")
+            return
+        if not len(recording):
+            recording.close()
+            QMessageBox.warning(self, "警告", "记录中没有采样!")
+            return
+        
+        # 回放在配置长度的历史中显示记录，不使用长期历史
+        self.close_replay()
+        self.max_history_points = self.history_points_spinbox.value()
+        self.history.clear(self.max_history_points)
+        self.archive = None
+        speed = self.REPLAY_SPEEDS[self.replay_speed_combo.currentIndex()]
+        self.replay = ReplaySession(recording, self.history, speed)
+        self.replay.seek(0)
+        for _, chart in self.charts:
+            chart.clear()
+        
+        self.replay_slider.blockSignals(True)
+        self.replay_slider.setRange(0, len(recording) - 1)
+        self.replay_slider.blockSignals(False)
+        self._set_replay_controls_enabled(True)
+        self._update_replay_position()
+        self.frame_scheduler.request()
+        self.statusBar.showMessage("正在回放 {path}: {count} 个采样".format(path=file_path, count=len(recording)))
+        
+    def close_replay(self):
+        """关闭正在回放的记录"""
+        if self.replay is None:
+            return
+        self.replay_play_button.setChecked(False)
+        self.replay.recording.close()
+        self.replay = None
+        self._set_replay_controls_enabled(False)
+        self.replay_position_label.setText("未加载记录")
+        
+    def _set_replay_controls_enabled(self, enabled):
+        """启用或禁用需要已加载记录的控件"""
+        self.replay_play_button.setEnabled(enabled)
+        self.replay_slider.setEnabled(enabled)
+        
+    def toggle_replay(self, checked):
+        """开始或暂停回放"""
+        if self.replay is None:
+            return
+        if checked:
+            # 在末尾再次播放时从头开始
+            if self.replay.at_end:
+                self.seek_replay(0)
+            self.replay.playing = True
+            self.replay_clock = time.monotonic()
+            self.replay_timer.start()
+            self.replay_play_button.setText("暂停")
+        else:
+            self.replay.playing = False
+            self.replay_timer.stop()
+            self.replay_play_button.setText("播放")
+        
+    def set_replay_speed(self, index):
+        """修改回放速度"""
+        if self.replay is not None:
+            self.replay.speed = self.REPLAY_SPEEDS[index]
+        
+    def _replay_tick(self):
+        """推进回放，由回放定时器调用"""
+        now = time.monotonic()
+        elapsed = now - self.replay_clock
+        self.replay_clock = now
+        
+        # 只追加上次推进以来经过的采样
+        if self.replay.tick(elapsed):
+            for _, chart in self.charts:
+                chart.clear()
+        self._update_replay_position()
+        self.frame_scheduler.request()
+        if not self.replay.playing:
+            self.replay_play_button.setChecked(False)
+        
+    def seek_replay(self, index):
+        """跳转到记录中的某个采样"""
+        if self.replay is None:
+            return
+        self.replay.seek(index)
+        
+        # 历史中已是另一段窗口，重建图表
+        for _, chart in self.charts:
+            chart.clear()
+        self._update_replay_position()
+        self.frame_scheduler.request()
+        
+    def _update_replay_position(self):
+        """在滑块和标签上显示回放位置"""
+        position = self.replay.position
+        # 拖动滑块时回放不能移动滑块
+        if not self.replay_slider.isSliderDown():
+            self.replay_slider.blockSignals(True)
+            self.replay_slider.setValue(position)
+            self.replay_slider.blockSignals(False)
+            self._show_replay_label(position)
+        
+    def _show_replay_label(self, position):
+        """在标签上显示回放位置的时间和序号"""
+        if self.replay is None:
+            return
+        timestamp = self.replay.recording.times[position]
+        self.replay_position_label.setText(
+            f"{datetime.datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S}  {position + 1}/{len(self.replay.recording)}")
+        
+    def update_charts(self, timestamp, data):
         """更新图表显示"""
-        # 获取当前时间
-        current_time = QDateTime.currentDateTime().toString("HH:mm:ss")
-        self.time_data.append(current_time)
-        
-        # 限制数据点数量
-        if len(self.time_data) > self.max_history_points:
-            self.time_data.pop(0)
-        
-        # 处理每个软件的数据
-        for software, metrics in data.items():
-            # 添加数据到相应的列表
-            self.cpu_data[software].append(metrics['cpu'])
-            self.memory_data[software].append(metrics['memory'])
-            self.network_data[software].append(metrics['network'])
-            self.disk_data[software].append(metrics['disk'])
-            self.gpu_data[software].append(metrics['gpu'])
-            self.pid_data[software].append(metrics['pid'])
-            self.username_data[software].append(metrics['username'])
-            
-            # 限制数据点数量
-            if len(self.cpu_data[software]) > self.max_history_points:
-                self.cpu_data[software].pop(0)
-                self.memory_data[software].pop(0)
-                self.network_data[software].pop(0)
-                self.disk_data[software].pop(0)
-                self.gpu_data[software].pop(0)
-                self.pid_data[software].pop(0)
-                self.username_data[software].pop(0)
-        
-        # 更新图表
-        self._update_canvas(self.cpu_canvas, self.cpu_data, "CPU使用率 (%)")
-        self._update_canvas(self.memory_canvas, self.memory_data, "内存使用 (MB)")
-        self._update_canvas(self.network_canvas, self.network_data, "网络使用 (Mbps)")
-        self._update_canvas(self.disk_canvas, self.disk_data, "硬盘使用 (MB/s)")
-        self._update_canvas(self.gpu_canvas, self.gpu_data, "GPU使用率 (%)")
+        # 将采样追加到环形缓冲区，耗时与历史长度无关
+        self.history.append(timestamp, data)
+        if self.archive is not None:
+            self.archive.append(timestamp, data)
+        
+        # 进程树分组中的进程，用于进程树选项卡
+        self.monitor_nodes = [node for metrics in data.values() for node in metrics.get('nodes', ())]
+        
+        # 只请求一帧，连续的采样合并为一次重绘
+        self.frame_scheduler.request()
     
-    def _update_canvas(self, canvas, data, title):
-        """更新单个画布"""
-        canvas.axes.clear()
-        canvas.axes.set_title(title)
-        canvas.axes.set_xlabel("时间")
-        canvas.axes.grid(True)
-        
-        # 为每种软件绘制线条
-        colors = ['b', 'g', 'r', 'c', 'm', 'y', 'k', 'tab:orange', 'tab:purple', 'tab:brown']
-        
-        if self.time_data:
-            for i, software in enumerate(data.keys()):
-                color = colors[i % len(colors)]
-                
-                # 获取最新的PID和用户名
-                latest_pid = self.pid_data[software][-1] if self.pid_data[software] else None
-                latest_username = self.username_data[software][-1] if self.username_data[software] else "未知"
-                
-                label = f"{software}"
-                if latest_pid is not None:
-                    label += f" (PID: {latest_pid}, 用户: {latest_username})"
-                
-                # 绘制系统资源时使用特殊样式
-                if software == "系统":
-                    canvas.axes.plot(self.time_data, data[software], label=label, color=color, linewidth=2, linestyle='--')
-                else:
-                    canvas.axes.plot(self.time_data, data[software], label=label, color=color)
+    def backfill_charts(self, timestamp, data):
+        """在已显示的时间点填入迟到的数据系列"""
+        # 压缩归档只能追加，保留显示时的数据点
+        if self.history.patch(timestamp, data):
+            self.frame_scheduler.request()
+    
+    def _render_frame(self):
+        """由帧调度器调用，只绘制当前可见的图表"""
+        self._update_canvas(self.chart_tabs.currentIndex())
+    
+    def _update_canvas(self, index):
+        """更新指定选项卡中的图表"""
+        if self.chart_tabs.widget(index) is self.monitor_tree:
+            self._update_monitor_tree()
+            return
+        if not 0 <= index < len(self.charts):
+            return
+        metric, chart = self.charts[index]
+        
+        # 所有数据点的matplotlib日期数值
+        times = self.history.times() / 86400.0
+        
+        series = []
+        for software in self.history.names:
+            # 获取最新的PID和用户名
+            latest_pid = self.history.latest(software, 'pid')
+            latest_username = self.history.latest(software, 'username') or "未知"
+            
+            label = f"{software}"
+            if latest_pid is not None:
+                label += f" (PID: {latest_pid}, 用户: {latest_username})"
             
-            # 添加图例和旋转x轴标签
-            canvas.axes.legend(loc='upper left')
-            canvas.axes.tick_params(axis='x', rotation=45)
+            # 绘制系统资源时使用特殊样式
+            style = {'linewidth': 2, 'linestyle': '--'} if software == "系统" else {}
             
-            # 调整布局
-            canvas.fig.tight_layout()
-            canvas.draw()
+            # 数据是历史记录的视图，无需复制
+            series.append((software, self.history.series(software, metric), label, style))
+        
+        chart.update(times, series, self.history.count)
+    
+    def _update_monitor_tree(self):
+        """显示被监控进程自身及其子树的使用量"""
+        snapshot = ProcessSnapshot()
+        seen = set()
+        for node in self.monitor_nodes:
+            # 匹配多个条目的进程只列出一次
+            if node['pid'] in seen:
+                continue
+            seen.add(node['pid'])
+            snapshot.append(node['name'] or str(node['pid']), node['pid'], node['username'] or "未知",
+                            node['cpu'] or 0, node['memory'] or 0, 0, ppid=node['ppid'])
+        
+        # 子树合计一次遍历求和，只有进程变化时才重建树
+        self.monitor_tree_model.update_snapshot(snapshot)
     
     def export_data(self, file_type):
         """导出数据到文件"""
-        if not self.time_data or not self.cpu_data:
+        # 压缩的长期历史比环形缓冲区保存得更久
+        history = self.archive if self.archive is not None and len(self.archive) > len(self.history) else self.history
+        if not len(history) or not history.names:
             QMessageBox.warning(self, "警告", "没有数据可导出!")
             return
             
@@ -925,6 +1239,17 @@ class ResourceMonitor(QMainWindow):
             timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             default_filename = f"resource_monitor_{timestamp}.{file_type}"
             
+            # 每个时间点的时间戳和时间字符串
+            timestamps = history.times().tolist()
+            time_strs = [datetime.datetime.fromtimestamp(t).strftime("%H:%M:%S") for t in timestamps]
+            
+            # 每种软件各项指标的数据列
+            columns = {}
+            for software in history.names:
+                columns[software] = [to_list(history.series(software, metric)) for metric in METRICS]
+                columns[software].append(history.label_series(software, 'pid').tolist())
+                columns[software].append(history.label_series(software, 'username').tolist())
+            
             if file_type == "json":
                 file_path, _ = QFileDialog.getSaveFileName(
                     self, "保存JSON文件", default_filename, "JSON文件 (*.json)"
@@ -936,25 +1261,22 @@ class ResourceMonitor(QMainWindow):
                 # 导出为JSON文件
                 export_data = []
                 
-                # 获取所有时间点的时间戳
-                timestamps = [datetime.datetime.strptime(t, "%H:%M:%S").timestamp() for t in self.time_data]
-                
-                for i, time_str in enumerate(self.time_data):
+                for i, time_str in enumerate(time_strs):
                     entry = {
                         '时间': time_str,
                         '时间戳': timestamps[i],
                         '软件资源': {}
                     }
                     
-                    for software in self.cpu_data.keys():
+                    for software, (cpu, memory, network, disk, gpu, pid, username) in columns.items():
                         entry['软件资源'][software] = {
-                            'CPU(%)': self.cpu_data[software][i] if i < len(self.cpu_data[software]) else None,
-                            '内存(MB)': self.memory_data[software][i] if i < len(self.memory_data[software]) else None,
-                            '网络(Mbps)': self.network_data[software][i] if i < len(self.network_data[software]) else None,
-                            '硬盘(MB/s)': self.disk_data[software][i] if i < len(self.disk_data[software]) else None,
-                            'GPU(%)': self.gpu_data[software][i] if i < len(self.gpu_data[software]) else None,
-                            'PID': self.pid_data[software][i] if i < len(self.pid_data[software]) else None,
-                            '用户名': self.username_data[software][i] if i < len(self.username_data[software]) else None
+                            'CPU(%)': cpu[i],
+                            '内存(MB)': memory[i],
+                            '网络(Mbps)': network[i],
+                            '硬盘(MB/s)': disk[i],
+                            'GPU(%)': gpu[i],
+                            'PID': pid[i],
+                            '用户名': username[i]
                         }
                     
                     export_data.append(entry)
@@ -976,7 +1298,7 @@ class ResourceMonitor(QMainWindow):
                     
                     # 创建表头
                     headers = ['时间']
-                    for software in self.cpu_data.keys():
+                    for software in columns:
                         headers.extend([
                             f'{software}_CPU(%)', 
                             f'{software}_内存(MB)', 
@@ -990,20 +1312,11 @@ class ResourceMonitor(QMainWindow):
                     writer.writerow(headers)
                     
                     # 写入数据
-                    for i, time_str in enumerate(self.time_data):
+                    for i, time_str in enumerate(time_strs):
                         row = [time_str]
-                        for software in self.cpu_data.keys():
-                            # 获取该时间点的数据
-                            cpu = self.cpu_data[software][i] if i < len(self.cpu_data[software]) else None
-                            memory = self.memory_data[software][i] if i < len(self.memory_data[software]) else None
-                            network = self.network_data[software][i] if i < len(self.network_data[software]) else None
-                            disk = self.disk_data[software][i] if i < len(self.disk_data[software]) else None
-                            gpu = self.gpu_data[software][i] if i < len(self.gpu_data[software]) else None
-                            pid = self.pid_data[software][i] if i < len(self.pid_data[software]) else None
-                            username = self.username_data[software][i] if i < len(self.username_data[software]) else None
-                            
-                            # 添加到行数据
-                            row.extend([cpu, memory, network, disk, gpu, pid, username])
+                        for software_columns in columns.values():
+                            # 添加该时间点的数据
+                            row.extend(column[i] for column in software_columns)
                         
                         writer.writerow(row)
             
@@ -1020,6 +1333,12 @@ class ResourceMonitor(QMainWindow):
             self.monitor_thread.stop()
             self.monitor_thread.wait()
         
+        # 丢弃尚未绘制的帧
+        self.frame_scheduler.cancel()
+        
+        # 停止回放
+        self.close_replay()
+        
         event.accept()
 
 if __name__ == "__main__":
@@ -1,15 +1,10 @@
 import sys
 import psutil
-import GPUtil
 import time
 import json
 import os
 import datetime
 import queue
-import win32gui
-import win32process
-import win32con
-import win32ui
 import csv
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                             QLabel, QLineEdit, QPushButton, QListWidget, QTabWidget, 
@@ -17,7 +12,7 @@ from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QH
                             QSpinBox, QDoubleSpinBox, QComboBox, QStatusBar, QDialog, 
                             QTreeWidget, QTreeWidgetItem, QHeaderView, QProgressBar, 
                             QToolBar, QAction, QMenu, QCheckBox, QTreeWidgetItemIterator,
-                            QListWidgetItem, QFrame, QGridLayout, QSizePolicy)
+                            QListWidgetItem, QFrame, QGridLayout, QSizePolicy, QSlider, QTreeView)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QDateTime, QTimer, QSortFilterProxyModel, QSize
 from PyQt5.QtGui import QFont, QIcon, QColor, QStandardItemModel, QStandardItem, QPixmap, QImage
 import matplotlib
@@ -26,196 +21,180 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
 
+# Allow running this file directly as well as with python -m
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from resource_monitor.charts import LiveChart
+from resource_monitor.classify import CATEGORY_APPLICATION, CATEGORY_SYSTEM, CATEGORY_USER, ProcessClassifier
+from resource_monitor.compressed import CompressedHistory
+from resource_monitor.frames import DEFAULT_FPS, FrameScheduler
+from resource_monitor.history import METRICS, HistoryStore, to_list
+from resource_monitor.matcher import parse_selector
+from resource_monitor.process_model import (ProcessFilterProxy, ProcessSnapshot, ProcessTableModel, ProcessTreeModel,
+                                            restore_tree_state, tree_state)
+from resource_monitor.recorder import open_recorder
+from resource_monitor.remote import DEFAULT_PORT, Collector
+from resource_monitor.replay import RECORDING_PATTERNS, ReplaySession, open_recording
+from resource_monitor.sampler import DEFAULT_WORKERS, ResourceSampler, get_gpus
+from resource_monitor.scheduler import AsyncSampler, parse_cadence
+
+# Local time zone for chart time axes
+LOCAL_TZ = datetime.datetime.now().astimezone().tzinfo
+
 # Configure matplotlib to support Chinese display
 plt.rcParams["font.family"] = ["SimHei"]
 plt.rcParams['axes.unicode_minus'] = False  # Fix negative sign display issue
 
 class MonitorThread(QThread):
     """Background thread for monitoring resources"""
-    update_signal = pyqtSignal(dict)
+    update_signal = pyqtSignal(float, dict)  # Sample timestamp, data
+    backfill_signal = pyqtSignal(float, dict)  # Timestamp of an earlier sample, series arriving late for it
     
-    def __init__(self, software_list, update_interval=1, monitor_system=False):
+    def __init__(self, software_list, update_interval=1, monitor_system=False, rescan_interval=10.0,
+                 group_by=('pattern',), recorder=None, intervals=None, workers=DEFAULT_WORKERS):
         super().__init__()
         self.software_list = software_list
         self.update_interval = update_interval
         self.running = True
-        self.process_network_counters = {}  # Store network counters for each process
-        self.system_network_counters = psutil.net_io_counters(pernic=True)
         self.monitor_system = monitor_system
+        # With per-collector intervals every metric is read on its own cadence by an asyncio scheduler
+        if intervals is None:
+            self.sampler = ResourceSampler(software_list, update_interval, monitor_system,
+                                           system_key="System", unknown_user="Unknown",
+                                           rescan_interval=rescan_interval, group_by=group_by, workers=workers)
+        else:
+            self.sampler = AsyncSampler(software_list, update_interval, monitor_system,
+                                        system_key="System", unknown_user="Unknown",
+                                        rescan_interval=rescan_interval, group_by=group_by, intervals=intervals,
+                                        workers=workers)
+        self.recorder = recorder  # Appends every sample to disk, owned by this thread
     
     def run(self):
+        if isinstance(self.sampler, AsyncSampler):
+            # The asyncio scheduler emits merged samples by itself
+            try:
+                self.sampler.serve(self.receive)
+            except Exception as e:
+                print(f"Monitoring thread error: {e}")
+            self.close_recorder()
+            return
+        
+        # Sample on a fixed schedule, the time spent sampling is not added to the interval
+        next_sample = time.monotonic()
         while self.running:
             try:
                 data = self.get_resource_data()
-                self.update_signal.emit(data)
-                time.sleep(self.update_interval)
+                timestamp = time.time()
+                self.update_signal.emit(timestamp, data)
+                self.record(timestamp, data)
+                next_sample = max(next_sample + self.update_interval, time.monotonic())
+                time.sleep(max(0.0, next_sample - time.monotonic()))
             except Exception as e:
                 print(f"Monitoring thread error: {e}")
                 self.running = False
+        
+        # Write out the samples still buffered
+        self.close_recorder()
+        self.sampler.close()
     
     def stop(self):
         self.running = False
+        if isinstance(self.sampler, AsyncSampler):
+            self.sampler.stop()
+    
+    def receive(self, timestamp, data):
+        """Pass a sample of the asyncio scheduler on to the charts"""
+        self.update_signal.emit(timestamp, data)
+        self.record(timestamp, data)
+    
+    def record(self, timestamp, data):
+        """Append the sample to the recording file, if any"""
+        if self.recorder is None:
+            return
+        try:
+            self.recorder.write(timestamp, data)
+        except OSError as e:
+            # A full disk stops the recording, not the monitoring
+            print(f"Recording error: {e}")
+            self.close_recorder()
+    
+    def close_recorder(self):
+        """Flush and close the recording file"""
+        if self.recorder is None:
+            return
+        try:
+            self.recorder.close()
+        except OSError as e:
+            print(f"Recording error: {e}")
+        self.recorder = None
     
     def get_resource_data(self):
         """Get resource usage of specified software"""
-        data = {}
-        
-        # Monitor system-wide resources
-        if self.monitor_system:
-            # CPU usage
-            cpu_percent = psutil.cpu_percent(interval=0.1)
-            
-            # Memory usage (MB)
-            memory = psutil.virtual_memory()
-            memory_mb = memory.used / (1024 **2)
-            memory_percent = memory.percent
-            
-            # Network usage
-            current_network_counters = psutil.net_io_counters(pernic=True)
-            if self.system_network_counters:
-                network_usage = 0
-                for nic, counters in current_network_counters.items():
-                    if nic in self.system_network_counters:
-                        # Calculate difference in sent and received bytes
-                        bytes_sent = counters.bytes_sent - self.system_network_counters[nic].bytes_sent
-                        bytes_recv = counters.bytes_recv - self.system_network_counters[nic].bytes_recv
-                        # Convert to Mbps
-                        network_usage += (bytes_sent + bytes_recv) * 8 / (1024** 2) / self.update_interval
-            else:
-                network_usage = 0
-            
-            # Update last network I/O counters
-            self.system_network_counters = current_network_counters
-            
-            # Disk usage
-            disk_counters = psutil.disk_io_counters()
-            disk_usage = (disk_counters.read_bytes + disk_counters.write_bytes) / (1024 **2) / self.update_interval
-            
-            # GPU usage
-            try:
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    gpu_usage = gpus[0].load * 100  # Convert to percentage
-                else:
-                    gpu_usage = 0
-            except:
-                gpu_usage = 0
-            
-            # Store system-wide data
-            data["System"] = {
-                'cpu': cpu_percent,
-                'memory': memory_mb,
-                'memory_percent': memory_percent,
-                'network': network_usage,
-                'disk': disk_usage,
-                'gpu': gpu_usage,
-                'pid': None,
-                'username': os.getlogin()
-            }
-        
-        # Get all process information
-        current_process_network = {}  # Store current process network connections count
-        
-        for proc in psutil.process_iter(['name', 'cpu_percent', 'memory_info', 'pid', 'username']):
-            try:
-                process_name = proc.info['name'].lower()
-                
-                # Check if process name is in monitoring list
-                for software in self.software_list:
-                    if software.lower() in process_name:
-                        # CPU usage
-                        cpu_percent = proc.info['cpu_percent']
-                        
-                        # Memory usage (MB)
-                        memory_mb = proc.info['memory_info'].rss / (1024** 2)
-                        
-                        # Network usage
-                        try:
-                            # Get process network connections
-                            connections = proc.connections(kind='inet')
-                            current_process_network[proc.info['pid']] = len(connections)
-                            
-                            # Estimate network usage based on connection count
-                            if proc.info['pid'] in self.process_network_counters:
-                                last_connections = self.process_network_counters[proc.info['pid']]
-                                network_usage = len(connections) - last_connections
-                                # If connection count decreases, it indicates data transmission
-                                if network_usage < 0:
-                                    network_usage = abs(network_usage) * 0.1  # Estimated value
-                                else:
-                                    network_usage = 0
-                            else:
-                                network_usage = 0
-                            
-                            # Limit maximum value
-                            if network_usage > 100:
-                                network_usage = 100
-                            
-                        except (psutil.AccessDenied, psutil.NoSuchProcess):
-                            network_usage = 0
-                        
-                        # Disk usage
-                        try:
-                            # Get process I/O counters
-                            io_counters = proc.io_counters()
-                            if io_counters:
-                                # Convert to MB/s
-                                disk_usage = (io_counters.read_bytes + io_counters.write_bytes) / (1024 **2) / self.update_interval
-                            else:
-                                disk_usage = 0
-                        except (psutil.AccessDenied, psutil.NoSuchProcess):
-                            disk_usage = 0
-                        
-                        # GPU usage
-                        try:
-                            gpu_usage = 0
-                            # Try to get GPU usage by process ID
-                            # Note: This requires NVIDIA's pynvml library support
-                            # Simplified handling here, actual implementation may need more complexity
-                            gpus = GPUtil.getGPUs()
-                            if gpus:
-                                # Cannot directly get process GPU usage, example only
-                                pass
-                        except:
-                            gpu_usage = 0
-                        
-                        # Store data
-                        data[software] = {
-                            'cpu': cpu_percent,
-                            'memory': memory_mb,
-                            'network': network_usage,
-                            'disk': disk_usage,
-                            'gpu': gpu_usage,
-                            'pid': proc.info['pid'],
-                            'username': proc.info['username'] if 'username' in proc.info else "Unknown"
-                        }
-                        
-                        # Exit inner loop to avoid duplicate addition of the same process
-                        break
-            except (psutil.AccessDenied, psutil.NoSuchProcess, psutil.ZombieProcess):
-                continue
+        return self.sampler.get_resource_data()
+
+class CollectorThread(MonitorThread):
+    """Background thread receiving samples from remote agents"""
+    
+    def __init__(self, port, update_interval=1, recorder=None):
+        QThread.__init__(self)
+        self.update_interval = update_interval
+        self.running = True
+        self.recorder = recorder
+        # Samples of all agents are merged on one time axis, series are named "host: name"
+        # The backlog of a reconnected agent fills in points already shown
+        self.collector = Collector(self.receive, port=port, interval=update_interval, backfill=self.receive_backfill)
+    
+    def run(self):
+        try:
+            self.collector.serve()
+        except OSError as e:
+            print(f"Collector error: {e}")
         
-        # Update process network counters
-        self.process_network_counters = current_process_network
-        
-        # Set default values for software not found
-        for software in self.software_list:
-            if software not in data:
-                data[software] = {
-                    'cpu': 0,
-                    'memory': 0,
-                    'network': 0,
-                    'disk': 0,
-                    'gpu': 0,
-                    'pid': None,
-                    'username': "Unknown"
-                }
-        
-        return data
+        # Write out the samples still buffered
+        self.close_recorder()
+    
+    def stop(self):
+        self.running = False
+        self.collector.stop()
+    
+    def receive(self, timestamp, data):
+        """Pass a merged sample of all agents to the charts, called by the collector"""
+        self.update_signal.emit(timestamp, data)
+        self.record(timestamp, data)
+    
+    def receive_backfill(self, timestamp, data):
+        """Pass series of agents that were behind to the charts, called by the collector"""
+        self.backfill_signal.emit(timestamp, data)
+        # Columnar recordings must stay in time order
+        if not getattr(self.recorder, 'ordered', False):
+            self.record(timestamp, data)
+
+class ProcessScanThread(QThread):
+    """Scan the process table in the background for live refresh"""
+    snapshot_ready = pyqtSignal(object)
+    
+    def __init__(self, scan, parent=None):
+        super().__init__(parent)
+        self.scan = scan
+    
+    def run(self):
+        try:
+            snapshot = self.scan()
+        except Exception as e:
+            # The rows of the previous scan stay, the next timer tick scans again
+            print(f"Process scan error: {e}")
+            return
+        self.snapshot_ready.emit(snapshot)
 
 class ProcessSelector(QDialog):
     """Process selection dialog"""
-    def __init__(self, parent=None):
+    # Milliseconds between scans in live refresh mode
+    LIVE_REFRESH_INTERVAL = 1000
+    
+    # Milliseconds of typing pause before the search runs
+    SEARCH_DELAY = 150
+    
+    def __init__(self, parent=None, classifier=None):
         super().__init__(parent)
         self.setWindowTitle("Select Process")
         self.setMinimumSize(900, 600)  # Increase window size
@@ -233,8 +212,15 @@ class ProcessSelector(QDialog):
         
         # Search box
         self.search_edit = QLineEdit()
-        self.search_edit.setPlaceholderText("Search processes...")
-        self.search_edit.textChanged.connect(self.filter_processes)
+        self.search_edit.setPlaceholderText("Search processes, e.g. user:root nginx")
+        self.search_edit.setToolTip("All words must match; name:, pid: and user: search a single column")
+        
+        # Search once typing pauses instead of on every keystroke
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY)
+        self.search_timer.timeout.connect(self.filter_processes)
+        self.search_edit.textChanged.connect(self.search_timer.start)
         
         # Refresh button
         self.refresh_button = QPushButton("Refresh")
@@ -245,19 +231,39 @@ class ProcessSelector(QDialog):
         self.show_icon_checkbox.setChecked(True)
         self.show_icon_checkbox.stateChanged.connect(self.refresh_processes)
         
+        # Live refresh checkbox
+        self.live_checkbox = QCheckBox("Live Refresh")
+        self.live_checkbox.stateChanged.connect(self.toggle_live_refresh)
+        
+        # Tree view checkbox
+        self.tree_checkbox = QCheckBox("Tree View")
+        self.tree_checkbox.setToolTip("Show processes under their parents, with the CPU and memory of each subtree")
+        self.tree_checkbox.stateChanged.connect(self.toggle_tree_view)
+        
         filter_layout.addWidget(QLabel("Filter type:"))
         filter_layout.addWidget(self.process_type_combo)
         filter_layout.addWidget(QLabel("Search:"))
         filter_layout.addWidget(self.search_edit)
         filter_layout.addWidget(self.refresh_button)
         filter_layout.addWidget(self.show_icon_checkbox)
+        filter_layout.addWidget(self.live_checkbox)
+        filter_layout.addWidget(self.tree_checkbox)
         
         layout.addLayout(filter_layout)
         
-        # Create process tree
-        self.process_tree = QTreeWidget()
-        self.process_tree.setColumnCount(5)
-        self.process_tree.setHeaderLabels(["Process Name", "PID", "Username", "CPU (%)", "Memory (MB)"])
+        # Create process list over one snapshot, the view only formats the rows it shows
+        self.process_model = ProcessTableModel(["Process Name", "PID", "Username", "CPU (%)", "Memory (MB)"], self)
+        
+        # Parent/child view of the same scans, with the totals of every subtree
+        self.tree_model = ProcessTreeModel(["Process Name", "PID", "Username", "CPU (%)", "Memory (MB)",
+                                            "Subtree CPU (%)", "Subtree Memory (MB)"], self)
+        
+        self.proxy_model = ProcessFilterProxy(self)
+        self.proxy_model.setSourceModel(self.process_model)
+        self.process_tree = QTreeView()
+        self.process_tree.setModel(self.proxy_model)
+        self.process_tree.setRootIsDecorated(False)
+        self.process_tree.setUniformRowHeights(True)  # Rows are never measured one by one
         
         # Set column width policy
         self.process_tree.header().setSectionResizeMode(0, QHeaderView.Stretch)  # Process name column auto-stretches
@@ -273,15 +279,15 @@ class ProcessSelector(QDialog):
         
         # Set style to display full process names
         self.process_tree.setStyleSheet("""
-            QTreeWidget {
+            QTreeView {
                 show-decoration-selected: 1;
                 alternate-background-color: #f2f2f2;
             }
-            QTreeWidget::item {
+            QTreeView::item {
                 height: 30px;
                 border-bottom: 1px solid #e0e0e0;
             }
-            QTreeWidget::item:selected {
+            QTreeView::item:selected {
                 background-color: #bde0fe;
                 color: black;
             }
@@ -299,194 +305,177 @@ class ProcessSelector(QDialog):
         self.select_button = QPushButton("Select")
         self.select_button.clicked.connect(self.select_process)
         
+        self.select_subtree_button = QPushButton("Select Subtree")
+        self.select_subtree_button.setToolTip("Monitor the selected process and all of its descendants as one series")
+        self.select_subtree_button.clicked.connect(self.select_subtree)
+        self.select_subtree_button.setVisible(False)
+        
         self.cancel_button = QPushButton("Cancel")
         self.cancel_button.clicked.connect(self.reject)
         
         button_layout.addStretch(1)
+        button_layout.addWidget(self.select_subtree_button)
         button_layout.addWidget(self.select_button)
         button_layout.addWidget(self.cancel_button)
         
         layout.addLayout(button_layout)
         
+        # Live refresh scans in the background and only applies the differences
+        self.scan_thread = ProcessScanThread(self.scan_processes, self)
+        self.scan_thread.snapshot_ready.connect(self.apply_snapshot)
+        self.live_timer = QTimer(self)
+        self.live_timer.setInterval(self.LIVE_REFRESH_INTERVAL)
+        self.live_timer.timeout.connect(self.start_live_scan)
+        
+        # Categories come from rules and are remembered for the lifetime of each process
+        self.classifier = classifier if classifier is not None else ProcessClassifier()
+        
         # Initialize process list
         self.refresh_processes()
         
         # Connect double-click event
-        self.process_tree.itemDoubleClicked.connect(self.item_double_clicked)
-        
-        # Store original process data
-        self.all_processes = []
+        self.process_tree.doubleClicked.connect(self.item_double_clicked)
+        self.process_tree.setExpandsOnDoubleClick(False)  # Double-click selects, the arrows expand
     
     def refresh_processes(self):
         """Refresh process list"""
-        self.process_tree.clear()
-        self.all_processes = []
-        
-        # Get current user
-        current_user = os.getlogin()
-        
-        # Create category root nodes
-        self.all_root = QTreeWidgetItem(self.process_tree)
-        self.all_root.setText(0, "All Processes")
-        self.all_root.setExpanded(True)
-        
-        self.apps_root = QTreeWidgetItem(self.process_tree)
-        self.apps_root.setText(0, "Applications")
-        self.apps_root.setExpanded(True)
+        # A live scan is already on its way
+        if self.scan_thread.isRunning():
+            return
         
-        self.system_root = QTreeWidgetItem(self.process_tree)
-        self.system_root.setText(0, "System Processes")
-        self.system_root.setExpanded(True)
+        self.apply_snapshot(self.scan_processes())
         
-        self.user_root = QTreeWidgetItem(self.process_tree)
-        self.user_root.setText(0, "User Processes")
-        self.user_root.setExpanded(True)
+        # Apply filter
+        self.filter_processes()
+    
+    def scan_processes(self):
+        """Return a snapshot of all processes"""
+        snapshot = ProcessSnapshot()
         
         # Get all processes
-        for proc in psutil.process_iter(['name', 'cpu_percent', 'memory_info', 'username', 'pid']):
+        for proc in psutil.process_iter(['name', 'cpu_percent', 'memory_info', 'username', 'pid', 'ppid',
+                                         'create_time']):
             try:
-                process_name = proc.info['name']
+                # Attributes that can't be read are None in proc.info
+                process_name = proc.info['name'] or ""
                 pid = proc.info['pid']
-                cpu_percent = proc.info['cpu_percent']
-                memory_mb = proc.info['memory_info'].rss / (1024** 2)
-                username = proc.info['username'] if 'username' in proc.info else "Unknown"
-                
-                # Store original process data
-                process_data = {
-                    'name': process_name,
-                    'pid': pid,
-                    'username': username,
-                    'cpu_percent': cpu_percent,
-                    'memory_mb': memory_mb
-                }
-                self.all_processes.append(process_data)
+                cpu_percent = proc.info['cpu_percent'] or 0.0
+                memory_info = proc.info['memory_info']
+                memory_mb = memory_info.rss / (1024 ** 2) if memory_info is not None else 0.0
+                username = proc.info['username'] or "Unknown"
                 
-                # Create process item
-                process_item = QTreeWidgetItem()
+                # Categorize as application and by user, only new processes are classified
+                categories = self.classifier.classify(proc, proc.info)
                 
-                # Set process name, use ellipsis for long names
-                process_item.setText(0, process_name)
-                process_item.setToolTip(0, process_name)  # Set full name as tooltip
-                
-                process_item.setText(1, str(pid))
-                process_item.setText(2, username)
-                process_item.setText(3, f"{cpu_percent:.1f}")
-                process_item.setText(4, f"{memory_mb:.1f}")
-                
-                # Set background color, processes with high CPU usage show red
-                if cpu_percent > 50:
-                    for i in range(5):
-                        process_item.setBackground(i, QColor(255, 200, 200))
-                        
-                # Categorize by user
-                self.all_root.addChild(process_item.clone())
-                
-                # Determine if it's an application
-                is_application = self.is_application(process_name)
-                if is_application:
-                    self.apps_root.addChild(process_item.clone())
-                
-                # Categorize by user
-                if username == current_user:
-                    self.user_root.addChild(process_item.clone())
-                else:
-                    self.system_root.addChild(process_item.clone())
+                # Store process data, rows are created by the view on demand
+                snapshot.append(process_name, pid, username, cpu_percent, memory_mb, categories,
+                                proc.info['create_time'], proc.info['ppid'])
                     
             except (psutil.AccessDenied, psutil.NoSuchProcess, psutil.ZombieProcess):
                 continue
         
-        # Apply filter
-        self.filter_processes()
-    
-    def is_application(self, process_name):
-        """Determine if it's an application"""
-        # Common application extensions
-        app_extensions = ['.exe', '.app', '.jar', '.pyw']
-        
-        # Common application names
-        app_names = ['chrome', 'firefox', 'explorer', 'word', 'excel', 'powerpoint', 
-                    'notepad', 'photoshop', 'premiere', 'aftereffects', 'vscode', 'sublime']
-        
-        process_name_lower = process_name.lower()
-        
-        # Check extensions
-        for ext in app_extensions:
-            if process_name_lower.endswith(ext):
-                return True
+        # Forget the categories of processes that have exited
+        self.classifier.prune(snapshot.keys)
         
-        # Check names
-        for name in app_names:
-            if name in process_name_lower:
-                return True
+        return snapshot
+    
+    def apply_snapshot(self, snapshot):
+        """Show a scan in the list or the tree, whichever is shown"""
+        if not self.tree_checkbox.isChecked():
+            # Only changed rows are updated, scroll position and selection are kept
+            self.process_model.update_snapshot(snapshot)
+            return
         
-        return False
+        # The tree is rebuilt when processes start or exit, expanded branches and the selection are restored
+        state = tree_state(self.process_tree, self.tree_model, self.proxy_model)
+        self.tree_model.update_snapshot(snapshot)
+        restore_tree_state(self.process_tree, self.tree_model, state, self.proxy_model)
+    
+    def toggle_tree_view(self, state):
+        """Switch between the flat list and the process tree"""
+        tree = state == Qt.Checked
+        header = self.process_tree.header()
+        sort_column, sort_order = header.sortIndicatorSection(), header.sortIndicatorOrder()
+        self.proxy_model.setSourceModel(self.tree_model if tree else self.process_model)
+        self.process_tree.setRootIsDecorated(tree)
+        self.select_subtree_button.setVisible(tree)
+        
+        # The tree has two more columns
+        header.setSectionResizeMode(0, QHeaderView.Stretch)
+        for column in range(1, self.proxy_model.columnCount()):
+            header.setSectionResizeMode(column, QHeaderView.ResizeToContents)
+        
+        # Keep the sort order, unless it was by a column of the tree only
+        if sort_column >= self.proxy_model.columnCount():
+            sort_column, sort_order = 0, Qt.AscendingOrder
+        self.process_tree.sortByColumn(sort_column, sort_order)
+        
+        # The model shown before keeps its rows, the other one is filled by a fresh scan
+        self.refresh_processes()
+        if tree:
+            self.process_tree.expandToDepth(0)
+    
+    def toggle_live_refresh(self, state):
+        """Start or stop refreshing the list every second"""
+        if state == Qt.Checked:
+            self.start_live_scan()
+            self.live_timer.start()
+        else:
+            self.live_timer.stop()
+    
+    def start_live_scan(self):
+        """Scan in the background unless the previous scan is still running"""
+        if not self.scan_thread.isRunning():
+            self.scan_thread.start()
+    
+    def done(self, result):
+        """Stop live refresh before the dialog closes"""
+        self.live_timer.stop()
+        self.scan_thread.wait()
+        super().done(result)
     
     def filter_processes(self):
         """Filter processes according to filter criteria"""
-        filter_type = self.process_type_combo.currentText()
-        search_text = self.search_edit.text().lower()
-        
-        # Hide all root nodes
-        self.all_root.setHidden(True)
-        self.apps_root.setHidden(True)
-        self.system_root.setHidden(True)
-        self.user_root.setHidden(True)
-        
-        # Show corresponding root node according to filter type
-        if filter_type == "All Processes":
-            self.all_root.setHidden(False)
-        elif filter_type == "Applications":
-            self.apps_root.setHidden(False)
-        elif filter_type == "System Processes":
-            self.system_root.setHidden(False)
-        elif filter_type == "User Processes":
-            self.user_root.setHidden(False)
-        
-        # Get current root node
-        if filter_type == "All Processes":
-            current_root = self.all_root
-        elif filter_type == "Applications":
-            current_root = self.apps_root
-        elif filter_type == "System Processes":
-            current_root = self.system_root
-        elif filter_type == "User Processes":
-            current_root = self.user_root
-        else:
-            current_root = self.all_root
-        
-        # Traverse all child items
-        for i in range(current_root.childCount()):
-            child = current_root.child(i)
-            
-            # If there is search text, check for match
-            if search_text and not (search_text in child.text(0).lower() or 
-                                  search_text in child.text(1).lower() or 
-                                  search_text in child.text(2).lower()):
-                child.setHidden(True)
-            else:
-                child.setHidden(False)
+        # Category of each filter type, in combo box order
+        categories = [0, CATEGORY_APPLICATION, CATEGORY_SYSTEM, CATEGORY_USER]
+        category = categories[self.process_type_combo.currentIndex()]
+        query = self.search_edit.text()
+        self.proxy_model.set_filter(category, query)
+        
+        # Matches may be deep in the tree, their ancestors are shown expanded
+        if self.tree_checkbox.isChecked() and (category or query.strip()):
+            self.process_tree.expandAll()
     
-    def item_double_clicked(self, item, column):
+    def item_double_clicked(self, index):
         """Select process when item is double-clicked"""
-        # Ensure it's not a top-level item
-        if item.parent() is not None:
-            self.select_process()
+        self.select_process()
     
-    def select_process(self):
-        """Select process and return"""
-        selected_items = self.process_tree.selectedItems()
-        if not selected_items:
+    def selected_row(self):
+        """Return the snapshot row of the first selected process, None after a warning if there is none"""
+        selected_rows = self.process_tree.selectionModel().selectedRows()
+        if not selected_rows:
             QMessageBox.warning(self, "Warning", "Please select a process first!")
-            return
+            return None
             
         # Get first selected item
-        item = selected_items[0]
-        
-        # Ensure it's not a top-level item
-        if item.parent() is not None:
-            process_name = item.text(0)
-            self.selected_process = process_name
-            self.accept()
+        index = self.proxy_model.mapToSource(selected_rows[0])
+        return self.proxy_model.sourceModel().snapshot_row(index.row(), index.parent())
+    
+    def select_process(self):
+        """Select process and return"""
+        row = self.selected_row()
+        if row is None:
+            return
+        self.selected_process = self.proxy_model.sourceModel().snapshot.names[row]
+        self.accept()
+    
+    def select_subtree(self):
+        """Select a process and all of its descendants, monitored as one series"""
+        row = self.selected_row()
+        if row is None:
+            return
+        self.selected_process = f"tree:{self.tree_model.snapshot.pids[row]}"
+        self.accept()
 
 class MplCanvas(FigureCanvas):
     """Matplotlib canvas for displaying charts"""
@@ -503,6 +492,12 @@ class MplCanvas(FigureCanvas):
 
 class ResourceMonitor(QMainWindow):
     """Main window class"""
+    # Group-by keys for each entry of group_by_combo
+    GROUP_BY_OPTIONS = [('pattern',), ('pattern', 'username'), ('pattern', 'tree'), ('pattern', 'cmdline')]
+    
+    # Replay speeds offered in the replay bar
+    REPLAY_SPEEDS = [0.5, 1.0, 2.0, 5.0, 10.0, 60.0]
+    
     def __init__(self):
         super().__init__()
         
@@ -515,18 +510,34 @@ class ResourceMonitor(QMainWindow):
         # Store monitoring data
         self.software_list = []
         self.monitor_thread = None
-        self.time_data = []
-        self.cpu_data = {}
-        self.memory_data = {}
-        self.network_data = {}
-        self.disk_data = {}
-        self.gpu_data = {}
-        self.pid_data = {}
-        self.username_data = {}
+        
+        # Process categories, kept across openings of the process selector
+        self.process_classifier = None
+        
+        # Monitored processes of the latest sample, when instances are grouped by process tree
+        self.monitor_nodes = []
         
         # Maximum history points
         self.max_history_points = 60
         
+        # Monitoring history, one preallocated ring buffer per series
+        self.history = HistoryStore(self.max_history_points)
+        
+        # Compressed long-term history for export, None when disabled
+        self.archive = None
+        
+        # Charts are redrawn by a capped-FPS frame scheduler, not once per sample
+        self.frame_scheduler = FrameScheduler(self._render_frame, DEFAULT_FPS, self)
+        
+        # Recording being replayed into the charts, None when showing live data
+        self.replay = None
+        self.replay_clock = 0.0
+        
+        # Replay playback advances on a timer, by wall-clock time times the speed
+        self.replay_timer = QTimer(self)
+        self.replay_timer.setInterval(50)
+        self.replay_timer.timeout.connect(self._replay_tick)
+        
         # System-wide monitoring option
         self.monitor_system = False
         
@@ -565,6 +576,7 @@ class ResourceMonitor(QMainWindow):
         software_label = QLabel("Software name:")
         self.software_entry = QLineEdit()
         self.software_entry.setPlaceholderText("Enter software name or select from process list")
+        self.software_entry.setToolTip("Plain names match part of the process name. Prefixes: exact:, glob:, re:, exe:, cmdline:, tree:<PID>")
         
         self.select_process_button = QPushButton("Select from Processes")
         self.select_process_button.clicked.connect(self.select_process)
@@ -603,21 +615,127 @@ class ResourceMonitor(QMainWindow):
         self.update_interval_spinbox.setSuffix(" seconds")
         
         self.history_points_spinbox = QSpinBox()
-        self.history_points_spinbox.setRange(10, 1000)
+        self.history_points_spinbox.setRange(10, 1000000)
         self.history_points_spinbox.setValue(60)
         self.history_points_spinbox.setSuffix(" points")
         
+        self.archive_hours_spinbox = QSpinBox()
+        self.archive_hours_spinbox.setRange(0, 24 * 30)
+        self.archive_hours_spinbox.setValue(24)
+        self.archive_hours_spinbox.setSuffix(" hours")
+        self.archive_hours_spinbox.setSpecialValueText("Off")
+        self.archive_hours_spinbox.setToolTip("Samples older than the history points are kept compressed in memory and included in exports")
+        
+        self.max_fps_spinbox = QSpinBox()
+        self.max_fps_spinbox.setRange(1, 60)
+        self.max_fps_spinbox.setValue(DEFAULT_FPS)
+        self.max_fps_spinbox.setSuffix(" FPS")
+        self.max_fps_spinbox.setToolTip("Charts are redrawn at most this often, independent of the update interval")
+        self.max_fps_spinbox.valueChanged.connect(self.frame_scheduler.set_fps)
+        
+        self.cadence_checkbox = QCheckBox("Sample each metric on its own cadence")
+        self.cadence_checkbox.setToolTip("CPU and memory stay fresh while expensive collectors (connections, GPU) run less often")
+        
+        self.cadence_entry = QLineEdit()
+        self.cadence_entry.setPlaceholderText("cpu=0.25, memory=0.25, io=1, connections=10, gpu=5, system=1")
+        self.cadence_entry.setToolTip("Seconds between runs of each collector, collectors not listed keep their default")
+        
+        self.workers_spinbox = QSpinBox()
+        self.workers_spinbox.setRange(0, 64)
+        self.workers_spinbox.setValue(DEFAULT_WORKERS)
+        self.workers_spinbox.setSuffix(" threads")
+        self.workers_spinbox.setSpecialValueText("Off")
+        self.workers_spinbox.setToolTip("Processes are read in parallel, so a tick takes as long as the slowest process instead of all of them together")
+        
+        self.group_by_combo = QComboBox()
+        self.group_by_combo.addItems(["Watch-list entry", "Entry + user", "Entry + process tree", "Entry + command line"])
+        self.group_by_combo.setToolTip("How multiple processes matching one entry are combined into series")
+        
+        self.rescan_interval_spinbox = QDoubleSpinBox()
+        self.rescan_interval_spinbox.setRange(1.0, 300.0)
+        self.rescan_interval_spinbox.setValue(10.0)
+        self.rescan_interval_spinbox.setSingleStep(1.0)
+        self.rescan_interval_spinbox.setSuffix(" seconds")
+        self.rescan_interval_spinbox.setToolTip("How often the whole process table is scanned for newly started processes")
+        
+        self.record_checkbox = QCheckBox("Record samples to disk while monitoring")
+        self.record_checkbox.setToolTip("Every sample is appended to a JSONL or CSV file, independent of the history points")
+        
+        self.rotate_size_spinbox = QSpinBox()
+        self.rotate_size_spinbox.setRange(0, 100000)
+        self.rotate_size_spinbox.setValue(0)
+        self.rotate_size_spinbox.setSuffix(" MB")
+        self.rotate_size_spinbox.setSpecialValueText("Never")
+        self.rotate_size_spinbox.setToolTip("Start a new numbered file once the current one reaches this size")
+        
+        self.collector_checkbox = QCheckBox("Receive samples from remote agents on port")
+        self.collector_checkbox.setToolTip("Show agents started with: python -m resource_monitor ... --agent THIS_HOST:PORT")
+        
+        self.collector_port_spinbox = QSpinBox()
+        self.collector_port_spinbox.setRange(1, 65535)
+        self.collector_port_spinbox.setValue(DEFAULT_PORT)
+        
         self.start_button = QPushButton("Start Monitoring")
         self.start_button.setCheckable(True)
         self.start_button.toggled.connect(self.toggle_monitoring)
         
         settings_layout.addRow("Update interval:", self.update_interval_spinbox)
         settings_layout.addRow("History points:", self.history_points_spinbox)
+        settings_layout.addRow("Long-term history:", self.archive_hours_spinbox)
+        settings_layout.addRow("Max refresh rate:", self.max_fps_spinbox)
+        settings_layout.addRow("Process rescan interval:", self.rescan_interval_spinbox)
+        settings_layout.addRow("Process reading threads:", self.workers_spinbox)
+        settings_layout.addRow("Group instances by:", self.group_by_combo)
+        settings_layout.addRow("Collector cadence:", self.cadence_checkbox)
+        settings_layout.addRow("Collector intervals:", self.cadence_entry)
+        settings_layout.addRow("Recording:", self.record_checkbox)
+        settings_layout.addRow("Rotate files after:", self.rotate_size_spinbox)
+        collector_layout = QHBoxLayout()
+        collector_layout.addWidget(self.collector_checkbox)
+        collector_layout.addWidget(self.collector_port_spinbox)
+        settings_layout.addRow("Remote agents:", collector_layout)
         settings_layout.addRow(self.start_button)
         
         settings_group.setLayout(settings_layout)
         control_layout.addWidget(settings_group)
         
+        # Replay controls
+        replay_group = QGroupBox("Replay")
+        replay_layout = QHBoxLayout()
+        
+        self.open_recording_button = QPushButton("Open Recording...")
+        self.open_recording_button.setToolTip("Load a recording (JSONL, CSV, .rmc, .db) or a JSON/CSV export into the charts")
+        self.open_recording_button.clicked.connect(self.open_recording)
+        
+        self.replay_play_button = QPushButton("Play")
+        self.replay_play_button.setCheckable(True)
+        self.replay_play_button.toggled.connect(self.toggle_replay)
+        
+        self.replay_speed_combo = QComboBox()
+        self.replay_speed_combo.addItems([f"{speed:g}x" for speed in self.REPLAY_SPEEDS])
+        self.replay_speed_combo.setCurrentIndex(self.REPLAY_SPEEDS.index(1.0))
+        self.replay_speed_combo.setToolTip("Playback speed relative to the recorded time")
+        self.replay_speed_combo.currentIndexChanged.connect(self.set_replay_speed)
+        
+        self.replay_slider = QSlider(Qt.Horizontal)
+        self.replay_slider.setToolTip("Drag to seek through the recording")
+        # Seeking rebuilds the history, so it runs once the slider is released; a drag only moves the label
+        self.replay_slider.setTracking(False)
+        self.replay_slider.valueChanged.connect(self.seek_replay)
+        self.replay_slider.sliderMoved.connect(self._show_replay_label)
+        
+        self.replay_position_label = QLabel("No recording loaded")
+        
+        replay_layout.addWidget(self.open_recording_button)
+        replay_layout.addWidget(self.replay_play_button)
+        replay_layout.addWidget(self.replay_speed_combo)
+        replay_layout.addWidget(self.replay_slider, 1)
+        replay_layout.addWidget(self.replay_position_label)
+        
+        replay_group.setLayout(replay_layout)
+        control_layout.addWidget(replay_group)
+        self._set_replay_controls_enabled(False)
+        
         # Export buttons
         export_layout = QHBoxLayout()
         self.export_json_button = QPushButton("Export JSON")
@@ -658,6 +776,33 @@ class ResourceMonitor(QMainWindow):
         self.gpu_canvas = MplCanvas(self, width=5, height=4, dpi=100)
         self.chart_tabs.addTab(self.gpu_canvas, "GPU Usage (%)")
         
+        # Process tree of the monitored processes, with the usage of each process and of its subtree
+        self.monitor_tree_model = ProcessTreeModel(["Process Name", "PID", "Username", "CPU (%)", "Memory (MB)",
+                                                    "Subtree CPU (%)", "Subtree Memory (MB)"], self)
+        self.monitor_tree = QTreeView()
+        self.monitor_tree.setModel(self.monitor_tree_model)
+        self.monitor_tree.setUniformRowHeights(True)
+        self.monitor_tree.setSortingEnabled(True)
+        self.monitor_tree.sortByColumn(5, Qt.DescendingOrder)
+        self.monitor_tree.header().setSectionResizeMode(0, QHeaderView.Stretch)
+        # Rebuilt trees start expanded, value updates keep what the user collapsed
+        self.monitor_tree_model.modelReset.connect(self.monitor_tree.expandAll)
+        tree_tab = self.chart_tabs.addTab(self.monitor_tree, "Process Tree")
+        self.chart_tabs.setTabToolTip(tree_tab, "Filled when instances are grouped by process tree")
+        
+        # Live charts in tab order, their line artists persist between updates
+        legend_kwargs = {'loc': 'upper left', 'bbox_to_anchor': (1, 1)}
+        self.charts = [
+            ('cpu', LiveChart(self.cpu_canvas, "CPU Usage (%)", "Time", LOCAL_TZ, legend_kwargs)),
+            ('memory', LiveChart(self.memory_canvas, "Memory Usage (MB)", "Time", LOCAL_TZ, legend_kwargs)),
+            ('network', LiveChart(self.network_canvas, "Network Usage (Mbps)", "Time", LOCAL_TZ, legend_kwargs)),
+            ('disk', LiveChart(self.disk_canvas, "Disk Usage (MB/s)", "Time", LOCAL_TZ, legend_kwargs)),
+            ('gpu', LiveChart(self.gpu_canvas, "GPU Usage (%)", "Time", LOCAL_TZ, legend_kwargs))
+        ]
+        
+        # Hidden charts are not drawn, bring a chart up to date when its tab is shown
+        self.chart_tabs.currentChanged.connect(self._update_canvas)
+        
         # Add chart area to splitter
         splitter.addWidget(self.chart_tabs)
         
@@ -688,14 +833,11 @@ class ResourceMonitor(QMainWindow):
             os_info = platform.platform()
             
             # GPU information
-            try:
-                gpus = GPUtil.getGPUs()
-                if gpus:
-                    gpu_info = gpus[0].name
-                else:
-                    gpu_info = "No GPU detected"
-            except:
-                gpu_info = "Unable to get GPU information"
+            gpus = get_gpus()
+            if gpus:
+                gpu_info = gpus[0].name
+            else:
+                gpu_info = "No GPU detected"
             
             # Update information label
             info_text = f"OS: {os_info} | CPU: {cpu_count} cores @ {cpu_freq:.2f}GHz | Memory: {total_memory}GB | GPU: {gpu_info}"
@@ -706,7 +848,9 @@ class ResourceMonitor(QMainWindow):
     
     def select_process(self):
         """Open process selection dialog"""
-        dialog = ProcessSelector(self)
+        if self.process_classifier is None:
+            self.process_classifier = ProcessClassifier()
+        dialog = ProcessSelector(self, self.process_classifier)
         if dialog.exec_():
             # Get selected process
             process_name = dialog.selected_process
@@ -725,18 +869,16 @@ class ResourceMonitor(QMainWindow):
         """Add software to monitoring list"""
         software_name = self.software_entry.text().strip()
         if software_name and software_name not in self.software_list:
+            # Reject invalid selectors before they reach the monitoring thread
+            try:
+                parse_selector(software_name)
+            except ValueError as e:
+                QMessageBox.warning(self, "Warning", str(e))
+                return
+            
             self.software_list.append(software_name)
             self.software_listbox.addItem(software_name)
             self.software_entry.clear()
-            
-            # Initialize chart data
-            self.cpu_data[software_name] = []
-            self.memory_data[software_name] = []
-            self.network_data[software_name] = []
-            self.disk_data[software_name] = []
-            self.gpu_data[software_name] = []
-            self.pid_data[software_name] = []
-            self.username_data[software_name] = []
     
     def remove_software(self):
         """Remove software from monitoring list"""
@@ -751,60 +893,73 @@ class ResourceMonitor(QMainWindow):
             self.software_listbox.takeItem(self.software_listbox.row(item))
             
             # Remove chart data
-            if software_name in self.cpu_data:
-                del self.cpu_data[software_name]
-            if software_name in self.memory_data:
-                del self.memory_data[software_name]
-            if software_name in self.network_data:
-                del self.network_data[software_name]
-            if software_name in self.disk_data:
-                del self.disk_data[software_name]
-            if software_name in self.gpu_data:
-                del self.gpu_data[software_name]
-            if software_name in self.pid_data:
-                del self.pid_data[software_name]
-            if software_name in self.username_data:
-                del self.username_data[software_name]
+            # Including the series of its groups, e.g. "name [user]"
+            for name in self.history.names:
+                if name == software_name or name.startswith(software_name + " ["):
+                    self.history.remove_series(name)
+                    if self.archive is not None:
+                        self.archive.remove_series(name)
     
     def toggle_monitoring(self, checked):
         """Start or stop monitoring"""
         if checked:
-            if not self.software_list and not self.monitor_system:
-                QMessageBox.warning(self, "Warning", "Please add software to monitor or select system-wide resource monitoring first!")
+            collecting = self.collector_checkbox.isChecked()
+            if not self.software_list and not self.monitor_system and not collecting:
+                QMessageBox.warning(self, "Warning", "Please add software to monitor, select system-wide resource monitoring or receive samples from remote agents first!")
                 self.start_button.setChecked(False)
                 return
                 
-            # Reset data
-            self.time_data = []
-            for software in self.software_list:
-                self.cpu_data[software] = []
-                self.memory_data[software] = []
-                self.network_data[software] = []
-                self.disk_data[software] = []
-                self.gpu_data[software] = []
-                self.pid_data[software] = []
-                self.username_data[software] = []
+            # Per-collector intervals of the asyncio scheduler, None samples everything at once
+            intervals = None
+            if self.cadence_checkbox.isChecked():
+                try:
+                    intervals = parse_cadence(self.cadence_entry.text())
+                except ValueError as e:
+                    QMessageBox.warning(self, "Warning", f"Invalid collector intervals: {e}")
+                    self.start_button.setChecked(False)
+                    return
+            
+            # Open the recording file before anything starts
+            recorder = None
+            if self.record_checkbox.isChecked():
+                recorder = self.create_recorder()
+                if recorder is None:
+                    self.start_button.setChecked(False)
+                    return
             
-            # If monitoring system-wide, initialize system data
-            if self.monitor_system:
-                self.cpu_data["System"] = []
-                self.memory_data["System"] = []
-                self.network_data["System"] = []
-                self.disk_data["System"] = []
-                self.gpu_data["System"] = []
-                self.pid_data["System"] = []
-                self.username_data["System"] = []
+            # Stop replaying, the charts show live data again
+            self.close_replay()
             
-            # Update maximum history points
+            # Reset data, series are created as their groups show up in the samples
             self.max_history_points = self.history_points_spinbox.value()
+            self.history.clear(self.max_history_points)
+            archive_hours = self.archive_hours_spinbox.value()
+            self.archive = CompressedHistory(archive_hours * 3600) if archive_hours else None
+            for _, chart in self.charts:
+                chart.clear()
+            self.monitor_nodes = []
+            self.monitor_tree_model.set_snapshot(ProcessSnapshot())
             
             # Start monitoring thread
-            self.monitor_thread = MonitorThread(
-                self.software_list, 
-                self.update_interval_spinbox.value(),
-                self.monitor_system
-            )
+            if collecting:
+                self.monitor_thread = CollectorThread(
+                    self.collector_port_spinbox.value(),
+                    self.update_interval_spinbox.value(),
+                    recorder
+                )
+            else:
+                self.monitor_thread = MonitorThread(
+                    self.software_list, 
+                    self.update_interval_spinbox.value(),
+                    self.monitor_system,
+                    self.rescan_interval_spinbox.value(),
+                    self.GROUP_BY_OPTIONS[self.group_by_combo.currentIndex()],
+                    recorder,
+                    intervals,
+                    self.workers_spinbox.value()
+                )
             self.monitor_thread.update_signal.connect(self.update_charts)
+            self.monitor_thread.backfill_signal.connect(self.backfill_charts)
             self.monitor_thread.finished.connect(self.monitoring_finished)
             self.monitor_thread.start()
             
@@ -817,8 +972,24 @@ class ResourceMonitor(QMainWindow):
             self.export_csv_button.setEnabled(False)
             self.update_interval_spinbox.setEnabled(False)
             self.history_points_spinbox.setEnabled(False)
+            self.archive_hours_spinbox.setEnabled(False)
+            self.rescan_interval_spinbox.setEnabled(False)
+            self.group_by_combo.setEnabled(False)
+            self.workers_spinbox.setEnabled(False)
+            self.cadence_checkbox.setEnabled(False)
+            self.cadence_entry.setEnabled(False)
+            self.record_checkbox.setEnabled(False)
+            self.rotate_size_spinbox.setEnabled(False)
+            self.open_recording_button.setEnabled(False)
+            self.collector_checkbox.setEnabled(False)
+            self.collector_port_spinbox.setEnabled(False)
             
-            self.statusBar.showMessage("Monitoring...")
+            if collecting:
+                self.statusBar.showMessage(f"Receiving samples from remote agents on port {self.collector_port_spinbox.value()}...")
+            elif recorder is not None:
+                self.statusBar.showMessage(f"Monitoring, recording to {recorder.current_path}...")
+            else:
+                self.statusBar.showMessage("Monitoring...")
         else:
             # Stop monitoring thread
             if self.monitor_thread and self.monitor_thread.isRunning():
@@ -837,131 +1008,268 @@ class ResourceMonitor(QMainWindow):
         self.export_csv_button.setEnabled(True)
         self.update_interval_spinbox.setEnabled(True)
         self.history_points_spinbox.setEnabled(True)
+        self.archive_hours_spinbox.setEnabled(True)
+        self.rescan_interval_spinbox.setEnabled(True)
+        self.group_by_combo.setEnabled(True)
+        self.workers_spinbox.setEnabled(True)
+        self.cadence_checkbox.setEnabled(True)
+        self.cadence_entry.setEnabled(True)
+        self.record_checkbox.setEnabled(True)
+        self.rotate_size_spinbox.setEnabled(True)
+        self.open_recording_button.setEnabled(True)
+        self.collector_checkbox.setEnabled(True)
+        self.collector_port_spinbox.setEnabled(True)
         
         self.statusBar.showMessage("Monitoring stopped")
     
-    def update_charts(self, data):
+    def create_recorder(self):
+        """Ask for a recording file and open it, None if cancelled"""
+        current_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Record Samples", f"resource_monitor_record_{current_time}.jsonl",
+            "JSON Lines Files (*.jsonl);;CSV Files (*.csv);;Columnar Recordings (*.rmc);;SQLite Databases (*.db)"
+        )
+        if not file_path:
+            return None
+        
+        # The extension selects the format: .rmc is memory-mappable binary columns, .db SQLite with rollups
+        try:
+            return open_recorder(file_path, max_bytes=self.rotate_size_spinbox.value() * 1024 * 1024)
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to open recording file: {str(e)}")
+            return None
+    
+    def open_recording(self):
+        """Load a recording or export for replay"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Open Recording", "",
+            f"Recordings ({' '.join(RECORDING_PATTERNS)});;All Files (*)"
+        )
+        if not file_path:
+            return
+        
+        try:
+            recording = open_recording(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to open recording: {str(e)}")
+            return
+        if not len(recording):
+            recording.close()
+            QMessageBox.warning(self, "Warning", "The recording contains no samples!")
+            return
+        
+        # Replay shows the recording in a history of the configured length, without an archive
+        self.close_replay()
+        self.max_history_points = self.history_points_spinbox.value()
+        self.history.clear(self.max_history_points)
+        self.archive = None
+        speed = self.REPLAY_SPEEDS[self.replay_speed_combo.currentIndex()]
+        self.replay = ReplaySession(recording, self.history, speed)
+        self.replay.seek(0)
+        for _, chart in self.charts:
+            chart.clear()
+        
+        self.replay_slider.blockSignals(True)
+        self.replay_slider.setRange(0, len(recording) - 1)
+        self.replay_slider.blockSignals(False)
+        self._set_replay_controls_enabled(True)
+        self._update_replay_position()
+        self.frame_scheduler.request()
+        self.statusBar.showMessage("Replaying {path}: {count} samples".format(path=file_path, count=len(recording)))
+        
+    def close_replay(self):
+        """Close the recording being replayed"""
+        if self.replay is None:
+            return
+        self.replay_play_button.setChecked(False)
+        self.replay.recording.close()
+        self.replay = None
+        self._set_replay_controls_enabled(False)
+        self.replay_position_label.setText("No recording loaded")
+        
+    def _set_replay_controls_enabled(self, enabled):
+        """Enable the controls that need a loaded recording"""
+        self.replay_play_button.setEnabled(enabled)
+        self.replay_slider.setEnabled(enabled)
+        
+    def toggle_replay(self, checked):
+        """Start or pause replay playback"""
+        if self.replay is None:
+            return
+        if checked:
+            # Playing again from the end starts over
+            if self.replay.at_end:
+                self.seek_replay(0)
+            self.replay.playing = True
+            self.replay_clock = time.monotonic()
+            self.replay_timer.start()
+            self.replay_play_button.setText("Pause")
+        else:
+            self.replay.playing = False
+            self.replay_timer.stop()
+            self.replay_play_button.setText("Play")
+        
+    def set_replay_speed(self, index):
+        """Change the replay playback speed"""
+        if self.replay is not None:
+            self.replay.speed = self.REPLAY_SPEEDS[index]
+        
+    def _replay_tick(self):
+        """Advance replay playback, called by the replay timer"""
+        now = time.monotonic()
+        elapsed = now - self.replay_clock
+        self.replay_clock = now
+        
+        # Only the samples passed since the last tick are appended
+        if self.replay.tick(elapsed):
+            for _, chart in self.charts:
+                chart.clear()
+        self._update_replay_position()
+        self.frame_scheduler.request()
+        if not self.replay.playing:
+            self.replay_play_button.setChecked(False)
+        
+    def seek_replay(self, index):
+        """Jump to a sample of the recording"""
+        if self.replay is None:
+            return
+        self.replay.seek(index)
+        
+        # Charts are rebuilt, the history now holds a different window
+        for _, chart in self.charts:
+            chart.clear()
+        self._update_replay_position()
+        self.frame_scheduler.request()
+        
+    def _update_replay_position(self):
+        """Show the replay position on the slider and label"""
+        position = self.replay.position
+        # Playback must not pull the slider away while it is dragged
+        if not self.replay_slider.isSliderDown():
+            self.replay_slider.blockSignals(True)
+            self.replay_slider.setValue(position)
+            self.replay_slider.blockSignals(False)
+            self._show_replay_label(position)
+        
+    def _show_replay_label(self, position):
+        """Show the time and index of a replay position on the label"""
+        if self.replay is None:
+            return
+        timestamp = self.replay.recording.times[position]
+        self.replay_position_label.setText(
+            f"{datetime.datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S}  {position + 1}/{len(self.replay.recording)}")
+        
+    def update_charts(self, timestamp, data):
         """Update chart display"""
-        # Get current time
-        current_time = QDateTime.currentDateTime().toString("HH:mm:ss")
-        self.time_data.append(current_time)
-        
-        # Limit number of data points
-        if len(self.time_data) > self.max_history_points:
-            self.time_data.pop(0)
-        
-        # Process data for each software
-        for software, metrics in data.items():
-            # Add data to corresponding lists
-            self.cpu_data[software].append(metrics['cpu'])
-            self.memory_data[software].append(metrics['memory'])
-            self.network_data[software].append(metrics['network'])
-            self.disk_data[software].append(metrics['disk'])
-            self.gpu_data[software].append(metrics['gpu'])
-            self.pid_data[software].append(metrics['pid'])
-            self.username_data[software].append(metrics['username'])
-            
-            # Limit number of data points
-            if len(self.cpu_data[software]) > self.max_history_points:
-                self.cpu_data[software].pop(0)
-                self.memory_data[software].pop(0)
-                self.network_data[software].pop(0)
-                self.disk_data[software].pop(0)
-                self.gpu_data[software].pop(0)
-                self.pid_data[software].pop(0)
-                self.username_data[software].pop(0)
-        
-        # Update charts
-        self._update_canvas(self.cpu_canvas, self.cpu_data, "CPU Usage (%)")
-        self._update_canvas(self.memory_canvas, self.memory_data, "Memory Usage (MB)")
-        self._update_canvas(self.network_canvas, self.network_data, "Network Usage (Mbps)")
-        self._update_canvas(self.disk_canvas, self.disk_data, "Disk Usage (MB/s)")
-        self._update_canvas(self.gpu_canvas, self.gpu_data, "GPU Usage (%)")
-    
-    def _update_canvas(self, canvas, data, title):
-        """Update a single canvas"""
-        canvas.axes.clear()
-        canvas.axes.set_title(title)
-        canvas.axes.set_xlabel("Time")
-        canvas.axes.grid(True)
-        
-        # Draw lines for each software
-        colors = ['b', 'g', 'r', 'c', 'm', 'y', 'k', 'tab:orange', 'tab:purple', 'tab:brown']
-        
-        if self.time_data:
-            for i, software in enumerate(data.keys()):
-                color = colors[i % len(colors)]
-                
-                # Get latest PID and username
-                last_pid = self.pid_data[software][-1] if self.pid_data[software] else "N/A"
-                last_username = self.username_data[software][-1] if self.username_data[software] else "N/A"
-                
-                # ׼��ͼ���ı�
-                label = f"{software} (PID: {last_pid}, �û�: {last_username})"
-                
-                # ��������
-                canvas.axes.plot(self.time_data, data[software], label=label, color=color, linewidth=2)
-            
-            # �Զ���תx���ǩ
-            canvas.axes.tick_params(axis='x', rotation=45)
+        # Append the sample to the ring buffers, O(1) regardless of history length
+        self.history.append(timestamp, data)
+        if self.archive is not None:
+            self.archive.append(timestamp, data)
+        
+        # Processes of the tree groups, for the process tree tab
+        self.monitor_nodes = [node for metrics in data.values() for node in metrics.get('nodes', ())]
+        
+        # Only request a frame, consecutive samples are coalesced into one redraw
+        self.frame_scheduler.request()
+    
+    def backfill_charts(self, timestamp, data):
+        """Fill in series that arrived late at a point already shown"""
+        # The compressed archive only appends, it keeps the points as they were shown
+        if self.history.patch(timestamp, data):
+            self.frame_scheduler.request()
+    
+    def _render_frame(self):
+        """Draw the visible chart, called by the frame scheduler"""
+        self._update_canvas(self.chart_tabs.currentIndex())
+    
+    def _update_canvas(self, index):
+        """Update the chart shown in the given tab"""
+        if self.chart_tabs.widget(index) is self.monitor_tree:
+            self._update_monitor_tree()
+            return
+        if not 0 <= index < len(self.charts):
+            return
+        metric, chart = self.charts[index]
+        
+        # Matplotlib date numbers of all points
+        times = self.history.times() / 86400.0
+        
+        series = []
+        for software in self.history.names:
+            # Get latest PID and username
+            last_pid = self.history.latest(software, 'pid') or "N/A"
+            last_username = self.history.latest(software, 'username') or "N/A"
             
-            # ����ͼ��������λ��
-            canvas.axes.legend(loc='upper left', bbox_to_anchor=(1, 1))
+            # Prepare legend text
+            label = f"{software} (PID: {last_pid}, User: {last_username})"
             
-            # ���������Է�ֹ��ǩ���ض�
-            canvas.fig.tight_layout()
+            # Values are a zero-copy view of the history
+            series.append((software, self.history.series(software, metric), label, {'linewidth': 2}))
         
-        # ���»���
-        canvas.draw()
+        chart.update(times, series, self.history.count)
+    
+    def _update_monitor_tree(self):
+        """Show the monitored processes with their own usage and that of their subtree"""
+        snapshot = ProcessSnapshot()
+        seen = set()
+        for node in self.monitor_nodes:
+            # A process matching several entries is listed once
+            if node['pid'] in seen:
+                continue
+            seen.add(node['pid'])
+            snapshot.append(node['name'] or str(node['pid']), node['pid'], node['username'] or "Unknown",
+                            node['cpu'] or 0, node['memory'] or 0, 0, ppid=node['ppid'])
+        
+        # Subtree totals are summed in one pass, the tree is only rebuilt when processes change
+        self.monitor_tree_model.update_snapshot(snapshot)
     
     def export_data(self, format_type):
-        """�����������"""
-        if not self.time_data:
-            QMessageBox.warning(self, "����", "û�пɵ���������!")
+        """Export monitoring data"""
+        # The compressed long-term history reaches further back than the ring buffers
+        history = self.archive if self.archive is not None and len(self.archive) > len(self.history) else self.history
+        if not len(history):
+            QMessageBox.warning(self, "Warning", "No data to export!")
             return
         
-        # ��ȡ����·��
+        # Get save path
         current_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         default_filename = f"resource_monitor_data_{current_time}"
+        time_points = [datetime.datetime.fromtimestamp(t).strftime("%H:%M:%S") for t in history.times()]
         
         if format_type == "json":
             default_filename += ".json"
             file_path, _ = QFileDialog.getSaveFileName(
-                self, "����JSON", default_filename, "JSON Files (*.json)"
+                self, "Export JSON", default_filename, "JSON Files (*.json)"
             )
             
             if file_path:
                 try:
-                    # ׼����������
+                    # Prepare export data
                     export_data = {
                         "timestamp": datetime.datetime.now().isoformat(),
-                        "time_points": self.time_data,
+                        "time_points": time_points,
                         "software": {}
                     }
                     
-                    for software in self.cpu_data.keys():
+                    for software in history.names:
                         export_data["software"][software] = {
-                            "cpu": self.cpu_data[software],
-                            "memory": self.memory_data[software],
-                            "network": self.network_data[software],
-                            "disk": self.disk_data[software],
-                            "gpu": self.gpu_data[software],
-                            "pid": self.pid_data[software],
-                            "username": self.username_data[software]
+                            metric: to_list(history.series(software, metric)) for metric in METRICS
                         }
+                        export_data["software"][software]["pid"] = history.label_series(software, 'pid').tolist()
+                        export_data["software"][software]["username"] = history.label_series(software, 'username').tolist()
                     
-                    # д��JSON�ļ�
+                    # Write JSON file
                     with open(file_path, 'w', encoding='utf-8') as f:
                         json.dump(export_data, f, ensure_ascii=False, indent=2)
                     
-                    QMessageBox.information(self, "�ɹ�", f"�����ѳɹ������� {file_path}")
+                    QMessageBox.information(self, "Success", f"Data successfully exported to {file_path}")
                 except Exception as e:
-                    QMessageBox.critical(self, "����", f"��������ʧ��: {str(e)}")
+                    QMessageBox.critical(self, "Error", f"Failed to export data: {str(e)}")
         
         elif format_type == "csv":
             default_filename += ".csv"
             file_path, _ = QFileDialog.getSaveFileName(
-                self, "����CSV", default_filename, "CSV Files (*.csv)"
+                self, "Export CSV", default_filename, "CSV Files (*.csv)"
             )
             
             if file_path:
@@ -969,38 +1277,32 @@ class ResourceMonitor(QMainWindow):
                     with open(file_path, 'w', newline='', encoding='utf-8') as f:
                         writer = csv.writer(f)
                         
-                        # д���ͷ
-                        header = ["ʱ��"]
-                        for software in self.cpu_data.keys():
+                        # Write header
+                        header = ["Time"]
+                        for software in history.names:
                             header.extend([
                                 f"{software}_CPU(%)",
-                                f"{software}_�ڴ�(MB)",
-                                f"{software}_����(Mbps)",
-                                f"{software}_Ӳ��(MB/s)",
+                                f"{software}_Memory(MB)",
+                                f"{software}_Network(Mbps)",
+                                f"{software}_Disk(MB/s)",
                                 f"{software}_GPU(%)",
                                 f"{software}_PID",
-                                f"{software}_�û�"
+                                f"{software}_User"
                             ])
                         writer.writerow(header)
                         
-                        # д��������
-                        for i, time_point in enumerate(self.time_data):
-                            row = [time_point]
-                            for software in self.cpu_data.keys():
-                                row.extend([
-                                    self.cpu_data[software][i] if i < len(self.cpu_data[software]) else "",
-                                    self.memory_data[software][i] if i < len(self.memory_data[software]) else "",
-                                    self.network_data[software][i] if i < len(self.network_data[software]) else "",
-                                    self.disk_data[software][i] if i < len(self.disk_data[software]) else "",
-                                    self.gpu_data[software][i] if i < len(self.gpu_data[software]) else "",
-                                    self.pid_data[software][i] if i < len(self.pid_data[software]) else "",
-                                    self.username_data[software][i] if i < len(self.username_data[software]) else ""
-                                ])
-                            writer.writerow(row)
+                        # Write data rows, one column per metric of every software
+                        columns = []
+                        for software in history.names:
+                            columns.extend(to_list(history.series(software, metric), "") for metric in METRICS)
+                            columns.append(history.label_series(software, 'pid').tolist())
+                            columns.append(history.label_series(software, 'username').tolist())
+                        for i, time_point in enumerate(time_points):
+                            writer.writerow([time_point] + ["" if column[i] is None else column[i] for column in columns])
                     
-                    QMessageBox.information(self, "�ɹ�", f"�����ѳɹ������� {file_path}")
+                    QMessageBox.information(self, "Success", f"Data successfully exported to {file_path}")
                 except Exception as e:
-                    QMessageBox.critical(self, "����", f"��������ʧ��: {str(e)}")
+                    QMessageBox.critical(self, "Error", f"Failed to export data: {str(e)}")
     
     def closeEvent(self, event):
         """�رմ���ʱ�Ĵ���"""
@@ -1009,6 +1311,12 @@ class ResourceMonitor(QMainWindow):
             self.monitor_thread.stop()
             self.monitor_thread.wait()
         
+        # Drop a pending frame
+        self.frame_scheduler.cancel()
+        
+        # Stop replay playback
+        self.close_replay()
+        
         event.accept()
 
 if __name__ == "__main__":
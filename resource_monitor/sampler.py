@@ -0,0 +1,394 @@
+"""GUI-free sampling core shared by the Qt front-ends and the command line"""
+import getpass
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import psutil
+
+from resource_monitor.aggregate import aggregate, parse_group_by
+from resource_monitor.matcher import ProcessMatcher
+from resource_monitor.rates import RateEngine
+from resource_monitor.tracker import ProcessTracker
+
+# Key used for system-wide data in sample dicts
+SYSTEM_KEY = "System"
+
+# Default size of the worker pool for per-process calls, 0 samples serially
+DEFAULT_WORKERS = 4
+
+# Seconds a per-process call may take before its process is skipped for the tick
+DEFAULT_CALL_TIMEOUT = 2.0
+
+# Tracked processes from which connections are counted in one system-wide call
+BATCH_CONNECTIONS_THRESHOLD = 16
+
+# Cached GPUtil module, False once the import has failed
+_gputil = None
+
+
+def _load_gputil():
+    """Import GPUtil on first use, return None when it is not installed"""
+    global _gputil
+    if _gputil is None:
+        try:
+            import GPUtil
+            _gputil = GPUtil
+        except Exception:
+            _gputil = False
+    return _gputil or None
+
+
+def get_gpus():
+    """Return the GPUs reported by GPUtil, or an empty list"""
+    gputil = _load_gputil()
+    if gputil is None:
+        return []
+    try:
+        return gputil.getGPUs()
+    except Exception:
+        return []
+
+
+def current_username():
+    """Return the login name, also when no controlling terminal exists"""
+    try:
+        return os.getlogin()
+    except OSError:
+        # os.getlogin() fails under daemons, services and containers
+        try:
+            return getpass.getuser()
+        except Exception:
+            return "Unknown"
+
+
+def empty_metrics(unknown_user="Unknown"):
+    """Return the metrics dict used for software that is not running"""
+    return {
+        'cpu': 0,
+        'memory': 0,
+        'network': 0,
+        'disk': 0,
+        'gpu': 0,
+        'pid': None,
+        'username': unknown_user,
+        'count': 0,
+        'pids': [],
+        'max': {'cpu': 0, 'memory': 0, 'network': 0, 'disk': 0, 'gpu': 0}
+    }
+
+
+class ResourceSampler:
+    """Collect resource usage of the monitored software and the system"""
+
+    def __init__(self, software_list, update_interval=1, monitor_system=False,
+                 system_key=SYSTEM_KEY, unknown_user="Unknown", rescan_interval=10.0,
+                 group_by=('pattern',), workers=DEFAULT_WORKERS, call_timeout=DEFAULT_CALL_TIMEOUT):
+        self.software_list = software_list
+        self.update_interval = update_interval
+        self.monitor_system = monitor_system
+        self.system_key = system_key
+        self.unknown_user = unknown_user
+        # How instances matching the watch list are rolled up into series
+        self.group_by = parse_group_by(group_by)
+        self.process_network_counters = {}  # Store network counters for each process
+        # Counter snapshots for rates: (bytes_sent, bytes_recv) per NIC, (read, write) per disk/process
+        self.network_rates = RateEngine(columns=2)
+        self.disk_rates = RateEngine(columns=2)
+        self.process_io_rates = RateEngine(columns=2)
+        self._update_system_rates()
+        # Prime the system CPU baseline so get_system_data() never has to block
+        psutil.cpu_percent(interval=None)
+        self._matcher = None
+        # Matching processes are rediscovered every rescan_interval seconds only
+        self.tracker = ProcessTracker(rescan_interval)
+        # connections() and io_counters() of many processes fan out over a bounded pool
+        self.workers = workers
+        self.call_timeout = call_timeout
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="sampler") if workers else None
+        self.in_flight = {}  # (pid, create_time) -> (call that timed out and is still running, its pool)
+        self.timeouts = 0
+        self.replaced = 0  # Pools replaced because every worker was stuck
+        self.connection_counts = None  # pid -> inet connections of this tick, None reads them per process
+
+    @property
+    def matcher(self):
+        """Watch list compiled into a ProcessMatcher, rebuilt when the list changes"""
+        if self._matcher is None or self._matcher.selectors != self.software_list:
+            self._matcher = ProcessMatcher(self.software_list)
+        return self._matcher
+
+    def get_resource_data(self):
+        """Get resource usage of specified software"""
+        data = {}
+
+        # Monitor system-wide resources
+        if self.monitor_system:
+            data[self.system_key] = self.get_system_data()
+
+        # Rediscover matching processes when due, otherwise only sample the cached ones
+        current_process_network = {}  # Store current process network connections count
+        self.tracker.refresh(self.matcher)
+
+        io_counters = {}  # Cumulative (read_bytes, write_bytes) of each sampled process
+        sampled = []
+        attrs = ['cpu_percent', 'memory_info', 'username', 'ppid']
+        if 'cmdline' in self.group_by:
+            attrs.append('cmdline')
+        if 'tree' in self.group_by:
+            attrs.append('name')
+        self.connection_counts = self._count_connections()
+        for key, matches, outcome in self._read_processes(attrs, current_process_network):
+            if isinstance(outcome, (psutil.NoSuchProcess, psutil.ZombieProcess)):
+                self.tracker.discard(key)
+                continue
+            if isinstance(outcome, psutil.AccessDenied):
+                continue
+            info, metrics, counters = outcome
+            if counters is not None:
+                io_counters[key] = counters
+            metrics.update(matches=matches, ppid=info['ppid'], cmdline=info.get('cmdline'), name=info.get('name'))
+            sampled.append((key, metrics))
+
+        # Disk usage (MB/s) of all sampled processes in one batch
+        io_rates = self.process_io_rates.update(io_counters)
+        for key, metrics in sampled:
+            if key in io_rates:
+                metrics['disk'] = float(io_rates[key].sum()) / (1024 ** 2)
+
+        # Update process network counters
+        self.process_network_counters = current_process_network
+
+        # Roll up all instances, e.g. every worker of a service, into one series per group
+        data.update(aggregate([metrics for _, metrics in sampled], self.group_by, self.unknown_user))
+
+        # Set default values for software not found
+        if self.group_by == ('pattern',):
+            for software in self.software_list:
+                if software not in data:
+                    data[software] = empty_metrics(self.unknown_user)
+
+        return data
+
+    def _count_connections(self):
+        """Count inet connections of all processes at once when many are tracked, else None
+
+        On Linux every connections() call parses the whole socket tables in
+        /proc/net, so one net_connections() costs about as much as a single
+        per-process call.
+        """
+        if len(self.tracker.tracked) < BATCH_CONNECTIONS_THRESHOLD:
+            return None
+        try:
+            connections = psutil.net_connections(kind='inet')
+        except (psutil.AccessDenied, OSError):
+            # Needs root on macOS, read them per process instead
+            return None
+        counts = {}
+        for connection in connections:
+            if connection.pid is not None:
+                counts[connection.pid] = counts.get(connection.pid, 0) + 1
+        return counts
+
+    def _read_processes(self, attrs, current_process_network):
+        """Yield (key, matches, outcome) of every tracked process
+
+        The outcome is (info, metrics, io counters), or the psutil error that
+        stopped the read. With a worker pool all processes are read
+        concurrently, so a tick takes as long as the slowest process instead
+        of the sum of all of them. A call that doesn't finish within
+        call_timeout of starting skips its process for this tick; it is not
+        read again until the stuck call returns. Stuck calls hold their
+        workers: once all workers of the pool are stuck, e.g. on processes in
+        D-state, the calls still queued are cancelled and submitted again to
+        a new pool, and the threads of the old one are abandoned.
+        """
+        items = self.tracker.items()
+        if self.executor is None:
+            for key, (proc, matches) in items:
+                try:
+                    yield key, matches, self._read_process(key, proc, attrs, current_process_network)
+                except psutil.Error as e:
+                    yield key, matches, e
+            return
+
+        for key in [key for key, (future, _) in self.in_flight.items() if future.done()]:
+            del self.in_flight[key]
+
+        started = {}  # key -> monotonic time its call started on a worker
+        queued = [(key, matches, proc) for key, (proc, matches) in items if key not in self.in_flight]
+        results = {}
+        while queued:
+            # Stuck calls of a replaced pool don't hold the workers of the current one
+            stuck = sum(1 for _, executor in self.in_flight.values() if executor is self.executor)
+            if stuck >= self.workers:
+                self._replace_pool()
+            futures = {self.executor.submit(self._timed_read, started, key, proc, attrs, current_process_network):
+                       (key, matches, proc) for key, matches, proc in queued}
+            self._wait_calls(futures, started, stuck)
+            queued = []
+            for future, (key, matches, proc) in futures.items():
+                if future.done():
+                    results[key] = future
+                elif future.cancel():
+                    # Never started, every worker is stuck: retry on a new pool
+                    queued.append((key, matches, proc))
+                else:
+                    # Running past its deadline
+                    self.in_flight[key] = (future, self.executor)
+                    self.timeouts += 1
+
+        for key, (_, matches) in items:
+            future = results.get(key)
+            if future is None:
+                continue
+            try:
+                yield key, matches, future.result()
+            except psutil.Error as e:
+                yield key, matches, e
+
+    def _wait_calls(self, futures, started, stuck):
+        """Wait until every call is done or past call_timeout, or all workers are stuck"""
+        pending = {future: key for future, (key, _, _) in futures.items()}
+        while pending:
+            now = time.monotonic()
+            deadlines = [started[key] + self.call_timeout for key in pending.values() if key in started]
+            running = [deadline for deadline in deadlines if deadline > now]
+            if not running and (len(deadlines) == len(pending) or stuck + len(deadlines) >= self.workers):
+                return
+            timeout = min(running) - now if running else self.call_timeout
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+
+    def _replace_pool(self):
+        """Start a new worker pool, the stuck threads of the old one are abandoned"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="sampler")
+        self.replaced += 1
+
+    def _timed_read(self, started, key, proc, attrs, current_process_network):
+        """Run _read_process, noting when the call got a worker"""
+        started[key] = time.monotonic()
+        return self._read_process(key, proc, attrs, current_process_network)
+
+    def _read_process(self, key, proc, attrs, current_process_network):
+        """Read one tracked process, raises the psutil errors of its calls"""
+        with proc.oneshot():
+            # A reused PID belongs to a different process
+            if not proc.is_running():
+                raise psutil.NoSuchProcess(key[0])
+            # The pooled handle remembers the last CPU times, so this is a per-tick delta
+            if self.tracker.pool.cpu_settled(key):
+                info = proc.as_dict(attrs)
+            else:
+                # Primed moments ago, reading now would also restart the baseline
+                info = proc.as_dict([attr for attr in attrs if attr != 'cpu_percent'])
+                info['cpu_percent'] = 0.0
+        info['pid'] = key[0]
+        metrics = self._sample_process(proc, info, current_process_network)
+        counters = self._read_io_counters(proc)
+        return info, metrics, counters
+
+    def close(self):
+        """Stop the worker pool, calls that are stuck are abandoned"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def get_system_data(self):
+        """Get system-wide resource usage"""
+        # CPU usage since the previous call
+        cpu_percent = psutil.cpu_percent(interval=None)
+
+        # Memory usage (MB)
+        memory = psutil.virtual_memory()
+        memory_mb = memory.used / (1024 ** 2)
+        memory_percent = memory.percent
+
+        # Network (Mbps) and disk (MB/s) usage from counter deltas
+        network_rates, disk_rates = self._update_system_rates()
+        network_usage = sum(float(rate.sum()) for rate in network_rates.values()) * 8 / (1024 ** 2)
+        disk_usage = sum(float(rate.sum()) for rate in disk_rates.values()) / (1024 ** 2)
+
+        # GPU usage
+        gpus = get_gpus()
+        gpu_usage = gpus[0].load * 100 if gpus else 0  # Convert to percentage
+
+        return {
+            'cpu': cpu_percent,
+            'memory': memory_mb,
+            'memory_percent': memory_percent,
+            'network': network_usage,
+            'disk': disk_usage,
+            'gpu': gpu_usage,
+            'pid': None,
+            'username': current_username()
+        }
+
+    def _update_system_rates(self):
+        """Snapshot NIC and disk counters, return their rates in bytes per second"""
+        nic_counters = psutil.net_io_counters(pernic=True) or {}
+        network_rates = self.network_rates.update(
+            {nic: (c.bytes_sent, c.bytes_recv) for nic, c in nic_counters.items()})
+        disk_counters = psutil.disk_io_counters()
+        disk_rates = self.disk_rates.update(
+            {'total': (disk_counters.read_bytes, disk_counters.write_bytes)} if disk_counters else {})
+        return network_rates, disk_rates
+
+    def _read_io_counters(self, proc):
+        """Return cumulative (read_bytes, write_bytes) of a process, or None"""
+        try:
+            io_counters = proc.io_counters()
+        except (psutil.AccessDenied, AttributeError, NotImplementedError):
+            # io_counters() is not available on every platform
+            return None
+        return (io_counters.read_bytes, io_counters.write_bytes) if io_counters else None
+
+    def _sample_process(self, proc, info, current_process_network):
+        """Build the metrics dict of a single matched process"""
+        pid = info['pid']
+
+        # CPU usage
+        cpu_percent = info['cpu_percent'] or 0
+
+        # Memory usage (MB)
+        memory_mb = info['memory_info'].rss / (1024 ** 2) if info['memory_info'] else 0
+
+        # Network usage
+        try:
+            # Get process network connections
+            if self.connection_counts is not None:
+                connection_count = self.connection_counts.get(pid, 0)
+            else:
+                connection_count = len(proc.connections(kind='inet'))
+            current_process_network[pid] = connection_count
+
+            # Estimate network usage based on connection count
+            network_usage = 0
+            if pid in self.process_network_counters:
+                last_connections = self.process_network_counters[pid]
+                # If connection count decreases, it indicates data transmission
+                if connection_count < last_connections:
+                    network_usage = (last_connections - connection_count) * 0.1  # Estimated value
+
+            # Limit maximum value
+            network_usage = min(network_usage, 100)
+        except (psutil.AccessDenied, psutil.NoSuchProcess):
+            network_usage = 0
+
+        # Disk usage, filled in from the batched I/O counter rates
+        disk_usage = 0
+
+        # GPU usage, per-process usage cannot be read through GPUtil
+        gpu_usage = 0
+
+        return {
+            'cpu': cpu_percent,
+            'memory': memory_mb,
+            'network': network_usage,
+            'disk': disk_usage,
+            'gpu': gpu_usage,
+            'pid': pid,
+            'username': info.get('username') or self.unknown_user
+        }
@@ -0,0 +1,423 @@
+"""asyncio sampler with a cadence per collector
+
+ResourceSampler reads every metric of every process once per tick, so the
+slowest call sets the pace for all of them. AsyncSampler splits the work
+into collectors. Each one declares how often it runs and what one run
+costs:
+
+    collector     interval   cost      reads
+    cpu           0.25 s     low       per-process CPU percent, owner, parent
+    memory        0.25 s     low       per-process RSS
+    system        1 s        low       system CPU, memory, NIC and disk rates
+    io            1 s        medium    per-process disk rates
+    connections   10 s       high      per-process socket counts
+    gpu           5 s        high      GPU load
+
+Process discovery (ProcessTracker.refresh) is one more job on the rescan
+interval. Jobs whose cost exceeds INLINE_COST run in a worker thread, so a
+slow GPU query or a process with thousands of sockets never delays the
+cheap readings. The declared cost is only the starting point: the measured
+duration of every run updates it, so a collector that turns out slow on
+this machine moves off the event loop by itself.
+
+Collectors write their latest readings into one table per process. Every
+update_interval the table is rolled up with aggregate() into a sample in
+the usual {name: metrics} shape, so all metrics share the emitter's time
+axis and each holds its most recent reading.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import psutil
+
+from resource_monitor.aggregate import aggregate, parse_group_by
+from resource_monitor.matcher import ProcessMatcher
+from resource_monitor.rates import RateEngine
+from resource_monitor.sampler import DEFAULT_WORKERS, SYSTEM_KEY, current_username, empty_metrics, get_gpus
+from resource_monitor.tracker import ProcessTracker
+
+# Seconds per run above which a job runs in a worker thread
+INLINE_COST = 0.005
+
+# Declared cost in seconds per run of the cost classes
+COSTS = {'low': 0.0005, 'medium': 0.002, 'high': 0.05}
+
+# Weight of the newest measured duration in the cost estimate
+COST_SMOOTHING = 0.3
+
+
+class MetricCollector:
+    """One group of metrics read on its own cadence"""
+
+    name = ''
+    interval = 1.0
+    cost = 'low'
+
+    def __init__(self, interval=None):
+        if interval is not None:
+            self.interval = interval
+        self.cost = COSTS.get(self.cost, self.cost)
+        self.runs = 0
+        self.total_time = 0.0
+
+    def collect(self, processes):
+        """Return ({key: metrics}, system metrics, exited keys) for [(key, process)]"""
+        raise NotImplementedError
+
+
+class CpuCollector(MetricCollector):
+    """CPU percent since the previous run, plus name, owner, parent and command line"""
+
+    name = 'cpu'
+    interval = 0.25
+
+    def __init__(self, interval=None, cmdline=False, pool=None):
+        super().__init__(interval)
+        self.cmdline = cmdline
+        self.pool = pool  # ProcessPool of the handles, tells when a new handle's CPU baseline is long enough
+        self.static = {}  # key -> attributes that don't change while a process lives
+
+    def collect(self, processes):
+        values = {}
+        exited = []
+        for key, proc in processes:
+            try:
+                # A reused PID belongs to a different process
+                if not proc.is_running():
+                    raise psutil.NoSuchProcess(key[0])
+                static = self.static.get(key)
+                if static is None:
+                    attrs = ['name', 'username', 'ppid'] + (['cmdline'] if self.cmdline else [])
+                    static = self.static[key] = proc.as_dict(attrs)
+                cpu = 0
+                # A handle primed moments ago keeps its baseline until the interval is long enough
+                if self.pool is None or self.pool.cpu_settled(key):
+                    cpu = proc.cpu_percent(interval=None) or 0
+                values[key] = dict(static, cpu=cpu)
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                exited.append(key)
+            except psutil.AccessDenied:
+                continue
+        live = {key for key, _ in processes}
+        for key in [key for key in self.static if key not in live]:
+            del self.static[key]
+        return values, None, exited
+
+
+class MemoryCollector(MetricCollector):
+    """Resident memory in MB"""
+
+    name = 'memory'
+    interval = 0.25
+
+    def collect(self, processes):
+        values = {}
+        exited = []
+        for key, proc in processes:
+            try:
+                values[key] = {'memory': proc.memory_info().rss / (1024 ** 2)}
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                exited.append(key)
+            except psutil.AccessDenied:
+                continue
+        return values, None, exited
+
+
+class IoCollector(MetricCollector):
+    """Disk MB/s from the I/O counters of every process"""
+
+    name = 'io'
+    interval = 1.0
+    cost = 'medium'
+
+    def __init__(self, interval=None):
+        super().__init__(interval)
+        self.rates = RateEngine(columns=2)
+
+    def collect(self, processes):
+        counters = {}
+        exited = []
+        for key, proc in processes:
+            try:
+                io_counters = proc.io_counters()
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                exited.append(key)
+                continue
+            except (psutil.AccessDenied, AttributeError, NotImplementedError):
+                # io_counters() is not available on every platform
+                continue
+            if io_counters:
+                counters[key] = (io_counters.read_bytes, io_counters.write_bytes)
+        rates = self.rates.update(counters)
+        values = {key: {'disk': float(rate.sum()) / (1024 ** 2)} for key, rate in rates.items()}
+        return values, None, exited
+
+
+class ConnectionsCollector(MetricCollector):
+    """Network estimate from the change in inet connection counts, like ResourceSampler"""
+
+    name = 'connections'
+    interval = 10.0
+    cost = 'high'
+
+    def __init__(self, interval=None):
+        super().__init__(interval)
+        self.counts = {}
+
+    def collect(self, processes):
+        values = {}
+        exited = []
+        counts = {}
+        for key, proc in processes:
+            try:
+                count = len(proc.connections(kind='inet'))
+            except (psutil.NoSuchProcess, psutil.ZombieProcess):
+                exited.append(key)
+                continue
+            except psutil.AccessDenied:
+                values[key] = {'network': 0}
+                continue
+            counts[key] = count
+            # If connection count decreases, it indicates data transmission
+            last = self.counts.get(key, count)
+            values[key] = {'network': min(max(last - count, 0) * 0.1, 100)}
+        self.counts = counts
+        return values, None, exited
+
+
+class GpuCollector(MetricCollector):
+    """Load of the first GPU, GPUtil can't report per-process usage"""
+
+    name = 'gpu'
+    interval = 5.0
+    cost = 'high'
+
+    def collect(self, processes):
+        gpus = get_gpus()
+        return {}, {'gpu': gpus[0].load * 100 if gpus else 0}, []
+
+
+class SystemCollector(MetricCollector):
+    """System-wide CPU, memory, network and disk"""
+
+    name = 'system'
+    interval = 1.0
+
+    def __init__(self, interval=None):
+        super().__init__(interval)
+        self.network_rates = RateEngine(columns=2)
+        self.disk_rates = RateEngine(columns=2)
+        self.username = current_username()
+        # Prime the baselines, the first run reports real deltas
+        psutil.cpu_percent(interval=None)
+        self._rates()
+
+    def _rates(self):
+        nic_counters = psutil.net_io_counters(pernic=True) or {}
+        network_rates = self.network_rates.update(
+            {nic: (c.bytes_sent, c.bytes_recv) for nic, c in nic_counters.items()})
+        disk_counters = psutil.disk_io_counters()
+        disk_rates = self.disk_rates.update(
+            {'total': (disk_counters.read_bytes, disk_counters.write_bytes)} if disk_counters else {})
+        return network_rates, disk_rates
+
+    def collect(self, processes):
+        memory = psutil.virtual_memory()
+        network_rates, disk_rates = self._rates()
+        return {}, {
+            'cpu': psutil.cpu_percent(interval=None),
+            'memory': memory.used / (1024 ** 2),
+            'memory_percent': memory.percent,
+            'network': sum(float(rate.sum()) for rate in network_rates.values()) * 8 / (1024 ** 2),
+            'disk': sum(float(rate.sum()) for rate in disk_rates.values()) / (1024 ** 2),
+            'username': self.username,
+        }, []
+
+
+# Collectors in the order their values are merged
+COLLECTORS = {collector.name: collector for collector in
+              (CpuCollector, MemoryCollector, IoCollector, ConnectionsCollector, GpuCollector, SystemCollector)}
+
+
+def parse_cadence(spec):
+    """Parse "cpu=0.25,connections=10" into {collector: interval}"""
+    intervals = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, seconds = item.partition('=')
+        name = name.strip()
+        if name not in COLLECTORS:
+            raise ValueError(f"Unknown collector {name!r}, expected one of {', '.join(COLLECTORS)}")
+        interval = float(seconds)
+        if interval <= 0:
+            raise ValueError(f"Interval of {name} must be positive")
+        intervals[name] = interval
+    return intervals
+
+
+class AsyncSampler:
+    """Sample on per-collector cadences and emit one merged sample per update_interval"""
+
+    def __init__(self, software_list, update_interval=1, monitor_system=False,
+                 system_key=SYSTEM_KEY, unknown_user="Unknown", rescan_interval=10.0,
+                 group_by=('pattern',), intervals=None, workers=DEFAULT_WORKERS):
+        self.software_list = software_list
+        self.update_interval = update_interval
+        self.monitor_system = monitor_system
+        self.system_key = system_key
+        self.unknown_user = unknown_user
+        self.group_by = parse_group_by(group_by)
+        self.tracker = ProcessTracker(rescan_interval)
+        self.matcher = ProcessMatcher(software_list)
+        intervals = intervals or {}
+        self.collectors = []
+        for name, collector_class in COLLECTORS.items():
+            if name in ('system', 'gpu') and not monitor_system:
+                continue
+            kwargs = {'cmdline': 'cmdline' in self.group_by, 'pool': self.tracker.pool} if name == 'cpu' else {}
+            self.collectors.append(collector_class(intervals.get(name), **kwargs))
+        self.values = {}  # (pid, create_time) -> latest metrics of every collector
+        self.system = {}
+        self.exited = set()
+        self.scanning = False
+        self.workers = workers  # Threads for expensive jobs, 0 uses the asyncio default
+        self.loop = None
+        self.stop_event = None
+        self.stopping = False
+
+    def serve(self, callback):
+        """Call callback(timestamp, data) every update_interval until stop() is called"""
+        asyncio.run(self.run(callback))
+
+    def stop(self):
+        """Stop serve(), may be called from any thread"""
+        self.stopping = True
+        if self.loop is not None and self.stop_event is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+
+    async def run(self, callback):
+        """Run all collectors and the emitter until stop() is called"""
+        self.loop = asyncio.get_running_loop()
+        self.stop_event = asyncio.Event()
+        if self.stopping:
+            return
+        if self.workers:
+            self.loop.set_default_executor(ThreadPoolExecutor(self.workers, thread_name_prefix="sampler"))
+        # Processes have to be known before anything can be read about them
+        await self._discover(force=True)
+        tasks = [asyncio.create_task(self._schedule(self._discover, self.tracker.rescan_interval))]
+        for collector in self.collectors:
+            tasks.append(asyncio.create_task(self._schedule(self._collect, collector.interval, collector)))
+        tasks.append(asyncio.create_task(self._schedule(self._emit, self.update_interval, callback)))
+        try:
+            await self.stop_event.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _schedule(self, job, interval, *args):
+        """Run job every interval, starting one interval from now; overruns skip the missed slots
+
+        Starting late makes the first CPU percent and rates cover a whole
+        interval instead of the moment since the baselines were primed.
+        """
+        next_run = time.monotonic()
+        while True:
+            next_run = max(next_run + interval, time.monotonic())
+            await asyncio.sleep(next_run - time.monotonic())
+            try:
+                await job(*args)
+            except Exception as e:
+                print(f"Sampler error: {e}")
+
+    async def _run_job(self, function, cost, *args):
+        """Run function inline or in a worker thread, depending on its cost"""
+        if cost > INLINE_COST:
+            return await self.loop.run_in_executor(None, function, *args)
+        return function(*args)
+
+    async def _discover(self, force=False):
+        """Rediscover matching processes when due"""
+        if not force and not self.tracker.needs_rescan(self.matcher):
+            return
+        self.scanning = True
+        try:
+            # Walking the process table is always expensive
+            await self.loop.run_in_executor(None, self.tracker.refresh, self.matcher, True)
+        finally:
+            self.scanning = False
+        self._forget_exited()
+
+    def _forget_exited(self):
+        # The tracker is replaced by a scan in a worker thread, it is only changed between scans
+        if self.scanning:
+            return
+        for key in self.exited:
+            self.tracker.discard(key)
+            self.values.pop(key, None)
+        self.exited.clear()
+        live = {key for key, _ in self.tracker.items()}
+        for key in [key for key in self.values if key not in live]:
+            del self.values[key]
+
+    async def _collect(self, collector):
+        """Run one collector and store its readings"""
+        processes = [(key, proc) for key, (proc, _) in self.tracker.items()]
+        start = time.perf_counter()
+        values, system, exited = await self._run_job(collector.collect, collector.cost, processes)
+        elapsed = time.perf_counter() - start
+        collector.cost += COST_SMOOTHING * (elapsed - collector.cost)
+        collector.runs += 1
+        collector.total_time += elapsed
+
+        for key, metrics in values.items():
+            self.values.setdefault(key, {}).update(metrics)
+        if system:
+            self.system.update(system)
+        if exited:
+            self.exited.update(exited)
+            self._forget_exited()
+
+    async def _emit(self, callback):
+        """Merge the latest readings into one sample"""
+        callback(time.time(), self.sample())
+
+    def sample(self):
+        """Return the latest readings as {name: metrics}, like ResourceSampler.get_resource_data()"""
+        data = {}
+        # Like processes, the system appears once its collector has run
+        if self.monitor_system and self.system:
+            system = {'cpu': 0, 'memory': 0, 'memory_percent': 0, 'network': 0, 'disk': 0, 'gpu': 0,
+                      'username': self.unknown_user}
+            system.update(self.system)
+            system['pid'] = None
+            data[self.system_key] = system
+
+        records = []
+        for key, (_, matches) in self.tracker.items():
+            values = self.values.get(key)
+            # Processes the cpu collector hasn't seen yet have no owner or parent
+            if values is None or 'cpu' not in values:
+                continue
+            record = {'cpu': 0, 'memory': 0, 'network': 0, 'disk': 0, 'gpu': 0}
+            record.update(values)
+            record.update(pid=key[0], matches=matches,
+                          username=values.get('username') or self.unknown_user)
+            records.append(record)
+        data.update(aggregate(records, self.group_by, self.unknown_user))
+
+        # Set default values for software not found
+        if self.group_by == ('pattern',):
+            for software in self.software_list:
+                if software not in data:
+                    data[software] = empty_metrics(self.unknown_user)
+        return data
+
+    def costs(self):
+        """Return {collector: (interval, mean seconds per run, runs)}"""
+        return {collector.name: (collector.interval, collector.total_time / collector.runs if collector.runs else 0.0,
+                                 collector.runs)
+                for collector in self.collectors}
@@ -0,0 +1,154 @@
+"""Indexed search over the processes listed in the process picker
+
+A query is a list of whitespace-separated terms that must all match. A plain
+term is looked up in the name, PID and user of a process; ``name:``, ``pid:``
+and ``user:`` restrict a term to one field:
+
+    nginx               name, PID or user contains "nginx"
+    user:root nginx     owned by a user containing "root", and matching nginx
+    pid:12              PID contains 12
+
+Matching is a case-insensitive substring test. SearchIndex maps every
+trigram (three consecutive characters) to the distinct field values that
+contain it, so a term of three or more characters is answered by
+intersecting a few small sets and then checking only the values that are
+left. Many processes share a value (every browser renderer has the same name
+and user), so the index is far smaller than the process table. Shorter terms
+scan the distinct values of their field. Processes are added and removed one
+at a time, so the index follows live refreshes without being rebuilt.
+"""
+SEARCH_FIELDS = ('name', 'pid', 'user')
+
+
+def parse_query(query):
+    """Split a query into a list of (field or None, lowercase term) pairs"""
+    terms = []
+    for word in query.lower().split():
+        field, sep, term = word.partition(':')
+        if sep and field in SEARCH_FIELDS:
+            if term:
+                terms.append((field, term))
+        else:
+            # Plain words may contain ':' themselves
+            terms.append((None, word))
+    return terms
+
+
+def trigrams(text):
+    """Return the set of three-character substrings of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class FieldIndex:
+    """Distinct values of one field, the processes having them and their trigrams"""
+
+    def __init__(self):
+        self.keys = {}  # value -> set of process keys
+        self.trigrams = {}  # trigram -> set of values
+
+    def add(self, value, key):
+        """Index one process's value"""
+        keys = self.keys.get(value)
+        if keys is None:
+            keys = self.keys[value] = set()
+            for trigram in trigrams(value):
+                self.trigrams.setdefault(trigram, set()).add(value)
+        keys.add(key)
+
+    def remove(self, value, key):
+        """Drop one process's value, and the value itself once no process has it"""
+        keys = self.keys.get(value)
+        if keys is None:
+            return
+        keys.discard(key)
+        if keys:
+            return
+        del self.keys[value]
+        for trigram in trigrams(value):
+            values = self.trigrams.get(trigram)
+            if values is not None:
+                values.discard(value)
+                if not values:
+                    del self.trigrams[trigram]
+
+    def search(self, term):
+        """Return the keys of the processes whose value contains term"""
+        if len(term) >= 3:
+            candidates = []
+            for trigram in trigrams(term):
+                values = self.trigrams.get(trigram)
+                if not values:
+                    return set()
+                candidates.append(values)
+            # Intersect from the smallest set, then confirm the order of the trigrams
+            candidates.sort(key=len)
+            values = [value for value in candidates[0].intersection(*candidates[1:]) if term in value]
+        else:
+            values = [value for value in self.keys if term in value]
+        return set().union(*(self.keys[value] for value in values))
+
+
+class SearchIndex:
+    """Trigram index over the name, PID and user of many processes"""
+
+    def __init__(self):
+        self.fields = {field: FieldIndex() for field in SEARCH_FIELDS}
+        self.values = {}  # key -> lowercase (name, pid, user)
+        # Processes are numbered as they are added, so a search can tell which came later
+        self.serials = {}
+        self.next_serial = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def add(self, key, name, pid, username):
+        """Index a process, replacing what was indexed for its key before"""
+        if key in self.values:
+            self.remove(key)
+        values = ((name or '').lower(), str(pid), (username or '').lower())
+        self.values[key] = values
+        for field, value in zip(SEARCH_FIELDS, values):
+            self.fields[field].add(value, key)
+        self.serials[key] = self.next_serial
+        self.next_serial += 1
+
+    def remove(self, key):
+        """Drop a process from the index"""
+        values = self.values.pop(key, None)
+        if values is None:
+            return
+        del self.serials[key]
+        for field, value in zip(SEARCH_FIELDS, values):
+            self.fields[field].remove(value, key)
+
+    def clear(self):
+        """Drop all processes, serials keep counting up"""
+        self.fields = {field: FieldIndex() for field in SEARCH_FIELDS}
+        self.values = {}
+        self.serials = {}
+
+    def search(self, terms):
+        """Return the set of keys matching all (field, term) pairs from parse_query()"""
+        result = None
+        for field, term in terms:
+            if field is None:
+                keys = set().union(*(index.search(term) for index in self.fields.values()))
+            else:
+                keys = self.fields[field].search(term)
+            result = keys if result is None else result & keys
+            if not result:
+                break
+        return set(self.values) if result is None else result
+
+    def matches(self, key, terms):
+        """Test a single indexed process against all terms"""
+        values = self.values.get(key)
+        if values is None:
+            return False
+        for field, term in terms:
+            if field is None:
+                if not any(term in value for value in values):
+                    return False
+            elif term not in values[SEARCH_FIELDS.index(field)]:
+                return False
+        return True
@@ -0,0 +1,326 @@
+"""SQLite history database with per-minute and per-hour rollups
+
+HistoryDatabase persists every sample to a local SQLite file and keeps
+three tiers:
+
+    raw     one row per series and sample (the sampling interval, usually 1 s)
+    1m      min/avg/max/p95 of every metric per series and minute
+    1h      the same per hour
+
+Rollups are computed from raw rows by a background thread with its own
+connection (start_rollups()), or by calling rollup() directly. Raw rows are
+read ROLLUP_CHUNK seconds at a time, so the first rollup of a long
+recording doesn't load it all at once. A sample written more than
+SETTLE_TIME seconds after its timestamp, such as the backlog of a remote
+agent, may land in a bucket that is already rolled up: write() marks its
+buckets in rollup_dirty and the next rollup() computes them again. Late
+samples older than the raw retention are expired with their raw rows and
+never reach the rollups. Each tier
+has its own retention, so a month of hourly data stays cheap while raw rows
+only cover the recent past. query() picks the finest tier that still covers
+the start of the range and returns at most about max_points buckets, so
+viewing a month never scans raw rows.
+
+HistoryDatabase has the write/flush/close interface of Recorder and can be
+used as the recording stage of the monitor thread. Rows are inserted into
+an open transaction and committed every flush_interval seconds.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from resource_monitor.history import METRICS
+
+# Rollup tiers and their bucket length in seconds
+ROLLUPS = (('1m', 60), ('1h', 3600))
+
+TIERS = ('raw',) + tuple(tier for tier, _ in ROLLUPS)
+
+STATISTICS = ('min', 'avg', 'max', 'p95')
+
+# Default retention per tier in seconds
+DEFAULT_RETENTION = {'raw': 2 * 86400, '1m': 30 * 86400, '1h': 365 * 86400}
+
+# Raw rows have to outlive the longest rollup bucket
+MIN_RAW_RETENTION = 2 * 3600
+
+# Seconds after the end of a bucket before it is rolled up, so that
+# samples still in the write buffer are included
+SETTLE_TIME = 15.0
+
+# Seconds of raw rows aggregated per query, bounds the memory of a rollup
+ROLLUP_CHUNK = 3600
+
+
+def percentile_groups(values, starts, q=95):
+    """Percentile of consecutive groups of values beginning at starts, ignoring NaN"""
+    ends = list(starts[1:]) + [len(values)]
+    result = np.full(len(starts), np.nan)
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        group = values[start:end]
+        group = group[~np.isnan(group)]
+        if len(group):
+            result[i] = np.percentile(group, q)
+    return result
+
+
+class HistoryDatabase:
+    """Persistent multi-resolution history of monitor samples"""
+
+    def __init__(self, path, retention=None, flush_interval=5.0, metrics=METRICS):
+        self.path = path
+        self.metrics = tuple(metrics)
+        self.retention = dict(DEFAULT_RETENTION, **(retention or {}))
+        if self.retention['raw'] < MIN_RAW_RETENTION:
+            raise ValueError(f"raw retention must be at least {MIN_RAW_RETENTION} seconds")
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.series_ids = {}
+        self.worker = None
+        self.stop_event = threading.Event()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # The recorder is created on the UI thread and used by the monitor thread
+        self.connection = self._connect(check_same_thread=False)
+        self._create_schema()
+        for series_id, name in self.connection.execute("SELECT id, name FROM series"):
+            self.series_ids[name] = series_id
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def current_path(self):
+        """File samples are written to"""
+        return self.path
+
+    def _connect(self, **kwargs):
+        # The rollup thread waits while the writer holds its transaction
+        connection = sqlite3.connect(self.path, timeout=30.0, **kwargs)
+        # WAL lets the rollup thread read while samples are written
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _create_schema(self):
+        metric_columns = ", ".join(f"{metric} REAL" for metric in self.metrics)
+        rollup_columns = ", ".join(f"{metric}_{statistic} REAL"
+                                   for metric in self.metrics for statistic in STATISTICS)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS series (id INTEGER PRIMARY KEY, name TEXT UNIQUE)")
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS raw (series_id INTEGER, ts REAL, {metric_columns}, "
+                f"pid INTEGER, username TEXT, PRIMARY KEY (series_id, ts)) WITHOUT ROWID")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS raw_ts ON raw (ts)")
+            for tier, _ in ROLLUPS:
+                self.connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS rollup_{tier} (series_id INTEGER, ts INTEGER, count INTEGER, "
+                    f"{rollup_columns}, PRIMARY KEY (series_id, ts)) WITHOUT ROWID")
+            # End of the last rolled-up bucket per tier
+            self.connection.execute("CREATE TABLE IF NOT EXISTS rollup_state (tier TEXT PRIMARY KEY, done REAL)")
+            # Buckets that received samples after they may have been rolled up
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS rollup_dirty (tier TEXT, ts INTEGER, PRIMARY KEY (tier, ts)) WITHOUT ROWID")
+
+    def _series_id(self, name):
+        series_id = self.series_ids.get(name)
+        if series_id is None:
+            cursor = self.connection.execute("INSERT OR IGNORE INTO series (name) VALUES (?)", (name,))
+            series_id = cursor.lastrowid if cursor.rowcount else \
+                self.connection.execute("SELECT id FROM series WHERE name = ?", (name,)).fetchone()[0]
+            self.series_ids[name] = series_id
+        return series_id
+
+    @property
+    def names(self):
+        """Series names in insertion order"""
+        return list(self.series_ids)
+
+    def write(self, timestamp, data):
+        """Insert one sample {name: metrics}; committed every flush_interval"""
+        with self.lock:
+            rows = []
+            for name, metrics in data.items():
+                rows.append([self._series_id(name), timestamp] +
+                            [metrics.get(metric) for metric in self.metrics] +
+                            [metrics.get('pid'), metrics.get('username')])
+            placeholders = ", ".join("?" * (len(self.metrics) + 4))
+            self.connection.executemany(f"INSERT OR REPLACE INTO raw VALUES ({placeholders})", rows)
+            if rows and timestamp < time.time() - SETTLE_TIME:
+                # Committed with the raw rows, so rollup() sees either both or neither
+                self.connection.executemany("INSERT OR IGNORE INTO rollup_dirty VALUES (?, ?)",
+                                            [(tier, int(timestamp // seconds * seconds)) for tier, seconds in ROLLUPS])
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Commit the samples written so far"""
+        self.last_flush = time.monotonic()
+        with self.lock:
+            self.connection.commit()
+
+    def close(self):
+        """Stop the rollup thread, commit and close"""
+        if self.connection is None:
+            return
+        # Commit first, the rollup thread may be waiting for the write lock
+        self.flush()
+        self.stop_rollups()
+        self.connection.close()
+        self.connection = None
+
+    def start_rollups(self, interval=60.0):
+        """Roll up and expire old rows every interval seconds in a background thread"""
+        if self.worker is not None:
+            return
+        self.stop_event.clear()
+        self.worker = threading.Thread(target=self._rollup_loop, args=(interval,), daemon=True)
+        self.worker.start()
+
+    def stop_rollups(self):
+        """Stop the background thread"""
+        if self.worker is None:
+            return
+        self.stop_event.set()
+        self.worker.join()
+        self.worker = None
+
+    def _rollup_loop(self, interval):
+        connection = self._connect()
+        try:
+            while not self.stop_event.wait(interval):
+                try:
+                    self.rollup(connection=connection)
+                    self.expire(connection=connection)
+                except sqlite3.Error as e:
+                    print(f"Rollup error: {e}")
+        finally:
+            connection.close()
+
+    def rollup(self, now=None, connection=None):
+        """Aggregate all complete buckets that haven't been rolled up yet or received late samples"""
+        connection = connection or self.connection
+        now = time.time() if now is None else now
+        for tier, seconds in ROLLUPS:
+            row = connection.execute("SELECT done FROM rollup_state WHERE tier = ?", (tier,)).fetchone()
+            done = row[0] if row else None
+            if done is not None:
+                self._rollup_dirty(connection, tier, seconds, done, now)
+            end = (now - SETTLE_TIME) // seconds * seconds
+            if done is None:
+                first = connection.execute("SELECT MIN(ts) FROM raw").fetchone()[0]
+                if first is None:
+                    continue
+                done = first // seconds * seconds
+            chunk = max(seconds, ROLLUP_CHUNK // seconds * seconds)
+            while done < end:
+                # Skip gaps without samples instead of querying them chunk by chunk
+                first = connection.execute("SELECT MIN(ts) FROM raw WHERE ts >= ? AND ts < ?",
+                                           (done, end)).fetchone()[0]
+                start = end if first is None else max(done, first // seconds * seconds)
+                stop = min(start + chunk, end)
+                self._rollup_range(connection, tier, seconds, start, stop)
+                with connection:
+                    connection.execute("INSERT OR REPLACE INTO rollup_state VALUES (?, ?)", (tier, stop))
+                done = stop
+
+    def _rollup_dirty(self, connection, tier, seconds, done, now):
+        """Compute again the rolled-up buckets that received late samples"""
+        # Raw rows of older buckets are partly expired, their rollups are kept as they are
+        oldest = now - self.retention['raw']
+        with connection:
+            connection.execute("DELETE FROM rollup_dirty WHERE tier = ? AND ts < ?", (tier, oldest))
+        buckets = [ts for (ts,) in connection.execute(
+            "SELECT ts FROM rollup_dirty WHERE tier = ? AND ts < ? ORDER BY ts", (tier, done))]
+        for ts in buckets:
+            self._rollup_range(connection, tier, seconds, ts, ts + seconds)
+
+    def _rollup_range(self, connection, tier, seconds, start, end):
+        """Compute the buckets of one tier between start and end"""
+        # Unmarked first, a sample written while the rows are read marks its bucket again
+        with connection:
+            connection.execute("DELETE FROM rollup_dirty WHERE tier = ? AND ts >= ? AND ts < ?", (tier, start, end))
+        columns = ", ".join(self.metrics)
+        rows = connection.execute(
+            f"SELECT series_id, CAST(ts / ? AS INTEGER) * ?, {columns} FROM raw "
+            f"WHERE ts >= ? AND ts < ? ORDER BY series_id, ts", (seconds, seconds, start, end)).fetchall()
+        if not rows:
+            return
+        data = np.array(rows, dtype=np.float64)
+        keys = data[:, :2]
+        values = data[:, 2:]
+        # Rows are sorted by series and time, so every bucket is one run
+        boundaries = np.flatnonzero((keys[1:] != keys[:-1]).any(axis=1)) + 1
+        starts = np.concatenate([[0], boundaries])
+        counts = np.diff(np.concatenate([starts, [len(data)]]))
+
+        columns = [keys[starts, 0].astype(np.int64), keys[starts, 1].astype(np.int64), counts]
+        for i in range(len(self.metrics)):
+            column = values[:, i]
+            # Missing values (NULL, read as NaN) are left out of every statistic
+            valid = np.add.reduceat(~np.isnan(column), starts)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                columns.append(np.fmin.reduceat(column, starts))
+                columns.append(np.where(valid, np.add.reduceat(np.nan_to_num(column), starts) / valid, np.nan))
+                columns.append(np.fmax.reduceat(column, starts))
+            columns.append(percentile_groups(column, starts))
+        placeholders = ", ".join("?" * len(columns))
+        with connection:
+            connection.executemany(f"INSERT OR REPLACE INTO rollup_{tier} VALUES ({placeholders})",
+                                   zip(*[column.tolist() for column in columns]))
+
+    def expire(self, now=None, connection=None):
+        """Delete rows that are older than the retention of their tier"""
+        connection = connection or self.connection
+        now = time.time() if now is None else now
+        with connection:
+            connection.execute("DELETE FROM raw WHERE ts < ?", (now - self.retention['raw'],))
+            for tier, _ in ROLLUPS:
+                connection.execute(f"DELETE FROM rollup_{tier} WHERE ts < ?", (now - self.retention[tier],))
+
+    def choose_tier(self, start, end, max_points=2000, now=None):
+        """Finest tier that covers start and has at most about max_points buckets"""
+        now = time.time() if now is None else now
+        resolutions = (('raw', 1),) + ROLLUPS
+        for tier, seconds in resolutions:
+            if now - self.retention[tier] <= start and (end - start) / seconds <= max_points:
+                return tier
+        return resolutions[-1][0]
+
+    def query(self, name, metric, start=None, end=None, max_points=2000, tier=None):
+        """Return {'tier', 'times', 'min', 'avg', 'max', 'p95'} of one metric of a series
+
+        The tier is chosen from the range unless given. Raw rows have the
+        same value in all four statistics.
+        """
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown metric {metric!r}")
+        now = time.time()
+        end = now if end is None else end
+        start = end - 3600 if start is None else start
+        tier = tier or self.choose_tier(start, end, max_points, now)
+        series_id = self.series_ids.get(name)
+        result = {'tier': tier}
+        with self.lock:
+            if tier == 'raw':
+                rows = self.connection.execute(
+                    f"SELECT ts, {metric} FROM raw WHERE series_id = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                    (series_id, start, end)).fetchall()
+            else:
+                columns = ", ".join(f"{metric}_{statistic}" for statistic in STATISTICS)
+                rows = self.connection.execute(
+                    f"SELECT ts, {columns} FROM rollup_{tier} WHERE series_id = ? AND ts >= ? AND ts < ? "
+                    f"ORDER BY ts", (series_id, start, end)).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), 2 if tier == 'raw' else 1 + len(STATISTICS))
+        result['times'] = data[:, 0]
+        for i, statistic in enumerate(STATISTICS):
+            result[statistic] = data[:, 1 if tier == 'raw' else i + 1]
+        return result
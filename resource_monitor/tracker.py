@@ -0,0 +1,76 @@
+"""Cache of the processes that match the watch list
+
+Walking the whole process table is the expensive part of a tick, yet the set
+of matching processes rarely changes. ProcessTracker remembers the matches,
+keyed by (pid, create_time) so a reused PID is never mistaken for the old
+process, and only rescans the table on its own slower cadence, when the watch
+list changes or when a tracked process has exited. The Process objects come
+from a ProcessPool, so their CPU percentages are deltas over the last tick.
+"""
+import time
+
+import psutil
+
+from resource_monitor.pool import ProcessPool
+
+
+class ProcessTracker:
+    """Tracked processes and the watch-list entries they match"""
+
+    def __init__(self, rescan_interval=10.0, pool=None):
+        self.rescan_interval = rescan_interval
+        self.pool = pool if pool is not None else ProcessPool()
+        self.tracked = {}  # (pid, create_time) -> (psutil.Process, matched entries)
+        self.last_scan = None
+        self.matcher = None
+        self.stale = True
+        self.scan_count = 0
+
+    def needs_rescan(self, matcher, now=None):
+        """Return True when the next refresh has to walk the whole process table"""
+        if self.stale or matcher is not self.matcher or self.last_scan is None:
+            return True
+        now = time.monotonic() if now is None else now
+        return now - self.last_scan >= self.rescan_interval
+
+    def refresh(self, matcher, force=False):
+        """Rediscover matching processes if due, return True when a scan ran"""
+        now = time.monotonic()
+        if not force and not self.needs_rescan(matcher, now):
+            return False
+
+        tracked = {}
+        processes = list(psutil.process_iter(matcher.attrs + ['pid', 'create_time']))
+        # tree: selectors need the parents of all processes before any of them is matched
+        trees = matcher.match_trees([proc.info for proc in processes]) if matcher.needs_tree else {}
+        for proc in processes:
+            try:
+                matches = matcher.match_info(proc.info, trees.get(proc.info['pid']))
+                if matches:
+                    key = (proc.info['pid'], proc.info['create_time'])
+                    tracked[key] = (self.pool.get(*key), matches)
+            except (psutil.AccessDenied, psutil.NoSuchProcess, psutil.ZombieProcess):
+                continue
+
+        # Keep pooled handles of processes that are still tracked, drop the rest
+        self.pool.prune(tracked)
+        self.tracked = tracked
+        self.matcher = matcher
+        self.last_scan = now
+        self.stale = False
+        self.scan_count += 1
+        return True
+
+    def items(self):
+        """Return a snapshot of ((pid, create_time), (process, matches)) pairs"""
+        return list(self.tracked.items())
+
+    def discard(self, key):
+        """Forget a process that has exited and rescan on the next refresh"""
+        self.pool.evict(key)
+        if self.tracked.pop(key, None) is not None:
+            self.stale = True
+
+    def invalidate(self):
+        """Force a rescan on the next refresh"""
+        self.stale = True
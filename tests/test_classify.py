@@ -0,0 +1,113 @@
+import contextlib
+
+import pytest
+
+from resource_monitor import classify
+from resource_monitor.classify import (CATEGORY_APPLICATION, CATEGORY_SYSTEM, CATEGORY_USER, ProcessClassifier,
+                                       desktop_executables, load_rules, parse_rule)
+
+
+class FakeProcess:
+    """Just enough of psutil.Process for the classifier, counting field reads"""
+
+    def __init__(self, pid, name, username='alice', exe=None, cmdline=None, uid=1000):
+        self.pid = pid
+        self.fields = {'name': name, 'username': username, 'exe': exe, 'cmdline': cmdline}
+        self.uid = uid
+        self.reads = 0
+
+    def create_time(self):
+        return 1000.0
+
+    def oneshot(self):
+        return contextlib.nullcontext()
+
+    def uids(self):
+        self.reads += 1
+        return type('uids', (), {'real': self.uid})()
+
+    def __getattr__(self, field):
+        if field not in ('name', 'username', 'exe', 'cmdline'):
+            raise AttributeError(field)
+
+        def read():
+            self.reads += 1
+            return self.fields[field]
+        return read
+
+
+def classifier(rules):
+    return ProcessClassifier(rules, current_user='alice')
+
+
+def test_parse_rule_and_errors():
+    rule = parse_rule('application name:*.exe')
+    assert (rule.category, rule.kind, rule.pattern) == ('application', 'name', '*.exe')
+    assert parse_rule('system uid:1000-').uid_range == (1000, None)
+    assert parse_rule('system uid:-99').uid_range == (0, 99)
+    for text in ('application name', 'bogus name:x', 'application bogus:x', 'system uid:a-b',
+                 'application name:'):
+        with pytest.raises(ValueError):
+            parse_rule(text)
+
+
+def test_name_wildcard_and_substring():
+    rules = classifier(['application name:*.exe', 'application name:chrome'])
+    assert rules.classify_values({'name': 'Setup.EXE'}) & CATEGORY_APPLICATION
+    assert rules.classify_values({'name': 'google-chrome'}) & CATEGORY_APPLICATION
+    assert rules.classify_values({'name': 'exe-runner'}) == CATEGORY_SYSTEM
+
+
+def test_first_owner_rule_wins():
+    rules = classifier(['system uid:0-999', 'user user:@current', 'system cgroup:/system.slice/'])
+    assert rules.classify_values({'uid': 0, 'username': 'alice'}) == CATEGORY_SYSTEM
+    assert rules.classify_values({'uid': 1000, 'username': 'alice',
+                                  'cgroup': '0::/system.slice/x.service'}) == CATEGORY_USER
+    assert rules.classify_values({'uid': 1001, 'username': 'bob', 'cgroup': None}) == CATEGORY_SYSTEM
+
+
+def test_desktop_rule(tmp_path):
+    (tmp_path / 'app.desktop').write_text('[Desktop Entry]\nExec=env FOO=1 /opt/editor/bin/editor %F\n')
+    assert desktop_executables([str(tmp_path)]) == {'/opt/editor/bin/editor', 'editor'}
+    rules = classifier(['application desktop:'])
+    rules._desktop_executables = {'/opt/editor/bin/editor', 'editor'}
+    assert rules.classify_values({'exe': '/usr/local/bin/editor'}) & CATEGORY_APPLICATION
+    assert rules.classify_values({'exe': None, 'name': 'Editor'}) & CATEGORY_APPLICATION
+    assert not rules.classify_values({'exe': '/bin/sh', 'name': 'sh'}) & CATEGORY_APPLICATION
+
+
+def test_classify_is_memoized_and_reads_only_needed_fields():
+    rules = classifier(['application cmdline:--app=', 'user user:@current'])
+    assert rules.fields == {'name', 'cmdline', 'username'}
+    proc = FakeProcess(10, 'electron', cmdline=['electron', '--app=notes'])
+    assert rules.classify(proc) == CATEGORY_APPLICATION | CATEGORY_USER
+    reads = proc.reads
+    assert rules.classify(proc) == CATEGORY_APPLICATION | CATEGORY_USER
+    assert proc.reads == reads and rules.classified == 1
+    # Fields already in info are not read again
+    other = FakeProcess(11, 'x')
+    rules.classify(other, {'pid': 11, 'create_time': 5.0, 'name': 'x', 'cmdline': None, 'username': 'bob'})
+    assert other.reads == 0
+    rules.prune([(10, 1000.0)])
+    assert list(rules.cache) == [(10, 1000.0)]
+
+
+def test_window_rule_is_re_evaluated(monkeypatch):
+    windows = set()
+    monkeypatch.setattr(classify, 'window_pids', lambda: set(windows))
+    monkeypatch.setattr(classify, 'WINDOW_CACHE_SECONDS', 0.0)
+    rules = classifier(['application window:', 'user user:@current'])
+    proc = FakeProcess(42, 'editor')
+    assert rules.classify(proc) == CATEGORY_USER
+    windows.add(42)
+    assert rules.classify(proc) == CATEGORY_APPLICATION | CATEGORY_USER
+    assert rules.classified == 1
+
+
+def test_load_rules(tmp_path):
+    path = tmp_path / 'classify.rules'
+    path.write_text('# comment\n\napplication name:foo\nsystem uid:0-999\n', encoding='utf-8')
+    assert [str(rule) for rule in load_rules(str(path))] == ['application name:foo', 'system uid:0-999']
+    path.write_text('application name:foo\nnonsense\n', encoding='utf-8')
+    with pytest.raises(ValueError, match='line 2'):
+        load_rules(str(path))
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from resource_monitor import columnar
+from resource_monitor.columnar import ColumnarRecording, ColumnarWriter, segment_path
+
+
+def test_round_trip_with_missing_values(tmp_path):
+    path = str(tmp_path / 'samples.rmc')
+    with ColumnarWriter(path, capacity=16) as writer:
+        writer.write(1.0, {'a': {'cpu': 1.5, 'memory': 10.0, 'pid': 7, 'username': 'alice'}})
+        writer.write(2.0, {'a': {'cpu': 2.5, 'pid': 7}, 'b': {'cpu': 9.0, 'count': 3}})
+        writer.write(3.0, {'b': {'cpu': 8.0}})
+    with ColumnarRecording(path) as recording:
+        assert len(recording) == 3
+        assert recording.series == ['a', 'b']
+        assert recording.usernames == {'a': 'alice', 'b': None}
+        assert recording.times.tolist() == [1.0, 2.0, 3.0]
+        assert np.allclose(recording.column('a', 'cpu')[:2], [1.5, 2.5])
+        assert np.isnan(recording.column('a', 'cpu')[2])
+        assert np.isnan(recording.column('b', 'cpu')[0])
+        assert recording.column('a', 'pid').tolist() == [7, 7, -1]
+        assert recording.column('b', 'count').tolist() == [-1, 3, -1]
+        assert recording.window(1.5, 3.0) == slice(1, 2)
+        assert recording.window() == slice(0, 3)
+
+
+def test_capacity_growth_keeps_values(tmp_path):
+    path = str(tmp_path / 'samples.rmc')
+    with ColumnarWriter(path, capacity=16) as writer:
+        for i in range(100):
+            writer.write(float(i), {'a': {'cpu': float(i)}})
+        assert writer.capacity == 128
+    with ColumnarRecording(path) as recording:
+        assert recording.column('a', 'cpu').tolist() == [float(i) for i in range(100)]
+
+
+def test_new_series_fill_slots_without_relayout(tmp_path):
+    path = str(tmp_path / 'samples.rmc')
+    writer = ColumnarWriter(path, capacity=64)
+    relayouts = []
+    relayout = writer._relayout
+    writer._relayout = lambda *args: relayouts.append(args) or relayout(*args)
+    for i in range(columnar.SERIES_SLOTS):
+        writer.write(float(i), {f's{i}': {'cpu': float(i)}})
+    assert relayouts == []
+    # Running out of slots with every series alive doubles them
+    writer.write(99.0, {'extra': {'cpu': 1.0}, **{f's{i}': {'cpu': 0.0} for i in range(columnar.SERIES_SLOTS)}})
+    assert writer.slots == 2 * columnar.SERIES_SLOTS and len(relayouts) == 1
+    writer.close()
+    with ColumnarRecording(path) as recording:
+        assert len(recording.series) == columnar.SERIES_SLOTS + 1
+        assert recording.column('s3', 'cpu')[3] == 3.0
+        assert np.isnan(recording.column('s3', 'cpu')[2])
+
+
+def test_dead_series_are_left_behind_in_a_new_segment(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, 'RETIRE_SAMPLES', 2)
+    path = str(tmp_path / 'samples.rmc')
+    with ColumnarWriter(path) as writer:
+        for i in range(40):
+            writer.write(float(i), {'steady': {'cpu': float(i)}, f'short{i}': {'cpu': 1.0}})
+    assert writer.paths[:2] == [path, segment_path(path, 1)]
+    for segment in writer.paths:
+        with ColumnarRecording(segment) as recording:
+            assert recording.series[0] == 'steady'
+            assert len(recording.series) <= columnar.SERIES_SLOTS
+
+
+def test_unknown_metric_and_bad_file(tmp_path):
+    with pytest.raises(ValueError):
+        ColumnarWriter(str(tmp_path / 'x.rmc'), metrics=('cpu', 'bogus'))
+    path = tmp_path / 'not.rmc'
+    path.write_bytes(b'x' * 64)
+    with pytest.raises(ValueError):
+        ColumnarRecording(str(path))
@@ -0,0 +1,70 @@
+import numpy as np
+
+from resource_monitor.compressed import (BitReader, BitWriter, CompressedHistory, TimestampEncoder, XorEncoder,
+                                         decode_timestamps, decode_values)
+
+
+def test_bit_writer_reader_round_trip():
+    writer = BitWriter()
+    fields = [(1, 1), (0, 1), (5, 3), (2 ** 40 + 3, 64), (0x1ff, 9)]
+    for value, nbits in fields:
+        writer.write(value, nbits)
+    reader = BitReader(writer.getvalue())
+    assert [reader.read(nbits) for _, nbits in fields] == [value for value, _ in fields]
+
+
+def test_timestamps_round_trip_with_jitter_and_gaps():
+    times = [1_700_000_000_000, 1_700_000_001_000, 1_700_000_002_003, 1_700_000_002_990,
+             1_700_000_100_000, 1_700_000_100_001, 1_699_999_000_000]
+    encoder = TimestampEncoder()
+    for ms in times:
+        encoder.append(ms)
+    decoded = decode_timestamps(encoder.writer.getvalue(), len(times))
+    assert (np.round(decoded * 1000).astype(np.int64) == times).all()
+
+
+def test_values_round_trip_bit_exact():
+    values = np.array([0.0, 0.0, 1.5, -1.5, np.nan, 1e300, 5e-324, 42.0, 42.0, np.inf])
+    encoder = XorEncoder()
+    for bits in values.view(np.uint64).tolist():
+        encoder.append(bits)
+    decoded = decode_values(encoder.writer.getvalue(), len(values))
+    assert decoded.view(np.uint64).tolist() == values.view(np.uint64).tolist()
+
+
+def test_history_round_trip_across_chunks():
+    history = CompressedHistory(chunk_size=16)
+    rng = np.random.default_rng(0)
+    cpu = rng.uniform(0, 100, 100)
+    for i in range(100):
+        data = {'a': {'cpu': cpu[i], 'memory': 100.0, 'pid': 1 if i < 50 else 2, 'username': 'u'}}
+        if i >= 30:
+            data['b'] = {'cpu': float(i)}
+        history.append(1000.0 + i, data)
+    assert len(history) == 100 and history.names == ['a', 'b']
+    assert np.array_equal(history.series('a', 'cpu'), cpu)
+    assert (history.series('a', 'memory') == 100.0).all()
+    b = history.series('b', 'cpu')
+    assert np.isnan(b[:30]).all() and b[30:].tolist() == [float(i) for i in range(30, 100)]
+    assert history.label_series('a', 'pid')[[0, 49, 50, 99]].tolist() == [1, 1, 2, 2]
+    assert history.latest('a', 'pid') == 2 and history.latest('b', 'username') is None
+    assert history.nbytes < history.raw_nbytes
+
+
+def test_history_window_queries():
+    history = CompressedHistory(chunk_size=8)
+    for i in range(40):
+        history.append(float(i), {'a': {'cpu': float(i)}})
+    assert history.times(10.0, 20.0).tolist() == [float(i) for i in range(10, 21)]
+    assert history.series('a', 'cpu', 35.0).tolist() == [35.0, 36.0, 37.0, 38.0, 39.0]
+    assert len(history.label_series('a', 'pid', None, 3.0)) == 4
+
+
+def test_retention_drops_sealed_chunks():
+    history = CompressedHistory(retention=20, chunk_size=8)
+    for i in range(100):
+        history.append(float(i), {'a': {'cpu': float(i)}})
+    times = history.times()
+    assert times[-1] == 99.0 and times[0] >= 99.0 - 20 - 8
+    assert len(history) == len(times)
+    assert history.series('a', 'cpu')[0] == times[0]
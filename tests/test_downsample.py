@@ -0,0 +1,71 @@
+import numpy as np
+
+from resource_monitor.downsample import MinMaxDecimator, _minmax_blocks, lttb, minmax
+
+
+def test_minmax_keeps_spikes():
+    times = np.arange(10000, dtype=np.float64)
+    values = np.zeros(10000)
+    values[1234] = 50.0
+    values[8765] = -7.0
+    t, v = minmax(times, values, 100)
+    assert len(v) <= 200
+    assert v.max() == 50.0 and t[v.argmax()] == 1234
+    assert v.min() == -7.0 and t[v.argmin()] == 8765
+    assert np.all(np.diff(t) >= 0)
+
+
+def test_minmax_short_series_is_unchanged():
+    times = np.arange(10.0)
+    values = np.arange(10.0)
+    t, v = minmax(times, values, 5)
+    assert t is times and v is values
+
+
+def test_minmax_all_nan_bucket_stays_a_gap():
+    times = np.arange(8.0)
+    values = np.array([1, 2, np.nan, np.nan, 3, 4, 5, 6], dtype=np.float64)
+    t, v = _minmax_blocks(times, values, 2)
+    assert np.isnan(v[2]) and np.isnan(v[3])
+    assert v[[0, 1, 4, 5]].tolist() == [1, 2, 3, 4]
+
+
+def test_lttb_keeps_ends_and_count():
+    times = np.arange(1000, dtype=np.float64)
+    values = np.sin(times / 50)
+    t, v = lttb(times, values, 100)
+    assert len(t) == 100
+    assert t[0] == 0 and t[-1] == 999
+    assert np.all(np.diff(t) > 0)
+
+
+def test_lttb_drops_nan():
+    times = np.arange(100, dtype=np.float64)
+    values = times.copy()
+    values[10:20] = np.nan
+    t, v = lttb(times, values, 10)
+    assert not np.isnan(v).any() and len(v) == 10
+
+
+def test_decimator_matches_fresh_reduction_while_scrolling():
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=20000)
+    values[15000] = 100.0
+    times = np.arange(len(values), dtype=np.float64)
+    decimator = MinMaxDecimator(buckets=50)
+    window = 4000
+    for end in range(window, len(values) + 1, 333):
+        t, v = decimator.decimate(times[end - window:end], values[end - window:end], end)
+        fresh = MinMaxDecimator(buckets=50)
+        t_fresh, v_fresh = fresh.decimate(times[end - window:end], values[end - window:end], end)
+        assert np.array_equal(t, t_fresh) and np.array_equal(v, v_fresh)
+        chunk = values[end - window:end]
+        assert v.max() == chunk.max() and v.min() == chunk.min()
+
+
+def test_decimator_resets_when_history_restarts():
+    decimator = MinMaxDecimator(buckets=10)
+    times = np.arange(1000, dtype=np.float64)
+    decimator.decimate(times, times, 1000)
+    t, v = decimator.decimate(times[:500], times[:500] * 2, 500)
+    assert v.max() == 998.0 and v.min() == 0.0
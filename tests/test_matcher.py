@@ -0,0 +1,73 @@
+import pytest
+
+from resource_monitor.matcher import AhoCorasick, ProcessMatcher, parse_selector
+
+
+def test_parse_selector_kinds():
+    assert parse_selector('chrome') == ('substring', 'name', 'chrome')
+    assert parse_selector('exact:nginx') == ('exact', 'name', 'nginx')
+    assert parse_selector('cmdline:--worker') == ('cmdline', 'cmdline', '--worker')
+    assert parse_selector('tree:1') == ('tree', 'ppid', '1')
+    # Unknown prefixes are part of a plain name
+    assert parse_selector('C:\\app.exe') == ('substring', 'name', 'C:\\app.exe')
+
+
+@pytest.mark.parametrize('selector', ['', 'exact:', 'tree:abc', 're:('])
+def test_parse_selector_rejects_invalid(selector):
+    with pytest.raises(ValueError):
+        parse_selector(selector)
+
+
+def test_aho_corasick_overlapping_words():
+    automaton = AhoCorasick([('he', 0), ('she', 1), ('hers', 2), ('his', 3)])
+    assert automaton.find('ushers') == {0, 1, 2}
+    assert automaton.find('this') == {3}
+    assert automaton.find('xyz') == set()
+    assert not AhoCorasick([])
+
+
+def test_match_name_selectors_case_insensitive():
+    matcher = ProcessMatcher(['chrome', 'exact:nginx', 'glob:python3.*', 're:^gunicorn\\b'])
+    assert matcher.attrs == ['name']
+    assert matcher.match('Google Chrome Helper') == ['chrome']
+    assert matcher.match('NGINX') == ['exact:nginx']
+    assert matcher.match('nginx-worker') == []
+    assert matcher.match('python3.11') == ['glob:python3.*']
+    assert matcher.match('python3') == []
+    assert matcher.match('gunicorn') == ['re:^gunicorn\\b']
+    assert matcher.match('xgunicorn') == []
+
+
+def test_match_returns_every_selector_in_watch_list_order():
+    matcher = ProcessMatcher(['exact:python', 'py', 'glob:p*'])
+    assert matcher.match('python') == ['exact:python', 'py', 'glob:p*']
+
+
+def test_match_exe_and_cmdline():
+    matcher = ProcessMatcher(['exe:/opt/app/', 'cmdline:--worker', 'cmdline:*serve*8080'])
+    assert matcher.attrs == ['name', 'exe', 'cmdline']
+    assert matcher.match('app', exe='/OPT/APP/bin/app') == ['exe:/opt/app/']
+    assert matcher.match('x', cmdline=['python', 'run.py', '--worker']) == ['cmdline:--worker']
+    assert matcher.match('x', cmdline='python serve.py --port 8080') == ['cmdline:*serve*8080']
+    assert matcher.match('x') == []
+
+
+def test_backreference_patterns_are_matched_on_their_own():
+    matcher = ProcessMatcher(['re:(a)\\1', 're:b+'])
+    assert matcher.match('xaay') == ['re:(a)\\1']
+    assert matcher.match('bb') == ['re:b+']
+
+
+def test_match_trees_finds_descendants():
+    matcher = ProcessMatcher(['tree:10'])
+    assert matcher.attrs == ['name', 'ppid']
+    infos = [{'pid': 1, 'ppid': 0}, {'pid': 10, 'ppid': 1}, {'pid': 11, 'ppid': 10},
+             {'pid': 12, 'ppid': 11}, {'pid': 20, 'ppid': 1}]
+    members = matcher.match_trees(infos)
+    assert set(members) == {10, 11, 12}
+    assert matcher.match_info({'name': 'worker'}, members[12]) == ['tree:10']
+    assert matcher.match_info({'name': 'worker'}, members.get(20)) == []
+
+
+def test_match_trees_missing_root():
+    assert ProcessMatcher(['tree:99']).match_trees([{'pid': 1, 'ppid': 0}]) == {}
@@ -0,0 +1,63 @@
+import numpy as np
+
+from resource_monitor.rates import RateEngine
+
+
+def test_first_update_is_zero_then_per_second():
+    engine = RateEngine(columns=2)
+    assert engine.update({'a': [100, 10]}, timestamp=0.0)['a'].tolist() == [0.0, 0.0]
+    assert engine.update({'a': [300, 40]}, timestamp=2.0)['a'].tolist() == [100.0, 15.0]
+
+
+def test_wraparound_within_modulus():
+    engine = RateEngine(wrap=2 ** 32)
+    engine.update({'nic': [2 ** 32 - 100]}, timestamp=0.0)
+    assert engine.update({'nic': [50]}, timestamp=1.0)['nic'].tolist() == [150.0]
+
+
+def test_reset_without_wrap_counts_from_zero():
+    engine = RateEngine()
+    engine.update({'nic': [1000]}, timestamp=0.0)
+    assert engine.update({'nic': [40]}, timestamp=2.0)['nic'].tolist() == [20.0]
+
+
+def test_implausible_wrap_is_a_reset():
+    engine = RateEngine(wrap=2 ** 8)
+    engine.update({'nic': [1000]}, timestamp=0.0)
+    # 40 - 1000 + 256 is still negative, so the counter restarted
+    assert engine.update({'nic': [40]}, timestamp=1.0)['nic'].tolist() == [40.0]
+
+
+def test_zero_elapsed_gives_zero_rate():
+    engine = RateEngine()
+    engine.update({'a': [0]}, timestamp=5.0)
+    assert engine.update({'a': [10]}, timestamp=5.0)['a'].tolist() == [0.0]
+
+
+def test_drop_missing_forgets_absent_keys():
+    engine = RateEngine()
+    engine.update({'a': [0], 'b': [0]}, timestamp=0.0)
+    engine.update({'a': [10]}, timestamp=1.0)
+    assert len(engine) == 1
+    # b comes back as a new key with a zero rate
+    assert engine.update({'a': [20], 'b': [50]}, timestamp=2.0)['b'].tolist() == [0.0]
+
+
+def test_keep_missing_and_forget():
+    engine = RateEngine()
+    engine.update({'a': [0], 'b': [0]}, timestamp=0.0)
+    engine.update({'a': [10], 'c': [5]}, timestamp=1.0, drop_missing=False)
+    assert len(engine) == 3
+    rates = engine.update({'b': [30], 'c': [7]}, timestamp=2.0, drop_missing=False)
+    assert np.allclose(rates['b'], [15.0]) and np.allclose(rates['c'], [2.0])
+    engine.forget('b')
+    engine.forget('missing')
+    assert engine.keys == ['a', 'c']
+    assert engine.update({'c': [9]}, timestamp=3.0, drop_missing=False)['c'].tolist() == [2.0]
+
+
+def test_empty_update_clears():
+    engine = RateEngine()
+    engine.update({'a': [1]}, timestamp=0.0)
+    assert engine.update({}, timestamp=1.0) == {}
+    assert len(engine) == 0
@@ -0,0 +1,74 @@
+import csv
+import json
+import os
+
+from resource_monitor import recorder
+from resource_monitor.recorder import CSV_COLUMNS, Recorder
+
+
+def sample(i):
+    return {'app': {'cpu': float(i), 'memory': 10.0, 'pid': 42, 'username': 'user', 'count': 1}}
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_single_file_without_rotation(tmp_path):
+    path = str(tmp_path / 'samples.jsonl')
+    with Recorder(path, flush_interval=60) as rec:
+        for i in range(3):
+            rec.write(float(i), sample(i))
+        assert rec.current_path == path
+    assert [record['software']['app']['cpu'] for record in read_jsonl(path)] == [0.0, 1.0, 2.0]
+
+
+def test_rotation_by_size_numbers_segments(tmp_path):
+    path = str(tmp_path / 'samples.jsonl')
+    with Recorder(path, buffer_size=1, max_bytes=300) as rec:
+        for i in range(20):
+            rec.write(float(i), sample(i))
+    assert rec.paths[0] == str(tmp_path / 'samples.0001.jsonl')
+    assert len(rec.paths) > 1 and not os.path.exists(path)
+    records = [record for segment in rec.paths for record in read_jsonl(segment)]
+    assert [record['timestamp'] for record in records] == [float(i) for i in range(20)]
+    # Every segment but the last holds at least one sample and stays within max_bytes
+    for segment in rec.paths[:-1]:
+        assert 0 < os.path.getsize(segment) <= 300
+
+
+def test_max_files_removes_oldest_segments(tmp_path):
+    path = str(tmp_path / 'samples.jsonl')
+    with Recorder(path, buffer_size=1, max_bytes=200, max_files=2) as rec:
+        for i in range(30):
+            rec.write(float(i), sample(i))
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in rec.paths)
+    assert len(rec.paths) == 2
+    assert read_jsonl(rec.paths[-1])[-1]['timestamp'] == 29.0
+
+
+def test_rotation_by_age(tmp_path, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(recorder.time, 'monotonic', lambda: clock[0])
+    path = str(tmp_path / 'samples.jsonl')
+    with Recorder(path, max_age=10) as rec:
+        rec.write(0.0, sample(0))
+        clock[0] += 5
+        rec.write(1.0, sample(1))
+        clock[0] += 6
+        rec.write(2.0, sample(2))
+    assert [len(read_jsonl(segment)) for segment in rec.paths] == [2, 1]
+
+
+def test_csv_segments_each_start_with_a_header(tmp_path):
+    path = str(tmp_path / 'samples.csv')
+    with Recorder(path, format_type='csv', buffer_size=1, max_bytes=150) as rec:
+        for i in range(10):
+            rec.write(float(i), sample(i))
+    assert len(rec.paths) > 1
+    for segment in rec.paths:
+        with open(segment, newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == CSV_COLUMNS
+        assert len(rows) > 1 and all(row[1] == 'app' for row in rows[1:])
@@ -0,0 +1,122 @@
+import math
+
+import pytest
+
+from resource_monitor.remote import Agent, HostMerger, decode_batch, encode_batch, parse_address
+
+
+def metrics(cpu, pid=1):
+    return {'cpu': cpu, 'memory': 10.0, 'network': None, 'disk': 0.0, 'gpu': 0.0,
+            'pid': pid, 'username': 'alice', 'count': 2}
+
+
+def test_batch_round_trip():
+    samples = [(1000.5, {'app': metrics(1.5), 'db': metrics(2.0, pid=None)}), (1001.5, {})]
+    host, decoded = decode_batch(encode_batch('web-1', samples))
+    assert host == 'web-1'
+    assert decoded[0][0] == 1000.5 and decoded[1] == (1001.5, {})
+    app = decoded[0][1]['app']
+    assert app['cpu'] == 1.5 and app['network'] is None and app['pid'] == 1
+    assert app['username'] == 'alice' and app['count'] == 2
+    assert decoded[0][1]['db']['pid'] is None
+
+
+def test_large_batch_is_compressed():
+    samples = [(float(i), {'app': metrics(1.0)}) for i in range(100)]
+    payload = encode_batch('host', samples)
+    assert payload[0] == 1
+    assert decode_batch(payload)[1] == decode_batch(encode_batch('host', samples[:50]))[1] + \
+        decode_batch(encode_batch('host', samples[50:]))[1]
+
+
+def test_parse_address():
+    assert parse_address('10.0.0.1:9000') == ('10.0.0.1', 9000)
+    assert parse_address('collector') == ('collector', 9106)
+    assert parse_address('9000') == ('', 9000)
+    assert parse_address('[::1]:9000') == ('::1', 9000)
+
+
+def test_merger_aligns_hosts_after_delay():
+    merger = HostMerger(interval=1.0, delay=2.0)
+    merger.add('a', 100.2, {'cpu': metrics(1.0)})
+    merger.add('b', 100.7, {'cpu': metrics(2.0)})
+    merger.add('a', 101.1, {'cpu': metrics(3.0)})
+    # Bucket 100 ends at 101, so it is ready from 103 on
+    assert merger.pop_ready(now=102.9) == []
+    ready = merger.pop_ready(now=103.0)
+    assert [timestamp for timestamp, _ in ready] == [100.0]
+    assert set(ready[0][1]) == {'a: cpu', 'b: cpu'}
+    assert merger.pop_ready(now=104.0)[0][1]['a: cpu']['cpu'] == 3.0
+
+
+def test_late_sample_of_an_emitted_host_is_dropped():
+    merger = HostMerger(interval=1.0, delay=0.0)
+    merger.add('a', 100.0, {'x': metrics(1.0)})
+    merger.pop_ready(now=101.0)
+    merger.add('a', 100.5, {'x': metrics(2.0)})
+    assert merger.late == 1 and merger.pop_backfill(flush=True) == []
+
+
+def test_lagging_host_is_backfilled_once_it_catches_up():
+    merger = HostMerger(interval=1.0, delay=0.0)
+    for t in range(100, 105):
+        merger.add('a', t, {'x': metrics(float(t))})
+    assert len(merger.pop_ready(now=105.0)) == 5
+    # b reconnects and sends its buffered samples for the emitted buckets
+    merger.add('b', 101.0, {'y': metrics(1.0)})
+    merger.add('b', 102.0, {'y': metrics(2.0)})
+    assert merger.backfilled == 2
+    # b hasn't moved past bucket 102 yet
+    assert [timestamp for timestamp, _ in merger.pop_backfill()] == [101.0]
+    merger.add('b', 106.0, {'y': metrics(6.0)})
+    backfill = merger.pop_backfill()
+    assert backfill == [(102.0, {'b: y': metrics(2.0)})]
+    # b's own watermark now rejects older samples
+    merger.add('b', 102.5, {'y': metrics(0.0)})
+    assert merger.late == 1
+
+
+def test_backfill_limit():
+    merger = HostMerger(interval=1.0, delay=0.0, max_backfill=10.0)
+    merger.add('a', 1000.0, {'x': metrics(1.0)})
+    merger.pop_ready(now=1001.0)
+    merger.add('b', 989.0, {'y': metrics(1.0)})
+    merger.add('b', 991.0, {'y': metrics(1.0)})
+    assert merger.late == 1 and merger.backfilled == 1
+    disabled = HostMerger(interval=1.0, delay=0.0, max_backfill=0)
+    disabled.add('a', 1000.0, {'x': metrics(1.0)})
+    disabled.pop_ready(now=1001.0)
+    disabled.add('b', 1000.0, {'y': metrics(1.0)})
+    assert disabled.late == 1
+
+
+@pytest.fixture
+def agent():
+    # Nothing listens on the port, the agent keeps reconnecting in the background
+    agent = Agent('127.0.0.1', 9, max_pending=5, reconnect_delay=60.0)
+    yield agent
+    agent.close()
+
+
+def test_agent_buffer_drops_oldest(agent):
+    for i in range(7):
+        agent.write(float(i), {})
+    assert agent.dropped == 2
+    assert [timestamp for timestamp, _ in agent.pending] == [2.0, 3.0, 4.0, 5.0, 6.0]
+
+
+def test_agent_requeue_drops_oldest_of_the_batch(agent):
+    for i in range(3):
+        agent.write(float(i + 10), {})
+    agent._requeue([(float(i), {}) for i in range(4)])
+    assert agent.dropped == 2
+    assert [timestamp for timestamp, _ in agent.pending] == [2.0, 3.0, 10.0, 11.0, 12.0]
+
+
+def test_agent_encode_skips_bad_samples(agent):
+    samples = [(1.0, {'a': metrics(1.0)}), (2.0, {'a': {'cpu': 'bad'}}), (3.0, {'a': metrics(3.0)})]
+    payloads = agent._encode(samples)
+    assert agent.invalid == 1
+    decoded = [sample for payload in payloads for sample in decode_batch(payload)[1]]
+    assert [timestamp for timestamp, _ in decoded] == [1.0, 3.0]
+    assert all(not math.isnan(data['a']['cpu']) for _, data in decoded)
@@ -0,0 +1,144 @@
+import csv
+import datetime
+import json
+
+import numpy as np
+
+from resource_monitor import columnar
+from resource_monitor.columnar import ColumnarWriter
+from resource_monitor.history import HistoryStore
+from resource_monitor.recorder import Recorder
+from resource_monitor.replay import (ColumnarFileRecording, CsvRecording, DatabaseRecording, JsonLinesRecording,
+                                     MemoryRecording, ReplaySession, clock_times, open_recording)
+from resource_monitor.store import HistoryDatabase
+
+
+def sample(i):
+    return {'app': {'cpu': float(i), 'memory': 2.0 * i, 'network': 0.0, 'disk': 0.0, 'gpu': 0.0,
+                    'pid': 100 + i, 'username': 'alice', 'count': 1}}
+
+
+def check_samples(recording, count):
+    assert len(recording) == count
+    samples = recording.read(0, count)
+    assert [timestamp for timestamp, _ in samples] == [1000.0 + i for i in range(count)]
+    for i, (_, data) in enumerate(samples):
+        assert data['app']['cpu'] == float(i) and data['app']['pid'] == 100 + i
+        assert data['app']['username'] == 'alice'
+    assert [timestamp for timestamp, _ in recording.read(2, 4)] == [1002.0, 1003.0]
+
+
+def test_rotated_json_lines(tmp_path):
+    path = str(tmp_path / 'samples.jsonl')
+    with Recorder(path, buffer_size=1, max_bytes=400) as recorder:
+        for i in range(10):
+            recorder.write(1000.0 + i, sample(i))
+    assert len(recorder.paths) > 1
+    # Any segment opens the whole recording
+    with open_recording(recorder.paths[-1]) as recording:
+        assert isinstance(recording, JsonLinesRecording)
+        check_samples(recording, 10)
+
+
+def test_csv_recording(tmp_path):
+    path = str(tmp_path / 'samples.csv')
+    with Recorder(path, format_type='csv') as recorder:
+        for i in range(6):
+            recorder.write(1000.0 + i, sample(i))
+    with open_recording(path) as recording:
+        assert isinstance(recording, CsvRecording)
+        check_samples(recording, 6)
+
+
+def test_columnar_recording_with_segments(tmp_path, monkeypatch):
+    monkeypatch.setattr(columnar, 'RETIRE_SAMPLES', 1)
+    path = str(tmp_path / 'samples.rmc')
+    with ColumnarWriter(path) as writer:
+        for i in range(40):
+            data = sample(i)
+            data[f'short{i}'] = {'cpu': 1.0}
+            writer.write(1000.0 + i, data)
+    assert len(writer.paths) > 1
+    for opened in (path, writer.paths[-1]):
+        with open_recording(opened) as recording:
+            assert isinstance(recording, ColumnarFileRecording)
+            check_samples(recording, 40)
+            assert set(recording.read(39, 40)[0][1]) == {'app', 'short39'}
+
+
+def test_database_recording(tmp_path):
+    path = str(tmp_path / 'history.db')
+    with HistoryDatabase(path) as database:
+        for i in range(5):
+            database.write(1000.0 + i, sample(i))
+    with open_recording(path) as recording:
+        assert isinstance(recording, DatabaseRecording)
+        check_samples(recording, 5)
+
+
+def test_english_json_export(tmp_path):
+    path = tmp_path / 'export.json'
+    path.write_text(json.dumps({
+        'timestamp': '2024-01-02T00:00:05',
+        'time_points': ['23:59:59', '00:00:05'],
+        'software': {'app': {'cpu': [1.0, 2.0], 'pid': [7, 7]}, 'gone': {'cpu': [3.0, None]}},
+    }), encoding='utf-8')
+    with open_recording(str(path)) as recording:
+        assert isinstance(recording, MemoryRecording)
+        (first, data0), (second, data1) = recording.read(0, 2)
+        assert second - first == 6
+        assert data0 == {'app': {'cpu': 1.0, 'pid': 7}, 'gone': {'cpu': 3.0}}
+        assert set(data1) == {'app'}
+
+
+def test_chinese_json_export(tmp_path):
+    path = tmp_path / 'export.json'
+    path.write_text(json.dumps([
+        {'时间戳': 2000.0, '软件资源': {'应用': {'CPU(%)': 5.0, '内存(MB)': 10.0, '用户名': '张三'}}},
+        {'时间戳': 1000.0, '软件资源': {'应用': {'CPU(%)': 4.0}}},
+    ], ensure_ascii=False), encoding='utf-8')
+    with open_recording(str(path)) as recording:
+        assert recording.times.tolist() == [1000.0, 2000.0]
+        assert recording.read(1, 2)[0][1] == {'应用': {'cpu': 5.0, 'memory': 10.0, 'username': '张三'}}
+
+
+def test_csv_export(tmp_path):
+    path = tmp_path / 'export.csv'
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Time', 'app_CPU(%)', 'app_内存(MB)', 'app_PID', 'Notes'])
+        writer.writerow(['10:00:00', '1.5', '20', '7', 'x'])
+        writer.writerow(['10:00:01', '', '21', '7', 'y'])
+    with open_recording(str(path)) as recording:
+        assert isinstance(recording, MemoryRecording)
+        (first, data0), (second, data1) = recording.read(0, 2)
+        assert second - first == 1
+        assert data0 == {'app': {'cpu': 1.5, 'memory': 20.0, 'pid': 7}}
+        assert data1 == {'app': {'memory': 21.0, 'pid': 7}}
+
+
+def test_clock_times_cross_midnight():
+    end = datetime.datetime(2024, 1, 2, 0, 0, 1)
+    times = clock_times(['23:59:58', '23:59:59', '00:00:00', '00:00:01'], end)
+    assert np.diff(times).tolist() == [1.0, 1.0, 1.0]
+    assert times[-1] == end.timestamp()
+
+
+def test_replay_session_seek_and_tick():
+    recording = MemoryRecording('memory', [(float(i), {'app': {'cpu': float(i)}}) for i in range(100)])
+    history = HistoryStore(10)
+    session = ReplaySession(recording, history)
+    session.seek(50)
+    assert history.times().tolist() == [float(i) for i in range(41, 51)]
+    # A short step only appends the samples that were passed
+    assert session.advance_to(53) is False
+    assert history.series('app', 'cpu').tolist()[-3:] == [51.0, 52.0, 53.0]
+    # A jump back reloads the window
+    assert session.advance_to(20) is True and history.times()[-1] == 20.0
+    session.playing = True
+    session.speed = 2.0
+    session.tick(5.0)
+    assert session.position == 30
+    session.tick(1000.0)
+    assert session.at_end and not session.playing
+    assert history.times()[-1] == 99.0
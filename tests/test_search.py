@@ -0,0 +1,85 @@
+from resource_monitor.search import FieldIndex, SearchIndex, parse_query, trigrams
+
+
+def build(processes):
+    index = SearchIndex()
+    for key, (name, pid, user) in processes.items():
+        index.add(key, name, pid, user)
+    return index
+
+
+PROCESSES = {
+    'a': ('nginx', 1201, 'www-data'),
+    'b': ('nginx', 1202, 'www-data'),
+    'c': ('postgres', 88, 'postgres'),
+    'd': ('Chrome Helper', 4120, 'alice'),
+    'e': ('bash', 120, 'root'),
+}
+
+
+def test_parse_query():
+    assert parse_query('User:Root  nginx') == [('user', 'root'), (None, 'nginx')]
+    assert parse_query('pid: c:\\app') == [(None, 'c:\\app')]
+    assert parse_query('') == []
+
+
+def test_trigrams():
+    assert trigrams('abcd') == {'abc', 'bcd'}
+    assert trigrams('ab') == set()
+
+
+def test_plain_term_searches_every_field():
+    index = build(PROCESSES)
+    assert index.search(parse_query('nginx')) == {'a', 'b'}
+    assert index.search(parse_query('120')) == {'a', 'b', 'd', 'e'}
+    assert index.search(parse_query('postgres')) == {'c'}
+    assert index.search(parse_query('CHROME help')) == {'d'}
+
+
+def test_field_terms_and_intersection():
+    index = build(PROCESSES)
+    assert index.search(parse_query('pid:120')) == {'a', 'b', 'd', 'e'}
+    assert index.search(parse_query('pid:1202')) == {'b'}
+    assert index.search(parse_query('user:www nginx')) == {'a', 'b'}
+    assert index.search(parse_query('user:root nginx')) == set()
+    # Short terms scan the distinct values
+    assert index.search(parse_query('name:sh')) == {'e'}
+    assert index.search([]) == set(PROCESSES)
+
+
+def test_trigrams_must_appear_in_order():
+    index = build({'x': ('abcxbcd', 1, 'u')})
+    # Every trigram of "abcd" occurs, but not the term itself
+    assert index.search(parse_query('name:abcd')) == set()
+    assert index.search(parse_query('name:xbcd')) == {'x'}
+
+
+def test_remove_and_replace():
+    index = build(PROCESSES)
+    index.remove('a')
+    assert index.search(parse_query('nginx')) == {'b'}
+    index.remove('b')
+    assert 'nginx' not in index.fields['name'].keys
+    assert 'ngi' not in index.fields['name'].trigrams
+    index.add('e', 'zsh', 120, 'root')
+    assert index.search(parse_query('bash')) == set()
+    assert index.search(parse_query('zsh')) == {'e'}
+    assert index.serials['e'] > index.serials['d']
+    index.remove('missing')
+    assert len(index) == 3
+
+
+def test_matches_single_process():
+    index = build(PROCESSES)
+    assert index.matches('d', parse_query('alice chrome'))
+    assert not index.matches('d', parse_query('user:chrome'))
+    assert not index.matches('missing', [])
+
+
+def test_field_index_shares_values():
+    field = FieldIndex()
+    field.add('nginx', 1)
+    field.add('nginx', 2)
+    assert field.search('gin') == {1, 2}
+    field.remove('nginx', 1)
+    assert field.search('gin') == {2}
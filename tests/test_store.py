@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from resource_monitor.store import MIN_RAW_RETENTION, HistoryDatabase, percentile_groups
+
+# A fixed "now" well after the samples, so every bucket is settled
+NOW = 1_700_003_600.0
+START = 1_699_999_200.0  # Starts an hour
+
+
+@pytest.fixture
+def database(tmp_path):
+    with HistoryDatabase(str(tmp_path / 'history.db'), flush_interval=0) as database:
+        yield database
+
+
+def test_raw_round_trip(database):
+    for i in range(5):
+        database.write(START + i, {'a': {'cpu': float(i), 'memory': 10.0, 'pid': 3, 'username': 'u'}})
+    database.flush()
+    result = database.query('a', 'cpu', START, START + 5, tier='raw')
+    assert result['tier'] == 'raw'
+    assert result['times'].tolist() == [START + i for i in range(5)]
+    assert result['min'].tolist() == result['p95'].tolist() == [float(i) for i in range(5)]
+    assert database.names == ['a']
+
+
+def test_rollup_statistics(database):
+    for i in range(120):
+        database.write(START + i, {'a': {'cpu': float(i % 60), 'memory': None}})
+    database.flush()
+    database.rollup(now=NOW)
+    result = database.query('a', 'cpu', START, START + 120, tier='1m')
+    assert result['times'].tolist() == [START, START + 60]
+    assert result['min'].tolist() == [0.0, 0.0]
+    assert result['max'].tolist() == [59.0, 59.0]
+    assert np.allclose(result['avg'], 29.5)
+    assert np.allclose(result['p95'], np.percentile(np.arange(60.0), 95))
+    # A metric without any value rolls up to NULL
+    assert np.isnan(database.query('a', 'memory', START, START + 120, tier='1m')['avg']).all()
+
+
+def test_late_samples_roll_up_again(database):
+    for i in range(60):
+        database.write(START + i, {'a': {'cpu': 1.0}})
+    database.flush()
+    database.rollup(now=NOW)
+    database.write(START + 30.5, {'a': {'cpu': 100.0}})
+    database.flush()
+    database.rollup(now=NOW)
+    result = database.query('a', 'cpu', START, START + 60, tier='1m')
+    assert result['max'].tolist() == [100.0]
+
+
+def test_expire_by_tier(database):
+    database.write(START, {'a': {'cpu': 1.0}})
+    database.flush()
+    database.rollup(now=NOW)
+    database.expire(now=START + database.retention['raw'] + 1)
+    assert len(database.query('a', 'cpu', START - 1, START + 1, tier='raw')['times']) == 0
+    assert len(database.query('a', 'cpu', START - 60, START + 60, tier='1m')['times']) == 1
+
+
+def test_choose_tier(database):
+    day = 86400
+    assert database.choose_tier(NOW - 600, NOW, now=NOW) == 'raw'
+    # Too many raw points for the range
+    assert database.choose_tier(NOW - day, NOW, now=NOW) == '1m'
+    # Older than the raw retention
+    assert database.choose_tier(NOW - 3 * day, NOW - 3 * day + 600, now=NOW) == '1m'
+    assert database.choose_tier(NOW - 20 * day, NOW, now=NOW) == '1h'
+    assert database.choose_tier(NOW - 3000 * day, NOW, now=NOW) == '1h'
+
+
+def test_short_raw_retention_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        HistoryDatabase(str(tmp_path / 'x.db'), retention={'raw': MIN_RAW_RETENTION - 1})
+
+
+def test_percentile_groups_ignores_nan():
+    values = np.array([1.0, 2.0, np.nan, np.nan, 5.0])
+    result = percentile_groups(values, [0, 2, 4], q=50)
+    assert result[0] == 1.5 and np.isnan(result[1]) and result[2] == 5.0